@@ -0,0 +1,441 @@
+"""
+This module times the slow parts of BrewHouse on made up data of several sizes.
+
+For each scale, sales data and a brewery state are made with
+synthetic_data in a temporary directory, the sales data is read from
+there with use_sales_file, and each function is run a few times. The
+fastest, median and mean times are written to a json file with the
+commit they were measured at, so the results of two commits can be
+compared with --compare.
+
+The cost of logging is timed as well: records put on a queue as every
+module does through log_setup, records below the level of the logger,
+and records written straight to a file as the modules used to.
+
+Compacting the sales is timed on a copy of the sales data, keeping the
+fewest days the forecasts allow, and reading the data again once
+compacted.
+
+Exports are timed writing the forecast of EXPORT_BEERS beers for a
+year in each format, and their throughput is given in records a second.
+
+The customers scale has thousands of customers, for the forecast of each
+customer, and isn't run unless asked for.
+
+The data starts on the same date whatever the day, so the results of
+different days can be compared. beer_suggestion looks ten weeks from
+today, which is usually past the forecast of the data, so suggest_batch
+is also timed with totals from the start of the forecast.
+
+Usage:
+    python benchmark.py --scales small medium --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from functools import partial
+from datetime import datetime, timedelta
+from logging.handlers import QueueListener
+from typing import Tuple, List, Dict, Callable, Any, Optional
+from log_setup import get_logger, LOG_FORMAT, RecordQueueHandler
+
+# The modules below change to the program's directory, so the paths given are resolved from here.
+START_DIR = os.getcwd()
+
+# pylint: disable=wrong-import-position
+import read_file
+from read_file import parse_data, write_data, use_sales_file, archive_file_name
+from sales_predictions import plot_growth_percent, plot_next_year, get_total
+from suggestions import beer_suggestion, suggest_batch
+from customer_demand import customer_forecast
+from forecast_accuracy import MODELS, AccuracyTracker, issue
+from inventory_management import finished_processes, objects_from_records, save_objects
+from state_store import STATE_FILE, read_state, to_json
+from synthetic_data import SyntheticSpec, write_sales, write_state, make_state
+from exports import FORMATS, EXTENSIONS, export_rows, export_file
+from retention import MIN_DAILY_YEARS, RetentionPolicy, compact_sales
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("benchmark")
+
+# The small scale is about the size of the real csv file.
+SCALES = {"small": SyntheticSpec(),
+          "medium": SyntheticSpec(recipes=10, customers=100, years=3, invoices_per_day=10,
+                                  tanks=20, batches=60, orders=1000),
+          "large": SyntheticSpec(recipes=30, customers=500, years=5, invoices_per_day=50,
+                                 tanks=50, batches=300, orders=20000),
+          # Many customers, for the forecast of each customer.
+          "customers": SyntheticSpec(recipes=10, customers=5000, years=2, invoices_per_day=200,
+                                     tanks=20, batches=60, orders=1000)}
+# The days of sales in the file added by the write_data benchmark.
+ADDED_DAYS = 30
+# The number of records logged in each run of the logging benchmarks.
+LOG_RECORDS = 1000
+# The days before the end of the data a forecast of each model is scored from.
+ISSUED_DAYS = 42
+# The policy the sales are compacted with, leaving the fewest days the forecasts allow.
+COMPACT_RETENTION = RetentionPolicy(daily_years=MIN_DAILY_YEARS, weekly_years=MIN_DAILY_YEARS)
+# The beers and days of the forecast written by the export benchmarks.
+EXPORT_BEERS = 500
+EXPORT_DAYS = 365
+
+
+def time_function(function: Callable[[], Any], repeat: int,
+                  setup: Callable[[], Any] = None) -> Dict[str, float]:
+    """
+    Runs the function the given number of times and returns how long it took.
+
+    :param function: The function to time.
+    :param repeat: The number of times to run it.
+    :param setup: Function run before each run and not timed.
+
+    :return: The fastest, median and mean times in milliseconds.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(times), "median_ms": statistics.median(times),
+            "mean_ms": statistics.mean(times)}
+
+
+def refresh_page_timer(state_dir: str) -> Optional[Tuple[Callable[[], None], Callable[[], None]]]:
+    """
+    Makes a hidden interface showing the site in the directory.
+
+    :param state_dir: The directory of the state file of the site.
+
+    :return:
+    The function refreshing the page and the function closing the
+    interface, or None if PyQt5 can't be imported.
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    # pylint: disable=import-outside-toplevel
+    try:
+        from PyQt5 import QtWidgets
+        from user_interface import UiMainWindow
+        from sites import Site, SiteRegistry
+    except ImportError as error:
+        LOGGER.warning("Not timing refresh_page: %s", error)
+        return None
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    registry = SiteRegistry(os.path.join(state_dir, "sites.json"))
+    registry.sites = {"Synthetic": Site("Synthetic", state_dir)}
+    window = QtWidgets.QMainWindow()
+    interface = UiMainWindow(window, registry)
+    # The inbox of the program isn't added to the made up sales data.
+    interface.stop_watching()
+    interface.runner.wait()
+
+    def refresh():
+        interface.refresh_page()
+        # The background work started by the refresh is finished before the next run.
+        interface.runner.wait()
+        app.processEvents()
+
+    def close():
+        window.close()
+        registry.stop()
+    return refresh, close
+
+
+def issued_tracker(prediction: Tuple, file_name: str) -> AccuracyTracker:
+    """
+    Makes a tracker holding a forecast of each model issued on each of the last ISSUED_DAYS days.
+
+    Every forecast is the given one moved to start the day after it was issued.
+    """
+    tracker = AccuracyTracker(file_name)
+    last = max(dates[-1] for dates in parse_data()['x'].values()).toordinal()
+    tracker.record([issue(model, [day, 0], day, ([datetime.fromordinal(day + 1)],
+                                                 prediction[1]))
+                    for day in range(last - ISSUED_DAYS, last) for model in MODELS])
+    return tracker
+
+
+def run_scale(name: str, spec: SyntheticSpec, repeat: int, directory: str,
+              ui: bool = True) -> List[Dict]:
+    """
+    Makes the data for one scale and times every function on it.
+
+    :param name: The name of the scale.
+    :param spec: The size of the data.
+    :param repeat: The number of times to run each function.
+    :param directory: The directory to make the data in.
+    :param ui: Whether to time refresh_page.
+
+    :return: The results of each function.
+    """
+    # pylint: disable=too-many-locals
+    LOGGER.info("Benchmarking the %s scale", name)
+    sales_file = os.path.join(directory, name + ".csv")
+    work_file = os.path.join(directory, name + "_work.csv")
+    added_file = os.path.join(directory, name + "_added.csv")
+    state_dir = os.path.join(directory, name)
+    rows = write_sales(sales_file, spec)
+    write_sales(added_file, spec._replace(years=ADDED_DAYS / 365, seed=spec.seed + 1))
+    write_state(state_dir, spec)
+    process_obj, tanks = make_state(spec)
+    use_sales_file(sales_file)
+    prediction = plot_next_year()
+    totals = get_total(prediction[0][0], 42, prediction)
+    tracker = issued_tracker(prediction, os.path.join(directory, name + ".forecasts.jsonl"))
+    data_dict = parse_data()
+
+    def unscored():
+        tracker.days = {}
+        tracker.scored_through = None
+
+    def fresh_copy():
+        shutil.copyfile(sales_file, work_file)
+        if os.path.exists(archive_file_name(work_file)):
+            os.remove(archive_file_name(work_file))
+        use_sales_file(work_file)
+        parse_data()
+
+    def compacted_copy():
+        fresh_copy()
+        compact_sales(COMPACT_RETENTION)
+        use_sales_file(work_file)
+
+    benchmarks = [
+        ("parse_data", parse_data, lambda: use_sales_file(sales_file)),
+        ("plot_growth_percent", lambda: plot_growth_percent(plot=False), None),
+        ("plot_next_year", plot_next_year, None),
+        ("get_total", lambda: get_total(prediction[0][0], 42, prediction), None),
+        ("beer_suggestion", lambda: beer_suggestion(prediction, process_obj, tanks), None),
+        ("suggest_batch", lambda: suggest_batch(totals, process_obj, tanks), None),
+        ("customer_forecast", lambda: customer_forecast(prediction), None),
+        ("score_forecasts", lambda: tracker.score(data_dict), unscored),
+        ("finished_processes", lambda: finished_processes(process_obj), None),
+        ("save_objects", lambda: save_objects(process_obj, tanks,
+                                              os.path.join(directory, STATE_FILE)), None),
+        # As load_objects does for the state file of the program.
+        ("load_objects", lambda: objects_from_records(read_state(os.path.join(state_dir,
+                                                                              STATE_FILE))),
+         None),
+        # Last, as they read the sales data from a copy they change.
+        ("compact_sales", lambda: compact_sales(COMPACT_RETENTION), fresh_copy),
+        ("parse_compacted", parse_data, compacted_copy),
+        ("write_data", lambda: write_data(added_file), fresh_copy),
+    ]
+    results = []
+    for benchmark, function, setup in benchmarks:
+        results.append(dict({"benchmark": benchmark, "scale": name, "rows": rows,
+                             "repeat": repeat}, **time_function(function, repeat, setup)))
+        LOGGER.info("%s at %s scale: %.2f ms", benchmark, name, results[-1]["median_ms"])
+    if ui:
+        use_sales_file(sales_file)
+        timer = refresh_page_timer(state_dir)
+        if timer is not None:
+            refresh, close = timer
+            results.append(dict({"benchmark": "refresh_page", "scale": name, "rows": rows,
+                                 "repeat": repeat}, **time_function(refresh, repeat)))
+            close()
+    return results
+
+
+def log_records(logger: logging.Logger, level: int):
+    """Logs LOG_RECORDS records at the given level."""
+    for number in range(LOG_RECORDS):
+        logger.log(level, "Record %d of %s", number, "the benchmark")
+
+
+def run_logging(repeat: int, directory: str) -> List[Dict]:
+    """
+    Times logging records through a queue, below the level and straight to a file.
+
+    The records go to a file in the directory rather than the log file of
+    the program. Only the time taken by the thread logging is counted, as
+    that is what the interface waits for.
+
+    :param repeat: The number of times to log the records.
+    :param directory: The directory to write the log files in.
+
+    :return: The results of each benchmark.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    queued_file = logging.FileHandler(os.path.join(directory, "queued.log"), encoding="utf-8")
+    queued_file.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, queued_file)
+    queued = logging.getLogger("benchmark.queued")
+    queued.addHandler(RecordQueueHandler(records))
+    direct_file = logging.FileHandler(os.path.join(directory, "direct.log"), encoding="utf-8")
+    direct_file.setFormatter(formatter)
+    direct = logging.getLogger("benchmark.direct")
+    direct.addHandler(direct_file)
+    for logger in [queued, direct]:
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    benchmarks = [("log_queued", lambda: log_records(queued, logging.INFO)),
+                  ("log_filtered", lambda: log_records(queued, logging.DEBUG)),
+                  ("log_direct", lambda: log_records(direct, logging.INFO))]
+    results = []
+    listener.start()
+    try:
+        for benchmark, function in benchmarks:
+            results.append(dict({"benchmark": benchmark, "scale": "logging",
+                                 "rows": LOG_RECORDS, "repeat": repeat},
+                                **time_function(function, repeat)))
+    finally:
+        listener.stop()
+        for logger in [queued, direct]:
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+        queued_file.close()
+        direct_file.close()
+    return results
+
+
+def export_forecast(prediction: Tuple, errors: Dict[str, float], output_format: str,
+                    file_name: str) -> int:
+    """Exports the forecast with intervals to the file, returning the records written."""
+    columns, rows = export_rows("forecast", prediction=prediction, errors=errors)
+    return export_file(rows, output_format, file_name, columns)
+
+
+def run_exports(repeat: int, directory: str) -> List[Dict]:
+    """
+    Times exporting a forecast of EXPORT_BEERS beers for EXPORT_DAYS days in each format.
+
+    Parquet is left out if pyarrow isn't installed.
+
+    :param repeat: The number of times to write each file.
+    :param directory: The directory to write the files in.
+
+    :return: The results of each benchmark, with the records written a second.
+    """
+    start = datetime(2020, 1, 1)
+    prediction = ([start + timedelta(days=day) for day in range(EXPORT_DAYS)],
+                  {"Recipe %d" % number: [float((number * day) % 97) for day in range(EXPORT_DAYS)]
+                   for number in range(EXPORT_BEERS)})
+    errors = {beer: 5.0 for beer in prediction[1]}
+    rows = EXPORT_BEERS * EXPORT_DAYS
+    results = []
+    for output_format in FORMATS:
+        write = partial(export_forecast, prediction, errors, output_format,
+                        os.path.join(directory, "forecast" + EXTENSIONS[output_format]))
+        try:
+            write()
+        except ValueError as error:
+            LOGGER.warning("Not timing export_%s: %s", output_format, error)
+            continue
+        timing = time_function(write, repeat)
+        results.append(dict({"benchmark": "export_" + output_format, "scale": "export",
+                             "rows": rows, "repeat": repeat,
+                             "rows_per_s": rows / (timing["median_ms"] / 1000)}, **timing))
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """Returns the commit the program is at, or None if it isn't in a git repository."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, check=True,
+                              text=True, cwd=D_NAME).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales: List[str], repeat: int = 3, ui: bool = True) -> Dict:
+    """
+    Times every function at each of the given scales, and the cost of logging.
+
+    The sales data is read from the csv file of the program again afterwards.
+
+    :param scales: The names of the scales in SCALES.
+    :param repeat: The number of times to run each function.
+    :param ui: Whether to time refresh_page.
+
+    :return: The results, with the commit, the machine and the specs of the scales.
+    """
+    sales_file = read_file.SALES_FILE
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            for name in scales:
+                results += run_scale(name, SCALES[name], repeat, directory, ui)
+            results += run_logging(repeat, directory)
+            results += run_exports(repeat, directory)
+        finally:
+            use_sales_file(sales_file)
+    return {"commit": git_commit(), "time": datetime.now(), "python": platform.python_version(),
+            "machine": platform.platform(),
+            "scales": {name: SCALES[name]._asdict() for name in scales}, "results": results}
+
+
+def compare(old: Dict, new: Dict) -> List[Dict]:
+    """
+    Compares the median times of the benchmarks in both results.
+
+    :param old: The results to compare with.
+    :param new: The new results.
+
+    :return: The old and new median and their ratio for each benchmark in both.
+    """
+    old_times = {(result["benchmark"], result["scale"]): result["median_ms"]
+                 for result in old["results"]}
+    return [{"benchmark": result["benchmark"], "scale": result["scale"],
+             "old_ms": old_times[(result["benchmark"], result["scale"])],
+             "new_ms": result["median_ms"],
+             "ratio": result["median_ms"] / max(old_times[(result["benchmark"],
+                                                           result["scale"])], 1e-6)}
+            for result in new["results"] if (result["benchmark"], result["scale"]) in old_times]
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Runs the benchmarks from the command line.
+
+    :param argv: The command line arguments. Defaults to sys.argv.
+
+    :return: The exit code, 1 if a benchmark is slower than --fail-above allows.
+    """
+    parser = argparse.ArgumentParser(description="Times BrewHouse on made up data.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"],
+                        help="the sizes of data to time (default: small medium)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each function")
+    parser.add_argument("--output", default="benchmark.json", help="json file for the results")
+    parser.add_argument("--no-ui", dest="ui", action="store_false",
+                        help="don't time refresh_page")
+    parser.add_argument("--compare", help="json file of earlier results to compare with")
+    parser.add_argument("--fail-above", type=float,
+                        help="exit with 1 if a median is more than this many times the old one")
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.scales, args.repeat, args.ui)
+    with open(os.path.join(START_DIR, args.output), "w", encoding="utf-8") as file:
+        json.dump(results, file, default=to_json, indent=1)
+    for result in results["results"]:
+        print("%-20s %-7s %10.2f ms" % (result["benchmark"], result["scale"],
+                                        result["median_ms"]))
+    if args.compare is None:
+        return 0
+    with open(os.path.join(START_DIR, args.compare), encoding="utf-8") as file:
+        comparison = compare(json.load(file), results)
+    print()
+    for row in comparison:
+        print("%-20s %-7s %10.2f -> %10.2f ms  x%.2f"
+              % (row["benchmark"], row["scale"], row["old_ms"], row["new_ms"], row["ratio"]))
+    if args.fail_above is not None and any(row["ratio"] > args.fail_above for row in comparison):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
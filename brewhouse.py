@@ -0,0 +1,584 @@
+"""
+This module is the command line interface, for jobs such as nightly imports.
+
+It doesn't import PyQt5, pyqtgraph or matplotlib, so it starts quickly.
+Each command writes its result as JSON or CSV records.
+
+Usage:
+    python -m brewhouse ingest new_sales.csv
+    python -m brewhouse ingest --orders orders.csv
+    python -m brewhouse forecast --start 2020-03-02 --days 7 --format csv
+    python -m brewhouse totals --days 42
+    python -m brewhouse customers --start 2020-03-02 --days 42 --top 10
+    python -m brewhouse suggest
+    python -m brewhouse plan --days 182 --format csv
+    python -m brewhouse accuracy
+    python -m brewhouse advance --auto-tank
+    python -m brewhouse export orders --format csv --output orders.csv
+    python -m brewhouse export forecast --intervals --output forecast.parquet
+    python -m brewhouse watch --follow
+    python -m brewhouse profile --repeat 5
+    python -m brewhouse sweep --lead-days 56 70 84 --top 10 --format csv
+    python -m brewhouse compact --daily-years 3 --weekly-years 5
+    python -m brewhouse ingest new_sales.csv --metrics brewhouse.prom
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+from datetime import datetime
+from typing import List, Any, Optional, IO
+from log_setup import get_logger
+
+# The modules below change to the program's directory, so the paths given are resolved from here.
+START_DIR = os.getcwd()
+
+# pylint: disable=wrong-import-position
+from read_file import write_data, parse_data
+from sales_predictions import plot_growth_percent, plot_next_year, get_total
+from forecast_cache import FORECASTS
+from forecast_accuracy import ACCURACY
+from inventory_management import batches_in_production, finished_processes, get_next_tanks, \
+    import_orders, save_objects, objects_from_records
+from suggestions import SuggestionPolicy, beer_suggestion, current_datetime
+from simulation import tank_specs
+from policy_sweep import GRID, REPLAY_DAYS, WARMUP_DAYS, policy_grid, sweep
+from projection import project_inventory
+from planner import plan_production
+from retention import DEFAULT_RETENTION, RetentionPolicy, compact_sales
+from customer_demand import METHODS, cached_customer_forecast, customer_totals
+from sites import SITES, MAIN_SITE, Site, Records
+from state_store import STATE_FILE, read_state, to_json
+from exports import EXPORTS, FORMATS, export_rows, export_file, format_of, interval_errors, \
+    write_rows
+from inbox import INBOX_DIR, InboxWatcher
+from instrumentation import METRICS
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("brewhouse")
+
+
+class CommandError(Exception):
+    """Raised when a command can't be carried out, with the message to show."""
+
+
+def user_path(path: str) -> str:
+    """Returns the path given on the command line, relative to where the command was run."""
+    return os.path.join(START_DIR, path)
+
+
+def parse_date(text: str) -> datetime:
+    """Parses a YYYY-MM-DD date from the command line."""
+    try:
+        return datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError("dates are given as YYYY-MM-DD") from None
+
+
+def write_records(records: Records, output_format: str, file: IO):
+    """
+    Writes the records as a json array, or in another of the FORMATS of exports.
+
+    :param records: The records to write.
+    :param output_format: One of FORMATS.
+    :param file: The file to write to, opened for bytes for Parquet.
+    """
+    if output_format == "json":
+        json.dump(records, file, default=to_json, indent=1)
+        file.write("\n")
+        return
+    write_rows(records, output_format, file)
+
+
+def standard_output(output_format: str) -> IO:
+    """Returns standard output, for bytes for Parquet."""
+    return sys.stdout.buffer if output_format == "parquet" else sys.stdout
+
+
+def save_site(site: Site):
+    """Saves the state of the site after a command changed it."""
+    result = save_objects(site.process, site.tanks, site.state_file)
+    if result != "success":
+        raise CommandError("Failed to save " + site.name + ": " + str(result))
+
+
+def ingest(args: argparse.Namespace, site: Site) -> Records:
+    """Adds each csv file to the sales data, or to the orders of the site with --orders."""
+    records = []
+    for file_name in args.files:
+        path = user_path(file_name)
+        if args.orders:
+            try:
+                result = import_orders(path, site.process)
+            except (OSError, KeyError, ValueError) as error:
+                result = "failed: " + str(error)
+        else:
+            result = write_data(path)
+        records.append({"file": file_name, "result": result})
+    if args.orders and any(isinstance(record["result"], int) for record in records):
+        save_site(site)
+    if not args.orders and any(record["result"] == "success" for record in records):
+        # The new sales are scored against the forecasts made before them.
+        FORECASTS.forecast()
+    failed = [record for record in records
+              if not isinstance(record["result"], int) and record["result"] != "success"]
+    if failed:
+        LOGGER.error("%d files failed to be added", len(failed))
+        args.exit_code = 1
+    return records
+
+
+def forecast(args: argparse.Namespace, _site: Site) -> Records:
+    """Returns the forecast sales of each beer for each day, from the model chosen for it."""
+    if args.start is None:
+        dates, data = FORECASTS.forecast()
+        if dates:
+            dates = dates[:args.days]
+    else:
+        dates, data = FORECASTS.window(args.start, args.days)
+    if not dates:
+        raise CommandError("The dates asked for are not in the forecast")
+    return [dict({"date": day.date()}, **{beer: sales[index] for beer, sales in data.items()})
+            for index, day in enumerate(dates)]
+
+
+def totals(args: argparse.Namespace, _site: Site) -> Records:
+    """Returns the total forecast sales of each beer over the given days."""
+    start = current_datetime() if args.start is None else args.start
+    total = get_total(start, args.days, FORECASTS.forecast())
+    if total is None:
+        raise CommandError("The dates asked for are not in the forecast")
+    return [{"beer": beer, "start": start.date(), "days": args.days, "bottles": bottles}
+            for beer, bottles in total.items()]
+
+
+def customers(args: argparse.Namespace, _site: Site) -> Records:
+    """
+    Returns the total forecast sales of each beer to each customer over the given days.
+
+    The customers of each beer are given from the largest, and add up to
+    the totals of the beer unless --adjust-totals is given.
+    """
+    start = current_datetime() if args.start is None else args.start
+    total = customer_totals(cached_customer_forecast(args.method, not args.adjust_totals), start,
+                            args.days)
+    if total is None:
+        raise CommandError("The dates asked for are not in the forecast")
+    records = []
+    for beer, sales in total.items():
+        if args.beer is not None and beer != args.beer:
+            continue
+        beer_total = sum(sales.values())
+        ranked = sorted(sales.items(), key=lambda item: -item[1])
+        for customer, bottles in ranked[:args.top or None]:
+            records.append({"beer": beer, "customer": customer, "start": start.date(),
+                            "days": args.days, "bottles": bottles,
+                            "share": bottles / beer_total if beer_total else 0.0})
+    return records
+
+
+def accuracy(args: argparse.Namespace, _site: Site) -> Records:
+    """
+    Returns the recent errors of each forecasting model for each beer.
+
+    The sales so far are scored first, and the model chosen for each beer is marked as selected.
+    """
+    FORECASTS.forecast()
+    return [record for record in ACCURACY.records()
+            if args.beer is None or record["beer"] == args.beer]
+
+
+def suggest(_args: argparse.Namespace, site: Site) -> Records:
+    """
+    Returns what should be done at the site.
+
+    These are the batch to start brewing, the batches to move to their
+    next step and the date each beer is projected to run out.
+    """
+    prediction = FORECASTS.forecast()
+    process_obj = site.process
+    records = []
+    with process_obj.lock:
+        beer, volume = beer_suggestion(prediction, process_obj, site.tanks)
+        if beer is not None:
+            records.append({"action": "start", "beer": beer, "volume": volume})
+        for batch in finished_processes(process_obj):
+            records.append({"action": "advance", "beer": batch.beer, "volume": batch.volume,
+                            "batch": batch.batch_id,
+                            "stage": process_obj.step_names[batch.current_step],
+                            "needs_tank": batch.next_step in [2, 3]})
+        projection = project_inventory(prediction, process_obj)
+    for beer, stockout in projection.first_stockout.items():
+        if stockout is not None:
+            records.append({"action": "stockout", "beer": beer, "date": stockout.date()})
+    return records
+
+
+def plan(args: argparse.Namespace, site: Site) -> Records:
+    """
+    Returns the batches to brew at the site over the horizon, the earliest first.
+
+    The batches already in production and waiting to be brewed are planned
+    around, and those waiting to be brewed are given as queued.
+    """
+    prediction = FORECASTS.forecast()
+    start = current_datetime() if args.start is None else args.start
+    if not prediction[0] or not prediction[0][0] <= start <= prediction[0][-1]:
+        raise CommandError("The dates asked for are not in the forecast")
+    with site.process.lock:
+        result = plan_production(prediction, site.process, site.tanks, start, args.days,
+                                 args.cover_days, args.brewhouses, args.time_budget)
+    LOGGER.info("Planned %d batches, %.0f bottles short", len(result.batches), result.shortage)
+    return [dict(batch._asdict(), start=batch.start.date(), ready=batch.ready.date())
+            for batch in result.batches]
+
+
+def advance(args: argparse.Namespace, site: Site) -> Records:
+    """
+    Moves batches to their next step and saves the site.
+
+    Without --batch, every batch that has finished its stage is moved.
+    Batches whose next step needs a tank are only moved with --auto-tank,
+    which puts them in the first free tank, or with --batch and --tank.
+    The tank given with --tank must be one get_next_tanks offers the batch.
+    """
+    process_obj = site.process
+    tanks_by_name = {tank.name: tank for tank in site.tanks}
+    if args.tank is not None and args.batch is None:
+        raise CommandError("--tank can only be given with --batch")
+    if args.tank is not None and args.tank not in tanks_by_name:
+        raise CommandError("There is no tank " + args.tank)
+    records = []
+    with process_obj.lock:
+        if args.batch is None:
+            batches = finished_processes(process_obj)
+        else:
+            batches = [batch for batch in batches_in_production(process_obj)
+                       if batch.batch_id == args.batch]
+            if not batches:
+                raise CommandError("There is no batch " + args.batch + " in production")
+        for batch in batches:
+            tank = None
+            if batch.next_step in [2, 3]:
+                if args.tank is not None:
+                    tank = next((tank for tank in get_next_tanks(batch, site.tanks) or []
+                                 if tank.name == args.tank), None)
+                    if tank is None:
+                        raise CommandError("Tank " + args.tank + " can't take batch "
+                                           + batch.batch_id + ": it is in use, too small or "
+                                           "not for the next stage")
+                elif args.auto_tank:
+                    free = get_next_tanks(batch, site.tanks)
+                    tank = free[0] if free else None
+                if tank is None:
+                    LOGGER.info("Not moving %s as it needs a tank", batch.batch_id)
+                    continue
+            record = {"batch": batch.batch_id, "beer": batch.beer,
+                      "from": process_obj.step_names[batch.current_step],
+                      "tank": None if tank is None else tank.name}
+            if not args.dry_run:
+                batch.go_next_step(process_obj, tank)
+                record["to"] = process_obj.step_names[batch.current_step]
+            records.append(record)
+    if records and not args.dry_run:
+        save_site(site)
+    return records
+
+
+def export(args: argparse.Namespace, site: Site) -> None:
+    """
+    Writes the forecast, window totals, batches, tanks, orders or bottled stock of the site.
+
+    The records are written as they are made rather than returned, so a
+    long forecast of many beers is never held at once.
+    """
+    prediction = FORECASTS.forecast() if args.what in ["forecast", "totals"] else None
+    errors = interval_errors(SITES.accuracy()) if args.intervals else None
+    columns, rows = export_rows(args.what, site, prediction, args.days, errors)
+    try:
+        if args.output is None:
+            write_rows(rows, args.output_format, standard_output(args.output_format), columns)
+        else:
+            export_file(rows, args.output_format, user_path(args.output), columns)
+    except ValueError as error:
+        raise CommandError(str(error)) from None
+
+
+def watch(args: argparse.Namespace, _site: Site) -> Optional[Records]:
+    """
+    Adds the csv files of sales data in the inbox not added before.
+
+    With --follow, the inbox is watched until interrupted and each file
+    added is written straight away as a line of JSON, so nothing is
+    returned to write at the end.
+    """
+    directory = INBOX_DIR if args.inbox is None else user_path(args.inbox)
+    if not args.follow:
+        records = [result._asdict() for result in InboxWatcher(directory).poll(False)]
+        if any(record["result"] != "success" for record in records):
+            args.exit_code = 1
+        return records
+
+    def print_result(result: Any):
+        print(json.dumps(result._asdict()), flush=True)
+
+    watcher = InboxWatcher(directory, args.interval, on_ingested=print_result)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        LOGGER.info("Stopped watching %s", directory)
+    return None
+
+
+def profile(args: argparse.Namespace, site: Site) -> Records:
+    """
+    Times the main operations on the site and returns the percentiles of each.
+
+    The sales data is read, the forecast, totals and suggestion are made,
+    and the state is saved to a temporary file and loaded again, each the
+    given number of times.
+    """
+    METRICS.enable()
+    METRICS.reset()
+    with tempfile.TemporaryDirectory() as directory:
+        state_file = os.path.join(directory, STATE_FILE)
+        for _ in range(args.repeat):
+            parse_data()
+            plot_growth_percent(plot=False)
+            prediction = plot_next_year()
+            if prediction[0]:
+                get_total(prediction[0][0], 42, prediction)
+            beer_suggestion(prediction, site.process, site.tanks)
+            save_objects(site.process, site.tanks, state_file)
+            with METRICS.timed("state.load"):
+                objects_from_records(read_state(state_file))
+    return METRICS.records()
+
+
+def policy_sweep(args: argparse.Namespace, site: Site) -> Records:
+    """
+    Tries every combination of the settings of the suggestion policy against past sales.
+
+    The brewery has the tanks of the site. The best policies are given first.
+    """
+    policies = policy_grid({name: getattr(args, name) for name in GRID})
+    with site.process.lock:
+        tanks = tank_specs(site.tanks)
+    try:
+        results = sweep(policies, tanks, args.days, args.warmup, args.workers)
+    except ValueError as error:
+        raise CommandError(str(error)) from None
+    return results[:args.top or None]
+
+
+def compact(args: argparse.Namespace, _site: Site) -> Records:
+    """Moves the sales older than the retention policy keeps into weekly and monthly totals."""
+    try:
+        return [compact_sales(RetentionPolicy(args.daily_years, args.weekly_years))]
+    except (OSError, ValueError) as error:
+        raise CommandError(str(error)) from None
+
+
+def add_common_options(parser: argparse.ArgumentParser, defaults: bool):
+    """
+    Adds the options every command takes.
+
+    :param parser: The parser to add them to.
+    :param defaults:
+    Whether to give the defaults. The options are added to the main parser
+    with defaults and to each command without, so they can be given before
+    or after the command.
+    """
+    def default(value: Any) -> Any:
+        return value if defaults else argparse.SUPPRESS
+
+    parser.add_argument("--site", default=default(MAIN_SITE),
+                        help="the site to use (default: " + MAIN_SITE + ")")
+    parser.add_argument("--format", dest="output_format", choices=FORMATS,
+                        default=default(None),
+                        help="how to write the result (default: from the extension of the "
+                             "output, or json)")
+    parser.add_argument("--output", default=default(None),
+                        help="file to write the result to instead of standard output")
+    parser.add_argument("--metrics", default=default(None),
+                        help="file to write how long each operation took to, in the "
+                             "Prometheus text format")
+
+
+def make_parser() -> argparse.ArgumentParser:
+    """Makes the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(prog="brewhouse",
+                                     description="Runs BrewHouse jobs without the user interface.")
+    add_common_options(parser, True)
+    common = argparse.ArgumentParser(add_help=False)
+    add_common_options(common, False)
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    command = commands.add_parser("ingest", parents=[common],
+                                  help="add csv files of sales data or orders")
+    command.add_argument("files", nargs="+")
+    command.add_argument("--orders", action="store_true",
+                         help="the files are orders to add to the site")
+    command.set_defaults(function=ingest)
+
+    command = commands.add_parser("forecast", parents=[common],
+                                  help="forecast the sales of each beer for each day")
+    command.add_argument("--start", type=parse_date, help="first date, YYYY-MM-DD")
+    command.add_argument("--days", type=int, default=365, help="number of days")
+    command.set_defaults(function=forecast)
+
+    command = commands.add_parser("totals", parents=[common],
+                                  help="total forecast sales of each beer")
+    command.add_argument("--start", type=parse_date, help="first date, YYYY-MM-DD (default: today)")
+    command.add_argument("--days", type=int, default=42, help="number of days (default: 42)")
+    command.set_defaults(function=totals)
+
+    command = commands.add_parser("customers", parents=[common],
+                                  help="total forecast sales of each beer to each customer")
+    command.add_argument("--start", type=parse_date, help="first date, YYYY-MM-DD (default: today)")
+    command.add_argument("--days", type=int, default=42, help="number of days (default: 42)")
+    command.add_argument("--beer", help="only give the customers of this beer")
+    command.add_argument("--top", type=int, default=20,
+                         help="customers of each beer to give, 0 for all (default: 20)")
+    command.add_argument("--method", choices=METHODS, default="mint",
+                         help="how the customers are made to add up to the beer (default: mint)")
+    command.add_argument("--adjust-totals", action="store_true",
+                         help="with mint, move the totals of each beer towards its customers")
+    command.set_defaults(function=customers)
+
+    command = commands.add_parser("accuracy", parents=[common],
+                                  help="recent errors of each forecasting model for each beer")
+    command.add_argument("--beer", help="only give the models of this beer")
+    command.set_defaults(function=accuracy)
+
+    command = commands.add_parser("suggest", parents=[common],
+                                  help="what to brew, advance and watch out for")
+    command.set_defaults(function=suggest)
+
+    command = commands.add_parser("plan", parents=[common],
+                                  help="plan the batches to brew to meet the forecast")
+    command.add_argument("--start", type=parse_date, help="first date, YYYY-MM-DD (default: today)")
+    command.add_argument("--days", type=int, default=365, help="number of days (default: 365)")
+    command.add_argument("--cover-days", type=int, default=42,
+                         help="days of demand each batch should cover (default: 42)")
+    command.add_argument("--brewhouses", type=int, default=1,
+                         help="batches that can be brewed at once (default: 1)")
+    command.add_argument("--time-budget", type=float, default=0.5,
+                         help="seconds to spend improving the plan (default: 0.5)")
+    command.set_defaults(function=plan)
+
+    command = commands.add_parser("advance", parents=[common],
+                                  help="move batches to their next step")
+    command.add_argument("--batch", help="id of the batch to move. Defaults to every batch "
+                                         "that has finished its stage")
+    command.add_argument("--tank", help="name of the tank to move the batch to")
+    command.add_argument("--auto-tank", action="store_true",
+                         help="move batches needing a tank to the first free one")
+    command.add_argument("--dry-run", action="store_true", help="only list what would be moved")
+    command.set_defaults(function=advance)
+
+    command = commands.add_parser("export", parents=[common],
+                                  help="write the forecast or the current state of the site")
+    command.add_argument("what", choices=EXPORTS)
+    command.add_argument("--days", type=int, default=42,
+                         help="days in each window of the totals (default: 42)")
+    command.add_argument("--intervals", action="store_true",
+                         help="give each day of the forecast a 90%% interval from recent errors")
+    command.set_defaults(function=export)
+
+    command = commands.add_parser("watch", parents=[common],
+                                  help="add the csv files of sales data dropped into the inbox")
+    command.add_argument("--inbox", help="the directory to add the files in "
+                                         "(default: " + INBOX_DIR + " in the program's directory)")
+    command.add_argument("--follow", action="store_true",
+                         help="keep watching the inbox, writing each file added as a json line")
+    command.add_argument("--interval", type=float, default=2.0,
+                         help="seconds between checks with --follow (default: 2)")
+    command.set_defaults(function=watch)
+
+    command = commands.add_parser("profile", parents=[common],
+                                  help="time the main operations and give their percentiles")
+    command.add_argument("--repeat", type=int, default=5,
+                         help="times to run each operation (default: 5)")
+    command.set_defaults(function=profile)
+
+    command = commands.add_parser("sweep", parents=[common],
+                                  help="try settings of the suggestion policy on past sales")
+    for name, values in GRID.items():
+        command.add_argument("--" + name.replace("_", "-"), dest=name, nargs="+",
+                             type=type(getattr(SuggestionPolicy(), name)), default=values,
+                             help="values to try (default: %s)"
+                                  % " ".join(str(value) for value in values))
+    command.add_argument("--days", type=int, default=REPLAY_DAYS,
+                         help="last days of sales to replay (default: %d)" % REPLAY_DAYS)
+    command.add_argument("--warmup", type=int, default=WARMUP_DAYS,
+                         help="days before them to fill the brewery (default: %d)" % WARMUP_DAYS)
+    command.add_argument("--workers", type=int, help="processes (default: one per processor)")
+    command.add_argument("--top", type=int, default=20,
+                         help="policies to give, the best first, 0 for all (default: 20)")
+    command.set_defaults(function=policy_sweep)
+
+    command = commands.add_parser("compact", parents=[common],
+                                  help="move old sales into weekly and monthly totals")
+    command.add_argument("--daily-years", type=float, default=DEFAULT_RETENTION.daily_years,
+                         help="years of sales kept by day (default: %g)"
+                              % DEFAULT_RETENTION.daily_years)
+    command.add_argument("--weekly-years", type=float, default=DEFAULT_RETENTION.weekly_years,
+                         help="years of sales kept by week, the rest by month (default: %g)"
+                              % DEFAULT_RETENTION.weekly_years)
+    command.set_defaults(function=compact)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs the command given on the command line.
+
+    :param argv: The command line arguments. Defaults to sys.argv.
+
+    :return: The exit code.
+    """
+    args = make_parser().parse_args(argv)
+    args.exit_code = 0
+    if args.output_format is None:
+        args.output_format = "json" if args.output is None else format_of(args.output, "json")
+    LOGGER.info("Running command %s", args.command)
+    if args.metrics is not None:
+        METRICS.enable()
+    try:
+        site = SITES.get(args.site)
+    except KeyError:
+        print("brewhouse: there is no site called " + args.site, file=sys.stderr)
+        return 2
+    try:
+        records = args.function(args, site)
+    except CommandError as error:
+        LOGGER.error("Command %s failed: %s", args.command, error)
+        print("brewhouse: " + str(error), file=sys.stderr)
+        return 1
+    finally:
+        if args.metrics is not None:
+            METRICS.write_prometheus(user_path(args.metrics))
+    if records is None:
+        return args.exit_code
+    try:
+        if args.output is None:
+            write_records(records, args.output_format, standard_output(args.output_format))
+        elif args.output_format == "parquet":
+            export_file(records, args.output_format, user_path(args.output))
+        else:
+            with open(user_path(args.output), "w", newline="", encoding="utf-8") as file:
+                write_records(records, args.output_format, file)
+    except ValueError as error:
+        print("brewhouse: " + str(error), file=sys.stderr)
+        return 1
+    return args.exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
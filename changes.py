@@ -0,0 +1,104 @@
+"""
+This module keeps track of which kinds of state have changed.
+
+Each change to a Process object notes the kinds of state it changed,
+such as the batches or the orders, in its ChangeTracker. The interface
+takes the kinds changed since it last updated and runs only the
+functions in Dependents subscribed to them, so only what depends on the
+change is updated. How long each function took is logged and recorded
+in METRICS as "ui." and its name.
+
+:attribute BATCH_MOVED: A batch was added or moved to another stage.
+:attribute TANK_CHANGED: A tank was filled or emptied.
+:attribute STOCK_CHANGED: The bottled stock changed.
+:attribute ORDER_CHANGED: An order was added or delivered.
+:attribute SALES_CHANGED: The sales data changed.
+:attribute EVERYTHING: Every kind of change.
+"""
+import os
+import threading
+from time import perf_counter
+from typing import Set, Dict, Callable, Iterable
+import logging
+from log_setup import get_logger
+from instrumentation import METRICS
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("changes")
+
+BATCH_MOVED = "batches"
+TANK_CHANGED = "tanks"
+STOCK_CHANGED = "stock"
+ORDER_CHANGED = "orders"
+SALES_CHANGED = "sales"
+EVERYTHING = frozenset([BATCH_MOVED, TANK_CHANGED, STOCK_CHANGED, ORDER_CHANGED,
+                        SALES_CHANGED])
+
+
+class ChangeTracker:
+    """This class collects the kinds of state changed since they were last taken."""
+    def __init__(self):
+        """Initialising with nothing changed."""
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def notify(self, kinds: Iterable[str]):
+        """Notes that the given kinds of state have changed."""
+        with self.lock:
+            self.pending.update(kinds)
+
+    def take(self) -> Set[str]:
+        """Returns the kinds of state changed since the last call and forgets them."""
+        with self.lock:
+            taken, self.pending = self.pending, set()
+        return taken
+
+
+class Dependents:
+    """This class runs the functions that depend on each kind of state when it changes."""
+    def __init__(self):
+        """Initialising with no functions subscribed."""
+        self.subscribers = []
+        self.last_timings = {}
+
+    def subscribe(self, name: str, kinds: Iterable[str], function: Callable[[], None]):
+        """
+        Runs the function whenever one of the kinds of state changes.
+
+        Functions are run in the order they were subscribed.
+
+        :param name: Name of the function in the timing log.
+        :param kinds: The kinds of state the function depends on.
+        :param function: The function to run.
+        """
+        self.subscribers.append((name, frozenset(kinds), function))
+
+    def run(self, kinds: Iterable[str]) -> Dict[str, float]:
+        """
+        Runs every function depending on any of the kinds of state and logs how long each took.
+
+        :param kinds: The kinds of state that changed.
+
+        :return: The milliseconds each function that was run took.
+        """
+        kinds = frozenset(kinds)
+        timings = {}
+        if not kinds:
+            return timings
+        start = perf_counter()
+        for name, depends_on, function in self.subscribers:
+            if depends_on & kinds:
+                began = perf_counter()
+                function()
+                took = perf_counter() - began
+                timings[name] = took * 1000
+                METRICS.observe("ui." + name, took)
+        total = (perf_counter() - start) * 1000
+        if LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info("Updated for %s in %.1f ms: %s", ", ".join(sorted(kinds)), total,
+                        ", ".join("%s %.1f ms" % timing for timing in timings.items()))
+        self.last_timings = timings
+        return timings
@@ -0,0 +1,301 @@
+"""
+This module forecasts the sales of each beer to each customer.
+
+The forecast is made from the sparse index of the sales of each customer
+kept by read_file. For each beer, the sales of every customer over the
+last two years are put in an array with a row for each day and a
+column for each customer, and every customer is forecast at once:
+
+* The sales of a customer on a day are forecast as their sales on the
+  same weekday a year before, averaged over SMOOTHING_DAYS days, as
+  large accounts order every few weeks rather than every day.
+* This is multiplied by the trend of the customer, the ratio of their
+  sales over the last TREND_DAYS days to the same days a year before,
+  up to TREND_LIMIT.
+* Customers who first bought in the last year are forecast to keep
+  buying at their average rate since then.
+
+The forecasts of the customers don't add up to the forecast of the beer
+from plot_next_year, so they are reconciled. With "mint", the gap on
+each day is shared between the customers in proportion to the variance
+of their daily sales, which is the minimum trace (MinT) reconciliation
+with a diagonal covariance. By default the forecast of the beer is kept
+as it is, so the customers add up to the totals beer_suggestion uses.
+With "bottom_up", the customers are left as they are and the totals are
+their sums.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Dict, NamedTuple, Optional
+import numpy as np
+from log_setup import get_logger
+import read_file
+from read_file import CustomerSales
+from forecast_cache import FORECASTS, MODEL, Forecast, ForecastCache
+from instrumentation import instrumented
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("customer_demand")
+
+METHODS = ["mint", "bottom_up"]
+# Days between a day and the same weekday a year before.
+YEAR_DAYS = 364
+SMOOTHING_DAYS = 28
+TREND_DAYS = 91
+TREND_LIMIT = 2.0
+# The days of sales read for each customer, enough for the trend and the forecast of a year.
+HISTORY_DAYS = 2 * YEAR_DAYS + SMOOTHING_DAYS // 2
+# Given to customers whose sales don't vary, so they take almost none of the gap.
+MINIMUM_VARIANCE = 1e-9
+# The type of the forecasts, as there is one for every customer on every day.
+DTYPE = np.float32
+
+
+class CustomerForecast(NamedTuple):
+    """
+    The forecast sales of each beer to each customer.
+
+    :attribute dates: The dates forecast, as in the forecast of the beers.
+    :attribute customers: The customers of each beer, one for each column of its sales.
+    :attribute sales:
+    The sales of each beer, with a row for each day and a column for each customer.
+    :attribute totals:
+    The forecast of each beer, as from plot_next_year, which the columns of
+    its customers add up to.
+    """
+    dates: List[datetime]
+    customers: Dict[str, List[str]]
+    sales: Dict[str, np.ndarray]
+    totals: Forecast
+
+
+class CustomerHistory(NamedTuple):
+    """
+    The sales of one beer to each customer over the last HISTORY_DAYS days, without the zeros.
+
+    :attribute numbers: The number of each customer in the customer list of read_file.
+    :attribute days: The day of each sale, 0 being the first day.
+    :attribute columns: The customer of each sale, its index in numbers.
+    :attribute sales: The sales of the customer on the day, summed over the rows of the csv file.
+    """
+    numbers: np.ndarray
+    days: np.ndarray
+    columns: np.ndarray
+    sales: np.ndarray
+
+    def sums(self, first: int, last: int) -> np.ndarray:
+        """Returns the sales of each customer from the first day up to the last, not included."""
+        inside = (self.days >= first) & (self.days < last)
+        return np.bincount(self.columns[inside], weights=self.sales[inside],
+                           minlength=len(self.numbers))
+
+    def variances(self) -> np.ndarray:
+        """Returns the variance of the daily sales of each customer over the last year."""
+        inside = self.days >= HISTORY_DAYS - YEAR_DAYS
+        columns, sales = self.columns[inside], self.sales[inside]
+        mean = np.bincount(columns, weights=sales, minlength=len(self.numbers)) / YEAR_DAYS
+        return np.bincount(columns, weights=sales ** 2, minlength=len(self.numbers)) / YEAR_DAYS \
+            - mean ** 2
+
+    def total_variance(self) -> float:
+        """Returns the variance of the daily sales of the beer over the last year."""
+        inside = self.days >= HISTORY_DAYS - YEAR_DAYS
+        return np.bincount(self.days[inside] - (HISTORY_DAYS - YEAR_DAYS),
+                           weights=self.sales[inside], minlength=YEAR_DAYS).var()
+
+
+def customer_history(rows: CustomerSales, first_day: int) -> CustomerHistory:
+    """
+    Takes the sales of one beer from the first day from the sparse index.
+
+    :param rows: The sales of the beer from the sparse index.
+    :param first_day: The ordinal of the first day of the HISTORY_DAYS days.
+
+    :return: The sales of each customer on each day they bought the beer.
+    """
+    customers = np.frombuffer(rows.customers, dtype=rows.customers.typecode)
+    days = np.frombuffer(rows.days, dtype=rows.days.typecode) - first_day
+    quantities = np.frombuffer(rows.quantities, dtype=rows.quantities.typecode)
+    inside = (days >= 0) & (days < HISTORY_DAYS)
+    numbers, columns = np.unique(customers[inside], return_inverse=True)
+    # Rows of the same customer on the same day are summed.
+    cells, cell = np.unique(days[inside] * len(numbers) + columns, return_inverse=True)
+    days, columns = np.divmod(cells, max(len(numbers), 1))
+    return CustomerHistory(numbers, days, columns,
+                           np.bincount(cell, weights=quantities[inside], minlength=len(cells)))
+
+
+def base_forecast(history: CustomerHistory, ahead: np.ndarray) -> np.ndarray:
+    """
+    Forecasts every customer from their sales, before reconciliation.
+
+    Each sale is added to the forecast of every day whose moving average
+    it is in, so the time taken grows with the number of sales rather
+    than the number of customers times the number of days.
+
+    :param history: The sales of each customer.
+    :param ahead: The number of days after the last day of data of each day to forecast.
+
+    :return: The forecast, with a row for each day and a column for each customer.
+    """
+    # The same weekday in the last year of data, or the year before for days further ahead.
+    years = np.ceil(np.maximum(ahead, 1) / YEAR_DAYS).astype(int)
+    source = np.clip(HISTORY_DAYS - 1 + ahead - YEAR_DAYS * years, 0, HISTORY_DAYS - 1)
+    # The days of the moving average around each of those days, fewer at the ends.
+    low = np.maximum(source - SMOOTHING_DAYS // 2, 0)
+    high = np.minimum(source + SMOOTHING_DAYS - SMOOTHING_DAYS // 2, HISTORY_DAYS)
+    lengths = high - low
+    # Each day of history paired with the days forecast from it, in order of the day of history.
+    window_day = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - low, lengths)
+    order = np.argsort(window_day, kind="stable")
+    forecast_day = np.repeat(np.arange(len(ahead)), lengths)[order]
+    pairs = np.bincount(window_day, minlength=HISTORY_DAYS)
+    first_pair = np.cumsum(pairs) - pairs
+    # Each sale repeated for every day forecast from its day.
+    repeats = pairs[history.days]
+    sale = np.repeat(np.arange(len(history.days)), repeats)
+    pair = first_pair[history.days][sale] + np.arange(repeats.sum()) \
+        - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    customers = len(history.numbers)
+    forecast = np.bincount(forecast_day[pair] * customers + history.columns[sale],
+                           weights=history.sales[sale], minlength=len(ahead) * customers)
+    forecast = forecast.reshape(len(ahead), customers).astype(DTYPE)
+    forecast /= lengths[:, None].astype(DTYPE)
+    recent = history.sums(HISTORY_DAYS - TREND_DAYS, HISTORY_DAYS)
+    year_before = history.sums(HISTORY_DAYS - TREND_DAYS - YEAR_DAYS, HISTORY_DAYS - YEAR_DAYS)
+    forecast *= np.minimum((recent + 1) / (year_before + 1), TREND_LIMIT).astype(DTYPE)
+    # Customers without sales before the last year keep their rate since their first sale.
+    new = history.sums(0, HISTORY_DAYS - YEAR_DAYS) == 0
+    if new.any():
+        first = np.full(customers, HISTORY_DAYS)
+        np.minimum.at(first, history.columns, history.days)
+        forecast[:, new] = history.sums(0, HISTORY_DAYS)[new] / (HISTORY_DAYS - first[new])
+    return forecast
+
+
+def reconcile(totals: np.ndarray, base: np.ndarray, variances: np.ndarray,
+              total_variance: float = 0.0) -> np.ndarray:
+    """
+    Makes the forecasts of the customers add up to the forecast of the beer.
+
+    The gap on each day is shared in proportion to the variance of each
+    customer. With the variance of the forecast of the beer, the total
+    moves part of the way to the sum of the customers, as in MinT with a
+    diagonal covariance. On days where the customers have to come down,
+    none is taken below 0: the gap is shared between the customers left
+    above 0, found by sorting them by how soon they would reach it.
+
+    :param totals: The forecast of the beer on each day.
+    :param base: The forecast of each customer, a row for each day and a column for each customer.
+    :param variances: The variance of the sales of each customer.
+    :param total_variance: The variance of the sales of the beer. 0 keeps the totals as they are.
+
+    :return: The reconciled forecast of each customer.
+    """
+    variances = np.maximum(variances, MINIMUM_VARIANCE).astype(DTYPE)
+    base_totals = base.sum(axis=1, dtype=float)
+    gap = totals - base_totals
+    weight = variances.sum(dtype=float)
+    reconciled = base + (gap / (total_variance + weight))[:, None].astype(DTYPE) * variances
+    cut = np.flatnonzero(gap < 0)
+    if cut.size:
+        target = np.maximum(base_totals[cut] + gap[cut] * weight / (total_variance + weight), 0)
+        days = base[cut]
+        # A customer reaches 0 when the gap per unit of variance falls to -sales / variance.
+        # Customers forecast no sales come last and are never above 0, so they are left out.
+        levels = -days / variances
+        above = max(np.count_nonzero(days, axis=1).max(), 1)
+        order = np.argsort(levels, axis=1)[:, :above]
+        levels = np.take_along_axis(levels, order, axis=1)
+        sales = np.cumsum(np.take_along_axis(days, order, axis=1), axis=1, dtype=float)
+        weights = np.cumsum(variances[order], axis=1, dtype=float)
+        # The number of customers left above 0 on each day, those reaching it last.
+        left = (sales + levels * weights < target[:, None]).sum(axis=1)
+        row = np.arange(cut.size)
+        share = np.where(left > 0, (target - sales[row, left - 1])
+                         / np.where(left > 0, weights[row, left - 1], 1), -np.inf)
+        reconciled[cut] = np.maximum(days + share[:, None].astype(DTYPE) * variances, 0)
+    return reconciled
+
+
+@instrumented("customers")
+def customer_forecast(prediction: Forecast, method: str = "mint", keep_totals: bool = True,
+                      beers: Optional[List[str]] = None) -> CustomerForecast:
+    """
+    Forecasts the sales of each beer to each customer and reconciles them with the beer.
+
+    :param prediction: The forecast of each beer from plot_next_year.
+    :param method: "mint" or "bottom_up".
+    :param keep_totals:
+    With "mint", whether to keep the forecast of each beer as it is. If
+    not, it moves towards the sum of its customers.
+    :param beers: The beers to forecast. Defaults to every beer in the prediction.
+
+    :return:
+    The forecast of each customer. Beers without sales to any customer in
+    the last two years are left out, and keep their forecast in the totals.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown reconciliation method " + method)
+    dates, data = prediction
+    if not dates:
+        return CustomerForecast([], {}, {}, prediction)
+    LOGGER.info("Forecasting customers with %s", method)
+    read_file.SALES.update()
+    names, index = read_file.SALES.customer_sales()
+    last_day = max((np.frombuffer(rows.days, dtype=rows.days.typecode).max()
+                    for rows in index.values() if rows.days), default=0)
+    first_day = last_day - HISTORY_DAYS + 1
+    ahead = np.array([day.toordinal() - last_day for day in dates])
+    customers, sales, totals = {}, {}, dict(data)
+    for beer in data if beers is None else beers:
+        if beer not in index:
+            continue
+        history = customer_history(index[beer], first_day)
+        if not history.numbers.size:
+            continue
+        base = base_forecast(history, ahead)
+        if method == "bottom_up":
+            reconciled = base
+        else:
+            reconciled = reconcile(np.asarray(data[beer], dtype=float), base,
+                                   history.variances(),
+                                   0.0 if keep_totals else history.total_variance())
+        customers[beer] = [names[number] for number in history.numbers]
+        sales[beer] = reconciled
+        totals[beer] = reconciled.sum(axis=1, dtype=float).tolist()
+    LOGGER.debug("Forecast %d customers of %d beers",
+                 sum(len(names) for names in customers.values()), len(customers))
+    return CustomerForecast(list(dates), customers, sales, (dates, totals))
+
+
+def cached_customer_forecast(method: str = "mint", keep_totals: bool = True,
+                             forecasts: ForecastCache = FORECASTS) -> CustomerForecast:
+    """Returns the forecast of each customer from the cache, working it out if needed."""
+    key = (forecasts.version(), MODEL + " by customer", method, keep_totals)
+    return forecasts.cached(key, lambda: customer_forecast(forecasts.forecast(), method,
+                                                           keep_totals))
+
+
+def customer_totals(forecast: CustomerForecast, start_date: datetime,
+                    date_range: int) -> Optional[Dict[str, Dict[str, float]]]:
+    """
+    Returns the total forecast sales of each beer to each customer in a period.
+
+    :param forecast: The forecast of each customer.
+    :param start_date: The first date of the period.
+    :param date_range: The number of days in the period.
+
+    :return: The total of each customer of each beer, or None if the period isn't in the forecast.
+    """
+    if start_date not in forecast.dates \
+            or start_date + timedelta(date_range) not in forecast.dates:
+        LOGGER.warning("Period from %s not in the forecast", start_date)
+        return None
+    index = forecast.dates.index(start_date)
+    return {beer: dict(zip(forecast.customers[beer],
+                           sales[index:index + date_range].sum(axis=0, dtype=float).tolist()))
+            for beer, sales in forecast.sales.items()}
@@ -0,0 +1,301 @@
+"""
+This module writes the forecast, totals and state of a site to files others can read.
+
+Each export is a stream of records made one at a time: the forecast
+of each beer on each day, the total forecast of each beer in each
+window, the batches in production, the tanks, the open orders or the
+bottled stock. The records are written in chunks of CHUNK_ROWS as csv,
+a json array, json lines or Parquet, so however many beers and days
+there are, only one chunk of records is held at once. Parquet files are
+written with pyarrow, which is only needed for them.
+
+The forecast can be given with an interval around each day, from the
+recent mean absolute error of the model chosen for the beer as kept by
+forecast_accuracy. The interval is where 90% of days would fall if the
+errors were normal.
+
+:attribute COLUMNS: The name and type of each column of each export.
+"""
+import os
+import csv
+import json
+from itertools import islice, accumulate
+from datetime import datetime, date
+from typing import Tuple, List, Dict, Any, Iterable, Iterator, Optional, IO
+from log_setup import get_logger
+from forecast_cache import Forecast
+from sites import Site, site_records
+from state_store import to_json
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("exports")
+
+EXPORTS = ["forecast", "totals", "batches", "tanks", "orders", "stock"]
+FORMATS = ["csv", "json", "jsonl", "parquet"]
+EXTENSIONS = {"csv": ".csv", "json": ".json", "jsonl": ".jsonl", "parquet": ".parquet"}
+CHUNK_ROWS = 4096
+# The mean absolute error times this is the half width of a 90% interval of normal errors.
+INTERVAL_WIDTH = 1.645 * 1.2533
+COLUMNS = {"forecast": [("date", "date"), ("beer", "string"), ("bottles", "float")],
+           "intervals": [("lower", "float"), ("upper", "float")],
+           "totals": [("start", "date"), ("days", "int"), ("beer", "string"),
+                      ("bottles", "float")],
+           "batches": [("batch", "string"), ("beer", "string"), ("volume", "int"),
+                       ("stage", "string"), ("started", "time"), ("tank", "string")],
+           "tanks": [("tank", "string"), ("volume", "int"), ("function", "string"),
+                     ("batch", "string")],
+           "orders": [("order", "int"), ("beer", "string"), ("quantity", "int"),
+                      ("due", "date"), ("reference", "string")],
+           "stock": [("beer", "string"), ("litres", "float"), ("bottles", "int")]}
+ENCODER = json.JSONEncoder(separators=(',', ':'), default=to_json)
+
+Columns = List[Tuple[str, str]]
+
+
+def interval_errors(records: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    Returns the mean absolute error of the model chosen for each beer.
+
+    :param records: The errors of each model for each beer, as from ACCURACY.records.
+    """
+    return {record["beer"]: record["mae"] for record in records
+            if record["selected"] and record["mae"] is not None}
+
+
+def forecast_rows(prediction: Forecast,
+                  errors: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Makes a record of the forecast sales of each beer on each day, a day at a time.
+
+    :param prediction: The forecast, as from plot_next_year.
+    :param errors:
+    The mean absolute error of each beer, as from interval_errors, to give
+    the lower and upper end of an interval. No interval is given if None.
+    Beers without an error are given no ends.
+    """
+    dates, data = prediction
+    for index, day in enumerate(dates or []):
+        for beer, sales in data.items():
+            row = {"date": day.date(), "beer": beer, "bottles": sales[index]}
+            if errors is not None:
+                error = errors.get(beer)
+                row["lower"] = None if error is None \
+                    else max(sales[index] - INTERVAL_WIDTH * error, 0.0)
+                row["upper"] = None if error is None else sales[index] + INTERVAL_WIDTH * error
+            yield row
+
+
+def totals_rows(prediction: Forecast, days: int) -> Iterator[Dict[str, Any]]:
+    """
+    Makes a record of the total forecast sales of each beer in each window of the forecast.
+
+    :param prediction: The forecast, as from plot_next_year.
+    :param days: The number of days in each window. The windows follow
+    each other from the first day of the forecast, and the last is left
+    out if the forecast ends before it does.
+    """
+    dates, data = prediction
+    cumulative = {beer: list(accumulate(sales, initial=0)) for beer, sales in data.items()}
+    for index in range(0, len(dates or []) - days + 1, days):
+        for beer, running in cumulative.items():
+            yield {"start": dates[index].date(), "days": days, "beer": beer,
+                   "bottles": running[index + days] - running[index]}
+
+
+def export_rows(what: str, site: Site = None, prediction: Forecast = None, days: int = 42,
+                errors: Optional[Dict[str, float]] = None) -> Tuple[Columns, Iterator[Dict]]:
+    """
+    Returns the columns and records of an export.
+
+    :param what: One of EXPORTS.
+    :param site: The Site or RemoteSite, for the batches, tanks, orders and stock.
+    :param prediction: The forecast, for the forecast and totals.
+    :param days: The number of days in each window of the totals.
+    :param errors: The error of each beer for the intervals of the forecast, if wanted.
+
+    :return: The name and type of each column and the records.
+    """
+    if what == "forecast":
+        return COLUMNS[what] + ([] if errors is None else COLUMNS["intervals"]), \
+            forecast_rows(prediction, errors)
+    if what == "totals":
+        return COLUMNS[what], totals_rows(prediction, days)
+    # The records of the site are copied under its lock, so the export is of one moment.
+    return COLUMNS[what], iter(site_records(site, what))
+
+
+def chunks(rows: Iterable[Dict], size: int = CHUNK_ROWS) -> Iterator[List[Dict]]:
+    """Splits the records into lists of the given size."""
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
+
+
+def text_chunks(rows: Iterable[Dict], columns: Optional[Columns] = None) \
+        -> Iterator[List[Dict]]:
+    """
+    Splits the records into chunks with the dates written as ISO strings, as in json.
+
+    Each date is only written once in a chunk, as the records of a day
+    share it. The records given aren't changed.
+
+    :param columns: The columns, to only look for dates in theirs. Every field is looked at if
+    not given.
+    """
+    dated = None if columns is None \
+        else [name for name, kind in columns if kind in ["date", "time"]]
+    for chunk in chunks(rows):
+        texts = {}
+        for index, row in enumerate(chunk):
+            changed = None
+            for field in row if dated is None else dated:
+                value = row.get(field)
+                if isinstance(value, (datetime, date)):
+                    text = texts.get(value)
+                    if text is None:
+                        text = texts[value] = to_json(value)
+                    if changed is None:
+                        changed = chunk[index] = dict(row)
+                    changed[field] = text
+        yield chunk
+
+
+def write_csv(rows: Iterable[Dict], file: IO[str], columns: Optional[Columns] = None) -> int:
+    """
+    Writes the records as csv with a header.
+
+    :param columns: The columns. Defaults to every field of the records,
+    which are all read first to find them.
+
+    :return: The number of records written.
+    """
+    if columns is None:
+        rows = list(rows)
+        fields = list(dict.fromkeys(field for row in rows for field in row))
+    else:
+        fields = [name for name, _ in columns]
+    writer = csv.writer(file, lineterminator="\n")
+    writer.writerow(fields)
+    written = 0
+    for chunk in text_chunks(rows, columns):
+        writer.writerows([row.get(field) for field in fields] for row in chunk)
+        written += len(chunk)
+    return written
+
+
+def write_json_lines(rows: Iterable[Dict], file: IO[str], array: bool = False,
+                     columns: Optional[Columns] = None) -> int:
+    """
+    Writes the records as json lines, or as a json array with one record on each line.
+
+    :return: The number of records written.
+    """
+    written = 0
+    separator = ",\n" if array else "\n"
+    for chunk in text_chunks(rows, columns):
+        text = separator.join(ENCODER.encode(row) for row in chunk)
+        if array:
+            text = ("[\n" if not written else ",\n") + text
+        else:
+            text += "\n"
+        file.write(text)
+        written += len(chunk)
+    if array:
+        file.write("\n]\n" if written else "[]\n")
+    return written
+
+
+def write_parquet(rows: Iterable[Dict], file: IO[bytes],
+                  columns: Optional[Columns] = None) -> int:
+    """
+    Writes the records as a Parquet file, a row group for each chunk.
+
+    :param columns: The columns. Defaults to every field of the records,
+    which are all read first to find them and their types.
+
+    :return: The number of records written.
+    """
+    # pylint: disable=import-outside-toplevel
+    try:
+        import pyarrow
+        from pyarrow import parquet
+    except ImportError:
+        raise ValueError("Parquet files need pyarrow, which isn't installed") from None
+    types = {"string": pyarrow.string(), "int": pyarrow.int64(), "float": pyarrow.float64(),
+             "date": pyarrow.date32(), "time": pyarrow.timestamp("us")}
+    if columns is None:
+        rows = list(rows)
+        schema = pyarrow.Table.from_pydict(
+            {field: [row.get(field) for row in rows]
+             for field in dict.fromkeys(field for row in rows for field in row)}).schema
+    else:
+        schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+    written = 0
+    with parquet.ParquetWriter(file, schema) as writer:
+        for chunk in chunks(rows):
+            writer.write_table(pyarrow.Table.from_pydict(
+                {name: [row.get(name) for row in chunk] for name in schema.names},
+                schema=schema))
+            written += len(chunk)
+        if not written:
+            writer.write_table(schema.empty_table())
+    return written
+
+
+def write_rows(rows: Iterable[Dict], output_format: str, file: IO,
+               columns: Optional[Columns] = None) -> int:
+    """
+    Writes the records to an open file in one of FORMATS.
+
+    :param rows: The records.
+    :param output_format: One of FORMATS.
+    :param file: The file, opened for text, or for bytes for Parquet.
+    :param columns: The name and type of each column, as in COLUMNS, if known.
+
+    :return: The number of records written.
+    """
+    if output_format == "csv":
+        return write_csv(rows, file, columns)
+    if output_format in ["json", "jsonl"]:
+        return write_json_lines(rows, file, output_format == "json", columns)
+    if output_format == "parquet":
+        return write_parquet(rows, file, columns)
+    raise ValueError("Records can't be written as " + output_format)
+
+
+def export_file(rows: Iterable[Dict], output_format: str, file_name: str,
+                columns: Optional[Columns] = None) -> int:
+    """
+    Writes the records to a file in one of FORMATS.
+
+    The records are written to a temporary file first and moved over the
+    file, so it is never left half written.
+
+    :return: The number of records written.
+    """
+    temporary = file_name + ".tmp"
+    try:
+        if output_format == "parquet":
+            with open(temporary, "wb") as file:
+                written = write_rows(rows, output_format, file, columns)
+        else:
+            with open(temporary, "w", newline="", encoding="utf-8") as file:
+                written = write_rows(rows, output_format, file, columns)
+        os.replace(temporary, file_name)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    LOGGER.info("Exported %d records to %s", written, file_name)
+    return written
+
+
+def format_of(file_name: str, default: str = "csv") -> str:
+    """Returns the format of a file from its extension, or the default if it isn't known."""
+    extension = os.path.splitext(file_name)[1].lower()
+    return next((output_format for output_format, known in EXTENSIONS.items()
+                 if known == extension), default)
@@ -0,0 +1,420 @@
+"""
+This module scores the forecasts against the sales that come in after them.
+
+Every time the forecast is worked out for new sales data, each model in
+MODELS is run in order, given the forecasts of the models before it so
+none is made twice, and the first HORIZON_DAYS days of its forecast are
+added to a log next to the csv file, one json line per forecast with the
+model, the version of the data, the last day of data it was made from
+and its sales as float32. When sales for later days are added, the days
+not scored yet are scored against every forecast made before them in
+one pass over an array with a row for each forecast, and the errors are
+added up for each day, model and beer. The last day of data isn't scored
+until there is a later one, as more of its sales may still be added.
+
+The errors of the last ROLLING_DAYS scored days give the mean absolute
+error, the bias and the weighted absolute percentage error (WAPE) of
+each model for each beer. The forecast used everywhere takes each beer
+from DEFAULT_MODEL unless another model has a lower WAPE, with both
+scored on at least MIN_SCORED forecast days. A model is never chosen
+over the default without the default having been scored to compare it
+with.
+
+Forecasts are dropped from the log once none of their days are in the
+rolling window, so the scores can be worked out again from the log
+after a restart.
+
+:attribute MODELS:
+The function making the forecast of each model, by name, given the
+forecasts of the models before it. DEFAULT_MODEL is the first.
+:attribute ACCURACY: The AccuracyTracker used by selected_forecast in forecast_cache.
+"""
+import os
+import json
+import base64
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Callable, NamedTuple, Optional
+import numpy as np
+from log_setup import get_logger
+import read_file
+from read_file import parse_data, data_version
+from sales_predictions import plot_next_year, seasonal_naive
+from customer_demand import customer_forecast
+from forecast_cache import Forecast
+from state_store import write_atomic
+from instrumentation import instrumented
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("forecast_accuracy")
+
+MODELS = {
+    "daily growth": lambda forecasts: plot_next_year(),
+    "seasonal naive": lambda forecasts: seasonal_naive(),
+    "customer sum": lambda forecasts: customer_forecast(forecasts["daily growth"],
+                                                        "bottom_up").totals,
+}
+DEFAULT_MODEL = "daily growth"
+# The days of each forecast kept and scored, the six weeks suggestions look at and more.
+HORIZON_DAYS = 84
+ROLLING_DAYS = 42
+# The forecast days a model must be scored on before it is chosen over the default.
+MIN_SCORED = 28
+LOG_SUFFIX = ".forecasts.jsonl"
+# The log is written again without the dropped forecasts once it has this many more lines.
+COMPACT_LINES = 64
+# The error, absolute error and actual sales summed for each day, model and beer,
+# and the number of forecast days scored.
+ERROR, ABSOLUTE, ACTUAL, COUNT = range(4)
+
+
+class IssuedForecast(NamedTuple):
+    """
+    The first days of a forecast of one model, as kept in the log.
+
+    :attribute model: The name of the model.
+    :attribute version: The version of the sales data it was made from.
+    :attribute issued: The ordinal of the last day of data it was made from.
+    :attribute start: The ordinal of its first day.
+    :attribute beers: The beers forecast.
+    :attribute values: The sales of each beer on each day, with a row for each beer.
+    """
+    model: str
+    version: List[int]
+    issued: int
+    start: int
+    beers: List[str]
+    values: np.ndarray
+
+    def to_line(self) -> str:
+        """Returns the forecast as a json line of the log."""
+        return json.dumps({"model": self.model, "version": list(self.version),
+                           "issued": self.issued, "start": self.start, "beers": self.beers,
+                           "values": base64.b64encode(self.values.tobytes()).decode("ascii")}) \
+            + "\n"
+
+    @classmethod
+    def from_line(cls, line: str) -> "IssuedForecast":
+        """Reads a forecast from a json line of the log."""
+        record = json.loads(line)
+        values = np.frombuffer(base64.b64decode(record["values"]), dtype=np.float32)
+        return cls(record["model"], record["version"], record["issued"], record["start"],
+                   record["beers"], values.reshape(len(record["beers"]), -1))
+
+
+def issue(model: str, version: List[int], issued: int, prediction: Forecast) -> IssuedForecast:
+    """Keeps the first HORIZON_DAYS days of the forecast of a model."""
+    dates, data = prediction
+    beers = sorted(data)
+    values = np.array([data[beer][:HORIZON_DAYS] for beer in beers], dtype=np.float32)
+    return IssuedForecast(model, list(version), issued, dates[0].toordinal(), beers,
+                          values.reshape(len(beers), -1))
+
+
+def log_file_name() -> str:
+    """Returns the name of the log of the current csv file of sales data."""
+    return os.path.splitext(read_file.SALES_FILE)[0] + LOG_SUFFIX
+
+
+def select_forecast(forecasts: Dict[str, Forecast], best: Dict[str, str]) -> Forecast:
+    """
+    Puts together the forecast of each beer from the model chosen for it.
+
+    :param forecasts: The forecast of each model. The one of DEFAULT_MODEL must be given.
+    :param best: The model chosen for each beer.
+
+    :return: The forecast on the dates of DEFAULT_MODEL. Days the chosen
+    model doesn't forecast are taken from DEFAULT_MODEL.
+    """
+    dates, default = forecasts[DEFAULT_MODEL]
+    if not dates:
+        return dates, default
+    selected = {}
+    for beer, sales in default.items():
+        model = best.get(beer, DEFAULT_MODEL)
+        if model == DEFAULT_MODEL or model not in forecasts \
+                or beer not in forecasts[model][1]:
+            selected[beer] = sales
+            continue
+        model_dates, model_data = forecasts[model]
+        offset = (dates[0] - model_dates[0]).days
+        model_sales = model_data[beer]
+        selected[beer] = [model_sales[offset + index]
+                          if 0 <= offset + index < len(model_sales) else sale
+                          for index, sale in enumerate(sales)]
+    return dates, selected
+
+
+class AccuracyTracker:
+    """This class keeps the issued forecasts and the errors of each model on each day."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, file_name: Optional[str] = None,
+                 models: Dict[str, Callable[[Dict[str, Forecast]], Forecast]] = None):
+        """
+        Initialising the tracker. The log is read when it is first needed.
+
+        :param file_name: The log of issued forecasts. Defaults to the one next to the csv file.
+        :param models:
+        The function making the forecast of each model, given the forecasts
+        of the models before it. Defaults to MODELS.
+        """
+        self.file_name = file_name
+        self.models = MODELS if models is None else models
+        self.model_names = list(self.models)
+        self.lock = threading.RLock()
+        self.loaded_from = None
+        self.forecasts = []
+        self.log_lines = 0
+        self.beers = []
+        # The summed errors of each scored day, by ordinal, with a row for each model.
+        self.days = {}
+        self.scored_through = None
+
+    def log_name(self) -> str:
+        """Returns the name of the log used."""
+        return log_file_name() if self.file_name is None else self.file_name
+
+    def load(self):
+        """Reads the log if it hasn't been read, or the csv file has changed since it was."""
+        with self.lock:
+            file_name = self.log_name()
+            if file_name == self.loaded_from:
+                return
+            self.loaded_from = file_name
+            self.forecasts = []
+            self.log_lines = 0
+            self.beers = []
+            self.days = {}
+            self.scored_through = None
+            issued = {}
+            try:
+                with open(file_name, encoding="utf-8") as file:
+                    for line in file:
+                        self.log_lines += 1
+                        try:
+                            forecast = IssuedForecast.from_line(line)
+                        except (ValueError, KeyError):
+                            LOGGER.warning("Skipping a damaged line of %s", file_name)
+                            continue
+                        issued[(forecast.model, tuple(forecast.version))] = forecast
+            except FileNotFoundError:
+                pass
+            for forecast in issued.values():
+                self.add(forecast)
+            LOGGER.info("Read %d issued forecasts from %s", len(self.forecasts), file_name)
+
+    def add(self, forecast: IssuedForecast):
+        """Keeps a forecast in memory."""
+        for beer in forecast.beers:
+            if beer not in self.beers:
+                self.beers.append(beer)
+        self.forecasts.append(forecast)
+
+    def record(self, forecasts: List[IssuedForecast]):
+        """Adds forecasts to the log, unless they are kept already."""
+        with self.lock:
+            self.load()
+            kept = {(forecast.model, tuple(forecast.version)) for forecast in self.forecasts}
+            new = [forecast for forecast in forecasts
+                   if (forecast.model, tuple(forecast.version)) not in kept]
+            if not new:
+                return
+            for forecast in new:
+                self.add(forecast)
+            try:
+                with open(self.loaded_from, "a", encoding="utf-8") as file:
+                    file.writelines(forecast.to_line() for forecast in new)
+                self.log_lines += len(new)
+            except OSError as error:
+                LOGGER.error("Forecasts could not be added to %s: %s", self.loaded_from, error)
+
+    @instrumented("accuracy.score")
+    def score(self, data_dict: Optional[Dict] = None) -> int:
+        """
+        Scores the days of sales not scored yet against every forecast made before them.
+
+        :param data_dict: The sales, as returned by parse_data. Read if not given.
+
+        :return: The number of days scored.
+        """
+        # pylint: disable=too-many-locals
+        with self.lock:
+            self.load()
+            data_dict = parse_data() if data_dict is None else data_dict
+            if not data_dict['x']:
+                return 0
+            last = max(dates[-1] for dates in data_dict['x'].values()).toordinal() - 1
+            if self.scored_through is not None and last < self.scored_through:
+                # Sales were taken away, so everything is scored again.
+                self.days = {}
+                self.scored_through = None
+            first = last - ROLLING_DAYS + 1
+            if self.scored_through is not None:
+                first = max(first, self.scored_through + 1)
+            self.drop_old(last)
+            if first > last or not self.forecasts:
+                self.scored_through = last
+                return 0
+            days = np.arange(first, last + 1)
+            actual = np.full((len(self.beers), len(days)), np.nan)
+            for row, beer in enumerate(self.beers):
+                if beer in data_dict['x']:
+                    sales = np.asarray(data_dict['y'][beer], dtype=float)
+                    index = days - data_dict['x'][beer][0].toordinal()
+                    inside = (index >= 0) & (index < len(sales))
+                    actual[row, inside] = sales[index[inside]]
+            # Each forecast is given a row for every beer, missing beers being nan.
+            values = np.full((len(self.forecasts), len(self.beers), HORIZON_DAYS), np.nan,
+                             dtype=np.float32)
+            for number, forecast in enumerate(self.forecasts):
+                rows = [self.beers.index(beer) for beer in forecast.beers]
+                values[number, rows, :forecast.values.shape[1]] = forecast.values
+            starts = np.array([forecast.start for forecast in self.forecasts])
+            issued = np.array([forecast.issued for forecast in self.forecasts])
+            models = np.array([self.model_names.index(forecast.model)
+                               if forecast.model in self.model_names else -1
+                               for forecast in self.forecasts])
+            offsets = days[None, :] - starts[:, None]
+            valid = (offsets >= 0) & (offsets < HORIZON_DAYS) & (days[None, :] > issued[:, None])
+            predicted = np.take_along_axis(
+                values, np.clip(offsets, 0, HORIZON_DAYS - 1)[:, None, :], axis=2)
+            error = predicted - actual[None, :, :]
+            scored = valid[:, None, :] & ~np.isnan(error)
+            error = np.where(scored, error, 0.0)
+            sums = np.zeros((len(self.model_names), 4, len(self.beers), len(days)))
+            for model in range(len(self.model_names)):
+                chosen = models == model
+                sums[model, ERROR] = error[chosen].sum(axis=0)
+                sums[model, ABSOLUTE] = np.abs(error[chosen]).sum(axis=0)
+                sums[model, ACTUAL] = np.where(scored[chosen], actual[None, :, :], 0.0).sum(axis=0)
+                sums[model, COUNT] = scored[chosen].sum(axis=0)
+            for column, day in enumerate(days.tolist()):
+                self.days[day] = sums[:, :, :, column]
+            self.scored_through = last
+            LOGGER.info("Scored %d days of sales against %d forecasts",
+                        len(days), len(self.forecasts))
+            return len(days)
+
+    def drop_old(self, last: int):
+        """
+        Drops the days and forecasts before the rolling window ending on the given day.
+
+        The log is written again without the dropped forecasts when it has
+        COMPACT_LINES more lines than forecasts kept.
+        """
+        first = last - ROLLING_DAYS + 1
+        self.days = {day: sums for day, sums in self.days.items() if day >= first}
+        self.forecasts = [forecast for forecast in self.forecasts
+                          if forecast.start + forecast.values.shape[1] > first]
+        if self.log_lines - len(self.forecasts) >= COMPACT_LINES:
+            result = write_atomic("".join(forecast.to_line() for forecast in self.forecasts)
+                                  .encode("utf-8"), self.loaded_from)
+            if result == "success":
+                LOGGER.info("Compacted %s to %d forecasts", self.loaded_from, len(self.forecasts))
+                self.log_lines = len(self.forecasts)
+            else:
+                LOGGER.error("%s could not be compacted: %s", self.loaded_from, result)
+
+    def totals(self) -> np.ndarray:
+        """Returns the errors summed over the scored days, by model, sum and beer."""
+        with self.lock:
+            totals = np.zeros((len(self.model_names), 4, len(self.beers)))
+            for sums in self.days.values():
+                totals[:, :, :sums.shape[2]] += sums
+            return totals
+
+    def best_models(self) -> Dict[str, str]:
+        """
+        Returns the model with the lowest WAPE for each beer, or DEFAULT_MODEL.
+
+        Another model is only chosen if DEFAULT_MODEL has been scored on
+        enough days too and did worse.
+        """
+        with self.lock:
+            totals = self.totals()
+            best = {beer: DEFAULT_MODEL for beer in self.beers}
+            if DEFAULT_MODEL not in self.model_names:
+                return best
+            default = self.model_names.index(DEFAULT_MODEL)
+            for row, beer in enumerate(self.beers):
+                wape = np.where((totals[:, COUNT, row] >= MIN_SCORED)
+                                & (totals[:, ACTUAL, row] > 0),
+                                totals[:, ABSOLUTE, row] / np.maximum(totals[:, ACTUAL, row], 1e-9),
+                                np.inf)
+                model = int(np.argmin(wape))
+                if np.isfinite(wape[default]) and wape[model] < wape[default]:
+                    best[beer] = self.model_names[model]
+            return best
+
+    def records(self) -> List[Dict[str, Any]]:
+        """
+        Returns the errors of each model for each beer over the rolling window.
+
+        The mean absolute error and bias are in bottles a day, and WAPE is
+        the absolute errors over the sales. Days forecast by more than one
+        forecast are counted once for each.
+        """
+        with self.lock:
+            totals = self.totals()
+            best = self.best_models()
+            days = sorted(self.days)
+            records = []
+            for row, beer in enumerate(self.beers):
+                for model, name in enumerate(self.model_names):
+                    count = int(totals[model, COUNT, row])
+                    absolute, error, actual = (float(totals[model, column, row])
+                                               for column in (ABSOLUTE, ERROR, ACTUAL))
+                    records.append({
+                        "beer": beer, "model": name, "scored": count,
+                        "mae": absolute / count if count else None,
+                        "bias": error / count if count else None,
+                        "wape": absolute / actual if actual else None,
+                        "selected": best[beer] == name,
+                        "from": datetime.fromordinal(days[0]).date() if days else None,
+                        "to": datetime.fromordinal(days[-1]).date() if days else None})
+            return records
+
+    @instrumented("accuracy.forecast")
+    def forecast(self) -> Forecast:
+        """
+        Makes the forecast of every model, keeps them, scores the new sales and selects.
+
+        A model that fails is left out, and isn't given to the models after it.
+        If DEFAULT_MODEL fails, the error is raised.
+
+        :return: The forecast of each beer from the model chosen for it.
+        """
+        version = data_version()
+        data_dict = parse_data()
+        forecasts = {}
+        for name, model in self.models.items():
+            try:
+                forecasts[name] = model(forecasts)
+            except Exception:  # pylint: disable=broad-except
+                if name == DEFAULT_MODEL:
+                    raise
+                LOGGER.exception("The %s model failed", name)
+        dates = forecasts[DEFAULT_MODEL][0]
+        if not dates or not data_dict['x']:
+            return forecasts[DEFAULT_MODEL]
+        issued = max(days[-1] for days in data_dict['x'].values()).toordinal()
+        with self.lock:
+            self.record([issue(name, version, issued, prediction)
+                         for name, prediction in forecasts.items() if prediction[0]])
+            self.score(data_dict)
+            best = self.best_models()
+        changed = sorted(beer for beer, model in best.items() if model != DEFAULT_MODEL)
+        if changed:
+            LOGGER.info("Forecasting %s from other models", ", ".join(changed))
+        return select_forecast(forecasts, best)
+
+
+ACCURACY = AccuracyTracker()
+
+if __name__ == "__main__":
+    ACCURACY.score()
+    for accuracy_record in ACCURACY.records():
+        print(accuracy_record)
@@ -0,0 +1,163 @@
+"""
+This module caches the forecast and the windows of it searched for on the graph.
+
+Working out the forecast reads the whole csv file, so searching a week
+or a month of it used to cost as much as the whole year. Results are
+kept in a bounded least recently used cache keyed by the version of the
+sales data, the model, the start date and the number of days, so adding
+sales data makes the old results unreachable and they are dropped as
+new ones are added. The forecast for the whole year is cached the same
+way, and each window is sliced from it.
+
+The forecast is made by selected_forecast, which takes each beer from
+the model with the best recent accuracy, as kept by forecast_accuracy.
+
+:attribute MODEL: The name of the forecast cached, which is the model selected for each beer.
+:attribute FORECASTS: The ForecastCache used by the interface.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Tuple, List, Dict, Hashable, Any, Callable
+from log_setup import get_logger
+from read_file import data_version
+from instrumentation import METRICS
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("forecast_cache")
+
+MODEL = "selected"
+
+Forecast = Tuple[List[datetime], Dict[str, List[float]]]
+
+
+def forecast_window(prediction: Forecast, start_date: datetime, date_range: int) -> Forecast:
+    """
+    Slices the given number of days from the start date out of the forecast.
+
+    Gives the same result as plot_next_year with the start date and range.
+
+    :param prediction: The forecast for the whole year, as from plot_next_year.
+    :param start_date: The first date of the window.
+    :param date_range: The number of days in the window.
+
+    :return: The dates and sales of the window, False and False if it
+    isn't in the forecast, or None and None if there is no forecast.
+    """
+    dates, data = prediction
+    if dates is None:
+        return None, None
+    if start_date not in dates or start_date + timedelta(date_range) not in dates:
+        return False, False
+    index = dates.index(start_date)
+    return dates[index:index + date_range], \
+        {key: sales[index:index + date_range] for key, sales in data.items()}
+
+
+def selected_forecast() -> Forecast:
+    """Returns the forecast of each beer from the model with the best recent accuracy."""
+    # forecast_accuracy runs the models, one of which uses the cache.
+    from forecast_accuracy import ACCURACY  # pylint: disable=import-outside-toplevel
+    return ACCURACY.forecast()
+
+
+class ForecastCache:
+    """This class holds the latest forecasts and windows, dropping the least recently used."""
+    def __init__(self, max_entries: int = 64, version: Callable[[], Hashable] = data_version,
+                 make_forecast: Callable[[], Forecast] = selected_forecast):
+        """
+        Initialising an empty cache.
+
+        :param max_entries: The number of results kept.
+        :param version: Function returning the version of the sales data.
+        :param make_forecast: Function working out the forecast for the whole year.
+        """
+        self.max_entries = max_entries
+        self.version = version
+        self.make_forecast = make_forecast
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Held while the whole forecast is worked out so it is only worked out once.
+        self.compute_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached result for the key, or None if it isn't cached."""
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+                METRICS.count("forecast_cache.miss")
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            METRICS.count("forecast_cache.hit")
+            return result
+
+    def put(self, key: Hashable, result: Any):
+        """Caches the result for the key, dropping the least recently used if the cache is full."""
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def cached(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """Returns the cached result for the key, working it out with the function if needed."""
+        result = self.get(key)
+        if result is None:
+            result = function()
+            self.put(key, result)
+        return result
+
+    def forecast(self) -> Forecast:
+        """Returns the forecast for the whole year from the current sales data."""
+        key = (self.version(), MODEL, None, None)
+        with self.compute_lock:
+            return self.cached(key, self.make_forecast)
+
+    def window(self, start_date: datetime, date_range: int) -> Forecast:
+        """
+        Returns the forecast for the given number of days from the start date.
+
+        :param start_date: The first date of the window.
+        :param date_range: The number of days in the window.
+
+        :return: The dates and sales of the window, as from forecast_window.
+        """
+        key = (self.version(), MODEL, start_date, date_range)
+        return self.cached(key, lambda: forecast_window(self.forecast(), start_date,
+                                                        date_range))
+
+    def peek(self, start_date: datetime, date_range: int) -> Forecast:
+        """Returns the window if it is cached without working anything out, otherwise None."""
+        with self.lock:
+            return self.entries.get((self.version(), MODEL, start_date, date_range))
+
+    def prefetch(self, start_date: datetime, date_range: int, steps: int = 1) -> int:
+        """
+        Works out the windows before and after the given one so stepping to them is instant.
+
+        :param start_date: The first date of the current window.
+        :param date_range: The number of days in each window.
+        :param steps: The number of windows to work out in each direction.
+
+        :return: The number of windows worked out.
+        """
+        added = 0
+        for step in range(1, steps + 1):
+            for direction in (1, -1):
+                start = start_date + timedelta(days=direction * step * date_range)
+                if self.peek(start, date_range) is None:
+                    self.window(start, date_range)
+                    added += 1
+        LOGGER.debug("Prefetched %d windows around %s", added, start_date)
+        return added
+
+
+FORECASTS = ForecastCache()
@@ -0,0 +1,284 @@
+"""
+This module answers questions about the state of the brewery in the past.
+
+Every stage a batch starts is recorded as a transition in the history of
+the Process object. HistoryIndex turns the transitions into intervals, one
+for each stage of each batch, kept in numpy arrays sorted by start time.
+As no finished stage lasted longer than the longest one, the intervals
+overlapping any time can only have started in the window that long before
+it, which two binary searches find. Stages still going on are kept
+separately. This keeps "state at a time" and "occupancy over a range"
+queries to milliseconds over years of history.
+
+Cycle time statistics for each beer and stage are worked out for every
+group at once by sorting the durations by group.
+"""
+import os
+import weakref
+from datetime import datetime
+from typing import Tuple, List, Dict, NamedTuple, Optional, Union
+from log_setup import get_logger
+import numpy as np
+from inventory_management import Process, BEER_PROCESS, batches_in_production
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("history")
+
+STEP_NAMES = ["waiting", "brewing", "fermenting", "conditioning", "bottling", "finished"]
+
+Time = Union[float, datetime]
+
+
+def timestamp(when: Time) -> float:
+    """Returns the time in seconds since the epoch for a datetime or a time."""
+    return when.timestamp() if isinstance(when, datetime) else float(when)
+
+
+class Occupancy(NamedTuple):
+    """
+    One stage of one batch.
+
+    :attribute batch_id: The id of the batch.
+    :attribute beer: Name of the beer.
+    :attribute volume: The volume of the batch.
+    :attribute stage: The name of the stage.
+    :attribute tank: The name of the tank the stage was in, if any.
+    :attribute start: The time the stage started.
+    :attribute end: The time the stage ended, or None if it hasn't.
+    """
+    batch_id: Optional[str]
+    beer: str
+    volume: float
+    stage: str
+    tank: Optional[str]
+    start: float
+    end: Optional[float]
+
+
+class CycleStats(NamedTuple):
+    """
+    The time in seconds the batches of a beer spent in a stage.
+
+    :attribute count: Number of batches.
+    :attribute mean: The mean time.
+    :attribute median: The median time.
+    :attribute p90: The time 90% of the batches took at most.
+    :attribute minimum: The shortest time.
+    :attribute maximum: The longest time.
+    """
+    count: int
+    mean: float
+    median: float
+    p90: float
+    minimum: float
+    maximum: float
+
+
+class HistoryIndex:
+    """This class holds the stage intervals of every batch, indexed by start time."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, transitions: List[dict]):
+        """
+        Building the intervals from the transitions.
+
+        Each stage ends when the next transition of the same batch happens.
+        The finished transition only ends the bottling stage.
+
+        :param transitions: The transition records, the oldest first.
+        """
+        LOGGER.info("Indexing %d transitions", len(transitions))
+        count = len(transitions)
+        ids = np.array([record["id"] or "" for record in transitions], dtype=object)
+        times = np.array([record["time"] for record in transitions], dtype=float)
+        steps = np.array([record["step"] for record in transitions], dtype=int)
+        self.beers, beer_codes = np.unique(
+            np.array([record["beer"] for record in transitions], dtype=object),
+            return_inverse=True)
+        self.tanks, tank_codes = np.unique(
+            np.array([record["tank"] or "" for record in transitions], dtype=object),
+            return_inverse=True)
+        volumes = np.array([record["volume"] for record in transitions], dtype=float)
+
+        # Putting the transitions of each batch together, keeping them in time order.
+        _, batch_codes = np.unique(ids, return_inverse=True)
+        order = np.lexsort((times, batch_codes))
+        ends = np.full(count, np.inf)
+        if count:
+            same_batch = batch_codes[order][1:] == batch_codes[order][:-1]
+            ends[order[:-1][same_batch]] = times[order][1:][same_batch]
+        keep = steps < 5
+
+        self.ids = ids[keep]
+        self.beer_codes = beer_codes[keep]
+        self.tank_codes = tank_codes[keep]
+        self.volumes = volumes[keep]
+        self.steps = steps[keep]
+        self.starts = times[keep]
+        self.ends = ends[keep]
+
+        self.by_start = np.argsort(self.starts, kind="stable")
+        self.sorted_starts = self.starts[self.by_start]
+        ongoing = np.isinf(self.ends)
+        self.ongoing = np.flatnonzero(ongoing)
+        finished = ~ongoing
+        self.longest = float((self.ends[finished] - self.starts[finished]).max()) \
+            if finished.any() else 0.0
+        LOGGER.debug("Indexed %d intervals", len(self.starts))
+
+    def __len__(self) -> int:
+        """Returns the number of intervals."""
+        return len(self.starts)
+
+    def overlapping(self, start: float, end: float) -> np.ndarray:
+        """
+        Returns the rows of the intervals overlapping the range, in order of start.
+
+        An interval overlaps a single time if it started at or before it and
+        hadn't ended by it.
+        """
+        low = np.searchsorted(self.sorted_starts, start - self.longest, side="left")
+        high = np.searchsorted(self.sorted_starts, end, side="left" if end > start else "right")
+        rows = self.by_start[low:high]
+        rows = rows[self.ends[rows] > start]
+        # Stages still going on that started before the window.
+        late = self.ongoing[self.starts[self.ongoing] < start - self.longest]
+        if len(late):
+            rows = np.union1d(rows, late)
+            rows = rows[np.argsort(self.starts[rows], kind="stable")]
+        return rows
+
+    def occupancy_rows(self, rows: np.ndarray) -> List[Occupancy]:
+        """Returns the intervals in the given rows as Occupancy tuples."""
+        return [Occupancy(self.ids[row] or None, self.beers[self.beer_codes[row]],
+                          float(self.volumes[row]), STEP_NAMES[self.steps[row]],
+                          self.tanks[self.tank_codes[row]] or None, float(self.starts[row]),
+                          None if np.isinf(self.ends[row]) else float(self.ends[row]))
+                for row in rows]
+
+    def state_at(self, when: Time) -> List[Occupancy]:
+        """
+        Returns the stage every batch in production was in at the given time.
+
+        :param when: The time, as a datetime or in seconds since the epoch.
+
+        :return: The stage of each batch, the earliest started first.
+        """
+        moment = timestamp(when)
+        return self.occupancy_rows(self.overlapping(moment, moment))
+
+    def tanks_at(self, when: Time) -> Dict[str, Occupancy]:
+        """Returns the batch in each occupied tank at the given time."""
+        return {occupancy.tank: occupancy for occupancy in self.state_at(when)
+                if occupancy.tank is not None}
+
+    def occupancy(self, start: Time, end: Time, tank: str = None) -> List[Occupancy]:
+        """
+        Returns every stage that was going on at some point in the range.
+
+        :param start: The start of the range.
+        :param end: The end of the range.
+        :param tank: If given, only the stages in this tank are returned.
+
+        :return: The stages, the earliest started first.
+        """
+        rows = self.overlapping(timestamp(start), timestamp(end))
+        if tank is not None:
+            rows = rows[self.tanks[self.tank_codes[rows]] == tank]
+        return self.occupancy_rows(rows)
+
+    def busy_seconds(self, start: Time, end: Time) -> Dict[str, float]:
+        """Returns the number of seconds each tank was occupied in the range."""
+        first, last = timestamp(start), timestamp(end)
+        rows = self.overlapping(first, last)
+        rows = rows[self.tanks[self.tank_codes[rows]] != ""]
+        seconds = np.minimum(self.ends[rows], last) - np.maximum(self.starts[rows], first)
+        totals = np.bincount(self.tank_codes[rows], weights=seconds, minlength=len(self.tanks))
+        return {tank: float(total) for tank, total in zip(self.tanks, totals) if tank}
+
+    def cycle_times(self, start: Time = None, end: Time = None,
+                    beer: str = None) -> Dict[Tuple[str, str], CycleStats]:
+        """
+        Works out how long the batches of each beer spent in each stage.
+
+        Only stages that ended in the range are counted.
+
+        :param start: The start of the range. Defaults to the start of the history.
+        :param end: The end of the range. Defaults to now.
+        :param beer: If given, only the batches of this beer are counted.
+
+        :return: The statistics for each (beer, stage).
+        """
+        mask = np.isfinite(self.ends)
+        if start is not None:
+            mask &= self.ends >= timestamp(start)
+        if end is not None:
+            mask &= self.ends <= timestamp(end)
+        if beer is not None:
+            mask &= self.beers[self.beer_codes] == beer
+        rows = np.flatnonzero(mask)
+        if not len(rows):
+            return {}
+        groups = self.beer_codes[rows] * len(STEP_NAMES) + self.steps[rows]
+        durations = self.ends[rows] - self.starts[rows]
+        order = np.lexsort((durations, groups))
+        groups, durations = groups[order], durations[order]
+
+        firsts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        counts = np.diff(np.r_[firsts, len(groups)])
+        means = np.add.reduceat(durations, firsts) / counts
+
+        def percentile(fraction: float) -> np.ndarray:
+            position = firsts + fraction * (counts - 1)
+            below = np.floor(position).astype(int)
+            above = np.ceil(position).astype(int)
+            return durations[below] + (durations[above] - durations[below]) * (position - below)
+
+        medians, p90s = percentile(0.5), percentile(0.9)
+        lasts = firsts + counts - 1
+        result = {}
+        for index, group in enumerate(groups[firsts]):
+            beer_code, step = divmod(int(group), len(STEP_NAMES))
+            result[(self.beers[beer_code], STEP_NAMES[step])] = CycleStats(
+                int(counts[index]), float(means[index]), float(medians[index]),
+                float(p90s[index]), float(durations[firsts[index]]),
+                float(durations[lasts[index]]))
+        return result
+
+
+# The latest index for each Process object, with the batch version it was built at. The
+# Process objects are held weakly so their indexes go with them, and a new Process
+# object is never given the index of one that has gone.
+INDEXES = weakref.WeakKeyDictionary()
+
+
+def history_index(process_obj: Process = BEER_PROCESS) -> HistoryIndex:
+    """
+    Returns the history index of the Process object, building it again if a batch has moved.
+
+    Batches that were in production before transitions were recorded are
+    given an interval starting when their current stage started.
+
+    :param process_obj: The Process object whose history is indexed.
+
+    :return: The HistoryIndex.
+    """
+    with process_obj.lock:
+        version = process_obj.batch_version
+        cached = INDEXES.get(process_obj)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        transitions = process_obj.history.records("transition")
+        recorded = {record["id"] for record in transitions}
+        for batch in batches_in_production(process_obj):
+            if batch.batch_id not in recorded:
+                tank = batch.current_tank.name if batch.current_step in [2, 3] else None
+                transitions.append({"type": "transition", "id": batch.batch_id,
+                                    "beer": batch.beer, "volume": batch.volume,
+                                    "step": batch.current_step, "tank": tank,
+                                    "time": batch.current_start_time})
+    index = HistoryIndex(transitions)
+    INDEXES[process_obj] = (version, index)
+    return index
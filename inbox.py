@@ -0,0 +1,187 @@
+"""
+This module adds the csv files of sales data dropped into the inbox directory.
+
+A background thread checks the directory every few seconds. A file is
+only added once its modification time and size are the same on two
+checks in a row, so a file still being copied isn't added half way
+through. How far each file has been added is kept in a ledger in the
+directory, so when an export is added to, only the new lines are added,
+and nothing is added twice after a restart. A file that was written
+again from the start is added again in full.
+
+Each file is added with append_sales, and the forecast is then worked
+out again in the same thread so it is ready when the interface asks.
+"""
+import os
+import json
+import time
+import threading
+from functools import partial
+from typing import List, Dict, Callable, NamedTuple, Optional
+from log_setup import get_logger
+from read_file import append_sales
+from forecast_cache import ForecastCache
+from state_store import write_atomic
+from instrumentation import instrumented
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("inbox")
+
+INBOX_DIR = 'inbox'
+LEDGER_FILE = '.ingested.json'
+# The number of bytes at the start of a file kept to tell it was written again.
+HEAD_SIZE = 64
+
+
+class IngestResult(NamedTuple):
+    """
+    The result of adding one file.
+
+    :attribute file: The name of the file in the inbox.
+    :attribute result: "success" or the error message from append_sales.
+    :attribute rows: The number of rows added.
+    :attribute seconds: How long adding the file took.
+    """
+    file: str
+    result: str
+    rows: int
+    seconds: float
+
+
+def read_head(path: str) -> str:
+    """Returns the start of the file as hex, to tell if it is written again."""
+    with open(path, 'rb') as file:
+        return file.read(HEAD_SIZE).hex()
+
+
+class InboxWatcher:
+    """This class adds the files dropped into the inbox from a background thread."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, directory: str = INBOX_DIR, interval: float = 2.0,
+                 forecasts: ForecastCache = None,
+                 on_progress: Callable[[str, int, int], None] = None,
+                 on_ingested: Callable[[IngestResult], None] = None):
+        """
+        Initialising the watcher. The thread is started by start.
+
+        :param directory: The inbox directory, which is made if it doesn't exist.
+        :param interval: Seconds between checks of the directory.
+        :param forecasts: The forecast cache to work out the new forecast in, if any.
+        :param on_progress:
+        Function given the name of a file, the bytes added so far and its
+        size while it is added. It is called from the watcher thread.
+        :param on_ingested: Function given the IngestResult of each file, from the watcher thread.
+        """
+        self.directory = directory
+        self.interval = interval
+        self.forecasts = forecasts
+        self.on_progress = on_progress
+        self.on_ingested = on_ingested
+        self.ledger_file = os.path.join(directory, LEDGER_FILE)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.ledger_file, encoding="utf-8") as file:
+                self.ledger = json.load(file)
+        except FileNotFoundError:
+            self.ledger = {}
+        # The modification time and size of each file at the last check.
+        self.seen = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Starts the watcher thread."""
+        LOGGER.info("Watching %s for sales data", self.directory)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Checks the inbox every interval until stopped."""
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+            except OSError:
+                LOGGER.exception("Failed to check the inbox")
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        """Stops the watcher thread, letting it finish the file it is adding."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def poll(self, wait_until_stable: bool = True) -> List[IngestResult]:
+        """
+        Adds every file in the inbox that is new or has changed since it was added.
+
+        :param wait_until_stable:
+        Whether to wait for the modification time and size of a file to be
+        the same on two checks before adding it. Without waiting, every file
+        is added straight away, for when the files are known to be complete.
+
+        :return: The result of each file added.
+        """
+        results = []
+        with os.scandir(self.directory) as entries:
+            files = sorted((entry.name, entry.stat()) for entry in entries
+                           if entry.is_file() and entry.name.lower().endswith(".csv"))
+        for name, stat in files:
+            version = [stat.st_mtime_ns, stat.st_size]
+            previous = self.seen.get(name)
+            self.seen[name] = version
+            if wait_until_stable and previous != version:
+                continue
+            done = self.ledger.get(name)
+            if done is not None and done["version"] == version:
+                continue
+            results.append(self.ingest(name, version, done))
+        if results and self.forecasts is not None \
+                and any(result.rows for result in results):
+            self.forecasts.forecast()
+        return results
+
+    @instrumented("inbox.ingest")
+    def ingest(self, name: str, version: List[int], done: Optional[Dict]) -> IngestResult:
+        """
+        Adds the lines of the file not added before.
+
+        :param name: The name of the file in the inbox.
+        :param version: The modification time and size of the file.
+        :param done: The ledger entry of the file, if it was added before.
+
+        :return: The result.
+        """
+        path = os.path.join(self.directory, name)
+        head = read_head(path)
+        offset = 0
+        if done is not None:
+            if version[1] >= done["offset"] and head.startswith(done["head"]):
+                offset = done["offset"]
+            else:
+                LOGGER.warning("%s was written again. Adding all of it.", name)
+        LOGGER.info("Adding %s from byte %d", name, offset)
+        start = time.perf_counter()
+        progress = None if self.on_progress is None else partial(self.on_progress, name)
+        total = done["rows"] if offset else 0
+        result, rows, offset = append_sales(path, offset, progress)
+        seconds = time.perf_counter() - start
+        # A file that failed keeps the offset it had and isn't tried again until it changes.
+        self.ledger[name] = {"version": version, "head": head, "result": result,
+                             "offset": offset, "rows": total + rows, "time": time.time()}
+        self.save_ledger()
+        ingested = IngestResult(name, result, rows, seconds)
+        LOGGER.info("Added %d rows from %s in %.2f s: %s", rows, name, seconds, result)
+        if self.on_ingested is not None:
+            self.on_ingested(ingested)
+        return ingested
+
+    def save_ledger(self):
+        """Saves how far each file has been added."""
+        result = write_atomic(json.dumps(self.ledger, indent=1).encode("utf-8"),
+                              self.ledger_file)
+        if result != "success":
+            LOGGER.error("Inbox ledger could not be saved: %s", result)
@@ -0,0 +1,252 @@
+"""
+This module records how long the main operations take and how often things happen.
+
+Operations are timed with the instrumented decorator or the timed
+context manager, and each is given a name such as "forecast" or
+"ui.orders". The times of each operation go into a Histogram with
+buckets growing by a quarter of a power of two from a microsecond, so
+the 50th, 95th and 99th percentiles can be given to within about 20%
+without keeping every time. Counters count events such as cache hits.
+
+Recording is off unless enable is called or the BREWHOUSE_METRICS
+environment variable is set, and while it is off a timed operation only
+checks one attribute, so the instrumentation can be left in place.
+
+The records can be shown in the interface (Ctrl+Shift+P), written by
+"python -m brewhouse profile" or served in the Prometheus text format
+by the service at /metrics.
+
+:attribute METRICS: The Metrics every module records to.
+"""
+import os
+import threading
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+from typing import List, Dict, Callable, Any
+from log_setup import get_logger
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("instrumentation")
+
+# The upper bounds of the buckets in seconds, from a microsecond to about two minutes.
+BOUNDS = [1e-6 * 2 ** (step / 4) for step in range(109)]
+# Every fourth bound, the powers of two, is written in the Prometheus format.
+EXPORT_STEP = 4
+PERCENTILES = [50, 95, 99]
+PROMETHEUS_PREFIX = "brewhouse"
+
+
+class Histogram:
+    """This class counts the times of one operation in buckets."""
+    def __init__(self):
+        """Initialising with no times."""
+        self.buckets = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float):
+        """Adds a time in seconds."""
+        self.buckets[bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """
+        Returns the time the given percent of times were at most.
+
+        :param percent: The percentile, such as 95.
+
+        :return: The upper bound of the bucket the percentile is in, or the
+        longest time if that is shorter. 0 if there are no times.
+        """
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                break
+        return min(BOUNDS[index] if index < len(BOUNDS) else self.maximum, self.maximum)
+
+
+class NullTimer:
+    """This class is the timer used while recording is off, which does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    """This class times the block of a with statement."""
+    def __init__(self, metrics: "Metrics", name: str):
+        """
+        Initialising the timer.
+
+        :param metrics: The Metrics to record the time to.
+        :param name: The name of the operation.
+        """
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """This class holds the histogram of each operation and the counters."""
+    def __init__(self, enabled: bool = False):
+        """
+        Initialising with nothing recorded.
+
+        :param enabled: Whether to record from the start.
+        """
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def enable(self, enabled: bool = True):
+        """Turns recording on or off. What was recorded is kept."""
+        LOGGER.info("Metrics %s", "enabled" if enabled else "disabled")
+        self.enabled = enabled
+
+    def reset(self):
+        """Forgets everything recorded."""
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def observe(self, name: str, seconds: float):
+        """Records that the operation took the given seconds, if recording is on."""
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, amount: int = 1):
+        """Adds to the counter, if recording is on."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timed(self, name: str) -> Any:
+        """Returns a context manager timing its block as the operation."""
+        return Timer(self, name) if self.enabled else NULL_TIMER
+
+    def instrumented(self, name: str) -> Callable[[Callable], Callable]:
+        """Returns a decorator timing every call of the function as the operation."""
+        def decorate(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def records(self) -> List[Dict[str, Any]]:
+        """
+        Returns the count, total and percentiles of each operation in milliseconds.
+
+        Operations are given in order of the total time taken, the longest first.
+        """
+        with self.lock:
+            histograms = list(self.histograms.items())
+            records = []
+            for name, histogram in histograms:
+                record = {"operation": name, "count": histogram.count,
+                          "total_ms": histogram.total * 1000}
+                for percent in PERCENTILES:
+                    record["p%d_ms" % percent] = histogram.percentile(percent) * 1000
+                record["max_ms"] = histogram.maximum * 1000
+                records.append(record)
+        return sorted(records, key=lambda record: -record["total_ms"])
+
+    def counter_records(self) -> List[Dict[str, Any]]:
+        """Returns the value of each counter."""
+        with self.lock:
+            return [{"counter": name, "value": value}
+                    for name, value in sorted(self.counters.items())]
+
+    def prometheus_text(self) -> str:
+        """Returns everything recorded in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            if self.histograms:
+                name = PROMETHEUS_PREFIX + "_operation_seconds"
+                lines += ["# HELP %s How long each operation took." % name,
+                          "# TYPE %s histogram" % name]
+            for operation, histogram in sorted(self.histograms.items()):
+                label = 'operation="%s"' % escape_label(operation)
+                cumulative = 0
+                for index, (bound, count) in enumerate(zip(BOUNDS, histogram.buckets)):
+                    cumulative += count
+                    if index % EXPORT_STEP == 0:
+                        lines.append('%s_bucket{%s,le="%.6g"} %d'
+                                     % (name, label, bound, cumulative))
+                lines += ['%s_bucket{%s,le="+Inf"} %d' % (name, label, histogram.count),
+                          "%s_sum{%s} %.9g" % (name, label, histogram.total),
+                          "%s_count{%s} %d" % (name, label, histogram.count)]
+            if self.counters:
+                name = PROMETHEUS_PREFIX + "_events_total"
+                lines += ["# HELP %s How many times each event happened." % name,
+                          "# TYPE %s counter" % name]
+            for event, value in sorted(self.counters.items()):
+                lines.append('%s{event="%s"} %d' % (name, escape_label(event), value))
+        return "".join(line + "\n" for line in lines)
+
+    def write_prometheus(self, file_name: str) -> str:
+        """
+        Writes everything recorded to a file in the Prometheus text format.
+
+        The file is replaced in one step, so a collector never reads half of it.
+
+        :param file_name: The file to write.
+        :return: Error message.
+        """
+        temporary = file_name + ".tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as file:
+                file.write(self.prometheus_text())
+            os.replace(temporary, file_name)
+        except OSError as error:
+            LOGGER.error("Metrics could not be written to %s: %s", file_name, error)
+            return str(error)
+        return "success"
+
+
+def escape_label(value: str) -> str:
+    """Escapes a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics(bool(os.environ.get("BREWHOUSE_METRICS")))
+timed = METRICS.timed
+instrumented = METRICS.instrumented
+count = METRICS.count
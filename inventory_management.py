@@ -2,7 +2,9 @@
 This module deals with the inventory management.
 
 It also deals with saving and loading of all the states of
-the batches and tanks.
+the batches and tanks. The state is converted to the records of the
+state file in state_store. Finished batches and delivered orders are
+added to the history of the Process object instead of being kept in it.
 
 :attribute BEER_PROCESS:
 A Process object that holds the list of Batch objects
@@ -14,22 +16,149 @@ List of Tank objects with fermentation capabilities.
 List of Tank objects with conditioning capabilities.
 """
 import os
+import copy
 import time
-from datetime import time as t_time
-from typing import Tuple, List
-import logging
+import threading
+import uuid
+from heapq import heappush, heappop
+from itertools import count
+from typing import Tuple, List, Optional, Iterator
+from datetime import date
+from log_setup import get_logger
 import _pickle
+from orders import Order, OrderBook
+from state_store import STATE_FILE, HistoryLog, encode, header, read_state, write_atomic
+from changes import BATCH_MOVED, TANK_CHANGED, STOCK_CHANGED, ORDER_CHANGED, EVERYTHING, \
+    ChangeTracker
+from instrumentation import instrumented
 
 ABS_PATH = os.path.abspath(__file__)
 D_NAME = os.path.dirname(ABS_PATH)
 os.chdir(D_NAME)
 
-LOGGER = logging.getLogger("inv_management")
-LOGGER.setLevel(logging.DEBUG)
-F_HANDLER = logging.FileHandler('log_file.log')
-F_FORMAT = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-F_HANDLER.setFormatter(F_FORMAT)
-LOGGER.addHandler(F_HANDLER)
+LOGGER = get_logger("inv_management")
+
+# How long each timed stage takes in seconds, as (fixed time, time per litre).
+STAGE_DURATIONS = {"brewing": (180 * 3600, 0),
+                   "fermenting": (4 * 7 * 24 * 3600, 0),
+                   "conditioning": (2 * 7 * 24 * 3600, 0),
+                   "bottling": (0, 3600)}
+
+# Litres in each bottle.
+BOTTLE_VOLUME = 0.5
+
+
+def stage_duration(step_name: str, volume: int) -> float:
+    """Returns the number of seconds the given stage takes for a batch of the given volume."""
+    fixed, per_litre = STAGE_DURATIONS[step_name]
+    return fixed + per_litre * volume
+
+
+def time_until_bottled(batch: "Batch", now: float) -> float:
+    """
+    Returns the number of seconds until the batch is bottled if every stage takes its usual time.
+
+    A waiting batch is assumed to start its next stage straight away.
+
+    :param batch: The Batch object in production.
+    :param now: The current time.
+
+    :return: Number of seconds until the batch is finished.
+    """
+    # The timed stages are in the order of steps 1 to 4.
+    stage_names = list(STAGE_DURATIONS)
+    if batch.current_step == 0:
+        remaining = 0
+        next_step = batch.next_step
+    else:
+        stage_end = batch.current_start_time + \
+            stage_duration(stage_names[batch.current_step - 1], batch.volume)
+        remaining = max(0, stage_end - now)
+        next_step = batch.current_step + 1
+    return remaining + sum(stage_duration(name, batch.volume)
+                           for name in stage_names[next_step - 1:])
+
+
+class StageScheduler:
+    """
+    This class keeps track of when each batch finishes its current stage.
+
+    Entries are kept in a min-heap ordered by the time the stage finishes.
+    An entry becomes stale when its batch moves on, and stale entries are
+    dropped lazily whenever they reach the top of the heap.
+    """
+    def __init__(self):
+        """Initialising an empty heap."""
+        self.heap = []
+        self.counter = count()
+
+    def schedule(self, batch: "Batch", step_name: str):
+        """
+        Adds the batch to the heap if the stage it is in is timed.
+
+        :param batch: The Batch object that has just started a stage.
+        :param step_name: The name of the stage the batch is in.
+        """
+        if step_name in STAGE_DURATIONS:
+            finish_time = batch.current_start_time + stage_duration(step_name, batch.volume)
+            heappush(self.heap, (finish_time, next(self.counter), batch.current_step,
+                                 batch.current_start_time, batch))
+
+    def rebuild(self, process_obj: "Process"):
+        """Rebuilds the heap from the batches in each stage of the Process object."""
+        self.heap = []
+        for step_name in STAGE_DURATIONS:
+            for batch in process_obj.steps[step_name]:
+                self.schedule(batch, step_name)
+
+    @staticmethod
+    def is_current(entry: tuple) -> bool:
+        """Checks if the entry still describes the stage its batch is in."""
+        _, _, step, start_time, batch = entry
+        return batch.current_step == step and batch.current_start_time == start_time
+
+    def finished(self, now: float) -> List["Batch"]:
+        """
+        Returns every batch that has finished its current stage by the given time.
+
+        Only the finished entries are popped, so this takes O(k log n) for k
+        finished batches. Entries that are still current are pushed back so the
+        batches are reported again until they are moved to the next stage.
+
+        :param now: The time to compare the finish times against.
+
+        :return: List of finished batches, the earliest finished first.
+        """
+        done = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heappop(self.heap)
+            if self.is_current(entry):
+                done.append(entry)
+        for entry in done:
+            heappush(self.heap, entry)
+        return [entry[-1] for entry in done]
+
+    def next_finish(self, after: float) -> Optional[Tuple[float, "Batch"]]:
+        """
+        Returns the time and batch of the next stage to finish after the given time.
+
+        Stages finishing at or before the time are skipped, as they are found
+        by finished. Batches that are finished but can't move on yet would
+        otherwise be given again each time, straight away.
+
+        :param after: The current time.
+
+        :return: The finish time and the batch, or None if nothing is timed.
+        """
+        skipped = []
+        while self.heap and (not self.is_current(self.heap[0]) or self.heap[0][0] <= after):
+            entry = heappop(self.heap)
+            if self.is_current(entry):
+                skipped.append(entry)
+        result = (self.heap[0][0], self.heap[0][-1]) if self.heap else None
+        for entry in skipped:
+            heappush(self.heap, entry)
+        return result
 
 
 class Process:
@@ -41,6 +170,11 @@ class Process:
     """
     # pylint: disable=too-many-instance-attributes
     # pylint: disable=too-few-public-methods
+    # Counts the changes made so unchanged state isn't saved again.
+    version = 0
+    # Counts the changes to the batches so the history index is only built again for them.
+    batch_version = 0
+
     def __init__(self):
         """
         Initialises each list/dictionary.
@@ -48,6 +182,9 @@ class Process:
         The dictionary steps allows each list to be accessed by its name.
         The list step_names allows the lists to be put in order.
         The dictionary finished stores each finished beer and its quantity.
+        The OrderBook orders stores the orders waiting to be delivered.
+        The HistoryLog history stores the finished batches and delivered orders.
+        The ChangeTracker changes stores the kinds of state changed since the interface updated.
         """
         LOGGER.debug("Initialising Process object")
         self.waiting = []
@@ -56,12 +193,53 @@ class Process:
         self.conditioning = []
         self.bottling = []
         self.finished = {}
-        self.orders = []
+        self.orders = OrderBook()
+        self.history = HistoryLog()
+        self.changes = ChangeTracker()
         self.steps = {"waiting": self.waiting, "brewing": self.brewing,
                       "fermenting": self.fermenting, "conditioning": self.conditioning,
                       "bottling": self.bottling, "finished": self.finished}
         self.step_names = ["waiting", "brewing", "fermenting",
                            "conditioning", "bottling", "finished"]
+        self.scheduler = StageScheduler()
+        # Function returning the current time. Replaced by a virtual clock in simulations.
+        self.clock = time.time
+        # Held while the state is changed or copied so a save is never half way through a change.
+        self.lock = threading.RLock()
+
+    def changed(self, *kinds: str):
+        """
+        Records that the state has changed. Must be called with the lock held.
+
+        :param kinds: The kinds of state changed, from changes. Defaults to every kind.
+        """
+        self.version += 1
+        if not kinds or BATCH_MOVED in kinds:
+            self.batch_version += 1
+        self.changes.notify(kinds or EVERYTHING)
+
+    def __getstate__(self) -> dict:
+        """The scheduler, clock, lock, history and changes are not saved with the state."""
+        state = self.__dict__.copy()
+        state.pop("scheduler", None)
+        state.pop("clock", None)
+        state.pop("lock", None)
+        state.pop("history", None)
+        state.pop("changes", None)
+        return state
+
+    def __setstate__(self, state: dict):
+        """Restoring the saved lists and rebuilding the scheduler."""
+        self.__dict__.update(state)
+        # Orders used to be saved as [beer, quantity, due date] lists.
+        if isinstance(self.orders, list):
+            self.orders = OrderBook.from_lists(self.orders)
+        self.clock = time.time
+        self.lock = threading.RLock()
+        self.history = HistoryLog()
+        self.changes = ChangeTracker()
+        self.scheduler = StageScheduler()
+        self.scheduler.rebuild(self)
 
 
 class Tank:
@@ -83,94 +261,138 @@ class Tank:
         self.current_batch = None
 
 
+def record_transition(process_obj: Process, batch: "Batch"):
+    """Adds the stage the batch has just started to the history of the Process object."""
+    tank = batch.current_tank.name if batch.current_step in [2, 3] else None
+    process_obj.history.append({"type": "transition", "id": batch.batch_id, "beer": batch.beer,
+                                "volume": batch.volume, "step": batch.current_step,
+                                "tank": tank, "time": batch.current_start_time})
+
+
 class Batch:
     """This class is the class for each batch."""
     # pylint: disable=too-few-public-methods
-    def __init__(self, beer: str, volume: int):
+    # Batches saved before batches had ids are given one when they are loaded.
+    batch_id = None
+
+    def __init__(self, beer: str, volume: int, start_time: float = None):
         """
         Initialising the batch.
         :param beer: Name of the beer for the batch.
         :param volume: The volume for the batch.
+        :param start_time: The time the batch was created. Defaults to now.
         """
         LOGGER.debug("Initialising Batch object")
+        self.batch_id = uuid.uuid4().hex
         self.beer = beer
         self.current_step = 0
-        self.current_start_time = time.time()
+        self.current_start_time = time.time() if start_time is None else start_time
         self.next_step = 1
         self.volume = volume
         self.current_tank = None
 
-    def go_next_step(self, process_obj: Process, next_tank: str = None) -> int:
+    def go_next_step(self, process_obj: Process, next_tank: Tank = None) -> int:
         """
         Handles all functions necessary for going to the next stage for the batch.
 
+        The batch isn't moved if the brewing equipment is in use or the next
+        stage needs a tank and none is given.
+
         :param process_obj: The Process object the batches and tanks are in.
-        :param next_tank: The Tank to handle the next stage if any.
+        :param next_tank: The Tank to handle the next stage if any, from the tanks of the site.
 
         :return: The current step of the Batch object.
         """
-        LOGGER.info("Going to the next step")
-        # Don't go to brewing stage if brewing equipment is occupied.
-        if self.next_step == 1 and process_obj.brewing:
-            return self.current_step
-
-        # Removing self from previous stage
-        if self.next_step <= 5:
-            current_step_name = process_obj.step_names[self.current_step]
-            process_obj.steps[current_step_name].remove(self)
-            LOGGER.debug("Removed self from previous step")
-            # Adding to the finished dictionary when finished.
-            if self.next_step == 5:
-                if self.beer in process_obj.finished.keys():
-                    process_obj.finished[self.beer] += self.volume
-                else:
-                    process_obj.finished[self.beer] = self.volume
-                LOGGER.debug("Added self to next step")
-        # If it was in a tank, set tank as empty.
-        if self.current_step in [2, 3]:
-            self.current_tank.current_batch = None
-
-        # If the next step requires a tank.
-        if self.next_step in [2, 3]:
-            if next_tank is not None:
-                next_tank = find_tank_from_name(next_tank.split(" ")[0])
-                if next_tank is not None:
-                    next_tank.current_batch = self
-                    self.current_tank = next_tank
-                    self.current_step = self.next_step
-                    self.next_step += 1
-                else:
-                    # If there are no available tanks set state to waiting.
-                    LOGGER.warning("No tanks available")
-                    self.current_step = 0
-        else:
+        LOGGER.debug("Batch %s going to the next step", self.batch_id)
+        with process_obj.lock:
+            # Don't go to brewing stage if brewing equipment is occupied.
+            if self.next_step == 1 and process_obj.brewing:
+                return self.current_step
+            # Don't go to a stage needing a tank without one.
+            if self.next_step in [2, 3] and next_tank is None:
+                LOGGER.warning("No tank given for batch %s", self.batch_id)
+                return self.current_step
+            kinds = [BATCH_MOVED]
+
+            # Removing self from previous stage
+            if self.next_step <= 5:
+                current_step_name = process_obj.step_names[self.current_step]
+                process_obj.steps[current_step_name].remove(self)
+                LOGGER.debug("Removed self from previous step")
+                # Adding to the finished dictionary when finished.
+                if self.next_step == 5:
+                    if self.beer in process_obj.finished.keys():
+                        process_obj.finished[self.beer] += self.volume
+                    else:
+                        process_obj.finished[self.beer] = self.volume
+                    process_obj.history.append({"type": "finished_batch", "id": self.batch_id,
+                                                "beer": self.beer, "volume": self.volume,
+                                                "time": process_obj.clock()})
+                    kinds.append(STOCK_CHANGED)
+                    LOGGER.debug("Added self to next step")
+            # If it was in a tank, set tank as empty.
+            if self.current_step in [2, 3]:
+                self.current_tank.current_batch = None
+                kinds.append(TANK_CHANGED)
+
+            # If the next step requires a tank.
+            if self.next_step in [2, 3]:
+                next_tank.current_batch = self
+                kinds.append(TANK_CHANGED)
+                self.current_tank = next_tank
             self.current_step = self.next_step
             self.next_step += 1
 
-        if self.current_step <= 4:
-            next_step_name = process_obj.step_names[self.current_step]
-            process_obj.steps[next_step_name].append(self)
+            if self.current_step <= 4:
+                next_step_name = process_obj.step_names[self.current_step]
+                process_obj.steps[next_step_name].append(self)
 
-        self.current_start_time = time.time()
+            self.current_start_time = process_obj.clock()
+            if self.current_step <= 4:
+                process_obj.scheduler.schedule(self, process_obj.step_names[self.current_step])
+            record_transition(process_obj, self)
+            process_obj.changed(*kinds)
 
         LOGGER.debug("Gone to next step")
         return self.current_step
 
 
+@instrumented("state.load")
 def load_objects() -> Tuple[Process, List[Tank]]:
     """
     This module loads saved data.
 
+    The state file is loaded if there is one. Otherwise the state is
+    migrated from the pickle file used by older versions.
+
     :return: The process object and the list of tanks.
     """
     LOGGER.info("Loading data")
     try:
-        with open('process_object.dictionary', 'rb') as file:
+        return objects_from_records(read_state(STATE_FILE))
+    except FileNotFoundError:
+        LOGGER.warning("State file not found. Looking for an old objects file.")
+        return migrate_pickle()
+    except (ValueError, KeyError):
+        LOGGER.critical("State file could not be read")
+        raise
+
+
+def migrate_pickle(file_name: str = 'process_object.dictionary') -> Tuple[Process, List[Tank]]:
+    """
+    Loads the state from the pickle file used by older versions and saves it as a state file.
+
+    The pickle file is left where it is.
+
+    :param file_name: The pickle file.
+
+    :return: The process object and the list of tanks.
+    """
+    try:
+        with open(file_name, 'rb') as file:
             result = _pickle.load(file)
             process_obj = result[0]
             tanks = result[1]
-        return process_obj, tanks
-
     except FileNotFoundError:
         LOGGER.error("File for objects not found")
         print("error: file not found")
@@ -178,6 +400,86 @@ def load_objects() -> Tuple[Process, List[Tank]]:
     except EOFError:
         LOGGER.warning("Empty objects file. Creating new.")
         return False, False
+    LOGGER.info("Migrating %s to %s", file_name, STATE_FILE)
+    for step_name in process_obj.step_names[:-1]:
+        for batch in process_obj.steps[step_name]:
+            if batch.batch_id is None:
+                batch.batch_id = uuid.uuid4().hex
+    write_atomic(encode(state_records(process_obj, tanks)), STATE_FILE)
+    return process_obj, tanks
+
+
+def state_records(process_obj: Process, tanks_list: List[Tank]) -> Iterator[dict]:
+    """
+    Converts the process object and list of tanks to the records of a state file.
+
+    The batches are given in the order they are in each stage, so the
+    waiting list keeps its order.
+    """
+    yield header(process_obj.orders.next_id)
+    for tank in tanks_list:
+        yield {"type": "tank", "name": tank.name, "volume": tank.volume,
+               "function": tank.function}
+    # This is used while the module is loading, before batches_in_production is defined.
+    batches = [batch for step_name in process_obj.step_names[:-1]
+               for batch in process_obj.steps[step_name]]
+    for batch in batches:
+        yield {"type": "batch", "id": batch.batch_id, "beer": batch.beer,
+               "volume": batch.volume, "step": batch.current_step,
+               "next_step": batch.next_step, "start": batch.current_start_time,
+               "tank": None if batch.current_tank is None else batch.current_tank.name}
+    for beer, volume in process_obj.finished.items():
+        yield {"type": "stock", "beer": beer, "volume": volume}
+    for order in process_obj.orders.open.values():
+        yield {"type": "order", "id": order.order_id, "beer": order.beer,
+               "quantity": order.quantity, "due": order.due.isoformat(),
+               "reference": order.reference}
+
+
+def objects_from_records(records: List[dict]) -> Tuple[Process, List[Tank]]:
+    """
+    Creates the process object and list of tanks from the records of a state file.
+
+    :param records: The records, starting with the header.
+
+    :return: The process object and the list of tanks.
+    """
+    process_obj = Process()
+    tanks = []
+    tanks_by_name = {}
+    orders = []
+    # The same due dates appear many times, so each is only parsed once.
+    due_dates = {}
+    for record in records:
+        kind = record["type"]
+        if kind == "tank":
+            tank = Tank(record["name"], record["volume"], record["function"])
+            tanks.append(tank)
+            tanks_by_name[tank.name] = tank
+        elif kind == "batch":
+            batch = Batch(record["beer"], record["volume"], record["start"])
+            batch.batch_id = record["id"]
+            batch.current_step = record["step"]
+            batch.next_step = record["next_step"]
+            if record["tank"] is not None:
+                if record["tank"] not in tanks_by_name:
+                    raise ValueError("Batch " + batch.batch_id + " is in an unknown tank "
+                                     + record["tank"])
+                batch.current_tank = tanks_by_name[record["tank"]]
+                batch.current_tank.current_batch = batch
+            process_obj.steps[process_obj.step_names[batch.current_step]].append(batch)
+        elif kind == "stock":
+            process_obj.finished[record["beer"]] = record["volume"]
+        elif kind == "order":
+            due = record["due"]
+            if due not in due_dates:
+                due_dates[due] = date.fromisoformat(due)
+            orders.append((record["id"], record["beer"], record["quantity"],
+                           due_dates[due], record["reference"]))
+    process_obj.orders.restore(orders, records[0]["next_order_id"])
+    process_obj.scheduler.rebuild(process_obj)
+    LOGGER.debug("Loaded %d tanks and %d orders", len(tanks), len(orders))
+    return process_obj, tanks
 
 
 def get_tank_types(tanks: List[Tank]) -> Tuple[List[Tank], List[Tank]]:
@@ -216,6 +518,21 @@ if not TANKS:
 FERMENTERS, CONDITIONERS = get_tank_types(TANKS)
 
 
+def describe_batch(batch: Batch, step_name: str) -> str:
+    """Returns the string saying how much of which beer the batch is and its stage."""
+    return str(batch.volume) + " Litres of " + batch.beer + " has been " + step_name
+
+
+def describe_ongoing(batch: Batch, process_obj: Process = BEER_PROCESS) -> str:
+    """Returns the string saying how long the batch has been in its stage."""
+    ongoing_time = process_obj.clock()-batch.current_start_time
+    minutes, seconds = divmod(ongoing_time, 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    weeks, days = divmod(days, 7)
+    return " for " + f"{weeks} weeks, {days} days and {hours}:{minutes}:{int(seconds)}"
+
+
 def show_beer_steps(process_obj=BEER_PROCESS) -> Tuple[List[Batch], List[str]]:
     """
     Returns list of batch of objects and strings describing each batch and its current stage.
@@ -228,7 +545,7 @@ def show_beer_steps(process_obj=BEER_PROCESS) -> Tuple[List[Batch], List[str]]:
 
     :return: List of processing batches and a list describing each batch.
     """
-    LOGGER.info("Making string for each batch")
+    LOGGER.debug("Making string for each batch")
     return_list = []
     object_list = []
 
@@ -236,20 +553,25 @@ def show_beer_steps(process_obj=BEER_PROCESS) -> Tuple[List[Batch], List[str]]:
         if key != "finished":
             object_list += step
             for batch in step:
-                ongoing_time = time.time()-batch.current_start_time
-                minutes, seconds = divmod(ongoing_time, 60)
-                hours, minutes = divmod(minutes, 60)
-                days, hours = divmod(hours, 24)
-                weeks, days = divmod(days, 7)
                 # Creating the string for each batch
-                return_list.append(str(batch.volume) + " Litres of " +
-                                   batch.beer + " has been " + key
-                                   + " for " + f"{weeks} weeks, {days} days and "
-                                               f"{hours}:{minutes}:{int(seconds)}")
+                return_list.append(describe_batch(batch, key)
+                                   + describe_ongoing(batch, process_obj))
 
     return object_list, return_list
 
 
+def batches_in_production(process_obj: Process = BEER_PROCESS) -> List[Batch]:
+    """Returns every batch that is waiting or in a stage of production."""
+    return [batch for step_name in process_obj.step_names[:-1]
+            for batch in process_obj.steps[step_name]]
+
+
+def describe_tank(tank: Tank) -> str:
+    """Returns the string saying which batch the tank is processing."""
+    batch = tank.current_batch
+    return tank.name + " is currently processing " + str(batch.volume) + "L of " + batch.beer
+
+
 def show_tanks(tanks: List[Tank] = TANKS) -> List[str]:
     """
     Returns a list of string describing each occupied tank.
@@ -257,15 +579,8 @@ def show_tanks(tanks: List[Tank] = TANKS) -> List[str]:
     :param tanks: List of all the tanks.
     :return: List containing description for each occupied tank.
     """
-    LOGGER.info("Creating string for each tank")
-    return_list = []
-    for tank in tanks:
-        if tank.current_batch is not None:
-            batch = tank.current_batch
-            return_list.append(tank.name + " is currently processing " +
-                               str(batch.volume) + "L of " + batch.beer)
-
-    return return_list
+    LOGGER.debug("Creating string for each tank")
+    return [describe_tank(tank) for tank in tanks if tank.current_batch is not None]
 
 
 def add_batch(process_obj: Process = BEER_PROCESS, beer: str = "Organic Pilsner",
@@ -282,37 +597,65 @@ def add_batch(process_obj: Process = BEER_PROCESS, beer: str = "Organic Pilsner"
 
     :return: The batch object created.
     """
-    LOGGER.info("Creating a new batch")
-    batch = Batch(beer, volume)
-    if not process_obj.brewing:
-        batch.current_step = 1
-        batch.next_step = 2
-        process_obj.brewing.append(batch)
-    else:
-        LOGGER.warning("Batch added to waiting list")
-        process_obj.waiting.append(batch)
+    LOGGER.debug("Creating a new batch")
+    with process_obj.lock:
+        batch = Batch(beer, volume, process_obj.clock())
+        if not process_obj.brewing:
+            batch.current_step = 1
+            batch.next_step = 2
+            process_obj.brewing.append(batch)
+            process_obj.scheduler.schedule(batch, "brewing")
+        else:
+            LOGGER.warning("Batch added to waiting list")
+            process_obj.waiting.append(batch)
+        record_transition(process_obj, batch)
+        process_obj.changed(BATCH_MOVED)
     return batch
 
 
-def available_tanks(volume: int, step: int) -> List[Tank]:
+def available_tanks(volume: int, step: int, tanks: List[Tank] = None) -> List[Tank]:
     """
     Gives all the available tanks for the given step and volume of batch.
 
     :param volume: Volume of batch.
     :param step: The step in the stage of production.
+    :param tanks: The tanks to choose from. Defaults to TANKS.
 
     :return: List of available tank objects.
     """
-    LOGGER.info("Finding all available tanks")
+    LOGGER.debug("Finding all available tanks")
+    if tanks is None:
+        fermenters, conditioners = FERMENTERS, CONDITIONERS
+    else:
+        fermenters, conditioners = get_tank_types(tanks)
     if step == 2:
-        tank_list = FERMENTERS
+        tank_list = fermenters
     elif step == 3:
-        tank_list = CONDITIONERS
+        tank_list = conditioners
     return_list = [tank for tank in tank_list
                    if volume <= tank.volume and tank.current_batch is None]
     return return_list
 
 
+def get_next_tanks(batch_object: Batch, tanks: List[Tank]) -> List[Tank]:
+    """
+    Returns the list of tanks that may be required for the next stage for a batch.
+
+    :param batch_object: The Batch object to look tanks for.
+    :param tanks: The tanks of the site the batch is at.
+    :return: List of tanks required if any.
+    """
+    if batch_object.next_step in [2, 3]:
+        LOGGER.debug("Tanks are required for next step of %s", batch_object.beer)
+        tanks = available_tanks(batch_object.volume, batch_object.next_step, tanks)
+        if batch_object.current_tank is not None and\
+                batch_object.current_tank.function == "conditioner":
+            tanks = [batch_object.current_tank] + tanks
+        if tanks:
+            return tanks
+    return False
+
+
 def find_tank_from_name(name: str) -> Tank:
     """Finds the tank object given its name"""
     for tank in TANKS:
@@ -321,51 +664,199 @@ def find_tank_from_name(name: str) -> Tank:
     return None
 
 
-def process_done(batch_list: List[Batch], time_limit: t_time) -> List[Batch]:
-    """Returns all batches that have been processing longer than the given time limit"""
-    return_list = []
-    for batch in batch_list:
-        if time.time() - batch.current_start_time > time_limit:
-            return_list.append(batch)
-    return return_list
-
-
-def finished_processes() -> List[Batch]:
+def finished_processes(process_obj: Process = BEER_PROCESS) -> List[Batch]:
     """
     Finds all batches that are finished done with its stage.
 
-    All batches in all stages are looked at and compared with the
-    required time for that stage. If the batch has been processing
-    longer than that, it is returned.
+    The first batch waiting to be brewed is finished waiting when the
+    brewing equipment is free. The batches in timed stages are taken from
+    the scheduler of the Process object, which only looks at the batches
+    whose stage has finished.
+
+    :param process_obj: The Process object containing the stages of production.
 
     :return: List of batches finished with the stage.
     """
-    LOGGER.info("Finding all the processes that are finished")
-    done_waiting = []
-    if not BEER_PROCESS.brewing:
-        waits = [batch for batch in BEER_PROCESS.waiting if batch.next_step == 1]
-        if waits:
-            done_waiting.append(waits[0])
+    LOGGER.debug("Finding all the processes that are finished")
+    with process_obj.lock:
+        done_waiting = []
+        if not process_obj.brewing:
+            waits = [batch for batch in process_obj.waiting if batch.next_step == 1]
+            if waits:
+                done_waiting.append(waits[0])
+
+        return done_waiting + process_obj.scheduler.finished(process_obj.clock())
 
-    done_brewing = process_done(BEER_PROCESS.brewing, 180*3600)
-    done_fermenting = process_done(BEER_PROCESS.fermenting, 4*7*24*3600)
-    done_conditioning = process_done(BEER_PROCESS.conditioning, 2*7*24*3600)
-    done_bottling = [batch for batch in BEER_PROCESS.bottling
-                     if time.time()-batch.current_start_time >= batch.volume*3600]
 
-    return done_waiting + done_brewing + done_fermenting + done_conditioning + done_bottling
+def next_stage_finish(process_obj: Process = BEER_PROCESS) -> Optional[Tuple[float, Batch]]:
+    """
+    Finds when the next batch will finish its stage.
 
+    Batches that have already finished their stage are skipped, as they
+    are found by finished_processes.
 
-def save_objects(process_obj: Process, tanks_list: List[Tank]) -> str:
+    :param process_obj: The Process object containing the stages of production.
+
+    :return: The time the stage finishes and the batch, or None if no batch is in a timed stage.
+    """
+    with process_obj.lock:
+        return process_obj.scheduler.next_finish(after=process_obj.clock())
+
+
+def deliver_order(order_id: int, process_obj: Process = BEER_PROCESS) -> bool:
+    """
+    Delivers an order if there are enough bottles in the finished stock.
+
+    :param order_id: The id of the order.
+    :param process_obj: The Process object containing the orders and finished stock.
+
+    :return: Whether the order was delivered.
+    """
+    LOGGER.info("Delivering order")
+    with process_obj.lock:
+        order = process_obj.orders.get(order_id)
+        if order is None or \
+                process_obj.finished.get(order.beer, 0) < order.quantity * BOTTLE_VOLUME:
+            LOGGER.warning("Not enough inventory")
+            return False
+        process_obj.orders.deliver(order_id)
+        process_obj.finished[order.beer] -= order.quantity * BOTTLE_VOLUME
+        archive_order(process_obj, order)
+        process_obj.changed(ORDER_CHANGED, STOCK_CHANGED)
+    return True
+
+
+def archive_order(process_obj: Process, order: Order):
+    """Adds a delivered order to the history of the Process object."""
+    process_obj.history.append({"type": "delivered_order", "id": order.order_id,
+                                "beer": order.beer, "quantity": order.quantity,
+                                "due": order.due.isoformat(), "reference": order.reference,
+                                "time": process_obj.clock()})
+
+
+def fulfil_orders(process_obj: Process = BEER_PROCESS) -> List[Order]:
+    """
+    Delivers every order that can be made from the finished stock, the earliest due first.
+
+    :param process_obj: The Process object containing the orders and finished stock.
+
+    :return: The orders delivered.
+    """
+    LOGGER.info("Fulfilling all possible orders")
+    with process_obj.lock:
+        stock = {beer: volume / BOTTLE_VOLUME for beer, volume in process_obj.finished.items()}
+        delivered = process_obj.orders.fulfil(stock)
+        for order in delivered:
+            process_obj.finished[order.beer] -= order.quantity * BOTTLE_VOLUME
+            archive_order(process_obj, order)
+        if delivered:
+            process_obj.changed(ORDER_CHANGED, STOCK_CHANGED)
+    return delivered
+
+
+def add_order(beer: str, quantity: int, due: date, process_obj: Process = BEER_PROCESS) -> Order:
+    """
+    Adds a new order.
+
+    :param beer: Name of the beer ordered.
+    :param quantity: Number of bottles ordered.
+    :param due: The date the order is due.
+    :param process_obj: The Process object containing the orders.
+
+    :return: The Order object created.
+    """
+    LOGGER.info("Adding order")
+    with process_obj.lock:
+        order = process_obj.orders.add(beer, quantity, due)
+        process_obj.changed(ORDER_CHANGED)
+    return order
+
+
+def import_orders(file_dir: str, process_obj: Process = BEER_PROCESS) -> int:
+    """
+    Adds every order in a csv file.
+
+    :param file_dir: The directory of the csv file.
+    :param process_obj: The Process object containing the orders.
+
+    :return: The number of orders added.
+    """
+    LOGGER.info("Importing orders")
+    with process_obj.lock:
+        added = process_obj.orders.import_csv(file_dir)
+        process_obj.changed(ORDER_CHANGED)
+    return added
+
+
+def copy_objects(process_obj: Process, tanks_list: List[Tank]) -> Tuple[Process, List[Tank]]:
+    """
+    Copies the process object and list of tanks for saving.
+
+    Only the lists, batches and tanks that change are copied. Orders are
+    shared through OrderBook.copy. The copy is not meant to be changed.
+
+    :return: The copied process object and list of tanks.
+    """
+    tank_copies = {id(tank): copy.copy(tank) for tank in tanks_list}
+    process_copy = Process.__new__(Process)
+    process_copy.__dict__.update(process_obj.__getstate__())
+    process_copy.steps = {}
+    for step_name in process_obj.step_names[:-1]:
+        batch_copies = []
+        for batch in process_obj.steps[step_name]:
+            batch_copy = copy.copy(batch)
+            if batch.current_tank is not None:
+                batch_copy.current_tank = tank_copies.setdefault(id(batch.current_tank),
+                                                                 copy.copy(batch.current_tank))
+                batch_copy.current_tank.current_batch = batch_copy
+            batch_copies.append(batch_copy)
+        setattr(process_copy, step_name, batch_copies)
+        process_copy.steps[step_name] = batch_copies
+    process_copy.finished = dict(process_obj.finished)
+    process_copy.steps["finished"] = process_copy.finished
+    process_copy.orders = process_obj.orders.copy()
+    # A tank still pointing at the original batch has a batch that has left production.
+    for tank_copy in tank_copies.values():
+        if tank_copy.current_batch is not None and \
+                tank_copy.current_batch.current_tank is not tank_copy:
+            tank_copy.current_batch = None
+    return process_copy, [tank_copies[id(tank)] for tank in tanks_list]
+
+
+def snapshot_objects(process_obj: Process, tanks_list: List[Tank]) -> Tuple[int, bytes]:
+    """
+    Takes a consistent copy of the process object and list of tanks and encodes it.
+
+    The lock is only held while copy_objects copies the parts that change,
+    so the copy is never taken half way through a change. The copy is then
+    encoded without the lock, so changes aren't held up by a save.
+
+    :return: The version of the state and the encoded state file.
+    """
+    with process_obj.lock:
+        version = process_obj.version
+        copies = copy_objects(process_obj, tanks_list)
+    return version, encode(state_records(*copies))
+
+
+def write_snapshot(process_obj: Process, data: bytes, file_name: str = STATE_FILE) -> str:
+    """
+    Writes an encoded state to the file.
+
+    The new history is appended to the history file first, so a finished
+    batch or delivered order that has left the state is never lost.
+    """
+    result = process_obj.history.flush()
+    if result != "success":
+        return result
+    return write_atomic(data, file_name)
+
+
+@instrumented("state.save")
+def save_objects(process_obj: Process, tanks_list: List[Tank], file_name: str = STATE_FILE) -> str:
     """Saves the process object and list of tanks."""
     LOGGER.info("Saving objects")
-    try:
-        with open('process_object.dictionary', 'wb') as file:
-            _pickle.dump([process_obj, tanks_list], file)
-            return "success"
-    except FileNotFoundError:
-        LOGGER.error("Objects file not found")
-        return "File not found"
+    return write_snapshot(process_obj, snapshot_objects(process_obj, tanks_list)[1], file_name)
 
 
 if __name__ == "__main__":
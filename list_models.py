@@ -0,0 +1,214 @@
+"""
+This module has the list model and delegate used for the lists in the user interface.
+
+Each row has a key, such as the id of a batch or an order. When the rows
+are set again, the new rows are matched to the old ones by key, so only
+the rows that were added, removed, moved or changed are signalled to the
+view. The action button of each row is drawn by ButtonDelegate instead of
+being a widget, so showing a row doesn't create any widgets.
+"""
+import os
+from typing import List, Callable, Any, Hashable, NamedTuple, Optional
+from log_setup import get_logger
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("list_models")
+
+ROW_ROLE = QtCore.Qt.UserRole
+BUTTON_WIDTH = 80
+BUTTON_HEIGHT = 24
+MARGIN = 4
+
+
+class Row(NamedTuple):
+    """
+    One row of a list.
+
+    :attribute key: The key identifying the row between updates.
+    :attribute text: The text shown, also used to tell if the row has changed.
+    :attribute action: The text of the action button, or None if there isn't one.
+    :attribute payload: The object the row is about, such as a Batch or an Order.
+    """
+    key: Hashable
+    text: str
+    action: Optional[str] = None
+    payload: Any = None
+
+
+# pylint: disable=c-extension-no-member
+class KeyedListModel(QtCore.QAbstractListModel):
+    """This class is a list model of rows that are updated by key."""
+    def __init__(self, parent: QtCore.QObject = None,
+                 describe: Callable[[Row], str] = None):
+        """
+        Initialising an empty model.
+
+        :param parent: The Qt parent of the model.
+        :param describe:
+        Function giving the text to show for a row, if it should be worked out
+        when the row is shown, such as for the time a batch has been processing.
+        """
+        super().__init__(parent)
+        self.rows = []
+        self.describe = describe
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        """Returns the number of rows."""
+        # pylint: disable=invalid-name
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole) -> Any:
+        """Returns the text or the Row for the index."""
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return row.text if self.describe is None else self.describe(row)
+        if role == ROW_ROLE:
+            return row
+        return None
+
+    def set_rows(self, new_rows: List[Row]):
+        """
+        Changes the rows to the new rows, signalling only what has changed.
+
+        Rows whose keys are gone are removed first. The new rows are then
+        gone through in order, inserting the runs of new keys, moving rows
+        that are out of place and updating rows whose text or action changed.
+
+        :param new_rows: The new rows, each with a different key.
+        """
+        if not self.rows:
+            if new_rows:
+                self.beginResetModel()
+                self.rows = list(new_rows)
+                self.endResetModel()
+            return
+        new_keys = {row.key for row in new_rows}
+        root = QtCore.QModelIndex()
+
+        position = len(self.rows) - 1
+        while position >= 0:
+            if self.rows[position].key in new_keys:
+                position -= 1
+                continue
+            first = position
+            while first > 0 and self.rows[first - 1].key not in new_keys:
+                first -= 1
+            self.beginRemoveRows(root, first, position)
+            del self.rows[first:position + 1]
+            self.endRemoveRows()
+            position = first - 1
+
+        old_keys = {row.key for row in self.rows}
+        position = 0
+        while position < len(new_rows):
+            row = new_rows[position]
+            if row.key not in old_keys:
+                last = position
+                while last + 1 < len(new_rows) and new_rows[last + 1].key not in old_keys:
+                    last += 1
+                self.beginInsertRows(root, position, last)
+                self.rows[position:position] = new_rows[position:last + 1]
+                self.endInsertRows()
+                position = last + 1
+                continue
+            if self.rows[position].key != row.key:
+                source = next(index for index in range(position + 1, len(self.rows))
+                              if self.rows[index].key == row.key)
+                self.beginMoveRows(root, source, source, root, position)
+                self.rows.insert(position, self.rows.pop(source))
+                self.endMoveRows()
+            if self.rows[position] != row:
+                self.rows[position] = row
+                index = self.index(position)
+                self.dataChanged.emit(index, index)
+            position += 1
+
+    def row(self, index: QtCore.QModelIndex) -> Row:
+        """Returns the Row at the index."""
+        return self.rows[index.row()]
+
+
+class ButtonDelegate(QtWidgets.QStyledItemDelegate):
+    """This class draws each row with its action button and says when a button is clicked."""
+    clicked = QtCore.pyqtSignal(object, QtCore.QPoint)
+
+    @staticmethod
+    def button_rect(option: QtWidgets.QStyleOptionViewItem) -> QtCore.QRect:
+        """Returns where the button is drawn in the row."""
+        rect = option.rect
+        return QtCore.QRect(rect.right() - BUTTON_WIDTH - MARGIN,
+                            rect.top() + (rect.height() - BUTTON_HEIGHT) // 2,
+                            BUTTON_WIDTH, BUTTON_HEIGHT)
+
+    @staticmethod
+    def text_rect(option: QtWidgets.QStyleOptionViewItem, row: Row) -> QtCore.QRect:
+        """Returns where the text is drawn in the row, leaving room for the button."""
+        room = BUTTON_WIDTH + 2 * MARGIN if row.action else 0
+        return option.rect.adjusted(MARGIN, MARGIN, -MARGIN - room, -MARGIN)
+
+    def paint(self, painter: QtGui.QPainter, option: QtWidgets.QStyleOptionViewItem,
+              index: QtCore.QModelIndex):
+        """Draws the text of the row and its button."""
+        row = index.data(ROW_ROLE)
+        style = option.widget.style() if option.widget else QtWidgets.QApplication.style()
+        painter.save()
+        painter.drawText(self.text_rect(option, row),
+                         QtCore.Qt.AlignVCenter | QtCore.Qt.TextWordWrap, index.data())
+        painter.restore()
+        if row.action:
+            button = QtWidgets.QStyleOptionButton()
+            button.rect = self.button_rect(option)
+            button.text = row.action
+            button.state = QtWidgets.QStyle.State_Enabled | QtWidgets.QStyle.State_Raised
+            style.drawControl(QtWidgets.QStyle.CE_PushButton, button, painter, option.widget)
+
+    def sizeHint(self, option: QtWidgets.QStyleOptionViewItem,
+                 index: QtCore.QModelIndex) -> QtCore.QSize:
+        """Returns the size of the row, with the text wrapped beside the button."""
+        # pylint: disable=invalid-name
+        row = index.data(ROW_ROLE)
+        width = option.rect.width() if option.rect.width() > 0 else 400
+        room = BUTTON_WIDTH + 4 * MARGIN if row.action else 2 * MARGIN
+        text = option.fontMetrics.boundingRect(
+            QtCore.QRect(0, 0, max(width - room, 50), 10000), QtCore.Qt.TextWordWrap,
+            index.data())
+        return QtCore.QSize(width, max(text.height(), BUTTON_HEIGHT if row.action else 0)
+                            + 2 * MARGIN)
+
+    def editorEvent(self, event: QtCore.QEvent, model: QtCore.QAbstractItemModel,
+                    option: QtWidgets.QStyleOptionViewItem, index: QtCore.QModelIndex) -> bool:
+        """Sends clicked with the Row when its button is clicked."""
+        # pylint: disable=invalid-name
+        if event.type() == QtCore.QEvent.MouseButtonRelease:
+            row = index.data(ROW_ROLE)
+            if row.action and self.button_rect(option).contains(event.pos()):
+                self.clicked.emit(row, event.globalPos())
+                return True
+        return False
+
+
+def make_list_view(parent: QtWidgets.QWidget, model: KeyedListModel,
+                   uniform: bool = False) -> QtWidgets.QListView:
+    """
+    Makes a list view of the model drawn with a ButtonDelegate.
+
+    :param parent: The parent widget.
+    :param model: The model to show.
+    :param uniform: Whether every row is the same height, which is much quicker for long lists.
+
+    :return: The list view. Its delegate is kept as its itemDelegate.
+    """
+    view = QtWidgets.QListView(parent)
+    view.setModel(model)
+    view.setItemDelegate(ButtonDelegate(view))
+    view.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+    view.setWordWrap(True)
+    view.setUniformItemSizes(uniform)
+    view.setResizeMode(QtWidgets.QListView.Adjust)
+    return view
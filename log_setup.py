@@ -0,0 +1,161 @@
+"""
+This module sets up the logging of every module.
+
+Every module used to add its own FileHandler to its logger, so records
+were written to the file on the thread that made them, and loggers
+shared by two modules wrote each record twice. Now each module gets its
+logger from get_logger, which adds the one QueueHandler to it once.
+Records are put on a queue and written to log_file.log by a
+QueueListener on its own thread, so the interface never waits for the
+disk. The file is rotated when it gets too big.
+
+The level of each logger is set from LEVELS. The BREWHOUSE_LOG_LEVELS
+environment variable changes them, as a default level and levels for
+named loggers, such as "WARNING,service=DEBUG,inv_management=INFO".
+
+:attribute LOG_FILE: The file records are written to.
+:attribute LEVELS: The level of each logger by name. Loggers not in it use DEFAULT_LEVEL.
+"""
+import os
+import queue
+import atexit
+import threading
+import logging
+from multiprocessing import util
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+
+LOG_FILE = os.path.join(D_NAME, 'log_file.log')
+# The file is rotated at this size, keeping this many old files.
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LEVEL = logging.INFO
+LEVELS = {}
+
+FORMATTER = logging.Formatter(LOG_FORMAT)
+RECORDS = queue.SimpleQueue()
+LISTENER = None
+SETUP_LOCK = threading.Lock()
+# The loggers given out by get_logger, by name.
+LOGGERS = {}
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    This class puts records on the queue without copying them.
+
+    QueueHandler copies each record and formats it in the thread logging
+    it. The file handler of the listener formats it anyway, so only the
+    message and the exception are made into text here, which is all that
+    can change before the listener gets to the record.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+QUEUE_HANDLER = RecordQueueHandler(RECORDS)
+
+
+def parse_levels(text: str) -> Dict[str, int]:
+    """
+    Reads the levels given as in BREWHOUSE_LOG_LEVELS.
+
+    :param text: A default level and levels for named loggers, separated by commas.
+
+    :return: The level of each logger by name, the default under "".
+    """
+    levels = {}
+    for part in text.split(","):
+        name, _, level = part.strip().rpartition("=")
+        if level:
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    # Names that aren't levels are given back as strings by getLevelName.
+    return {name: level for name, level in levels.items() if isinstance(level, int)}
+
+
+def level_of(name: str) -> int:
+    """Returns the level the logger with the given name is set to."""
+    return LEVELS.get(name, LEVELS.get("", DEFAULT_LEVEL))
+
+
+def start_listener():
+    """Starts writing the records in the queue to the log file on a thread of its own."""
+    global LISTENER  # pylint: disable=global-statement
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT,
+                                       encoding="utf-8")
+    file_handler.setFormatter(FORMATTER)
+    LISTENER = QueueListener(RECORDS, file_handler)
+    LISTENER.start()
+
+
+def stop_listener():
+    """Writes the records left in the queue and stops the listener. Run at exit."""
+    global LISTENER  # pylint: disable=global-statement
+    with SETUP_LOCK:
+        if LISTENER is not None:
+            LISTENER.stop()
+            for handler in LISTENER.handlers:
+                handler.close()
+            LISTENER = None
+
+
+def restart_in_child():
+    """
+    Gives a forked process a queue and listener of its own.
+
+    The listener thread isn't copied into the child, and the queue may have
+    been locked by it when the process was forked. Worker processes of a
+    process pool leave without running atexit, so the listener is also
+    stopped by the exit function of multiprocessing.
+    """
+    global RECORDS, LISTENER, SETUP_LOCK  # pylint: disable=global-statement
+    SETUP_LOCK = threading.Lock()
+    RECORDS = queue.SimpleQueue()
+    QUEUE_HANDLER.queue = RECORDS
+    LISTENER = None
+    if LOGGERS:
+        start_listener()
+        util.Finalize(None, stop_listener, exitpriority=0)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns the logger with the given name, writing to the log file through the queue.
+
+    The queue handler is only added once, however many modules ask for the logger.
+
+    :param name: The name of the logger, which is the subsystem its level is set by.
+    """
+    with SETUP_LOCK:
+        if LISTENER is None:
+            start_listener()
+        logger = LOGGERS.get(name)
+        if logger is None:
+            logger = logging.getLogger(name)
+            logger.setLevel(level_of(name))
+            if QUEUE_HANDLER not in logger.handlers:
+                logger.addHandler(QUEUE_HANDLER)
+            LOGGERS[name] = logger
+        return logger
+
+
+def set_level(name: str, level: int):
+    """Changes the level of the logger with the given name, or the default with ""."""
+    LEVELS[name] = level
+    for logger_name, logger in LOGGERS.items():
+        logger.setLevel(level_of(logger_name))
+
+
+LEVELS.update(parse_levels(os.environ.get("BREWHOUSE_LOG_LEVELS", "")))
+atexit.register(stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=restart_in_child)
@@ -0,0 +1,263 @@
+"""
+This module deals with the orders waiting to be delivered.
+
+Open orders are kept in a dictionary by their id so they can be found,
+cancelled and delivered in constant time. For each beer a heap of
+(due date, id) gives the order that is due first, and a list of
+(due date, id) kept sorted gives every order in the order they are due.
+Cancelled and delivered orders are left in the heaps and the list and
+skipped when they are reached.
+"""
+import os
+import csv
+from bisect import insort
+from heapq import heappush, heappop, heapify
+from datetime import date, datetime
+from typing import Dict, List, Iterator, Optional
+from log_setup import get_logger
+from dateutil.parser import parse
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("orders")
+
+
+class Order:
+    """This class is the class for each order."""
+    # pylint: disable=too-few-public-methods
+    def __init__(self, order_id: int, beer: str, quantity: int, due: date, reference: str = None):
+        """
+        Initialising the order.
+
+        :param order_id: The id of the order in the order book.
+        :param beer: Name of the beer ordered.
+        :param quantity: Number of bottles ordered.
+        :param due: The date the order is due.
+        :param reference: Reference for the order such as the invoice number.
+        """
+        self.order_id = order_id
+        self.beer = beer
+        self.quantity = quantity
+        self.due = due
+        self.reference = reference
+        self.status = "open"
+
+
+def parse_due_date(text: str) -> date:
+    """Parses a date such as '02-Nov-18', falling back to dateutil for other formats."""
+    try:
+        return datetime.strptime(text, "%d-%b-%y").date()
+    except ValueError:
+        return parse(text).date()
+
+
+class OrderBook:
+    """This class holds every open order, indexed by id and by due date for each beer."""
+    def __init__(self):
+        """Initialising an empty order book."""
+        self.open = {}
+        self.heaps = {}
+        self.by_due = []
+        self.counts = {}
+        self.next_id = 1
+
+    def __len__(self) -> int:
+        """Returns the number of open orders."""
+        return len(self.open)
+
+    def __iter__(self) -> Iterator[Order]:
+        """Iterates through the open orders, the earliest due first, without sorting them."""
+        for _, order_id in list(self.by_due):
+            order = self.open.get(order_id)
+            if order is not None:
+                yield order
+
+    def get(self, order_id: int) -> Optional[Order]:
+        """Returns the open order with the given id, or None if there isn't one."""
+        return self.open.get(order_id)
+
+    def add(self, beer: str, quantity: int, due: date, reference: str = None) -> Order:
+        """
+        Adds a new open order.
+
+        :param beer: Name of the beer ordered.
+        :param quantity: Number of bottles ordered.
+        :param due: The date the order is due.
+        :param reference: Reference for the order such as the invoice number.
+
+        :return: The Order object created.
+        """
+        order = self.create(beer, quantity, due, reference)
+        heappush(self.heaps.setdefault(beer, []), (due, order.order_id))
+        insort(self.by_due, (due, order.order_id))
+        return order
+
+    def create(self, beer: str, quantity: int, due: date, reference: str = None) -> Order:
+        """Creates an open order without adding it to the heap of the beer or the due dates."""
+        order = Order(self.next_id, beer, quantity, due, reference)
+        self.next_id += 1
+        self.open[order.order_id] = order
+        self.counts[beer] = self.counts.get(beer, 0) + 1
+        return order
+
+    def close(self, order_id: int, status: str) -> Optional[Order]:
+        """
+        Removes an open order, leaving its heap entry to be skipped later.
+
+        The heap of the beer, and the list of due dates, are rebuilt when
+        most of their entries are closed orders so they don't keep growing.
+        """
+        order = self.open.pop(order_id, None)
+        if order is None:
+            return None
+        order.status = status
+        self.counts[order.beer] -= 1
+        heap = self.heaps[order.beer]
+        if len(heap) > 2 * self.counts[order.beer] + 32:
+            heap[:] = [entry for entry in heap if entry[1] in self.open]
+            heapify(heap)
+        if len(self.by_due) > 2 * len(self.open) + 32:
+            self.by_due = [entry for entry in self.by_due if entry[1] in self.open]
+        return order
+
+    def cancel(self, order_id: int) -> Optional[Order]:
+        """Cancels the open order with the given id."""
+        LOGGER.info("Cancelling order %d", order_id)
+        return self.close(order_id, "cancelled")
+
+    def deliver(self, order_id: int) -> Optional[Order]:
+        """Marks the open order with the given id as delivered."""
+        LOGGER.info("Delivering order %d", order_id)
+        return self.close(order_id, "delivered")
+
+    def peek(self, beer: str) -> Optional[Order]:
+        """Returns the open order for the beer that is due first."""
+        heap = self.heaps.get(beer, [])
+        while heap and heap[0][1] not in self.open:
+            heappop(heap)
+        return self.open[heap[0][1]] if heap else None
+
+    def fulfil(self, stock: Dict[str, float]) -> List[Order]:
+        """
+        Delivers every order possible from the stock, the earliest due first.
+
+        For each beer, orders are delivered in order of due date until there
+        isn't enough stock for the next one, so later orders never take
+        stock from earlier ones.
+
+        :param stock: The number of bottles of each beer. Updated in place.
+
+        :return: The orders delivered.
+        """
+        LOGGER.info("Fulfilling orders")
+        delivered = []
+        for beer in self.heaps:
+            order = self.peek(beer)
+            while order is not None and stock.get(beer, 0) >= order.quantity:
+                stock[beer] -= order.quantity
+                delivered.append(self.close(order.order_id, "delivered"))
+                order = self.peek(beer)
+        LOGGER.debug("%d orders fulfilled", len(delivered))
+        return delivered
+
+    def import_csv(self, file_dir: str) -> int:
+        """
+        Adds every order in a csv file.
+
+        The file uses the same columns as the sales data, 'Recipe',
+        'Quantity ordered' and 'Date Required', with an optional
+        'Invoice Number' kept as the reference. Every row is read and
+        checked before any order is added, so a bad row, such as one
+        without a recipe or with a quantity of 0 or less, leaves the book
+        as it was. The heaps and the list of due dates are rebuilt once at
+        the end instead of adding each order.
+
+        :param file_dir: The directory of the csv file.
+
+        :return: The number of orders added.
+        """
+        LOGGER.info("Importing orders from %s", file_dir)
+        rows = []
+        # The same dates appear many times, so each is only parsed once.
+        due_dates = {}
+        with open(file_dir, newline='') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                # A short row has None for the columns it is missing.
+                text = row["Date Required"] or ""
+                if text not in due_dates:
+                    due_dates[text] = parse_due_date(text)
+                beer, quantity = row["Recipe"] or "", int(row["Quantity ordered"] or 0)
+                if not beer.strip() or quantity <= 0:
+                    raise ValueError("The order on line %d of %s needs a recipe and a quantity "
+                                     "more than 0" % (reader.line_num, file_dir))
+                rows.append((beer, quantity, due_dates[text], row.get("Invoice Number")))
+        for beer, quantity, due, reference in rows:
+            order = self.create(beer, quantity, due, reference)
+            self.heaps.setdefault(beer, []).append((due, order.order_id))
+            self.by_due.append((due, order.order_id))
+        for heap in self.heaps.values():
+            heapify(heap)
+        self.by_due.sort()
+        LOGGER.debug("%d orders imported", len(rows))
+        return len(rows)
+
+    def copy(self) -> "OrderBook":
+        """
+        Returns a copy of the order book for saving.
+
+        The Order objects are shared as they aren't changed while open. The
+        heaps and the list of due dates aren't copied as they are rebuilt
+        when the copy is loaded.
+        """
+        book = OrderBook()
+        book.open = dict(self.open)
+        book.counts = dict(self.counts)
+        book.next_id = self.next_id
+        return book
+
+    def __getstate__(self) -> dict:
+        """
+        Saves the orders as tuples with the dates as day numbers.
+
+        This is much quicker to save than the Order objects and heaps, which
+        are rebuilt on loading.
+        """
+        return {"open": [(order.order_id, order.beer, order.quantity, order.due.toordinal(),
+                          order.reference) for order in self.open.values()],
+                "next_id": self.next_id}
+
+    def __setstate__(self, state: dict):
+        """Rebuilding the orders and heaps from the saved tuples."""
+        self.__init__()
+        self.restore([(order_id, beer, quantity, date.fromordinal(due), reference)
+                      for order_id, beer, quantity, due, reference in state["open"]],
+                     state["next_id"])
+
+    def restore(self, orders: List[tuple], next_id: int):
+        """
+        Adds saved open orders with the ids they were saved with.
+
+        :param orders: The (id, beer, quantity, due date, reference) of each order.
+        :param next_id: The id the next new order will be given.
+        """
+        for order_id, beer, quantity, due, reference in orders:
+            order = Order(order_id, beer, quantity, due, reference)
+            self.open[order_id] = order
+            self.counts[beer] = self.counts.get(beer, 0) + 1
+            self.heaps.setdefault(beer, []).append((due, order_id))
+            self.by_due.append((due, order_id))
+        for heap in self.heaps.values():
+            heapify(heap)
+        self.by_due.sort()
+        self.next_id = max(next_id, self.next_id)
+
+    @classmethod
+    def from_lists(cls, orders: List[list]) -> "OrderBook":
+        """Creates an order book from orders saved as [beer, quantity, due date] lists."""
+        book = cls()
+        for beer, quantity, due in orders:
+            book.add(beer, quantity, due)
+        return book
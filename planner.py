@@ -0,0 +1,436 @@
+"""
+This module plans the batches to brew over a horizon to meet the predicted demand.
+
+Unlike beer_suggestion, which picks one beer for the fermenters free now,
+the planner builds a full schedule of batch starts, tank assignments and
+volumes. A greedy pass fills every brewing slot with the beer that is
+furthest behind its demand when the batch would be ready, booking the
+earliest free fermenter and conditioner that fit. A local search then moves
+planned batches between beers while that lowers the total shortage.
+
+The projected stock of every beer for every day is kept in a numpy array
+so each step only updates the rows that change.
+"""
+import os
+import time
+from math import ceil
+from datetime import datetime, timedelta
+from typing import Tuple, List, Dict, NamedTuple, Optional
+from log_setup import get_logger
+import numpy as np
+from inventory_management import Process, Tank, BEER_PROCESS, TANKS, BOTTLE_VOLUME, \
+    STAGE_DURATIONS, stage_duration, time_until_bottled, batches_in_production
+from sales_predictions import daily_matrix
+from suggestions import current_datetime
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("planner")
+
+DAY = 24 * 3600
+
+
+class PlannedBatch(NamedTuple):
+    """
+    One batch in the production plan.
+
+    :attribute start: When brewing starts.
+    :attribute beer: Name of the beer.
+    :attribute volume: Volume of the batch in litres.
+    :attribute fermenter: Name of the tank used for fermenting.
+    :attribute conditioner: Name of the tank used for conditioning.
+    :attribute ready: When the batch is bottled and ready.
+    :attribute queued: Whether the batch is already waiting in the Process object.
+    """
+    start: datetime
+    beer: str
+    volume: int
+    fermenter: str
+    conditioner: str
+    ready: datetime
+    queued: bool = False
+
+
+class Plan(NamedTuple):
+    """
+    The result of plan_production.
+
+    :attribute batches: The planned batches in order of brewing.
+    :attribute dates: The dates of the horizon.
+    :attribute projected: The projected bottles in stock of each beer for each date.
+    :attribute shortage: Sum over all beers and dates of the bottles short.
+    :attribute idle_tank_days: Sum over all tanks of the days spent empty.
+    """
+    batches: List[PlannedBatch]
+    dates: List[datetime]
+    projected: Dict[str, np.ndarray]
+    shortage: float
+    idle_tank_days: float
+
+
+class TankBook:
+    """
+    This class books the tanks and brewing equipment over the horizon.
+
+    Times are in days from the start of the plan. Each tank is free from the
+    time in free_at onwards, as the planner books batches in order of time.
+    """
+    def __init__(self, tanks: List[Tank], brewhouses: int):
+        """
+        Initialising every tank and brewhouse as free.
+
+        :param tanks: The tanks that can be booked.
+        :param brewhouses: Number of batches that can be brewed at once.
+        """
+        self.names = [tank.name for tank in tanks]
+        self.volumes = np.array([tank.volume for tank in tanks], dtype=float)
+        self.fermenter = np.array([tank.function in ["both", "fermenter"] for tank in tanks])
+        self.conditioner = np.array([tank.function in ["both", "conditioner"] for tank in tanks])
+        self.both = self.fermenter & self.conditioner
+        self.free_at = np.zeros(len(tanks))
+        self.busy = np.zeros(len(tanks))
+        self.brewhouses = [0.0] * brewhouses
+
+    def occupy(self, index: int, start: float, end: float, horizon: float):
+        """Books the tank from start to end, counting the busy time within the horizon."""
+        self.free_at[index] = end
+        self.busy[index] += max(0.0, min(end, horizon) - max(start, 0.0))
+
+    def earliest(self, mask: np.ndarray, volume: float, wanted: float) -> int:
+        """
+        Finds the tank that can take the volume the earliest after the wanted time.
+
+        Ties are broken by the smallest tank so large tanks are kept free.
+
+        :return: The index of the tank, or -1 if no tank fits.
+        """
+        fits = mask & (self.volumes >= volume)
+        if not fits.any():
+            return -1
+        ready = np.where(fits, np.maximum(self.free_at, wanted), np.inf)
+        best = ready.min()
+        choices = np.flatnonzero(ready == best)
+        return int(choices[np.argmin(self.volumes[choices])])
+
+    def book(self, volume: float, earliest: float,
+             horizon: float) -> Optional[Tuple[float, str, str, float]]:
+        """
+        Books the brewing equipment, a fermenter and a conditioner for one batch.
+
+        Brewing is delayed until a fermenter is free when it finishes.
+
+        :param volume: Volume of the batch in litres.
+        :param earliest: The earliest day brewing can start.
+        :param horizon: Number of days in the horizon.
+
+        :return:
+        The brewing start day, the fermenter, the conditioner and the day conditioning
+        ends, or None if no tank fits the batch.
+        """
+        brew = stage_duration("brewing", volume) / DAY
+        house = int(np.argmin(self.brewhouses))
+        start = max(earliest, self.brewhouses[house])
+        # Nothing is booked unless every tank is found, so a batch that doesn't fit books nothing.
+        booking = self.book_tanks(volume, start + brew, horizon)
+        if booking is None:
+            return None
+        ferment_start, fermenter, conditioner, condition_end = booking
+        self.brewhouses[house] = ferment_start
+        return ferment_start - brew, fermenter, conditioner, condition_end
+
+    def book_tanks(self, volume: float, wanted: float,
+                   horizon: float) -> Optional[Tuple[float, str, str, float]]:
+        """
+        Books a fermenter and a conditioner for a brewed batch.
+
+        A batch in a tank that can also condition is conditioned in the same tank.
+        Otherwise the batch stays in the fermenter until a conditioner is free.
+
+        :param volume: Volume of the batch in litres.
+        :param wanted: The earliest day fermenting can start.
+        :param horizon: Number of days in the horizon.
+
+        :return:
+        The day fermenting starts, the fermenter, the conditioner and the day
+        conditioning ends, or None if no tank fits the batch.
+        """
+        ferment = stage_duration("fermenting", volume) / DAY
+        condition = stage_duration("conditioning", volume) / DAY
+        fermenters = self.fermenter
+        if not (self.conditioner & (self.volumes >= volume)).any():
+            # Only a tank that can also condition will do if no conditioner fits.
+            fermenters = fermenters & self.both
+        fermenter = self.earliest(fermenters, volume, wanted)
+        if fermenter < 0:
+            return None
+        ferment_start = max(wanted, self.free_at[fermenter])
+        ferment_end = ferment_start + ferment
+        if self.both[fermenter]:
+            conditioner, condition_start = fermenter, ferment_end
+        else:
+            conditioner = self.earliest(self.conditioner, volume, ferment_end)
+            condition_start = max(ferment_end, self.free_at[conditioner])
+        if conditioner == fermenter:
+            self.occupy(fermenter, ferment_start, condition_start + condition, horizon)
+        else:
+            self.occupy(fermenter, ferment_start, condition_start, horizon)
+            self.occupy(conditioner, condition_start, condition_start + condition, horizon)
+        return ferment_start, self.names[fermenter], self.names[conditioner], \
+            condition_start + condition
+
+    def book_conditioner(self, volume: float, wanted: float,
+                         horizon: float) -> Optional[Tuple[str, float]]:
+        """
+        Books a conditioner for a fermented batch.
+
+        :param volume: Volume of the batch in litres.
+        :param wanted: The earliest day conditioning can start.
+        :param horizon: Number of days in the horizon.
+
+        :return: The conditioner and the day conditioning ends, or None if no tank fits the batch.
+        """
+        conditioner = self.earliest(self.conditioner, volume, wanted)
+        if conditioner < 0:
+            return None
+        condition_start = max(wanted, self.free_at[conditioner])
+        condition_end = condition_start + stage_duration("conditioning", volume) / DAY
+        self.occupy(conditioner, condition_start, condition_end, horizon)
+        return self.names[conditioner], condition_end
+
+
+def shortage(rows: np.ndarray) -> np.ndarray:
+    """Returns the bottles short summed over the days for each row of projected stock."""
+    return np.maximum(0.0, -rows).sum(axis=-1)
+
+
+class Planner:
+    """This class holds the state of one planning run."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, prediction: Tuple[List[datetime], Dict[str, List[float]]],
+                 process_obj: Process, tanks: List[Tank], start: datetime,
+                 horizon_days: int, cover_days: int, brewhouses: int):
+        """
+        Setting up the demand, the projected stock and the tank bookings.
+
+        :param prediction: The dates and the predicted daily sales in bottles, as from
+        plot_next_year.
+        :param process_obj: The Process object with the current pipeline and finished stock.
+        :param tanks: The tanks that can be used.
+        :param start: The date the plan starts.
+        :param horizon_days: Number of days to plan.
+        :param cover_days: Number of days of demand each new batch should cover.
+        :param brewhouses: Number of batches that can be brewed at once.
+        """
+        predictions = prediction[1]
+        self.start = start
+        self.horizon = horizon_days
+        self.cover = cover_days
+        self.dates = [start + timedelta(days=day) for day in range(horizon_days)]
+        pipeline = batches_in_production(process_obj)
+        self.beers = list(dict.fromkeys(list(predictions) + list(process_obj.finished)
+                                        + [batch.beer for batch in pipeline]))
+        self.index = {beer: row for row, beer in enumerate(self.beers)}
+
+        demand = daily_matrix(prediction, self.beers, start, horizon_days)
+        stock = np.array([process_obj.finished.get(beer, 0) / BOTTLE_VOLUME
+                          for beer in self.beers])
+        self.projected = stock[:, None] - np.cumsum(demand, axis=1)
+
+        self.book = TankBook(tanks, brewhouses)
+        self.batches = []
+        self.max_volume = max([tank.volume for tank in tanks if tank.function != "conditioner"],
+                              default=0)
+        self.book_pipeline(process_obj, tanks, pipeline)
+
+    def day_of(self, day: float) -> int:
+        """Returns the index of the first whole day at or after the given time."""
+        return int(ceil(day - 1e-9))
+
+    def arrive(self, beer: str, volume: float, day: float, sign: int = 1):
+        """Adds the bottles of a batch to the projected stock from the day it is ready."""
+        index = self.day_of(day)
+        if index < self.horizon:
+            self.projected[self.index[beer], index:] += sign * volume / BOTTLE_VOLUME
+
+    def book_pipeline(self, process_obj: Process, tanks: List[Tank], pipeline: list):
+        """
+        Adds the batches already in production to the projected stock and tank bookings.
+
+        The tanks in use are booked until their batch leaves them. The tanks
+        each batch still needs are then booked, the batches furthest along
+        first, and its bottles arrive once those tanks let it be bottled.
+        Batches waiting to be brewed keep their beer and volume in the plan.
+        """
+        now = self.start.timestamp()
+        stage_names = list(STAGE_DURATIONS)
+        for index, tank in enumerate(tanks):
+            batch = tank.current_batch
+            if batch is not None and batch.current_step in [2, 3]:
+                stage_end = batch.current_start_time + \
+                    stage_duration(stage_names[batch.current_step - 1], batch.volume)
+                if batch.current_step == 2 and tank.function == "both":
+                    stage_end += stage_duration("conditioning", batch.volume)
+                self.book.occupy(index, 0.0, max(0.0, (stage_end - now) / DAY), self.horizon)
+
+        queued = []
+        # A waiting batch has finished the stage before its next step.
+        for batch in sorted(pipeline, key=lambda batch: -(batch.current_step
+                                                          or batch.next_step - 1)):
+            if batch.current_step == 0 and batch.next_step == 1:
+                queued.append(batch)
+                continue
+            if batch.current_step > 0:
+                stage_end = max(0.0, (batch.current_start_time + stage_duration(
+                    stage_names[batch.current_step - 1], batch.volume) - now) / DAY)
+            else:
+                stage_end = 0.0
+            if batch.current_step == 1:
+                self.book.brewhouses[0] = stage_end
+            if batch.next_step == 2:
+                booking = self.book.book_tanks(batch.volume, stage_end, self.horizon)
+                ready = None if booking is None else booking[-1]
+            elif batch.next_step == 3 and (batch.current_step == 0
+                                           or batch.current_tank.function == "fermenter"):
+                booking = self.book.book_conditioner(batch.volume, stage_end, self.horizon)
+                ready = None if booking is None else booking[-1]
+            else:
+                # The batch is bottling or has the tank it needs.
+                self.arrive(batch.beer, batch.volume, time_until_bottled(batch, now) / DAY)
+                continue
+            if ready is None:
+                LOGGER.warning("No tank fits the %d litres of %s in production",
+                               batch.volume, batch.beer)
+                continue
+            self.arrive(batch.beer, batch.volume,
+                        ready + stage_duration("bottling", batch.volume) / DAY)
+
+        for batch in queued:
+            self.add(batch.beer, batch.volume, 0.0, queued=True)
+
+    def add(self, beer: str, volume: int, earliest: float, queued: bool = False) -> float:
+        """
+        Books the tanks for a batch and adds it to the plan.
+
+        :return: The day brewing starts, or None if no tank fits the batch.
+        """
+        booking = self.book.book(volume, earliest, self.horizon)
+        if booking is None:
+            return None
+        start, fermenter, conditioner, condition_end = booking
+        ready = condition_end + stage_duration("bottling", volume) / DAY
+        self.arrive(beer, volume, ready)
+        self.batches.append([start, beer, volume, fermenter, conditioner, ready, queued])
+        return start
+
+    def needs(self, ready: float) -> np.ndarray:
+        """Returns the bottles each beer is short by the end of the cover after the ready day."""
+        end = min(self.day_of(ready + self.cover), self.horizon - 1)
+        return np.maximum(0.0, -self.projected[:, end])
+
+    def greedy(self):
+        """Fills every brewing slot with the beer that is the most short when the batch is ready."""
+        if self.max_volume <= 0:
+            return
+        lead = sum(stage_duration(name, self.max_volume) for name in STAGE_DURATIONS) / DAY
+        earliest = 0.0
+        while True:
+            slot = max(earliest, min(self.book.brewhouses))
+            if slot + lead >= self.horizon:
+                break
+            needs = self.needs(slot + lead)
+            row = int(np.argmax(needs))
+            volume = min(self.max_volume, int(ceil(needs[row] * BOTTLE_VOLUME / 10.0)) * 10)
+            if volume <= 10:
+                # Nothing is short, so try again the next day.
+                earliest = slot + 1
+                continue
+            start = self.add(self.beers[row], volume, slot)
+            if start is None:
+                break
+            earliest = start
+
+    def improve(self, time_budget: float):
+        """
+        Moves planned batches to other beers while it lowers the total shortage.
+
+        For each batch the change in shortage of moving it to every other beer
+        is computed at once over the whole projected stock array.
+
+        :param time_budget: Number of seconds the search may take.
+        """
+        deadline = time.perf_counter() + time_budget
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for batch in self.batches:
+                start, beer, volume, _, _, ready, queued = batch
+                index = self.day_of(ready)
+                if queued or index >= self.horizon:
+                    continue
+                bottles = volume / BOTTLE_VOLUME
+                rows = self.projected[:, index:]
+                current = shortage(rows)
+                row = self.index[beer]
+                removed = shortage(rows[row] - bottles) - current[row]
+                added = shortage(rows + bottles) - current
+                change = removed + added
+                change[row] = 0.0
+                best = int(np.argmin(change))
+                if change[best] < -1e-6:
+                    self.arrive(beer, volume, ready, sign=-1)
+                    self.arrive(self.beers[best], volume, ready)
+                    batch[1] = self.beers[best]
+                    improved = True
+                if time.perf_counter() >= deadline:
+                    LOGGER.warning("Planner stopped at the time budget")
+                    break
+
+    def result(self) -> Plan:
+        """Returns the plan with the batches in order of brewing."""
+        batches = [PlannedBatch(self.start + timedelta(days=start), beer, volume, fermenter,
+                                conditioner, self.start + timedelta(days=ready), queued)
+                   for start, beer, volume, fermenter, conditioner, ready, queued
+                   in sorted(self.batches, key=lambda batch: batch[0])]
+        return Plan(batches, self.dates,
+                    {beer: self.projected[row] for beer, row in self.index.items()},
+                    float(shortage(self.projected).sum()),
+                    float(len(self.book.busy) * self.horizon - self.book.busy.sum()))
+
+
+def plan_production(prediction: Tuple[List[datetime], Dict[str, List[float]]],
+                    process_obj: Process = BEER_PROCESS, tanks: List[Tank] = TANKS,
+                    start: datetime = None, horizon_days: int = 365, cover_days: int = 42,
+                    brewhouses: int = 1, time_budget: float = 0.5) -> Plan:
+    """
+    Plans the batches to brew over the horizon.
+
+    :param prediction: The dates and the predicted daily sales in bottles, as from plot_next_year.
+    :param process_obj: The Process object with the current pipeline and finished stock.
+    :param tanks: The tanks that can be used.
+    :param start: The date the plan starts. Defaults to today.
+    :param horizon_days: Number of days to plan.
+    :param cover_days: Number of days of demand each new batch should cover.
+    :param brewhouses: Number of batches that can be brewed at once.
+    :param time_budget: Number of seconds the local search may take.
+
+    :return: The plan.
+    """
+    LOGGER.info("Planning production for %d days", horizon_days)
+    if start is None:
+        start = current_datetime()
+    planner = Planner(prediction, process_obj, tanks, start, horizon_days, cover_days, brewhouses)
+    planner.greedy()
+    LOGGER.debug("Greedy plan made with %d batches", len(planner.batches))
+    planner.improve(time_budget)
+    return planner.result()
+
+
+if __name__ == "__main__":
+    from sales_predictions import plot_next_year
+    PREDICTION = plot_next_year()
+    PLAN = plan_production(PREDICTION, start=PREDICTION[0][0])
+    for planned in PLAN.batches:
+        print(planned)
+    print("Shortage:", PLAN.shortage, "Idle tank days:", PLAN.idle_tank_days)
@@ -0,0 +1,187 @@
+"""
+This module tries many settings of the suggestion policy against past sales.
+
+Each SuggestionPolicy is run through a Simulation of the brewery over
+the last days of the sales data on a virtual clock. The brewery sells
+what was really sold each day, and the policy is given what it could
+have known then: the sales of the same days a year before, as in the
+seasonal naive forecast. Days whose year before is earlier than the
+sales data are forecast with the average sales of each beer before the
+replay, so no day is forecast from sales after it. The brewery starts
+empty, so the first warm up days are left out of the
+results.
+
+Every combination of the values given for each setting is simulated in
+a process pool. The sales are sent to each process once, and the
+policies in chunks, so thousands of combinations take seconds. For each
+one, the days a beer ran out, the bottles that couldn't be sold, the
+stock held and the days the tanks stood empty are given, the fewest
+days out of stock first.
+
+Usage:
+    python -m brewhouse sweep --lead-days 42 56 70 --demand-share 0.5 0.75 --top 20
+"""
+import os
+from functools import partial
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Tuple, List, Dict, Any, Optional
+from log_setup import get_logger
+from read_file import parse_data
+from suggestions import SuggestionPolicy, suggest_batch
+from simulation import Demand, Scenario, run_scenario
+from inventory_management import BOTTLE_VOLUME
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("policy_sweep")
+
+# The values tried for each setting of the policy unless others are given.
+GRID = {"lead_days": [42, 56, 70, 84],
+        "window_days": [28, 42, 56],
+        "pipeline_factor": [1.0, 2.0, 3.0],
+        "demand_share": [0.25, 0.5, 0.75, 1.0],
+        "round_to": [10, 50],
+        "min_tank_volume": [400, 800]}
+REPLAY_DAYS = 182
+WARMUP_DAYS = 56
+YEAR_DAYS = 364
+# The policies sent to a process at a time.
+CHUNK_SIZE = 16
+
+# The sales replayed in each process of the pool, set once by share_replay.
+REPLAY = {}
+
+
+def policy_grid(values: Dict[str, List[Any]] = None) -> List[SuggestionPolicy]:
+    """
+    Returns a policy for every combination of the values of each setting.
+
+    :param values: The values to try for settings of SuggestionPolicy. Settings left out keep
+    their default.
+    """
+    values = GRID if values is None else values
+    names = [name for name in SuggestionPolicy._fields if name in values]
+    return [SuggestionPolicy(**dict(zip(names, combination)))
+            for combination in product(*(values[name] for name in names))]
+
+
+def sold(sales: List[int], index: int) -> int:
+    """Returns the sales on the day with the index, or 0 if it is outside the sales."""
+    return sales[index] if 0 <= index < len(sales) else 0
+
+
+def historical_replay(days: int = REPLAY_DAYS, warmup_days: int = WARMUP_DAYS,
+                      data_dict: Dict = None) -> Tuple[Demand, Demand]:
+    """
+    Takes the last days of the sales data and the forecast the policy is given for them.
+
+    :param days: The number of days counted in the results.
+    :param warmup_days: The number of days before them the brewery starts filling.
+    :param data_dict: The sales, as returned by parse_data. Read if not given.
+
+    :return:
+    The sales of each beer on each day replayed, and the forecast of them,
+    going on for a year after the replay so the policy can look ahead from
+    its last day.
+
+    :raises ValueError: If there are no sales before the days replayed.
+    """
+    data_dict = parse_data() if data_dict is None else data_dict
+    last = max(dates[-1] for dates in data_dict['x'].values())
+    first = min(dates[0] for dates in data_dict['x'].values())
+    start = last - timedelta(days=days + warmup_days - 1)
+    if start <= first:
+        raise ValueError("There are %d days of sales, not more than the %d days replayed, so "
+                         "there is nothing to forecast them from"
+                         % ((last - first).days + 1, days + warmup_days))
+    # The days of sales before the replay, and the first day forecast with the year before.
+    known_days = (start - first).days
+    seasonal = min(YEAR_DAYS - known_days, days + warmup_days + YEAR_DAYS)
+    if seasonal > 0:
+        LOGGER.warning("The sales start %s, less than a year before the replay from %s, so "
+                       "the first %d days are forecast with the average sales before it",
+                       first.date(), start.date(), seasonal)
+    else:
+        LOGGER.info("The sales of a year before are used as the forecast")
+    replay_dates = [start + timedelta(days=day) for day in range(days + warmup_days)]
+    forecast_dates = [start + timedelta(days=day) for day in range(days + warmup_days + YEAR_DAYS)]
+    replayed, forecast = {}, {}
+    for beer, dates in data_dict['x'].items():
+        sales = data_dict['y'][beer]
+        # The index of the start in the sales of the beer.
+        offset = (start - dates[0]).days
+        replayed[beer] = [sold(sales, offset + day) for day in range(days + warmup_days)]
+        average = sum(sales[:max(offset, 0)]) / known_days
+        forecast[beer] = [average if day < seasonal else sold(sales, offset + day - YEAR_DAYS)
+                          for day in range(days + warmup_days + YEAR_DAYS)]
+    return (replay_dates, replayed), (forecast_dates, forecast)
+
+
+def share_replay(demand: Demand, forecast: Demand):
+    """Keeps the sales replayed in the process, run once in each process of the pool."""
+    REPLAY["demand"] = demand
+    REPLAY["forecast"] = forecast
+
+
+def policy_scenario(policy: SuggestionPolicy, tanks: List[Tuple[str, int, str]], days: int,
+                    warmup_days: int) -> Scenario:
+    """Returns the Scenario running the brewery with the policy."""
+    return Scenario(str(policy), tanks, days + warmup_days,
+                    partial(suggest_batch, policy=policy), policy.lead_days,
+                    policy.window_days, warmup_days=warmup_days)
+
+
+def evaluate(policy: SuggestionPolicy, tanks: List[Tuple[str, int, str]], days: int,
+             warmup_days: int) -> Dict[str, Any]:
+    """
+    Simulates the policy on the sales kept by share_replay.
+
+    :return: The settings of the policy and how the brewery did, with
+    the days any beer was out of stock, the bottles that couldn't be
+    sold, the bottles left in stock at the end, the average bottles in
+    stock and the days the tanks were empty, added up over the tanks.
+    """
+    result = run_scenario(policy_scenario(policy, tanks, days, warmup_days), REPLAY["demand"],
+                          REPLAY["forecast"])
+    return dict(policy._asdict(),
+                stockout_days=sum(result["stockout_days"].values()),
+                unmet_bottles=result["unmet_bottles"],
+                overproduced_bottles=sum(result["finished_stock"].values()) / BOTTLE_VOLUME,
+                mean_stock_bottles=result["mean_stock_bottles"],
+                tank_idle_days=sum(1 - used for used in result["tank_utilisation"].values())
+                * result["days"],
+                batches_started=result["batches_started"])
+
+
+def sweep(policies: List[SuggestionPolicy], tanks: List[Tuple[str, int, str]],
+          days: int = REPLAY_DAYS, warmup_days: int = WARMUP_DAYS,
+          max_workers: Optional[int] = None,
+          replay: Tuple[Demand, Demand] = None) -> List[Dict[str, Any]]:
+    """
+    Simulates every policy against the past sales in a process pool.
+
+    :param policies: The policies to try.
+    :param tanks: The (name, volume, function) of each tank of the brewery.
+    :param days: The number of days counted in the results.
+    :param warmup_days: The number of days before them the brewery starts filling.
+    :param max_workers: Number of processes. Defaults to the number of processors.
+    :param replay: The sales and forecast, as from historical_replay. Read if not given.
+
+    :return: The results of each policy, the fewest days out of stock first,
+    then the fewest bottles unsold and the least stock held.
+    """
+    demand, forecast = historical_replay(days, warmup_days) if replay is None else replay
+    LOGGER.info("Trying %d policies against the sales from %s", len(policies),
+                demand[0][0].date())
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=share_replay,
+                             initargs=(demand, forecast)) as executor:
+        results = list(executor.map(partial(evaluate, tanks=tanks, days=days,
+                                            warmup_days=warmup_days),
+                                    policies, chunksize=CHUNK_SIZE))
+    LOGGER.info("Tried %d policies", len(results))
+    return sorted(results, key=lambda result: (result["stockout_days"], result["unmet_bottles"],
+                                               result["mean_stock_bottles"]))
@@ -0,0 +1,113 @@
+"""
+This module projects the bottles in stock for each beer for each day ahead.
+
+The projection starts from the finished stock in the Process object and
+adds each batch in production on the day it is expected to be bottled,
+using the stage durations from inventory_management. The open orders are
+taken on their due date and the predicted sales each day. Everything is
+kept in numpy arrays with a row for each beer and a column for each day,
+so it is cheap enough to recompute whenever the interface refreshes.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Tuple, List, Dict, NamedTuple, Optional
+from log_setup import get_logger
+import numpy as np
+from inventory_management import Process, BEER_PROCESS, BOTTLE_VOLUME, \
+    batches_in_production, time_until_bottled
+from sales_predictions import daily_matrix
+from suggestions import current_datetime
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("projection")
+
+DAY = 24 * 3600
+
+
+class Projection(NamedTuple):
+    """
+    The projected stock of each beer.
+
+    :attribute dates: The date of each column.
+    :attribute beers: The beer of each row.
+    :attribute on_hand: The bottles in stock at the end of each day.
+    :attribute arrivals: The bottles bottled on each day.
+    :attribute demand: The bottles ordered or predicted to be sold on each day.
+    :attribute first_stockout: The first date each beer runs out, or None if it doesn't.
+    """
+    dates: List[datetime]
+    beers: List[str]
+    on_hand: np.ndarray
+    arrivals: np.ndarray
+    demand: np.ndarray
+    first_stockout: Dict[str, Optional[datetime]]
+
+
+def project_inventory(prediction: Tuple[List[datetime], Dict[str, List[float]]] = None,
+                      process_obj: Process = BEER_PROCESS, start_date: datetime = None,
+                      days: int = 180) -> Projection:
+    """
+    Projects the bottles in stock for each beer for each day.
+
+    Orders due on a day are part of the predicted sales for that day, so the
+    demand each day is the larger of the two. Orders already overdue are
+    taken on the first day.
+
+    :param prediction:
+    The list of dates and the dictionary of predicted sales, as from plot_next_year.
+    If None or the prediction failed, only the orders are used as demand.
+    :param process_obj: The Process object with the pipeline, finished stock and orders.
+    :param start_date: The date of the first day. Defaults to today.
+    :param days: The number of days to project.
+
+    :return: The projection.
+    """
+    LOGGER.info("Projecting inventory for %d days", days)
+    if prediction is not None and not prediction[0]:
+        prediction = None
+    if start_date is None:
+        start_date = current_datetime()
+    pipeline = batches_in_production(process_obj)
+    orders = list(process_obj.orders.open.values())
+    beers = list(dict.fromkeys(list(prediction[1] if prediction else [])
+                               + list(process_obj.finished)
+                               + [batch.beer for batch in pipeline]
+                               + [order.beer for order in orders]))
+    index = {beer: row for row, beer in enumerate(beers)}
+
+    arrivals = np.zeros((len(beers), days))
+    if pipeline:
+        now = start_date.timestamp()
+        rows = np.array([index[batch.beer] for batch in pipeline])
+        ready = np.ceil(np.array([time_until_bottled(batch, now) for batch in pipeline]) / DAY)
+        bottles = np.array([batch.volume for batch in pipeline]) / BOTTLE_VOLUME
+        in_range = ready < days
+        np.add.at(arrivals, (rows[in_range], ready[in_range].astype(int)), bottles[in_range])
+
+    ordered = np.zeros((len(beers), days))
+    if orders:
+        rows = np.array([index[order.beer] for order in orders])
+        due = np.array([(datetime.combine(order.due, datetime.min.time()) - start_date).days
+                        for order in orders])
+        due = np.maximum(due, 0)
+        in_range = due < days
+        quantities = np.array([order.quantity for order in orders], dtype=float)
+        np.add.at(ordered, (rows[in_range], due[in_range]), quantities[in_range])
+
+    demand = ordered
+    if prediction:
+        demand = np.maximum(ordered, daily_matrix(prediction, beers, start_date, days))
+
+    stock = np.array([process_obj.finished.get(beer, 0) / BOTTLE_VOLUME for beer in beers])
+    on_hand = stock[:, None] + np.cumsum(arrivals - demand, axis=1)
+
+    short = on_hand < 0
+    first = np.argmax(short, axis=1)
+    dates = [start_date + timedelta(days=day) for day in range(days)]
+    first_stockout = {beer: dates[first[row]] if short[row].any() else None
+                      for beer, row in index.items()}
+    LOGGER.debug("Inventory projected")
+    return Projection(dates, beers, on_hand, arrivals, demand, first_stockout)
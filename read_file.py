@@ -1,26 +1,347 @@
-"""This module deals with reading the csv file and adding to it"""
+"""
+This module deals with reading the csv file and adding to it
+
+The sales of each beer on each day are kept in SALES, which only reads
+the lines added to the csv file since it was last read. New sales data
+is appended to the end of the csv file rather than the file being
+written again, so adding a file takes time in proportion to the new data.
+
+SALES also keeps the customer, day and quantity of every row for each
+beer in arrays, which are added to as rows are read. This is a sparse
+index of the sales of each customer, read by customer_demand.
+
+Sales older than the retention policy keeps are moved by retention into
+an archive file next to the csv file, as weekly and monthly totals of
+each beer. SALES reads the archive too, and data_dict gives the totals
+as points of each period next to the sales of each day in the csv file,
+so reading the data takes time in proportion to the rows kept rather
+than every day since the first sale.
+"""
 import os
+import io
 import csv
+import json
+import shutil
+import threading
+from array import array
 from datetime import timedelta, datetime
-from typing import Dict, List, Union
-import logging
-from pandas import read_csv, concat
-from pandas.errors import ParserError
+from typing import Dict, List, Tuple, Iterable, Iterator, Callable, BinaryIO, \
+    NamedTuple, Optional
+from log_setup import get_logger
 from dateutil.parser import parse
+from instrumentation import instrumented
 
 ABS_PATH = os.path.abspath(__file__)
 D_NAME = os.path.dirname(ABS_PATH)
 os.chdir(D_NAME)
 
-LOGGER = logging.getLogger("inv_management")
-LOGGER.setLevel(logging.DEBUG)
-F_HANDLER = logging.FileHandler('log_file.log')
-F_FORMAT = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-F_HANDLER.setFormatter(F_FORMAT)
-LOGGER.addHandler(F_HANDLER)
+LOGGER = get_logger("read_file")
+
+# Held while the csv file is read or written, as the interface does both in background threads.
+DATA_LOCK = threading.RLock()
+
+SALES_FILE = 'Barnabys_sales_fabriacted_data.csv'
+SALES_COLUMNS = ["Invoice Number", "Customer", "Date Required", "Recipe", "Gyle Number",
+                 "Quantity ordered"]
+REQUIRED_COLUMNS = ["Date Required", "Recipe", "Quantity ordered"]
+CUSTOMER_COLUMN = 1
+DATE_COLUMN = 2
+BEER_COLUMN = 3
+QUANTITY_COLUMN = 5
+CHUNK_SIZE = 1 << 20
+ARCHIVE_SUFFIX = ".archive.jsonl"
+ARCHIVE_SCHEMA = "brewhouse-sales-archive"
+
+
+class CustomerSales(NamedTuple):
+    """
+    The rows of sales of one beer, as arrays of the same length.
+
+    :attribute customers: The number of the customer of each row, its index in the customer list.
+    :attribute days: The date of each row as a proleptic Gregorian ordinal.
+    :attribute quantities: The quantity of each row.
+    """
+    customers: array
+    days: array
+    quantities: array
+
+
+class SalesArchive(NamedTuple):
+    """
+    The sales moved out of the csv file, as totals of each beer over weeks and months.
+
+    :attribute through: The first day of the sales left in the csv file.
+    Rows of the csv file before it are already in the totals.
+    :attribute periods: The (days, quantity) of each beer from the first day of each period.
+    """
+    through: Optional[datetime]
+    periods: Dict[str, Dict[datetime, Tuple[int, int]]]
+
+
+def archive_file_name(file_name: str) -> str:
+    """Returns the archive file kept next to a csv file of sales data."""
+    return os.path.splitext(file_name)[0] + ARCHIVE_SUFFIX
+
+
+def file_version(file_name: str) -> Tuple[int, int]:
+    """Returns the modification time and size of a file, or zeros if there isn't one."""
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return 0, 0
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_archive(file_name: str) -> SalesArchive:
+    """
+    Reads the archive of a csv file of sales data.
+
+    :param file_name: The archive file, as from archive_file_name.
+
+    :return: The archive, empty if there isn't one.
+    """
+    try:
+        with open(file_name, encoding="utf-8") as file:
+            records = json.loads("[" + ",".join(line for line in file if line.strip()) + "]")
+    except FileNotFoundError:
+        return SalesArchive(None, {})
+    if not records or records[0].get("schema") != ARCHIVE_SCHEMA:
+        raise ValueError(file_name + " is not an archive of sales data")
+    periods = {}
+    for record in records[1:]:
+        periods.setdefault(record["beer"], {})[datetime.fromisoformat(record["start"])] = \
+            record["days"], record["quantity"]
+    return SalesArchive(datetime.fromisoformat(records[0]["through"]), periods)
+
+
+class SalesTotals:
+    """
+    This class holds the sales of each beer on each day in the csv file.
+
+    Sales data is only ever appended to the csv file, so update reads only
+    the lines added since it last read the file. If the file was rewritten
+    instead, it is read again from the start, as it is when the archive
+    changes.
+    """
+    def __init__(self, file_name: str = SALES_FILE):
+        """
+        Initialising the totals without reading the file.
+
+        :param file_name: The csv file of sales data.
+        """
+        self.file_name = file_name
+        self.daily = {}
+        self.offset = 0
+        # The bytes before the offset, to tell the file was appended to rather than rewritten.
+        self.tail = b""
+        # Each date appears on many rows, so each is only parsed once.
+        self.dates = {}
+        # The rows of each beer in the sparse index, and the name and number of each customer.
+        self.customer_rows = {}
+        self.customer_names = []
+        self.customer_numbers = {}
+        self.archive = SalesArchive(None, {})
+        self.archive_version = None
+        # The ordinal of the first day of the rows read from the csv file.
+        self.first_day = None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forgets the sales read so far."""
+        # Adding missing data to the beginning
+        self.daily = {'Organic Red Helles': {datetime(2018, 11, 1): 0},
+                      'Organic Dunkel': {datetime(2018, 11, 1): 0}}
+        self.customer_rows = {}
+        self.customer_names = []
+        self.customer_numbers = {}
+        self.archive = SalesArchive(None, {})
+        self.archive_version = None
+        self.first_day = None
+        self.offset = 0
+        self.tail = b""
+
+    def add_rows(self, rows: Iterable[List[str]]) -> int:
+        """Adds the sales in the rows of the csv file, returning the number of rows added."""
+        added = 0
+        through = self.archive.through
+        for row in rows:
+            if len(row) <= QUANTITY_COLUMN:
+                continue
+            text = row[DATE_COLUMN]
+            if text not in self.dates:
+                date_obj = parse(text)
+                self.dates[text] = date_obj, date_obj.toordinal()
+            date_obj, day = self.dates[text]
+            if through is not None and date_obj < through:
+                # Left by a compaction that stopped before the csv file was written.
+                continue
+            if self.first_day is None or day < self.first_day:
+                self.first_day = day
+            beer = row[BEER_COLUMN]
+            sales = self.daily.setdefault(beer, {})
+            quantity = int(row[QUANTITY_COLUMN])
+            sales[date_obj] = sales.get(date_obj, 0) + quantity
+            customer = self.customer_numbers.get(row[CUSTOMER_COLUMN])
+            if customer is None:
+                customer = self.customer_numbers[row[CUSTOMER_COLUMN]] = len(self.customer_names)
+                self.customer_names.append(row[CUSTOMER_COLUMN])
+            index = self.customer_rows.get(beer)
+            if index is None:
+                index = self.customer_rows[beer] = CustomerSales(array('l'), array('l'),
+                                                                 array('q'))
+            index.customers.append(customer)
+            index.days.append(day)
+            index.quantities.append(quantity)
+            added += 1
+        return added
+
+    def update(self) -> int:
+        """
+        Reads the lines added to the csv file since it was last read.
+
+        :return: The number of rows read.
+        """
+        with DATA_LOCK, self.lock:
+            try:
+                file = open(self.file_name, 'rb')
+            except FileNotFoundError:
+                LOGGER.critical("CSV File Not Found")
+                self.reset()
+                return 0
+            with file:
+                if self.offset:
+                    file.seek(self.offset - len(self.tail))
+                    if file.read(len(self.tail)) != self.tail:
+                        LOGGER.info("The csv file was rewritten. Reading all of it.")
+                        self.reset()
+                version = file_version(archive_file_name(self.file_name))
+                if version != self.archive_version:
+                    if self.offset:
+                        LOGGER.info("The sales archive changed. Reading all of the csv file.")
+                        self.reset()
+                    self.archive = read_archive(archive_file_name(self.file_name))
+                    self.archive_version = version
+                added = 0
+                for lines, offset in complete_lines(file, self.offset):
+                    reader = csv.reader(io.StringIO(lines.decode("utf-8", "replace")))
+                    if self.offset == 0:
+                        # Ignoring the header.
+                        next(reader, None)
+                    added += self.add_rows(reader)
+                    self.tail = lines[-64:]
+                    self.offset = offset
+        if added:
+            LOGGER.debug("Read %d new rows of sales", added)
+        return added
+
+    def data_dict(self) -> Dict[str, Dict[str, list]]:
+        """
+        Returns the sales of each beer on every day, in the structure returned by parse_data.
+
+        Only the days of the rows in the csv file are given, and every beer
+        is given a sale of 0 on the days without sales, up to the latest
+        date of any beer. The totals in the archive are given as they are
+        under 'periods', the (first day, days, quantity) of each period of
+        each beer, the earliest first, so the days given don't grow with
+        the years archived.
+        """
+        with self.lock:
+            daily = {beer: dict(sales) for beer, sales in self.daily.items()}
+            archive = self.archive
+        data_dict = {'x': {}, 'y': {}, 'periods': {}}
+        for beer, periods in archive.periods.items():
+            data_dict['periods'][beer] = [(start, days, quantity) for start, (days, quantity)
+                                          in sorted(periods.items())]
+        if archive.through is not None:
+            # The days before the rows are in the archive, such as the missing data added.
+            daily = {beer: {date_obj: quantity for date_obj, quantity in sales.items()
+                            if date_obj >= archive.through}
+                     for beer, sales in daily.items()}
+            for beer in archive.periods:
+                daily.setdefault(beer, {})
+        dated = [sales for sales in daily.values() if sales]
+        if not dated:
+            return data_dict
+        last_date = max(max(sales) for sales in dated)
+        firsts = {beer: min(sales) if sales else archive.through
+                  for beer, sales in daily.items()}
+        first_date = min(firsts.values())
+        # Each beer is given the days of one list from its first day.
+        calendar = [first_date + timedelta(days=day)
+                    for day in range((last_date - first_date).days + 1)]
+        for beer, first in firsts.items():
+            offset = (first - first_date).days
+            if offset >= len(calendar):
+                continue
+            values = [0] * (len(calendar) - offset)
+            for date_obj, quantity in daily[beer].items():
+                values[(date_obj - first).days] += quantity
+            data_dict['x'][beer] = calendar[offset:]
+            data_dict['y'][beer] = values
+        return data_dict
+
+    def customer_sales(self) -> Tuple[List[str], Dict[str, CustomerSales]]:
+        """
+        Returns a copy of the sparse index of the sales of each customer.
 
+        :return: The names of the customers and the rows of each beer.
+        """
+        with self.lock:
+            return list(self.customer_names), \
+                {beer: CustomerSales(*(column[:] for column in rows))
+                 for beer, rows in self.customer_rows.items()}
 
-def parse_data() -> Dict[str, Dict[str, List[Union[datetime, int]]]]:
+
+def complete_lines(file: BinaryIO, offset: int = 0, chunk_size: int = CHUNK_SIZE,
+                   to_end: bool = False) -> Iterator[Tuple[bytes, int]]:
+    """
+    Reads the complete lines of the file from the offset in chunks.
+
+    A line without a newline at the end of a file being written to, such
+    as the csv file, is still being written, so it is left for next time.
+
+    :param file: The file, opened in binary mode.
+    :param offset: The byte to start reading from.
+    :param chunk_size: The number of bytes to read at a time.
+    :param to_end: Whether the file is complete, so a line without a newline at the end is
+    given as the last line.
+
+    :return: Each chunk of complete lines and the offset after it.
+    """
+    file.seek(offset)
+    left = b""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            if to_end and left:
+                yield left, offset + len(left)
+            return
+        chunk = left + chunk
+        end = chunk.rfind(b"\n") + 1
+        left = chunk[end:]
+        if end:
+            offset += end
+            yield chunk[:end], offset
+
+
+SALES = SalesTotals()
+
+
+def use_sales_file(file_name: str):
+    """
+    Reads and adds the sales data in another csv file from now on, such as a generated one.
+
+    :param file_name: The csv file of sales data.
+    """
+    global SALES_FILE, SALES  # pylint: disable=global-statement
+    with DATA_LOCK:
+        SALES_FILE = file_name
+        SALES = SalesTotals(file_name)
+
+
+@instrumented("parse")
+def parse_data() -> Dict[str, Dict[str, list]]:
     """
     Parses the data in the csv to a dictionary in the following structure.
 
@@ -29,74 +350,112 @@ def parse_data() -> Dict[str, Dict[str, List[Union[datetime, int]]]]:
        'Beer3': [date1, date2, date3...]}
     'y': {'Beer1': [value1, value2, value3...],
        'Beer2': [value1, value2, value3...],
-       'Beer3': [value1, value2, value3...]}}
+       'Beer3': [value1, value2, value3...]}
+    'periods': {'Beer1': [(start1, days1, total1), (start2, days2, total2)...]}}
+
+    'periods' holds the archived weekly and monthly totals, before the
+    first date in 'x'. Only the lines added to the csv file since it was
+    last parsed are read.
 
     :return: Parsed data.
     """
     LOGGER.info("Reading the csv file")
-    try:
-        with open('Barnabys_sales_fabriacted_data.csv') as file:
-            # Adding missing data to the beginning
-            data_dict = {'x': {'Organic Red Helles': [datetime(2018, 11, 1)],
-                               'Organic Dunkel': [datetime(2018, 11, 1)]},
-                         'y': {'Organic Red Helles': [0], 'Organic Dunkel': [0]}}
-
-            # Iterating through each row, ignoring the header.
-            for row in list(csv.reader(file, delimiter=','))[1:]:
-                # row[3] is the beer name
-                # If the beer has not been added to the dictionary yet
-                if row[3] not in data_dict['x'].keys():
-                    data_dict['x'][row[3]] = []
-                    data_dict['y'][row[3]] = []
-
-                date_obj = parse(row[2])
-                quantity = int(row[5])
-                # If date to be added exists, add sales to the existing data.
-                # If it doesn't, add the date and sale to the dictionary.
-                if date_obj not in data_dict['x'][row[3]]:
-                    data_dict['x'][row[3]].append(date_obj)
-                    data_dict['y'][row[3]].append(quantity)
-                else:
-                    # Adding sale to existing sale value
-                    data_dict['y'][row[3]][data_dict['x'][row[3]].index(date_obj)] += quantity
-            LOGGER.debug("Initial reading done")
-
-            # Sorting each list in the dictionaries.
-            for key, x_beer in data_dict['x'].items():
-                data_dict['y'][key] = [x for _, x in sorted(zip(x_beer, data_dict['y'][key]))]
-                data_dict['x'][key] = sorted(x_beer)
-
-            # If the latest dates don't match, add dates so the latest date matches.
-            last_date_list = [item[-1] for item in data_dict['x'].values()]
-            if not (last_date_list[0] == last_date_list[1]
-                    and last_date_list[1] == last_date_list[2]):
-                for key, value in data_dict['x'].items():
-                    if max(last_date_list) not in value:
-                        data_dict['x'][key].append(max(last_date_list))
-                        data_dict['y'][key].append(0)
-                LOGGER.debug("Latest date matched")
-
-            for key, x_beer in data_dict['x'].items():
-                # Filling in the gaps with sales of 0.
-                for counter, (date_obj, quantity) in \
-                        enumerate(zip(x_beer[:-1], data_dict['y'][key][:-1])):
-                    next_date_obj = x_beer[counter+1]
-                    gap = (next_date_obj - date_obj).days - 1
-
-                    for i in range(gap):
-                        get_date_obj = date_obj + timedelta(days=1+i)
-                        new_quantity = 0
-                        x_beer.append(get_date_obj)
-                        data_dict['y'][key].append(new_quantity)
-
-                # Sorting the data in case it got mixed while filling in gaps.
-                data_dict['y'][key] = [x for _, x in sorted(zip(x_beer, data_dict['y'][key]))]
-                data_dict['x'][key] = sorted(x_beer)
-                LOGGER.debug("Filled gap and sorted %s", key)
-    except FileNotFoundError:
-        LOGGER.critical("CSV File Not Found")
+    SALES.update()
+    return SALES.data_dict()
+
+
+def data_version() -> Tuple[int, int]:
+    """
+    Returns the modification time and size of the csv file.
 
-    return data_dict
+    Both change whenever data is added, so results worked out from the data can be cached by them.
+    """
+    return file_version(SALES_FILE)
+
+
+def check_sales_row(row: List[str], columns: Dict[str, int], dates: Dict[str, datetime]) \
+        -> List[str]:
+    """
+    Puts a row of new sales data in the order of the columns of the csv file and checks it.
+
+    :param row: The row of the new file.
+    :param columns: The index of each column in the new file.
+    :param dates: The dates already parsed, so each is only parsed once.
+
+    :return: The row for the csv file.
+    """
+    row = [row[columns[name]] if name in columns and columns[name] < len(row) else ""
+           for name in SALES_COLUMNS]
+    if row[DATE_COLUMN] not in dates:
+        dates[row[DATE_COLUMN]] = parse(row[DATE_COLUMN])
+    int(row[QUANTITY_COLUMN])
+    if not row[BEER_COLUMN]:
+        raise ValueError("No beer given")
+    return row
+
+
+@instrumented("sales.append")
+def append_sales(file_dir: str, offset: int = 0,
+                 progress: Callable[[int, int], None] = None) -> Tuple[str, int, int]:
+    """
+    Adds the rows of a csv file of sales data to the csv file, from the given byte.
+
+    The file is read and checked in chunks, its last row ending at the end
+    of the file even without a newline, and the rows are written to a
+    temporary file, which is appended to the csv file only once every row
+    has been checked. The columns are matched to those of the csv file by
+    name, and the totals are then updated with just the new rows.
+
+    :param file_dir: The directory of the csv file to be added.
+    :param offset: The byte to start from, for a file added to since it was last added.
+    :param progress: Function given the number of bytes read and the size of the file.
+
+    :return: Error message, the number of rows added and the byte the next rows start from.
+    """
+    try:
+        file = open(file_dir, 'rb')
+    except OSError:
+        return "File not found", 0, offset
+    added = 0
+    dates = {}
+    # Named after the thread so files added at the same time don't share it.
+    temporary = '%s.%d.new' % (SALES_FILE, threading.get_ident())
+    with file:
+        size = os.fstat(file.fileno()).st_size
+        header = next(csv.reader([file.readline().decode("utf-8-sig", "replace")]), [])
+        columns = {name.strip(): index for index, name in enumerate(header)}
+        if any(name not in columns for name in REQUIRED_COLUMNS):
+            LOGGER.error("Invalid data in new csv file")
+            return "Valid data not found in file", 0, offset
+        start = max(offset, file.tell())
+        with open(temporary, 'w', newline='', encoding="utf-8") as new_rows:
+            writer = csv.writer(new_rows, lineterminator="\n")
+            for lines, end in complete_lines(file, start, to_end=True):
+                try:
+                    rows = [check_sales_row(row, columns, dates)
+                            for row in csv.reader(io.StringIO(lines.decode("utf-8", "replace")))
+                            if row]
+                except (ValueError, OverflowError):
+                    LOGGER.error("Invalid data in new csv file")
+                    new_rows.close()
+                    os.remove(temporary)
+                    return "Valid data not found in file", 0, offset
+                writer.writerows(rows)
+                added += len(rows)
+                start = end
+                if progress is not None:
+                    progress(end, size)
+    with DATA_LOCK, open(SALES_FILE, 'ab+') as sales, open(temporary, 'rb') as new_rows:
+        sales.seek(0, os.SEEK_END)
+        if sales.tell():
+            sales.seek(-1, os.SEEK_END)
+            if sales.read(1) != b"\n":
+                sales.write(b"\n")
+        shutil.copyfileobj(new_rows, sales)
+    os.remove(temporary)
+    SALES.update()
+    LOGGER.info("Added %d rows of sales from %s", added, file_dir)
+    return "success", added, start
 
 
 def write_data(file_dir: str) -> str:
@@ -107,22 +466,7 @@ def write_data(file_dir: str) -> str:
     :return: Error message.
     """
     LOGGER.info("Writing csv data#")
-    try:
-        open(file_dir)
-    except FileNotFoundError:
-        return "File not found"
-
-    try:
-        file_a = read_csv('Barnabys_sales_fabriacted_data.csv', index_col=0)
-        file_b = read_csv(file_dir, index_col=0)
-        concat([file_a, file_b]).to_csv('Barnabys_sales_fabriacted_data.csv')
-        return "success"
-    except FileNotFoundError:
-        LOGGER.error("csv file was not found")
-        return "file not found"
-    except ParserError:
-        LOGGER.error("Invalid data in new csv file")
-        return "Valid data not found in file"
+    return append_sales(file_dir)[0]
 
 
 DATA_DICT = parse_data()
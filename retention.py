@@ -0,0 +1,255 @@
+"""
+This module keeps the sales data from growing without end.
+
+The RetentionPolicy says how long each part of the sales is kept as it
+is. The rows of the csv file of the last daily_years years are kept, so
+each invoice and the sales of each day are there. Older sales are kept
+as the total of each beer over each week up to weekly_years years back,
+and as the total of each month before that. Weeks are cut at the start
+of each month, so each week is in one month and adding the weeks of a
+month up gives its total exactly.
+
+compact_sales moves the rows that have got older than the policy keeps
+from the csv file into its archive, which read_file gives as the totals
+of each period next to the days still in the csv file. It can be
+run as often as wanted: the archive remembers the first day left in the
+csv file, and nothing is read unless a week has got old enough to be
+moved since the last time. The csv file is read in chunks and only the
+totals of the weeks and months being made are held, so it takes memory
+in proportion to the weeks moved rather than the rows.
+
+The archive is written before the csv file. Rows of the csv file older
+than the day the archive says it holds are ignored, so the sales aren't
+counted twice if the csv file isn't written.
+
+Usage:
+    python -m brewhouse compact --daily-years 3 --weekly-years 5
+"""
+import os
+import io
+import csv
+from datetime import datetime, timedelta
+from typing import NamedTuple, Dict, Tuple, Any, Optional
+from log_setup import get_logger
+from dateutil.parser import parse
+import read_file
+from read_file import DATA_LOCK, DATE_COLUMN, BEER_COLUMN, QUANTITY_COLUMN, ARCHIVE_SCHEMA, \
+    SalesArchive, archive_file_name, complete_lines
+from state_store import encode, write_atomic
+from customer_demand import HISTORY_DAYS
+from instrumentation import instrumented
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("retention")
+
+YEAR_DAYS = 365
+# The forecast of each customer reads HISTORY_DAYS days of rows, which
+# covers the year before the last year the seasonal naive forecast reads.
+MIN_DAILY_YEARS = HISTORY_DAYS / YEAR_DAYS
+# A period of more days than this is a month.
+WEEK_DAYS = 7
+
+
+class RetentionPolicy(NamedTuple):
+    """
+    How long the sales are kept at each granularity.
+
+    :attribute daily_years: Years of rows of sales kept in the csv file, at
+    least MIN_DAILY_YEARS so every forecast reads rows rather than totals.
+    :attribute weekly_years: Years the weekly totals are kept for, from
+    the last day of sales. Older sales are kept as monthly totals.
+    """
+    daily_years: float = 3.0
+    weekly_years: float = 5.0
+
+
+DEFAULT_RETENTION = RetentionPolicy()
+
+
+def month_start(day: datetime) -> datetime:
+    """Returns the first day of the month of the day."""
+    return day.replace(day=1)
+
+
+def next_month(day: datetime) -> datetime:
+    """Returns the first day of the month after the day."""
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def period_of(day: datetime, monthly: bool) -> Tuple[datetime, int]:
+    """
+    Returns the period the day is totalled in.
+
+    :param day: The day, at midnight.
+    :param monthly: Whether the period is the month rather than the week.
+
+    :return: The first day of the period and its number of days.
+    """
+    end = next_month(day)
+    if monthly:
+        start = month_start(day)
+    else:
+        monday = day - timedelta(days=day.weekday())
+        start = max(monday, month_start(day))
+        end = min(monday + timedelta(days=WEEK_DAYS), end)
+    return start, (end - start).days
+
+
+def cutoffs(last: datetime, policy: RetentionPolicy) -> Tuple[datetime, datetime]:
+    """
+    Returns the first day kept as rows and the first day kept in weekly totals.
+
+    Both are the first day of a period, so the periods before them are whole.
+
+    :param last: The last day of sales.
+    :param policy: The retention policy.
+    """
+    daily = period_of(last - timedelta(days=round(policy.daily_years * YEAR_DAYS)), False)[0]
+    weekly = month_start(last - timedelta(days=round(policy.weekly_years * YEAR_DAYS)))
+    return daily, min(weekly, daily)
+
+
+def roll_up(periods: Dict[str, Dict[datetime, Tuple[int, int]]], weekly: datetime) \
+        -> Dict[str, Dict[datetime, Tuple[int, int]]]:
+    """
+    Adds the weeks before the given day up into months.
+
+    :param periods: The (days, quantity) of each beer from the first day of each period.
+    :param weekly: The first day kept in weekly totals.
+
+    :return: The periods, with the weeks before the day replaced by their months.
+    """
+    rolled = {}
+    for beer, beer_periods in periods.items():
+        totals = rolled.setdefault(beer, {})
+        for start, (days, quantity) in beer_periods.items():
+            if days <= WEEK_DAYS and start < weekly:
+                start, days = period_of(start, True)
+            old_days, old_quantity = totals.get(start, (days, 0))
+            totals[start] = max(days, old_days), old_quantity + quantity
+    return rolled
+
+
+def write_archive(archive: SalesArchive, file_name: str) -> str:
+    """Writes the archive of a csv file of sales data, as read by read_archive."""
+    records = [{"type": "header", "schema": ARCHIVE_SCHEMA, "version": 1,
+                "through": archive.through.date().isoformat()}]
+    records += [{"beer": beer, "start": start.date().isoformat(), "days": days,
+                 "quantity": quantity}
+                for beer, beer_periods in archive.periods.items()
+                for start, (days, quantity) in sorted(beer_periods.items())]
+    return write_atomic(encode(records), file_name)
+
+
+@instrumented("sales.compact")
+def compact_sales(policy: RetentionPolicy = DEFAULT_RETENTION,
+                  file_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Moves the sales older than the policy keeps from the csv file into its archive.
+
+    :param policy: The retention policy.
+    :param file_name: The csv file of sales data. Defaults to the one read by parse_data.
+
+    :return: The first day left in the csv file, the rows moved and kept,
+    and the weeks and months in the archive. No rows are given as kept if
+    the csv file didn't need to be read.
+    """
+    if round(policy.daily_years * YEAR_DAYS) < HISTORY_DAYS \
+            or policy.weekly_years < policy.daily_years:
+        raise ValueError("At least %.2f years of daily sales must be kept for the forecasts, "
+                         "and weekly totals for at least as long" % MIN_DAILY_YEARS)
+    with DATA_LOCK:
+        file_name = read_file.SALES_FILE if file_name is None else file_name
+        sales = read_file.SALES if file_name == read_file.SALES_FILE \
+            else read_file.SalesTotals(file_name)
+        sales.update()
+        if sales.first_day is None:
+            return summary(sales.archive, 0, 0)
+        last = max(max(days) for days in sales.daily.values() if days)
+        daily, weekly = cutoffs(last, policy)
+        archived = sales.archive
+        through = daily if archived.through is None else max(archived.through, daily)
+        periods = roll_up(archived.periods, weekly)
+        rewrite = sales.first_day < through.toordinal()
+        if not rewrite and periods == archived.periods:
+            LOGGER.debug("No sales are old enough to be compacted")
+            return summary(archived, 0, 0)
+        moved = kept = 0
+        try:
+            if rewrite:
+                moved, kept = move_rows(file_name, archived.through, through, weekly, periods)
+            archive = SalesArchive(through, periods)
+            if write_archive(archive, archive_file_name(file_name)) != "success":
+                raise OSError("The archive of " + file_name + " couldn't be written")
+            if rewrite:
+                os.replace(file_name + ".compact", file_name)
+        finally:
+            if os.path.exists(file_name + ".compact"):
+                os.remove(file_name + ".compact")
+        sales.update()
+    LOGGER.info("Moved %d rows of sales before %s to the archive, keeping %d",
+                moved, through.date(), kept)
+    return summary(archive, moved, kept)
+
+
+def move_rows(file_name: str, archived: Optional[datetime], through: datetime,
+              weekly: datetime, periods: Dict[str, Dict[datetime, Tuple[int, int]]]) \
+        -> Tuple[int, int]:
+    """
+    Adds the rows of the csv file before a day to the periods and writes the rest to a new file.
+
+    The rows are written to the csv file name with ".compact" added, to be
+    moved over the csv file once the archive is written.
+
+    :param file_name: The csv file of sales data.
+    :param archived: The first day left in the csv file by the last compaction, if any.
+    Rows before it are already in the archive and are dropped.
+    :param through: The first day to keep in the csv file.
+    :param weekly: The first day kept in weekly totals. Rows before it are added to months.
+    :param periods: The (days, quantity) of each beer from the first day of each period,
+    added to.
+
+    :return: The number of rows moved and kept.
+    """
+    dates = {}
+    moved = kept = 0
+    with open(file_name, "rb") as file, \
+            open(file_name + ".compact", "w", newline="", encoding="utf-8") as new_file:
+        new_file.write(file.readline().decode("utf-8", "replace").rstrip("\r\n") + "\n")
+        writer = csv.writer(new_file, lineterminator="\n")
+        # The csv file isn't written to while it is compacted, so a last row without a
+        # newline is complete and kept.
+        for lines, _ in complete_lines(file, file.tell(), to_end=True):
+            rows = []
+            for row in csv.reader(io.StringIO(lines.decode("utf-8", "replace"))):
+                if len(row) <= QUANTITY_COLUMN:
+                    rows.append(row)
+                    continue
+                text = row[DATE_COLUMN]
+                if text not in dates:
+                    dates[text] = parse(text).replace(hour=0, minute=0, second=0, microsecond=0)
+                day = dates[text]
+                if day >= through:
+                    rows.append(row)
+                elif archived is None or day >= archived:
+                    start, days = period_of(day, day < weekly)
+                    totals = periods.setdefault(row[BEER_COLUMN], {})
+                    totals[start] = days, totals.get(start, (days, 0))[1] + int(
+                        row[QUANTITY_COLUMN])
+                    moved += 1
+            writer.writerows(rows)
+            kept += len(rows)
+    return moved, kept
+
+
+def summary(archive: SalesArchive, moved: int, kept: int) -> Dict[str, Any]:
+    """Returns what compact_sales gives for the archive and the rows moved and kept."""
+    lengths = [days for beer_periods in archive.periods.values()
+               for days, _ in beer_periods.values()]
+    return {"through": None if archive.through is None else archive.through.date(),
+            "moved": moved, "kept": kept,
+            "weeks": sum(days <= WEEK_DAYS for days in lengths),
+            "months": sum(days > WEEK_DAYS for days in lengths)}
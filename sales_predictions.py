@@ -6,26 +6,28 @@ that to the latest data point for each beer over and over until all the growth r
 been multiplied.
 In addition, the module can plot past data and the prediction using
 matplotlib and find the total predicted sale of a given time period.
+seasonal_naive predicts each beer as its sales a year before, which
+forecast_accuracy compares with the growth rate prediction.
+matplotlib is only imported when something is plotted, so the prediction
+can be made without it.
 """
 import os
 from datetime import datetime, timedelta
-from typing import List, Tuple, Dict
-import logging
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
+from typing import List, Tuple, Dict, TYPE_CHECKING
+from log_setup import get_logger
+import numpy as np
 from read_file import parse_data
+from instrumentation import instrumented
+
+if TYPE_CHECKING:
+    from matplotlib.lines import Line2D
 
 
 ABS_PATH = os.path.abspath(__file__)
 D_NAME = os.path.dirname(ABS_PATH)
 os.chdir(D_NAME)
 
-LOGGER = logging.getLogger("sales_predictions")
-LOGGER.setLevel(logging.DEBUG)
-F_HANDLER = logging.FileHandler('log_file.log')
-F_FORMAT = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-F_HANDLER.setFormatter(F_FORMAT)
-LOGGER.addHandler(F_HANDLER)
+LOGGER = get_logger("sales_predictions")
 
 
 def calculate_growth(start_date_obj: datetime, end_date_obj: datetime,
@@ -83,27 +85,32 @@ def multiply_rate(value: int, percent_list: List[int],
     return multiply_rate(value, percent_list, index, new_list)
 
 
-def plot_past_data(key_name: str = None) -> List[Line2D]:
+def plot_past_data(key_name: str = None) -> List["Line2D"]:
     """
     This function plots the past data using matplotlib.
 
     The optional argument allows you to see the graph for only one beer type.
+    Archived sales are plotted as the mean sales a day of each week or
+    month, from its first day.
 
     :param key_name: A specific type of beer to be shown.
     :return: The plot.
     """
     LOGGER.info("Plotting past data")
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
     data_dict = parse_data()
     for key in data_dict['x']:
         if key_name is None or key == key_name:
-            x_data = data_dict['x'][key]
-            y_data = data_dict['y'][key]
+            periods = data_dict['periods'].get(key, [])
+            x_data = [start for start, _, _ in periods] + data_dict['x'][key]
+            y_data = [total / days for _, days, total in periods] + data_dict['y'][key]
             line_2d = plt.plot(x_data, y_data, label=key, marker=".", linewidth=0.5, markersize=1)
 
     plt.legend()
     return line_2d
 
 
+@instrumented("growth")
 def plot_growth_percent(days: int = 1, key_name: str = None, plot: bool = True,
                         start_date: datetime = None) -> Tuple[List[datetime], Dict[str, List[int]]]:
     """
@@ -121,6 +128,8 @@ def plot_growth_percent(days: int = 1, key_name: str = None, plot: bool = True,
     :return: A dictionary of the growth rates and the corresponding dates.
     """
     LOGGER.info("Calculating growth rates")
+    if plot:
+        import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
     data_dict = parse_data()
     growth_dict = {}
 
@@ -138,7 +147,6 @@ def plot_growth_percent(days: int = 1, key_name: str = None, plot: bool = True,
                     dates.append(date)
                     growth = calculate_growth(date, date + timedelta(days), x_data, y_data, days)
                     growth_rates.append(growth)
-            LOGGER.debug("Data and date added")
 
             growth_dict[key] = growth_rates
 
@@ -152,6 +160,7 @@ def plot_growth_percent(days: int = 1, key_name: str = None, plot: bool = True,
     return dates, growth_dict
 
 
+@instrumented("forecast")
 def plot_next_year(days: int = 1, key_name: str = None, next_year: bool = True,
                    start_date: datetime = None, date_range: int = None)\
         -> Tuple[List[datetime], Dict[str, List[int]]]:
@@ -194,7 +203,6 @@ def plot_next_year(days: int = 1, key_name: str = None, next_year: bool = True,
     for key, percent_list in percent_dict.items():
         start_sale = data_dict['y'][key][-1]
 
-        LOGGER.debug("Multiplying rate")
         prediction_dict[key] = multiply_rate(start_sale, percent_list)
 
         if start_date is not None:
@@ -212,6 +220,36 @@ def plot_next_year(days: int = 1, key_name: str = None, next_year: bool = True,
     return dates, prediction_dict
 
 
+@instrumented("forecast.seasonal")
+def seasonal_naive(window: int = 7) -> Tuple[List[datetime], Dict[str, List[float]]]:
+    """
+    This function predicts each beer for a year from the latest data as its sales a year before.
+
+    Each day is given the average sales of the days around the same
+    weekday 52 weeks before, so the seasons are followed without the
+    noise of single days.
+
+    :param window: The number of days averaged.
+
+    :return: A list of the dates and a dictionary of the predicted sales of each beer.
+    """
+    LOGGER.info("Calculating the seasonal naive prediction")
+    data_dict = parse_data()
+    last_date = max(dates[-1] for dates in data_dict['x'].values())
+    dates = [last_date + timedelta(days=day) for day in range(1, 365)]
+    prediction_dict = {}
+    for key, x_data in data_dict['x'].items():
+        sales = np.asarray(data_dict['y'][key], dtype=float)
+        # The days of the data a year before each date, and those around them.
+        index = np.arange(1, 365)[:, None] + (last_date - x_data[0]).days - 364 \
+            + np.arange(window)[None, :] - window // 2
+        inside = (index >= 0) & (index < len(sales))
+        totals = np.where(inside, sales[np.clip(index, 0, len(sales) - 1)], 0).sum(axis=1)
+        prediction_dict[key] = (totals / np.maximum(inside.sum(axis=1), 1)).tolist()
+    return dates, prediction_dict
+
+
+@instrumented("totals")
 def get_total(start_date: datetime, date_range: datetime,
               data_tuple: Tuple[List[datetime], Dict[str, List[int]]]) -> Dict[str, int]:
     """
@@ -224,7 +262,7 @@ def get_total(start_date: datetime, date_range: datetime,
     :return:
     A dictionary containing the total for each beer.
     """
-    LOGGER.info("Getting total from %s", str(start_date))
+    LOGGER.debug("Getting total from %s", start_date)
     dates, data = data_tuple
     return_dict = {}
     for key, batch in data.items():
@@ -241,7 +279,32 @@ def get_total(start_date: datetime, date_range: datetime,
     return return_dict
 
 
+def daily_matrix(prediction: Tuple[List[datetime], Dict[str, List[int]]], beers: List[str],
+                 start_date: datetime, days: int) -> np.ndarray:
+    """
+    This function lines up the prediction for each beer with the given dates.
+
+    :param prediction: The list of dates and the dictionary which holds the sales data.
+    :param beers: The beers for each row. Beers without a prediction are left as 0.
+    :param start_date: The date for the first column.
+    :param days: The number of columns.
+
+    :return: An array with a row for each beer and a column for each day.
+    """
+    dates, data = prediction
+    matrix = np.zeros((len(beers), days))
+    if dates:
+        offset = (dates[0] - start_date).days
+        first, last = max(0, offset), min(days, offset + len(dates))
+        if first < last:
+            for row, beer in enumerate(beers):
+                if beer in data:
+                    matrix[row, first:last] = data[beer][first - offset:last - offset]
+    return matrix
+
+
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     plot_past_data(key_name="Organic Pilsner")
     # plot_next_year(days=1, key_name="Organic Pilsner", next_year=False)
     # plot_growth_percent(days=7, key_name="Organic Pilsner")
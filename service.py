@@ -0,0 +1,633 @@
+"""
+This module is a local HTTP service holding the state of every site and the forecast.
+
+Several people can then work on the same brewhouse, each with their own
+interface connected to the service through service_client, instead of
+each copy loading and saving the state itself. The service loads every
+site once, keeps it in memory and saves it in the background, and makes
+the forecast once for everyone with FORECASTS.
+
+Requests are read with asyncio and connections are kept alive. Every
+GET response has an ETag made from the version of what it depends on,
+such as the version of the Process object of the site or the version of
+the sales data, so a request with a matching If-None-Match is answered
+with 304 Not Modified straight away without working anything out.
+Responses are also cached by their ETag, and anything else is worked out
+in a thread pool so slow requests don't hold up the others.
+
+Usage:
+    python service.py --port 8765
+    python service.py --inbox inbox     also add sales data dropped into the inbox
+    python service.py --metrics         record how long each operation takes for /metrics
+
+GET endpoints:
+    /sites                              names of the sites
+    /version                            version of the sales data and of each site
+    /sales/version                      version of the sales data
+    /forecast?start=YYYY-MM-DD&days=N   forecast, the whole year without start
+    /totals?start=YYYY-MM-DD&days=N     total forecast sales of each beer
+    /sites/<site>/state                 state of the site as JSON lines
+    /sites/<site>/batches, tanks, orders or stock
+    /sites/<site>/history               stage transitions, finished batches and delivered orders
+    /sites/<site>/recommendations       batch to start and when each beer runs out
+    /accuracy                           recent errors of each forecasting model for each beer
+    /metrics                            times of each operation in the Prometheus text format
+
+POST endpoints, taking and giving JSON:
+    /sites/<site>/batches               {"beer": ..., "volume": ...}
+    /sites/<site>/batches/<id>/advance  {"tank": name or null}
+    /sites/<site>/orders                {"beer": ..., "quantity": ..., "due": YYYY-MM-DD}
+    /sites/<site>/orders/<id>/deliver
+    /sites/<site>/orders/fulfil
+    /sites/<site>/orders/import         csv of orders as the body
+    /sales                              csv of sales data as the body
+"""
+import os
+import re
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from typing import Tuple, List, Dict, Callable, Any, Optional, NamedTuple
+from urllib.parse import urlsplit, parse_qsl, unquote
+from log_setup import get_logger
+from inventory_management import batches_in_production, snapshot_objects, get_next_tanks
+from sales_predictions import get_total
+from suggestions import current_datetime
+from read_file import data_version
+from forecast_cache import FORECASTS, ForecastCache
+from forecast_accuracy import ACCURACY
+from state_store import to_json
+from inbox import InboxWatcher
+from instrumentation import METRICS
+from sites import SITES, SiteRegistry, Site, site_records
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("service")
+
+DEFAULT_PORT = 8765
+MAX_BODY = 64 * 1024 * 1024
+STATUS_TEXT = {200: "OK", 201: "Created", 304: "Not Modified", 400: "Bad Request",
+               404: "Not Found", 409: "Conflict", 413: "Payload Too Large",
+               500: "Internal Server Error"}
+JSON_TYPE = "application/json"
+LINES_TYPE = "application/x-ndjson"
+
+
+class RequestError(Exception):
+    """Raised when a request can't be carried out, with the status to answer with."""
+    def __init__(self, status: int, message: str):
+        """
+        :param status: The HTTP status code.
+        :param message: The message sent back.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class Request(NamedTuple):
+    """
+    One HTTP request.
+
+    :attribute method: The method, such as GET.
+    :attribute target: The path and query as sent, used to cache the response.
+    :attribute path: The path without the query.
+    :attribute query: The parameters in the query.
+    :attribute headers: The headers, with lower case names.
+    :attribute body: The body.
+    :attribute keep_alive: Whether the connection is kept open after the response.
+    """
+    method: str
+    target: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+    keep_alive: bool
+
+
+class Response(NamedTuple):
+    """
+    One HTTP response.
+
+    :attribute status: The HTTP status code.
+    :attribute body: The body.
+    :attribute content_type: The type of the body.
+    :attribute etag: The ETag of the body, or None if it isn't cached.
+    """
+    status: int
+    body: bytes = b""
+    content_type: str = JSON_TYPE
+    etag: Optional[str] = None
+
+
+def encode_json(value: Any) -> bytes:
+    """Encodes the value as compact json, with dates as ISO strings."""
+    return json.dumps(value, default=to_json, separators=(',', ':')).encode("utf-8")
+
+
+def query_date(query: Dict[str, str], name: str) -> Optional[datetime]:
+    """Returns the YYYY-MM-DD date in the query, or None if it isn't given."""
+    if name not in query:
+        return None
+    try:
+        return datetime.strptime(query[name], "%Y-%m-%d")
+    except ValueError:
+        raise RequestError(400, name + " is given as YYYY-MM-DD") from None
+
+
+def query_int(query: Dict[str, str], name: str, default: int) -> int:
+    """Returns the positive whole number in the query, or the default if it isn't given."""
+    try:
+        value = int(query.get(name, default))
+    except ValueError:
+        raise RequestError(400, name + " must be a whole number") from None
+    if value <= 0:
+        raise RequestError(400, name + " must be more than 0")
+    return value
+
+
+def json_body(request: Request) -> Dict[str, Any]:
+    """Returns the json object in the body of the request, or an empty one if there is no body."""
+    if not request.body:
+        return {}
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        raise RequestError(400, "The body is not valid json") from None
+    if not isinstance(payload, dict):
+        raise RequestError(400, "The body must be a json object")
+    return payload
+
+
+def forecast_json(prediction: Tuple[List[datetime], Dict[str, List[float]]]) -> Dict[str, Any]:
+    """Turns a forecast into json, with the dates and the sales of each beer for each date."""
+    dates, data = prediction
+    return {"dates": dates, "sales": data}
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """
+    Reads the next request on the connection.
+
+    :param reader: The stream of the connection.
+
+    :return: The request, or None if the connection was closed.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise RequestError(400, "Malformed request line") from None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise RequestError(400, "Malformed Content-Length") from None
+    if length > MAX_BODY:
+        raise RequestError(413, "The body is too large")
+    body = await reader.readexactly(length) if length else b""
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    parts = urlsplit(target)
+    return Request(method.upper(), target, unquote(parts.path),
+                   dict(parse_qsl(parts.query)), headers, body, keep_alive)
+
+
+def response_bytes(response: Response, keep_alive: bool) -> bytes:
+    """Turns the response into the bytes sent back."""
+    head = ["HTTP/1.1 %d %s" % (response.status, STATUS_TEXT.get(response.status, "")),
+            "Content-Length: %d" % len(response.body),
+            "Connection: " + ("keep-alive" if keep_alive else "close")]
+    if response.body:
+        head.append("Content-Type: " + response.content_type)
+    if response.etag is not None:
+        head.append("ETag: " + response.etag)
+        head.append("Cache-Control: no-cache")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body
+
+
+class BrewService:
+    """This class answers the requests for the state of the sites and the forecast."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, registry: SiteRegistry = SITES, forecasts: ForecastCache = FORECASTS,
+                 max_cached: int = 256, workers: int = 8):
+        """
+        Initialising the service. Sites are loaded when it is started.
+
+        :param registry: The sites to serve.
+        :param forecasts: The cache of the forecast.
+        :param max_cached: The number of responses cached.
+        :param workers: The number of threads working out responses.
+        """
+        self.registry = registry
+        self.forecasts = forecasts
+        self.max_cached = max_cached
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.bodies = OrderedDict()
+        # Versions start again each time a site is loaded, so ETags given before a restart
+        # are told apart by when the service was started.
+        self.started = "%x" % int(time.time())
+        self.counts = {"requests": 0, "not_modified": 0, "cached": 0}
+        # (method, path pattern, function giving the ETag or None, function giving the response)
+        routes = [
+            ("GET", r"/sites", None, self.get_sites),
+            ("GET", r"/version", None, self.get_version),
+            ("GET", r"/metrics", None, self.get_metrics),
+            ("GET", r"/sales/version", self.sales_etag, self.get_sales_version),
+            ("GET", r"/forecast", self.sales_etag, self.get_forecast),
+            ("GET", r"/totals", self.totals_etag, self.get_totals),
+            ("GET", r"/accuracy", self.sales_etag, self.get_accuracy),
+            ("GET", r"/sites/([^/]+)/state", self.site_etag, self.get_state),
+            ("GET", r"/sites/([^/]+)/(batches|tanks|orders|stock)", self.site_etag,
+             self.get_records),
+            ("GET", r"/sites/([^/]+)/history", self.site_etag, self.get_history),
+            ("GET", r"/sites/([^/]+)/recommendations", self.recommendations_etag,
+             self.get_recommendations),
+            ("POST", r"/sites/([^/]+)/batches", None, self.post_batch),
+            ("POST", r"/sites/([^/]+)/batches/([^/]+)/advance", None, self.post_advance),
+            ("POST", r"/sites/([^/]+)/orders", None, self.post_order),
+            ("POST", r"/sites/([^/]+)/orders/(\d+)/deliver", None, self.post_deliver),
+            ("POST", r"/sites/([^/]+)/orders/fulfil", None, self.post_fulfil),
+            ("POST", r"/sites/([^/]+)/orders/import", None, self.post_import),
+            ("POST", r"/sales", None, self.post_sales),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), etag, function)
+                       for method, pattern, etag, function in routes]
+
+    def site(self, name: str) -> Site:
+        """Returns the site with the given name."""
+        try:
+            return self.registry.get(name)
+        except KeyError:
+            raise RequestError(404, "There is no site called " + name) from None
+
+    @staticmethod
+    def sales_tag() -> str:
+        """Returns the version of the sales data as a string."""
+        return "s%x-%x" % data_version()
+
+    def site_tag(self, name: str) -> str:
+        """Returns the version of the state of the site as a string."""
+        return "%s-%d" % (name, self.site(name).process.version)
+
+    def etag(self, *tags: str) -> str:
+        """Returns the ETag made from the versions given."""
+        return '"' + "-".join((self.started,) + tags) + '"'
+
+    def sales_etag(self, _request: Request) -> str:
+        """The ETag of anything depending only on the sales data."""
+        return self.etag(self.sales_tag())
+
+    def totals_etag(self, request: Request) -> str:
+        """The ETag of the totals, which start today unless a start is given."""
+        if "start" in request.query:
+            return self.sales_etag(request)
+        return self.etag(self.sales_tag(), current_datetime().strftime("%Y%m%d"))
+
+    def site_etag(self, _request: Request, name: str, *_groups: str) -> str:
+        """The ETag of anything depending only on the state of the site."""
+        return self.etag(self.site_tag(name))
+
+    def recommendations_etag(self, _request: Request, name: str) -> str:
+        """
+        The ETag of the recommendations of the site.
+
+        They depend on the state of the site and the sales data, and change
+        as time passes, so they are worked out again every minute.
+        """
+        return self.etag(self.site_tag(name), self.sales_tag(), "%x" % int(time.time() // 60))
+
+    def get_sites(self, _request: Request) -> Any:
+        """The name of every site, the main site first."""
+        return self.registry.names()
+
+    def get_version(self, _request: Request) -> Any:
+        """The version of the sales data and of each site."""
+        return {"sales": list(data_version()),
+                "sites": {name: self.site(name).process.version
+                          for name in self.registry.names()}}
+
+    @staticmethod
+    def get_metrics(_request: Request) -> Response:
+        """The times of each operation and the counters in the Prometheus text format."""
+        return Response(200, METRICS.prometheus_text().encode("utf-8"),
+                        "text/plain; version=0.0.4")
+
+    @staticmethod
+    def get_sales_version(_request: Request) -> Any:
+        """The version of the sales data."""
+        return {"version": list(data_version())}
+
+    def get_forecast(self, request: Request) -> Any:
+        """The forecast for the days asked for, or for the whole year."""
+        start = query_date(request.query, "start")
+        if start is None:
+            prediction = self.forecasts.forecast()
+            if "days" in request.query and prediction[0] is not None:
+                days = query_int(request.query, "days", 365)
+                prediction = prediction[0][:days], {beer: sales[:days]
+                                                    for beer, sales in prediction[1].items()}
+        else:
+            prediction = self.forecasts.window(start, query_int(request.query, "days", 7))
+        if prediction[0] is False:
+            raise RequestError(404, "The dates asked for are not in the forecast")
+        return forecast_json(prediction)
+
+    def get_totals(self, request: Request) -> Any:
+        """The total forecast sales of each beer over the days asked for."""
+        start = query_date(request.query, "start") or current_datetime()
+        total = get_total(start, query_int(request.query, "days", 42), self.forecasts.forecast())
+        if total is None:
+            raise RequestError(404, "The dates asked for are not in the forecast")
+        return total
+
+    def get_accuracy(self, _request: Request) -> Any:
+        """The errors of each model for each beer, scored against the sales so far."""
+        self.forecasts.forecast()
+        return ACCURACY.records()
+
+    def get_state(self, _request: Request, name: str) -> Response:
+        """The state of the site as the JSON lines of a state file."""
+        site = self.site(name)
+        _version, data = snapshot_objects(site.process, site.tanks)
+        return Response(200, data, LINES_TYPE)
+
+    def get_records(self, _request: Request, name: str, what: str) -> Any:
+        """The batches, tanks, orders or stock of the site."""
+        return site_records(self.site(name), what)
+
+    def get_history(self, _request: Request, name: str) -> Any:
+        """The history of the site."""
+        return self.site(name).process.history.records()
+
+    def get_recommendations(self, _request: Request, name: str) -> Any:
+        """The batch to start at the site and when each beer is projected to run out."""
+        (beer, volume), first_stockout, _prediction = self.site(name).recommendations()
+        return {"suggestion": {"beer": beer, "volume": volume}, "stockouts": first_stockout}
+
+    def check_beer(self, beer: str):
+        """
+        Raises a RequestError unless the beer is one of the beers forecast.
+
+        Any name is taken if there is no sales data to forecast from.
+        """
+        beers = self.forecasts.forecast()[1]
+        if not beer.strip() or (beers and beer not in beers):
+            raise RequestError(400, "There is no beer called " + repr(beer))
+
+    def post_batch(self, request: Request, name: str) -> Response:
+        """Starts a new batch."""
+        payload = json_body(request)
+        beer, volume = payload.get("beer"), payload.get("volume")
+        if not isinstance(beer, str) or not isinstance(volume, int) or not 0 < volume <= 1000:
+            raise RequestError(400, "A batch needs a beer and a volume between 0 and 1000")
+        self.check_beer(beer)
+        batch = self.site(name).add_batch(beer, volume)
+        return Response(201, encode_json({"batch": batch.batch_id}))
+
+    def post_advance(self, request: Request, name: str, batch_id: str) -> Any:
+        """Moves a batch to its next step, in the tank given if it needs one."""
+        site = self.site(name)
+        tank_name = json_body(request).get("tank")
+        with site.process.lock:
+            batch = next((batch for batch in batches_in_production(site.process)
+                          if batch.batch_id == batch_id), None)
+            if batch is None:
+                raise RequestError(404, "There is no batch " + batch_id + " in production")
+            tank = None
+            if batch.next_step in [2, 3]:
+                tank = next((tank for tank in get_next_tanks(batch, site.tanks) or []
+                             if tank.name == tank_name), None)
+                if tank is None:
+                    raise RequestError(409, "The batch needs a free tank to go to")
+            elif batch.next_step == 1 and site.process.brewing:
+                raise RequestError(409, "The brewing equipment is in use")
+            step = site.advance(batch, tank)
+        return {"batch": batch_id, "stage": site.process.step_names[step],
+                "tank": None if tank is None else tank.name}
+
+    def post_order(self, request: Request, name: str) -> Response:
+        """Adds a new order."""
+        payload = json_body(request)
+        beer, quantity = payload.get("beer"), payload.get("quantity")
+        try:
+            due = date.fromisoformat(payload.get("due"))
+        except (TypeError, ValueError):
+            due = None
+        if not isinstance(beer, str) or not isinstance(quantity, int) or quantity <= 0 \
+                or due is None:
+            raise RequestError(400, "An order needs a beer, a quantity more than 0 and a due "
+                                    "date as YYYY-MM-DD")
+        self.check_beer(beer)
+        order = self.site(name).add_order(beer, quantity, due)
+        return Response(201, encode_json({"order": order.order_id}))
+
+    def post_deliver(self, _request: Request, name: str, order_id: str) -> Any:
+        """Delivers an order if there is enough stock."""
+        site = self.site(name)
+        if site.process.orders.get(int(order_id)) is None:
+            raise RequestError(404, "There is no order " + order_id)
+        if not site.deliver(int(order_id)):
+            raise RequestError(409, "Not enough inventory")
+        return {"order": int(order_id)}
+
+    def post_fulfil(self, _request: Request, name: str) -> Any:
+        """Delivers every order that can be made from the stock."""
+        return {"delivered": [{"order": order.order_id, "beer": order.beer,
+                               "quantity": order.quantity, "due": order.due,
+                               "reference": order.reference}
+                              for order in self.site(name).fulfil()]}
+
+    @staticmethod
+    def with_body_file(request: Request, function: Callable[[str], Any]) -> Any:
+        """Writes the body of the request to a temporary csv file and calls the function with it."""
+        handle, file_name = tempfile.mkstemp(suffix=".csv")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(request.body)
+            return function(file_name)
+        finally:
+            os.remove(file_name)
+
+    def post_import(self, request: Request, name: str) -> Any:
+        """Adds every order in the csv body."""
+        site = self.site(name)
+        try:
+            return {"added": self.with_body_file(request, site.import_orders)}
+        except (KeyError, ValueError) as error:
+            raise RequestError(400, "Valid orders not found: " + str(error)) from None
+
+    def post_sales(self, request: Request) -> Any:
+        """Adds the sales data in the csv body."""
+        result = self.with_body_file(request, self.registry.add_sales)
+        if result != "success":
+            raise RequestError(400, result)
+        # The new sales are scored against the forecasts made before them.
+        self.forecasts.forecast()
+        return {"result": result}
+
+    def remember(self, key: Tuple[str, str], response: Response):
+        """Caches a response, dropping the least recently used if the cache is full."""
+        self.bodies[key] = response
+        self.bodies.move_to_end(key)
+        while len(self.bodies) > self.max_cached:
+            self.bodies.popitem(last=False)
+
+    def work_out(self, request: Request, function: Callable, groups: Tuple[str, ...]) -> Response:
+        """Runs the function of the route in the thread pool, saving the site if it changed."""
+        with METRICS.timed("service." + function.__name__):
+            result = function(request, *groups)
+        if request.method == "POST" and groups:
+            self.site(groups[0]).request_save()
+        if isinstance(result, Response):
+            return result
+        return Response(200, encode_json(result))
+
+    async def respond(self, request: Request) -> Response:
+        """
+        Works out the response to the request.
+
+        The ETag of a GET is worked out first. A request that already has
+        the latest version is answered with 304, and a cached body is used
+        if there is one. Anything else is worked out in the thread pool.
+        """
+        self.counts["requests"] += 1
+        for method, pattern, etag_function, function in self.routes:
+            match = pattern.match(request.path)
+            if match is None or method != request.method:
+                continue
+            groups = match.groups()
+            etag = None if etag_function is None else etag_function(request, *groups)
+            if etag is not None:
+                if request.headers.get("if-none-match") == etag:
+                    self.counts["not_modified"] += 1
+                    METRICS.count("service.not_modified")
+                    return Response(304, etag=etag)
+                cached = self.bodies.get((request.target, etag))
+                if cached is not None:
+                    self.counts["cached"] += 1
+                    METRICS.count("service.cached")
+                    self.bodies.move_to_end((request.target, etag))
+                    return cached
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self.executor, self.work_out, request,
+                                                  function, groups)
+            if etag is not None and response.status == 200:
+                response = response._replace(etag=etag)
+                self.remember((request.target, etag), response)
+            return response
+        raise RequestError(404, "No such endpoint: " + request.method + " " + request.path)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answers each request on a connection until it is closed."""
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = request.keep_alive
+                    response = await self.respond(request)
+                except RequestError as error:
+                    response = Response(error.status, encode_json({"error": str(error)}))
+                except Exception as error:  # pylint: disable=broad-except
+                    LOGGER.exception("Request failed")
+                    response = Response(500, encode_json({"error": str(error)}))
+                writer.write(response_bytes(response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            LOGGER.debug("Connection closed by the client")
+        finally:
+            writer.close()
+
+    def open_sites(self):
+        """Loads every site and starts saving each in the background."""
+        self.registry.map(lambda site: site.open())
+
+    async def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                    ready: Callable[[int], None] = None):
+        """
+        Loads the sites and answers requests until cancelled.
+
+        :param host: The address to listen on.
+        :param port: The port to listen on. 0 picks a free port.
+        :param ready: Function given the port once the service is listening.
+        """
+        self.open_sites()
+        server = await asyncio.start_server(self.handle, host, port)
+        port = server.sockets[0].getsockname()[1]
+        LOGGER.info("Serving on %s:%d", host, port)
+        if ready is not None:
+            ready(port)
+        async with server:
+            await server.serve_forever()
+
+    def stop(self):
+        """Stops the thread pool and saves every site."""
+        self.executor.shutdown(wait=True)
+        self.registry.stop()
+        LOGGER.info("Service stopped after %d requests, %d not modified and %d cached",
+                    self.counts["requests"], self.counts["not_modified"], self.counts["cached"])
+
+
+def interrupt(_signal_number: int, _frame: Any):
+    """Stops the service the same way as Ctrl+C when it is asked to terminate."""
+    raise KeyboardInterrupt
+
+
+def main(argv: Optional[List[str]] = None):
+    """Runs the service until it is interrupted, saving every site before exiting."""
+    parser = argparse.ArgumentParser(description="Serves the state of BrewHouse to its "
+                                                 "interfaces on this computer.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on "
+                                                            "(default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port to listen on (default: %d)" % DEFAULT_PORT)
+    parser.add_argument("--inbox", help="directory to add the csv files of sales data "
+                                        "dropped into")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record how long each operation takes, served at /metrics")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        METRICS.enable()
+    service = BrewService()
+    # Clients see the sales added from the inbox by the version of the sales data.
+    watcher = None
+    if args.inbox is not None:
+        watcher = InboxWatcher(args.inbox, forecasts=service.forecasts)
+        watcher.start()
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        asyncio.run(service.serve(args.host, args.port,
+                                  lambda port: print("Serving on http://%s:%d" % (args.host, port),
+                                                     flush=True)))
+    except KeyboardInterrupt:
+        LOGGER.info("Interrupted")
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+"""
+This module connects the interface to the sites held by a service.
+
+RemoteRegistry and RemoteSite have the same methods as SiteRegistry and
+Site, so the interface works the same way with the sites of a service as
+with sites loaded from disk. Each RemoteSite keeps a copy of the state
+of its site, built from the state file the service sends. The copy is
+only built again when the ETag of the state has changed, so checking for
+changes is one small request. Changes are sent to the service, which
+saves them, and the copy is then brought up to date.
+
+Running this module measures how many requests a second the service answers.
+
+Usage:
+    python service_client.py --url http://127.0.0.1:8765 --threads 8 --requests 5000
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from typing import Tuple, List, Dict, Callable, Any, Optional
+from urllib.parse import urlsplit, quote
+from log_setup import get_logger
+from inventory_management import Process, Tank, Batch, batches_in_production, \
+    objects_from_records
+from orders import Order
+from state_store import HistoryLog, decode
+from forecast_cache import ForecastCache, Forecast
+from changes import BATCH_MOVED, TANK_CHANGED, STOCK_CHANGED, ORDER_CHANGED, SALES_CHANGED
+from sites import MAIN_SITE
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("service_client")
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+# The kinds of change to tell the interface about when the records of each type change.
+RECORD_CHANGES = {"batch": [BATCH_MOVED, TANK_CHANGED], "tank": [TANK_CHANGED],
+                  "stock": [STOCK_CHANGED], "order": [ORDER_CHANGED],
+                  "header": [ORDER_CHANGED]}
+
+
+class ServiceError(Exception):
+    """Raised when the service answers a request with an error."""
+    def __init__(self, status: int, message: str):
+        """
+        :param status: The HTTP status code.
+        :param message: The message sent back.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+def parse_json(body: bytes) -> Any:
+    """Decodes a json response."""
+    return json.loads(body)
+
+
+def parse_state(body: bytes) -> List[dict]:
+    """Decodes a state file sent by the service."""
+    return decode(body.decode("utf-8").splitlines())
+
+
+def parse_forecast(body: bytes) -> Forecast:
+    """Decodes a forecast sent by the service, as from plot_next_year."""
+    forecast = json.loads(body)
+    if forecast["dates"] is None:
+        return None, None
+    return [datetime.fromisoformat(day) for day in forecast["dates"]], forecast["sales"]
+
+
+class ServiceClient:
+    """
+    This class sends requests to the service.
+
+    Each thread has its own connection, which is kept open. The latest
+    response to each GET is kept with its ETag, so asking again is
+    answered with 304 if it hasn't changed and the kept response is used.
+    """
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 30):
+        """
+        :param url: The address of the service.
+        :param timeout: Seconds to wait for the service before giving up.
+        """
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+        # The ETag and decoded response of each path.
+        self.responses = {}
+        self.lock = threading.Lock()
+        self.sales_version = None
+
+    def connection(self) -> http.client.HTTPConnection:
+        """Returns the connection of the current thread, opening it if needed."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.connection = connection
+        return connection
+
+    def close(self):
+        """Closes the connection of the current thread."""
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def request(self, method: str, path: str, body: bytes = None,
+                headers: Dict[str, str] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        Sends a request, opening the connection again once if the service closed it.
+
+        A GET is sent again whenever the connection was lost. Other requests
+        are only sent again if the connection was lost while they were being
+        sent, as the service may have acted on one it didn't answer.
+
+        :param method: GET or POST.
+        :param path: The path and query.
+        :param body: The body to send.
+        :param headers: The headers to send.
+
+        :return: The status, the headers with lower case names and the body of the response.
+        """
+        for attempt in range(2):
+            connection = self.connection()
+            sent = False
+            try:
+                connection.request(method, path, body, headers or {})
+                sent = True
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                    ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt or (sent and method != "GET"):
+                    raise
+                LOGGER.debug("Connection lost, sending %s %s again", method, path)
+                continue
+            if response.status >= 400:
+                try:
+                    message = json.loads(data)["error"]
+                except (ValueError, KeyError, TypeError):
+                    message = data.decode("utf-8", "replace")
+                raise ServiceError(response.status, message)
+            return response.status, {name.lower(): value
+                                     for name, value in response.getheaders()}, data
+        raise ConnectionError("Could not reach the service")
+
+    def fetch(self, path: str, parse: Callable[[bytes], Any] = parse_json) -> Tuple[Any, bool]:
+        """
+        Gets the path, using the kept response if it hasn't changed.
+
+        :param path: The path and query.
+        :param parse: Function decoding the body.
+
+        :return: The decoded response and whether it changed since it was last fetched.
+        """
+        with self.lock:
+            kept = self.responses.get(path)
+        headers = {} if kept is None else {"If-None-Match": kept[0]}
+        status, response_headers, data = self.request("GET", path, headers=headers)
+        if status == 304:
+            return kept[1], False
+        value = parse(data)
+        if "etag" in response_headers:
+            with self.lock:
+                self.responses[path] = (response_headers["etag"], value)
+        return value, True
+
+    def get(self, path: str, parse: Callable[[bytes], Any] = parse_json) -> Any:
+        """Returns the decoded response to the path."""
+        return self.fetch(path, parse)[0]
+
+    def post(self, path: str, payload: Dict[str, Any] = None, body: bytes = None,
+             content_type: str = "application/json") -> Any:
+        """
+        Posts json, or the body if given, to the path.
+
+        :return: The decoded json response.
+        """
+        if body is None:
+            body = json.dumps(payload or {}).encode("utf-8")
+        return json.loads(self.request("POST", path, body, {"Content-Type": content_type})[2])
+
+    def sales_changed(self) -> bool:
+        """Checks the version of the sales data and returns whether it has changed."""
+        version, changed = self.fetch("/sales/version")
+        old, self.sales_version = self.sales_version, tuple(version["version"])
+        return changed and old is not None and old != self.sales_version
+
+    def forecast(self) -> Forecast:
+        """Returns the forecast for the whole year, as from plot_next_year."""
+        return self.get("/forecast", parse_forecast)
+
+
+class RemoteHistory(HistoryLog):
+    """This class is the history of a site held by the service. Nothing is added to it here."""
+    def __init__(self, client: ServiceClient, path: str):
+        """
+        :param client: The client of the service.
+        :param path: The path of the history of the site.
+        """
+        super().__init__(os.devnull)
+        self.client = client
+        self.path = path
+
+    def load(self) -> List[dict]:
+        """Gets the history from the service. It is only sent again if it has changed."""
+        return self.client.get(self.path)
+
+
+class RemoteSite:
+    """This class is a copy of a site held by the service, with the same methods as Site."""
+    remote = True
+    state_manager = None
+
+    def __init__(self, client: ServiceClient, name: str):
+        """
+        Initialising the site without getting its state.
+
+        :param client: The client of the service.
+        :param name: Name of the site.
+        """
+        self.client = client
+        self.name = name
+        self.path = "/sites/" + quote(name, safe="")
+        self._process = None
+        self._tanks = None
+        # The records of each type in the state last sent, to tell what has changed.
+        self.records = {}
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the state of the site has been got from the service."""
+        return self._process is not None
+
+    def load(self):
+        """Gets the state of the site if it hasn't been got yet."""
+        if not self.loaded:
+            self.sync()
+
+    def open(self):
+        """Gets the state of the site. The service saves it."""
+        self.load()
+
+    @property
+    def process(self) -> Process:
+        """The copy of the Process object of the site."""
+        self.load()
+        return self._process
+
+    @property
+    def tanks(self) -> List[Tank]:
+        """The copy of the list of tanks of the site."""
+        self.load()
+        return self._tanks
+
+    def sync(self):
+        """
+        Brings the copy of the site up to date with the service.
+
+        The copy is built again only if the state has changed, and the
+        kinds of state that changed are noted in its ChangeTracker, along
+        with the sales data if it has changed.
+        """
+        with self.lock:
+            sales_changed = self.client.sales_changed()
+            records, changed = self.client.fetch(self.path + "/state", parse_state)
+            if changed or not self.loaded:
+                by_type = {}
+                for record in records:
+                    by_type.setdefault(record["type"], []).append(record)
+                kinds = set()
+                for record_type, record_kinds in RECORD_CHANGES.items():
+                    if by_type.get(record_type, []) != self.records.get(record_type, []):
+                        kinds.update(record_kinds)
+                process_obj, tanks = objects_from_records(records)
+                process_obj.history = RemoteHistory(self.client, self.path + "/history")
+                process_obj.changes.notify(kinds)
+                LOGGER.debug("Site %s changed: %s", self.name, ", ".join(sorted(kinds)))
+                self.records = by_type
+                self._tanks = tanks
+                self._process = process_obj
+            if sales_changed:
+                self._process.changes.notify([SALES_CHANGED])
+
+    def find_batch(self, batch_id: str) -> Optional[Batch]:
+        """Returns the batch in production with the id, or None."""
+        return next((batch for batch in batches_in_production(self.process)
+                     if batch.batch_id == batch_id), None)
+
+    def add_batch(self, beer: str, volume: int) -> Batch:
+        """Starts a new batch of the beer at the service."""
+        batch_id = self.client.post(self.path + "/batches",
+                                    {"beer": beer, "volume": volume})["batch"]
+        self.sync()
+        return self.find_batch(batch_id)
+
+    def advance(self, batch: Batch, tank: Tank = None) -> int:
+        """
+        Moves the batch to its next step at the service, in the tank if given.
+
+        :return: The current step of the batch, which is unchanged if it couldn't be moved.
+        """
+        try:
+            self.client.post(self.path + "/batches/" + quote(batch.batch_id, safe="")
+                             + "/advance", {"tank": None if tank is None else tank.name})
+        except ServiceError as error:
+            if error.status != 409:
+                raise
+            LOGGER.warning("Batch %s not moved: %s", batch.batch_id, error)
+        self.sync()
+        moved = self.find_batch(batch.batch_id)
+        return 5 if moved is None else moved.current_step
+
+    def add_order(self, beer: str, quantity: int, due: date) -> Order:
+        """Adds a new order at the service."""
+        order_id = self.client.post(self.path + "/orders", {"beer": beer, "quantity": quantity,
+                                                            "due": due.isoformat()})["order"]
+        self.sync()
+        return self.process.orders.get(order_id)
+
+    def deliver(self, order_id: int) -> bool:
+        """Delivers the order at the service if there is enough stock."""
+        try:
+            self.client.post(self.path + "/orders/" + str(order_id) + "/deliver")
+        except ServiceError as error:
+            if error.status != 409:
+                raise
+            return False
+        finally:
+            self.sync()
+        return True
+
+    def fulfil(self) -> List[Order]:
+        """Delivers every order that can be made from the stock at the service."""
+        delivered = self.client.post(self.path + "/orders/fulfil")["delivered"]
+        self.sync()
+        return [Order(record["order"], record["beer"], record["quantity"],
+                      date.fromisoformat(record["due"]), record["reference"])
+                for record in delivered]
+
+    def import_orders(self, file_dir: str) -> int:
+        """Sends every order in the csv file to the service."""
+        with open(file_dir, "rb") as file:
+            body = file.read()
+        try:
+            added = self.client.post(self.path + "/orders/import", body=body,
+                                     content_type="text/csv")["added"]
+        except ServiceError as error:
+            if error.status != 400:
+                raise
+            raise ValueError(str(error)) from None
+        self.sync()
+        return added
+
+    def recommendations(self, _prediction: Forecast = None) \
+            -> Tuple[Tuple[str, int], Dict[str, Optional[datetime]], Forecast]:
+        """
+        Gets the batch to start and when each beer runs out from the service.
+
+        The forecast is kept by the service, so None is given back for it.
+        """
+        result = self.client.get(self.path + "/recommendations")
+        suggestion = result["suggestion"]
+        return (suggestion["beer"], suggestion["volume"]), \
+            {beer: None if day is None else datetime.fromisoformat(day)
+             for beer, day in result["stockouts"].items()}, None
+
+    def request_save(self):
+        """Does nothing, as the service saves each change."""
+
+    @staticmethod
+    def save_stats() -> Dict[str, float]:
+        """Returns no saves, as the service saves each change."""
+        return {"saves": 0}
+
+
+class RemoteRegistry:
+    """This class holds every site of the service by name, with the same methods as SiteRegistry."""
+    remote = True
+
+    def __init__(self, url: str = DEFAULT_URL):
+        """
+        Getting the names of the sites from the service.
+
+        :param url: The address of the service.
+        """
+        self.client = ServiceClient(url)
+        self.sites = {name: RemoteSite(self.client, name) for name in self.client.get("/sites")}
+        # The forecast is made by the service, and only sent again once the sales data changes.
+        self.forecasts = ForecastCache(version=lambda: self.client.sales_version,
+                                       make_forecast=self.client.forecast)
+
+    def names(self) -> List[str]:
+        """Returns the name of every site, the main site first."""
+        return list(self.sites)
+
+    def get(self, name: str) -> RemoteSite:
+        """Returns the site with the given name."""
+        return self.sites[name]
+
+    def stop(self):
+        """Closes the connection to the service."""
+        self.client.close()
+
+    def add_sales(self, file_dir: str) -> str:
+        """Sends the sales data in the csv file to the service, giving the result as write_data."""
+        try:
+            with open(file_dir, "rb") as file:
+                body = file.read()
+        except OSError:
+            return "File not found"
+        try:
+            return self.client.post("/sales", body=body, content_type="text/csv")["result"]
+        except ServiceError as error:
+            return str(error)
+
+    def accuracy(self) -> List[Dict[str, Any]]:
+        """Returns the recent errors of each forecasting model for each beer from the service."""
+        return self.client.get("/accuracy")
+
+
+def benchmark(url: str, threads: int, requests: int, paths: List[str]) -> Dict[str, float]:
+    """
+    Sends the requests from several threads and measures how quickly they are answered.
+
+    Each thread keeps its connection open and sends If-None-Match like the
+    interface does, cycling through the paths.
+
+    :param url: The address of the service.
+    :param threads: The number of threads sending requests.
+    :param requests: The number of requests sent in total.
+    :param paths: The paths to get.
+
+    :return: The requests a second and the median and 99th percentile latency in milliseconds.
+    """
+    client = ServiceClient(url)
+    latencies = []
+
+    def send(count: int) -> List[float]:
+        times = []
+        for index in range(count):
+            began = time.perf_counter()
+            client.fetch(paths[index % len(paths)], bytes)
+            times.append(time.perf_counter() - began)
+        client.close()
+        return times
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for times in executor.map(send, [requests // threads] * threads):
+            latencies.extend(times)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"requests": len(latencies), "seconds": elapsed,
+            "requests_per_second": len(latencies) / elapsed,
+            "median_ms": latencies[len(latencies) // 2] * 1000,
+            "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000}
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description="Measures how many requests a second the "
+                                                 "service answers.")
+    PARSER.add_argument("--url", default=DEFAULT_URL)
+    PARSER.add_argument("--threads", type=int, default=8)
+    PARSER.add_argument("--requests", type=int, default=5000)
+    PARSER.add_argument("--site", default=MAIN_SITE)
+    ARGS = PARSER.parse_args()
+    SITE_PATH = "/sites/" + quote(ARGS.site, safe="")
+    # The totals are asked for from the start of the forecast, so they are always in it.
+    START = ServiceClient(ARGS.url).get("/forecast?days=1")["dates"][0][:10]
+    print(json.dumps(benchmark(ARGS.url, ARGS.threads, ARGS.requests,
+                               [SITE_PATH + "/state", SITE_PATH + "/orders",
+                                SITE_PATH + "/tanks", SITE_PATH + "/recommendations",
+                                "/forecast", "/totals?start=" + START, "/sales/version"]),
+                     indent=1))
@@ -0,0 +1,311 @@
+"""
+This module simulates the brewery forward in time for what-if questions.
+
+The Process, Tank and Batch objects from inventory_management are run on
+a virtual clock instead of the wall clock. Events are taken in time order
+from an event queue holding a tick for each day and the stage finish times
+from the scheduler of the Process object. Each day the predicted sales are
+taken from the finished stock and a suggestion policy decides whether to
+start a new batch. Finished stages are moved on as soon as a tank is free.
+The policy can be given a forecast other than the sales, so past sales
+can be replayed against what would have been forecast at the time.
+
+A grid of scenarios can be run in parallel in a process pool.
+"""
+import os
+import time
+import copy
+from heapq import heappush, heappop
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Tuple, List, Dict, Callable, NamedTuple, Optional, Union
+from log_setup import get_logger
+from inventory_management import Process, Tank, Batch, TANKS, BOTTLE_VOLUME, \
+    add_batch, available_tanks, finished_processes, batches_in_production
+from suggestions import suggest_batch
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("simulation")
+
+DAY = 24 * 3600
+# Stage events are handled before the day tick at the same time.
+STAGE_EVENT = 0
+DAY_EVENT = 1
+
+Demand = Tuple[List[datetime], Dict[str, List[float]]]
+
+
+class VirtualClock:
+    """A clock that only moves when the simulation moves it."""
+    # pylint: disable=too-few-public-methods
+    def __init__(self, start: float):
+        """
+        Initialising the clock.
+
+        :param start: The time the clock starts at.
+        """
+        self.now = start
+
+    def __call__(self) -> float:
+        """Returns the current virtual time."""
+        return self.now
+
+
+class Scenario(NamedTuple):
+    """
+    The settings for one simulation run.
+
+    :attribute name: Name identifying the scenario in the results.
+    :attribute tanks: The (name, volume, function) of each tank.
+    :attribute days: Number of days to simulate.
+    :attribute policy: Function choosing the next batch, called like suggest_batch.
+    :attribute lead_days: Number of days ahead the policy starts looking at demand.
+    :attribute window_days: Number of days of demand the policy looks at.
+    :attribute initial: Process object to start from instead of an empty brewery.
+    :attribute warmup_days:
+    Number of days at the start left out of the results, while the
+    batches started fill the empty brewery.
+    """
+    name: str
+    tanks: List[Tuple[str, int, str]]
+    days: int = 182
+    policy: Callable[[Dict[str, float], Process, List[Tank]], Tuple[str, int]] = suggest_batch
+    lead_days: int = 70
+    window_days: int = 42
+    initial: Optional[Process] = None
+    warmup_days: int = 0
+
+
+def tank_specs(tanks: List[Tank] = TANKS) -> List[Tuple[str, int, str]]:
+    """Returns the (name, volume, function) of each tank so it can be used in a Scenario."""
+    return [(tank.name, tank.volume, tank.function) for tank in tanks]
+
+
+def copy_state(process_obj: Process, tanks: List[Tank], start: float) -> Process:
+    """
+    Copies a Process object onto the given tanks for a simulation starting at the given time.
+
+    The batches keep the time they have spent in their stage, and batches in
+    a tank are put into the tank with the same name if there is one.
+
+    :param process_obj: The Process object to copy.
+    :param tanks: The tanks of the simulation.
+    :param start: The virtual time the simulation starts at.
+
+    :return: The copied Process object.
+    """
+    process_copy = copy.deepcopy(process_obj)
+    offset = start - time.time()
+    tanks_by_name = {tank.name: tank for tank in tanks}
+    for batch in batches_in_production(process_copy):
+        batch.current_start_time += offset
+        if batch.current_tank is not None:
+            batch.current_tank = tanks_by_name.get(batch.current_tank.name)
+            if batch.current_tank is not None:
+                batch.current_tank.current_batch = batch
+    process_copy.scheduler.rebuild(process_copy)
+    return process_copy
+
+
+class Simulation:
+    """This class runs one scenario against the predicted demand."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, scenario: Scenario, demand: Demand, forecast: Demand = None):
+        """
+        Setting up the brewery for the scenario on a virtual clock.
+
+        :param scenario: The Scenario to simulate.
+        :param demand: The dates and the predicted daily sales in bottles, as from plot_next_year.
+        :param forecast:
+        The daily sales the policy is given, starting on the same date as
+        the demand. Defaults to the demand.
+        """
+        dates, predictions = demand
+        self.scenario = scenario
+        self.start = dates[0].timestamp()
+        self.end = self.start + min(scenario.days, len(dates)) * DAY
+        self.days = min(scenario.days, len(dates))
+        # The results are counted from this time, after the warm up.
+        self.measure_start = self.start + min(scenario.warmup_days, self.days) * DAY
+        self.demand = predictions
+        # Running totals so the demand over any window is a subtraction.
+        self.cumulative = {beer: list(accumulate(sales, initial=0))
+                           for beer, sales in (demand if forecast is None else forecast)[1].items()}
+
+        self.tanks = [Tank(name, volume, function) for name, volume, function in scenario.tanks]
+        if scenario.initial is None:
+            self.process = Process()
+        else:
+            self.process = copy_state(scenario.initial, self.tanks, self.start)
+        self.clock = VirtualClock(self.start)
+        self.process.clock = self.clock
+
+        self.events = []
+        self.queued = set()
+        self.last_time = self.start
+        self.busy = {tank.name: 0.0 for tank in self.tanks}
+        self.sold = {beer: 0.0 for beer in predictions}
+        self.unmet = {beer: 0.0 for beer in predictions}
+        self.stockout_days = {beer: 0 for beer in predictions}
+        self.stock_bottle_days = 0.0
+        self.batches_started = 0
+        self.litres_bottled = 0
+
+    def window_totals(self, day: int) -> Dict[str, float]:
+        """Returns the predicted demand for each beer in the window the policy looks at."""
+        first = day + self.scenario.lead_days
+        last = first + self.scenario.window_days
+        totals = {}
+        for beer, cumulative in self.cumulative.items():
+            end = min(last, len(cumulative) - 1)
+            totals[beer] = cumulative[end] - cumulative[min(first, end)]
+        return totals
+
+    def advance(self, batch: Batch) -> bool:
+        """
+        Moves a finished batch to its next stage if there is room.
+
+        The smallest free tank that fits is used. A batch finished fermenting
+        stays in its tank for conditioning if the tank can condition.
+
+        :param batch: The batch that finished its stage.
+
+        :return: Whether the batch was moved.
+        """
+        if batch.next_step in [2, 3]:
+            tanks = available_tanks(batch.volume, batch.next_step, self.tanks)
+            if batch.next_step == 3 and batch.current_tank is not None and \
+                    batch.current_tank.function in ["both", "conditioner"]:
+                tanks = [batch.current_tank]
+            if not tanks:
+                return False
+            batch.go_next_step(self.process, min(tanks, key=lambda tank: tank.volume))
+        else:
+            if batch.next_step == 5:
+                self.litres_bottled += batch.volume
+            batch.go_next_step(self.process)
+        return True
+
+    def advance_finished(self):
+        """Moves every finished batch on until nothing else can move."""
+        moved = True
+        while moved:
+            moved = False
+            for batch in finished_processes(self.process):
+                if self.advance(batch):
+                    moved = True
+
+    def sell(self, day: int):
+        """Takes the predicted sales for the day from the finished stock."""
+        finished = self.process.finished
+        measured = day >= self.scenario.warmup_days
+        for beer, sales in self.demand.items():
+            wanted = max(sales[day], 0)
+            sold = min(wanted, finished.get(beer, 0) / BOTTLE_VOLUME)
+            if sold:
+                finished[beer] -= sold * BOTTLE_VOLUME
+            if not measured:
+                continue
+            self.sold[beer] += sold
+            if wanted - sold > 1e-9:
+                self.unmet[beer] += wanted - sold
+                self.stockout_days[beer] += 1
+        if measured:
+            self.stock_bottle_days += sum(finished.values()) / BOTTLE_VOLUME
+
+    def start_batch(self, day: int):
+        """Asks the policy whether to start a new batch and starts it."""
+        beer, volume = self.scenario.policy(self.window_totals(day), self.process, self.tanks)
+        if beer is not None and volume > 10:
+            add_batch(self.process, beer, volume)
+            self.batches_started += 1
+
+    def record_busy(self, event_time: float):
+        """Adds the time since the last event, after the warm up, to every occupied tank."""
+        elapsed = max(event_time - max(self.last_time, self.measure_start), 0)
+        for tank in self.tanks:
+            if tank.current_batch is not None:
+                self.busy[tank.name] += elapsed
+        self.last_time = event_time
+
+    def queue_next_finish(self):
+        """Adds the next stage finish to the event queue if it is within the simulation."""
+        next_finish = self.process.scheduler.next_finish(after=self.clock.now)
+        if next_finish is not None:
+            finish_time = next_finish[0]
+            if finish_time < self.end and finish_time not in self.queued:
+                self.queued.add(finish_time)
+                heappush(self.events, (finish_time, STAGE_EVENT, 0))
+
+    def run(self) -> Dict[str, Union[str, int, float, Dict[str, float]]]:
+        """
+        Runs the simulation to the end.
+
+        :return: The results of the scenario.
+        """
+        LOGGER.debug("Simulating scenario %s", self.scenario.name)
+        for day in range(self.days):
+            heappush(self.events, (self.start + day * DAY, DAY_EVENT, day))
+        self.queue_next_finish()
+
+        while self.events:
+            event_time, kind, day = heappop(self.events)
+            self.record_busy(event_time)
+            self.clock.now = event_time
+            self.advance_finished()
+            if kind == DAY_EVENT:
+                self.sell(day)
+                self.start_batch(day)
+                self.advance_finished()
+            self.queue_next_finish()
+        self.record_busy(self.end)
+
+        duration = self.end - self.measure_start
+        measured_days = self.days - min(self.scenario.warmup_days, self.days)
+        LOGGER.debug("Scenario %s simulated", self.scenario.name)
+        return {"name": self.scenario.name,
+                "days": measured_days,
+                "sold_bottles": sum(self.sold.values()),
+                "unmet_bottles": sum(self.unmet.values()),
+                "stockout_days": self.stockout_days,
+                "batches_started": self.batches_started,
+                "litres_bottled": self.litres_bottled,
+                "tank_utilisation": {name: busy / duration if duration else 0.0
+                                     for name, busy in self.busy.items()},
+                "mean_stock_bottles":
+                    self.stock_bottle_days / measured_days if measured_days else 0.0,
+                "finished_stock": dict(self.process.finished)}
+
+
+def run_scenario(scenario: Scenario, demand: Demand, forecast: Demand = None) -> Dict:
+    """Simulates one scenario and returns its results."""
+    return Simulation(scenario, demand, forecast).run()
+
+
+def run_grid(scenarios: List[Scenario], demand: Demand, max_workers: int = None) -> List[Dict]:
+    """
+    Simulates every scenario in a process pool.
+
+    :param scenarios: The scenarios to simulate.
+    :param demand: The dates and the predicted daily sales in bottles, as from plot_next_year.
+    :param max_workers: Number of processes. Defaults to the number of processors.
+
+    :return: The results for each scenario, in the same order.
+    """
+    LOGGER.info("Simulating %d scenarios", len(scenarios))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run_scenario, scenarios, [demand] * len(scenarios)))
+
+
+if __name__ == "__main__":
+    from sales_predictions import plot_next_year
+    DEMAND = plot_next_year()
+    BASE = tank_specs()
+    EXTRA = BASE + [("Extra 1", 1000, "fermenter"), ("Extra 2", 1000, "fermenter")]
+    for result in run_grid([Scenario("current tanks", BASE),
+                            Scenario("two extra fermenters", EXTRA)], DEMAND):
+        print(result)
@@ -0,0 +1,346 @@
+"""
+This module deals with running several brewhouses, each as a site.
+
+Each site has its own Process object, tanks and orders, saved in its own
+state and history files in its directory and written by its own
+StateManager. Sites are only loaded the first time they are used, and
+stay loaded, so switching between them doesn't load anything again. The
+main site is the brewhouse in BEER_PROCESS and TANKS, saved in the
+program's own directory.
+
+Changes to a site are made through the methods of Site, such as
+add_batch and deliver, so the interface works the same way with the
+sites of a service through service_client.
+
+The other sites are listed in sites.json. Queries across sites run the
+same function on every site in a thread pool, which also loads the sites
+not yet loaded in parallel.
+
+:attribute SITES: The SiteRegistry of every site.
+"""
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from typing import Tuple, List, Dict, Callable, Any, Optional
+from log_setup import get_logger
+from inventory_management import Process, Tank, Batch, BEER_PROCESS, TANKS, BOTTLE_VOLUME, \
+    batches_in_production, objects_from_records, save_objects, add_batch, add_order, \
+    deliver_order, fulfil_orders, import_orders
+from orders import Order
+from state_store import STATE_FILE, HISTORY_FILE, HistoryLog, read_state
+from state_manager import StateManager, STATE_MANAGER
+from suggestions import suggest_batch, beer_suggestion
+from projection import project_inventory
+from forecast_cache import FORECASTS, Forecast
+from forecast_accuracy import ACCURACY
+from read_file import write_data
+from instrumentation import METRICS
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("sites")
+
+SITES_FILE = 'sites.json'
+MAIN_SITE = "Main"
+
+Records = List[Dict[str, Any]]
+
+
+def recommendations(process_obj: Process, tanks: List[Tank], prediction: Forecast = None) \
+        -> Tuple[Tuple[str, int], Dict[str, Optional[datetime]], Forecast]:
+    """
+    Works out the batch to start and when each beer is projected to run out.
+
+    This is run in the background. The forecast is made without the lock
+    of the Process object, which is then held while the batches are read.
+
+    :param process_obj: The Process object of the site.
+    :param tanks: The tanks of the site.
+    :param prediction: The forecast from plot_next_year, if the sales haven't changed since.
+
+    :return: The suggested beer and volume, the first stock out date of each beer and the forecast.
+    """
+    if prediction is None:
+        prediction = FORECASTS.forecast()
+    with process_obj.lock:
+        suggestion = beer_suggestion(prediction, process_obj, tanks)
+        projection = project_inventory(prediction, process_obj)
+    return suggestion, projection.first_stockout, prediction
+
+
+class Site:
+    """This class is the class for each brewhouse."""
+    # Sites of a service are mirrored by service_client.RemoteSite instead.
+    remote = False
+
+    def __init__(self, name: str, directory: str, process_obj: Process = None,
+                 tanks: List[Tank] = None, state_manager: StateManager = None):
+        """
+        Initialising the site without loading it.
+
+        :param name: Name of the site.
+        :param directory: The directory the state and history files of the site are in.
+        :param process_obj: The Process object, if the site is already loaded.
+        :param tanks: The list of tanks, if the site is already loaded.
+        :param state_manager: The StateManager saving the site, if the site is already loaded.
+        """
+        self.name = name
+        self.directory = directory
+        self.state_file = os.path.join(directory, STATE_FILE)
+        self.history_file = os.path.join(directory, HISTORY_FILE)
+        self._process = process_obj
+        self._tanks = tanks
+        self.state_manager = state_manager
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the state of the site has been loaded."""
+        return self._process is not None
+
+    def load(self):
+        """Loads the state of the site if it hasn't been loaded yet."""
+        with self.lock:
+            if self.loaded:
+                return
+            LOGGER.info("Loading site %s", self.name)
+            try:
+                with METRICS.timed("state.load"):
+                    process_obj, tanks = objects_from_records(read_state(self.state_file))
+            except FileNotFoundError:
+                LOGGER.warning("No state file for site %s. Starting empty.", self.name)
+                process_obj, tanks = Process(), []
+            process_obj.history = HistoryLog(self.history_file)
+            self.state_manager = StateManager(process_obj, tanks, self.state_file)
+            self._tanks = tanks
+            self._process = process_obj
+
+    def open(self):
+        """Loads the site and starts saving it in the background."""
+        self.load()
+        if self.state_manager.thread is None:
+            self.state_manager.start()
+
+    @property
+    def process(self) -> Process:
+        """The Process object of the site, loading the site if needed."""
+        self.load()
+        return self._process
+
+    @property
+    def tanks(self) -> List[Tank]:
+        """The list of tanks of the site, loading the site if needed."""
+        self.load()
+        return self._tanks
+
+    def sync(self):
+        """Brings the site up to date. The state of a local site is always up to date."""
+
+    def add_batch(self, beer: str, volume: int) -> Batch:
+        """Starts a new batch of the beer, as add_batch."""
+        return add_batch(self.process, beer=beer, volume=volume)
+
+    def advance(self, batch: Batch, tank: Tank = None) -> int:
+        """Moves the batch to its next step, in the tank if given, as Batch.go_next_step."""
+        return batch.go_next_step(self.process, tank)
+
+    def add_order(self, beer: str, quantity: int, due: date) -> Order:
+        """Adds a new order, as add_order."""
+        return add_order(beer, quantity, due, self.process)
+
+    def deliver(self, order_id: int) -> bool:
+        """Delivers the order if there is enough stock, as deliver_order."""
+        return deliver_order(order_id, self.process)
+
+    def fulfil(self) -> List[Order]:
+        """Delivers every order that can be made from the stock, as fulfil_orders."""
+        return fulfil_orders(self.process)
+
+    def import_orders(self, file_dir: str) -> int:
+        """Adds every order in the csv file, as import_orders."""
+        return import_orders(file_dir, self.process)
+
+    def recommendations(self, prediction: Forecast = None) \
+            -> Tuple[Tuple[str, int], Dict[str, Optional[datetime]], Forecast]:
+        """Works out the batch to start and when each beer runs out, as recommendations."""
+        return recommendations(self.process, self.tanks, prediction)
+
+    def request_save(self):
+        """Asks for the site to be saved in the background."""
+        self.state_manager.request_save()
+
+    def save_stats(self) -> Dict[str, float]:
+        """Returns how long the recent saves of the site took, as StateManager.stats."""
+        return self.state_manager.stats()
+
+
+class SiteRegistry:
+    """This class holds every site by name."""
+    remote = False
+    # The sales data is shared by every site, and so is the forecast made from it.
+    forecasts = FORECASTS
+
+    def __init__(self, file_name: str = SITES_FILE):
+        """
+        Reading the list of sites. No site other than the main site is loaded.
+
+        :param file_name: The json file listing the name and directory of each other site.
+        """
+        self.file_name = file_name
+        self.sites = {MAIN_SITE: Site(MAIN_SITE, ".", BEER_PROCESS, TANKS, STATE_MANAGER)}
+        try:
+            with open(file_name, encoding="utf-8") as file:
+                for entry in json.load(file):
+                    self.sites[entry["name"]] = Site(entry["name"], entry["directory"])
+        except FileNotFoundError:
+            LOGGER.info("No other sites")
+
+    def names(self) -> List[str]:
+        """Returns the name of every site, the main site first."""
+        return list(self.sites)
+
+    def get(self, name: str) -> Site:
+        """Returns the site with the given name."""
+        return self.sites[name]
+
+    def add(self, name: str, tanks: List[Tank], directory: str = None) -> Site:
+        """
+        Adds a new site with the given tanks and saves the list of sites.
+
+        :param name: Name of the site.
+        :param tanks: The tanks of the site.
+        :param directory: The directory for the files of the site. Defaults to sites/<name>.
+
+        :return: The new Site.
+        """
+        LOGGER.info("Adding site %s", name)
+        if name in self.sites:
+            raise ValueError("There is already a site called " + name)
+        if directory is None:
+            directory = os.path.join("sites", name)
+        os.makedirs(directory, exist_ok=True)
+        site = Site(name, directory)
+        save_objects(Process(), tanks, site.state_file)
+        self.sites[name] = site
+        with open(self.file_name, "w", encoding="utf-8") as file:
+            json.dump([{"name": other.name, "directory": other.directory}
+                       for other in self.sites.values() if other.name != MAIN_SITE], file,
+                      indent=1)
+        return site
+
+    def map(self, function: Callable[[Site], Any], max_workers: int = None) -> Dict[str, Any]:
+        """
+        Runs the function on every site in a thread pool.
+
+        :param function: The function to run, given the Site.
+        :param max_workers: Number of threads. Defaults to one for each site.
+
+        :return: The result for each site by name.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or len(self.sites)) as executor:
+            results = executor.map(function, self.sites.values())
+            return dict(zip(self.sites, results))
+
+    def stop(self):
+        """Stops saving every loaded site, saving any changes left."""
+        for site in self.sites.values():
+            if site.loaded and site.state_manager.thread is not None:
+                site.state_manager.stop()
+
+    @staticmethod
+    def add_sales(file_dir: str) -> str:
+        """Adds the sales data in the csv file, as write_data."""
+        return write_data(file_dir)
+
+    def accuracy(self) -> Records:
+        """Returns the recent errors of each forecasting model for each beer."""
+        self.forecasts.forecast()
+        return ACCURACY.records()
+
+
+def site_records(site: Site, what: str) -> Records:
+    """
+    Returns the batches, tanks, orders or bottled stock of the site as records.
+
+    :param site: The site.
+    :param what: "batches", "tanks", "orders" or "stock".
+
+    :return: A record for each batch in production, tank, open order or beer in stock.
+    """
+    process_obj = site.process
+    with process_obj.lock:
+        if what == "batches":
+            return [{"batch": batch.batch_id, "beer": batch.beer, "volume": batch.volume,
+                     "stage": process_obj.step_names[batch.current_step],
+                     "started": datetime.fromtimestamp(batch.current_start_time),
+                     "tank": batch.current_tank.name if batch.current_step in [2, 3] else None}
+                    for batch in batches_in_production(process_obj)]
+        if what == "tanks":
+            return [{"tank": tank.name, "volume": tank.volume, "function": tank.function,
+                     "batch": None if tank.current_batch is None else tank.current_batch.batch_id}
+                    for tank in site.tanks]
+        if what == "orders":
+            return [{"order": order.order_id, "beer": order.beer, "quantity": order.quantity,
+                     "due": order.due, "reference": order.reference}
+                    for order in process_obj.orders]
+        if what == "stock":
+            return [{"beer": beer, "litres": volume, "bottles": int(volume / BOTTLE_VOLUME)}
+                    for beer, volume in process_obj.finished.items()]
+    raise ValueError("There are no records of " + what)
+
+
+def site_stock(site: Site) -> Dict[str, float]:
+    """Returns the finished litres of each beer at the site."""
+    with site.process.lock:
+        return dict(site.process.finished)
+
+
+def site_pipeline(site: Site) -> Dict[str, float]:
+    """Returns the litres of each beer in production at the site."""
+    totals = {}
+    with site.process.lock:
+        for batch in batches_in_production(site.process):
+            totals[batch.beer] = totals.get(batch.beer, 0) + batch.volume
+    return totals
+
+
+def add_totals(per_site: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """Adds up the totals for each beer across sites."""
+    totals = {}
+    for site_totals in per_site.values():
+        for beer, volume in site_totals.items():
+            totals[beer] = totals.get(beer, 0) + volume
+    return totals
+
+
+def total_finished(registry: SiteRegistry = None) -> Dict[str, float]:
+    """Returns the finished litres of each beer across every site."""
+    return add_totals((registry or SITES).map(site_stock))
+
+
+def total_pipeline(registry: SiteRegistry = None) -> Dict[str, float]:
+    """Returns the litres of each beer in production across every site."""
+    return add_totals((registry or SITES).map(site_pipeline))
+
+
+def site_suggestions(totals_dict: Dict[str, float],
+                     registry: SiteRegistry = None) -> Dict[str, Tuple[str, int]]:
+    """
+    Chooses the next batch to brew at each site.
+
+    :param totals_dict: The predicted demand in bottles for each beer, as for suggest_batch.
+    :param registry: The sites. Defaults to SITES.
+
+    :return: The name and volume of the beer suggested for each site, or None and None.
+    """
+    def suggest(site: Site) -> Tuple[str, int]:
+        with site.process.lock:
+            return suggest_batch(totals_dict, site.process, site.tanks)
+    return (registry or SITES).map(suggest)
+
+
+SITES = SiteRegistry()
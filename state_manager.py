@@ -0,0 +1,126 @@
+"""
+This module saves the state of the batches and tanks in the background.
+
+Changes to the state are made while holding the lock of the Process
+object. The saver thread only holds the same lock while copying the parts
+of the state that change, then encodes the copy and writes it to disk
+without the lock, along with any new history. Save requests are
+debounced so a burst of changes is written once, and nothing is written
+if the state hasn't changed since the last save.
+"""
+import os
+import time
+import threading
+from collections import deque
+from typing import List, Dict
+from log_setup import get_logger
+from inventory_management import Process, Tank, BEER_PROCESS, TANKS, \
+    snapshot_objects, write_snapshot
+from state_store import STATE_FILE
+from instrumentation import METRICS
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("state_manager")
+
+
+class StateManager:
+    """This class saves the state from a background thread."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, process_obj: Process, tanks: List[Tank],
+                 file_name: str = STATE_FILE, debounce: float = 1.0,
+                 max_delay: float = 10.0, interval: float = 120.0):
+        """
+        Initialising the saver. The thread is started by start.
+
+        :param process_obj: The Process object to save.
+        :param tanks: The list of tanks to save.
+        :param file_name: The file to save to.
+        :param debounce: Seconds without new requests before saving.
+        :param max_delay: Longest time in seconds a requested save can be put off for.
+        :param interval: Seconds between checks for changes nobody asked to save.
+        """
+        self.process_obj = process_obj
+        self.tanks = tanks
+        self.file_name = file_name
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.interval = interval
+        self.saved_version = process_obj.version
+        self.requested = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        # (seconds taking the snapshot, seconds writing it) for recent saves.
+        self.latencies = deque(maxlen=100)
+
+    def start(self):
+        """Starts the saver thread."""
+        LOGGER.info("Starting state saver")
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def request_save(self):
+        """Asks for the state to be saved soon. Returns straight away."""
+        self.requested.set()
+
+    def run(self):
+        """Saves the state whenever it is requested or every interval, until stopped."""
+        while not self.stopped.is_set():
+            self.requested.wait(self.interval)
+            first_request = time.monotonic()
+            # Waiting for the requests to stop coming before saving.
+            while self.requested.is_set() and not self.stopped.is_set() \
+                    and time.monotonic() - first_request < self.max_delay:
+                self.requested.clear()
+                self.stopped.wait(self.debounce)
+            self.requested.clear()
+            if not self.stopped.is_set():
+                self.save()
+
+    def save(self) -> bool:
+        """
+        Saves the state if it has changed since the last save.
+
+        :return: Whether the state was written.
+        """
+        if self.process_obj.version == self.saved_version:
+            return False
+        start = time.perf_counter()
+        version, data = snapshot_objects(self.process_obj, self.tanks)
+        snapshotted = time.perf_counter()
+        result = write_snapshot(self.process_obj, data, self.file_name)
+        written = time.perf_counter()
+        if result != "success":
+            LOGGER.error("State could not be saved: %s", result)
+            return False
+        self.saved_version = version
+        self.latencies.append((snapshotted - start, written - snapshotted))
+        METRICS.observe("state.snapshot", snapshotted - start)
+        METRICS.observe("state.write", written - snapshotted)
+        LOGGER.info("State saved, snapshot took %.1f ms and write took %.1f ms",
+                    (snapshotted - start) * 1000, (written - snapshotted) * 1000)
+        return True
+
+    def stop(self):
+        """Stops the saver thread and saves any changes left."""
+        LOGGER.info("Stopping state saver")
+        self.stopped.set()
+        self.requested.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.save()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the number of saves and the latest and average latencies in milliseconds."""
+        if not self.latencies:
+            return {"saves": 0}
+        snapshots, writes = zip(*self.latencies)
+        return {"saves": len(self.latencies),
+                "last_snapshot_ms": snapshots[-1] * 1000, "last_write_ms": writes[-1] * 1000,
+                "mean_snapshot_ms": sum(snapshots) / len(snapshots) * 1000,
+                "mean_write_ms": sum(writes) / len(writes) * 1000}
+
+
+STATE_MANAGER = StateManager(BEER_PROCESS, TANKS)
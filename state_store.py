@@ -0,0 +1,247 @@
+"""
+This module deals with the files the state of the brewery is saved in.
+
+The state is saved as JSON lines. The first line is a header naming the
+schema and its version, and every other line is one record, such as a
+tank, a batch or an open order, with a 'type' field saying which. The
+fields of each type of record are listed in SCHEMA and checked on loading.
+
+Stage transitions, finished batches and delivered orders are only ever
+added to, so they are appended to a separate history file instead of
+being written with the rest of the state. The history file isn't read
+until the history is asked for, so loading the state takes the same time
+however long the history is.
+
+The records are plain dictionaries so this module doesn't depend on the
+classes in inventory_management, which converts its objects to and from
+records.
+"""
+import os
+import json
+import threading
+from datetime import datetime, date
+from typing import List, Optional, Iterable, Any
+from log_setup import get_logger
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("state_store")
+
+STATE_FILE = 'brewery_state.jsonl'
+HISTORY_FILE = 'brewery_history.jsonl'
+SCHEMA_NAME = "brewhouse-state"
+SCHEMA_VERSION = 1
+
+NUMBER = (int, float)
+OPTIONAL_STR = (str, type(None))
+# The fields of each type of record and the types they can have.
+SCHEMA = {
+    "header": {"schema": str, "version": int, "next_order_id": int},
+    "tank": {"name": str, "volume": NUMBER, "function": str},
+    "batch": {"id": str, "beer": str, "volume": NUMBER, "step": int, "next_step": int,
+              "start": NUMBER, "tank": OPTIONAL_STR},
+    "stock": {"beer": str, "volume": NUMBER},
+    "order": {"id": int, "beer": str, "quantity": int, "due": str, "reference": OPTIONAL_STR},
+    "transition": {"id": OPTIONAL_STR, "beer": str, "volume": NUMBER, "step": int,
+                   "tank": OPTIONAL_STR, "time": NUMBER},
+    "finished_batch": {"id": OPTIONAL_STR, "beer": str, "volume": NUMBER, "time": NUMBER},
+    "delivered_order": {"id": int, "beer": str, "quantity": int, "due": str,
+                        "reference": OPTIONAL_STR, "time": NUMBER},
+}
+
+
+def validate(record: dict) -> dict:
+    """
+    Checks the record has every field of its type in SCHEMA with the right type.
+
+    :param record: The record to check.
+
+    :return: The same record.
+    """
+    fields = SCHEMA.get(record.get("type"))
+    if fields is None:
+        raise ValueError("Unknown record type: " + str(record.get("type")))
+    for field, field_type in fields.items():
+        if field not in record:
+            raise ValueError(record["type"] + " record is missing " + field)
+        if not isinstance(record[field], field_type):
+            raise ValueError(record["type"] + " record has the wrong type for " + field)
+    return record
+
+
+# Reused for every record as json.dumps makes a new encoder each call.
+ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+
+def to_json(value: Any) -> Any:
+    """Turns the dates in records into ISO strings for json. Given as default to json.dump."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(type(value).__name__ + " can't be written as json")
+
+
+def encode(records: Iterable[dict]) -> bytes:
+    """Encodes the records as JSON lines."""
+    return "".join(ENCODER.encode(record) + "\n" for record in records).encode("utf-8")
+
+
+def decode(lines: Iterable[str]) -> List[dict]:
+    """
+    Decodes and checks the records in the JSON lines, skipping blank lines.
+
+    The lines are decoded as one JSON array, which is much quicker than
+    decoding each line on its own.
+    """
+    records = json.loads("[" + ",".join(line for line in lines if line.strip()) + "]")
+    return [validate(record) for record in records]
+
+
+def decode_lines(lines: Iterable[str], file_name: str) -> List[dict]:
+    """
+    Decodes and checks the records in the JSON lines, skipping damaged lines.
+
+    The lines are decoded together with decode, and only decoded one at a
+    time if that fails, such as when the last line was cut short by a crash.
+
+    :param file_name: The file the lines are from, for the warnings.
+    """
+    lines = list(lines)
+    try:
+        return decode(lines)
+    except ValueError:
+        pass
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("Not a record")
+            records.append(validate(record))
+        except ValueError:
+            LOGGER.warning("Skipping a damaged line of %s", file_name)
+    return records
+
+
+def header(next_order_id: int) -> dict:
+    """Returns the header record for a state file of the current schema version."""
+    return {"type": "header", "schema": SCHEMA_NAME, "version": SCHEMA_VERSION,
+            "next_order_id": next_order_id}
+
+
+def read_state(file_name: str = STATE_FILE) -> List[dict]:
+    """
+    Reads the records in a state file.
+
+    :param file_name: The state file.
+
+    :return: The records, starting with the header.
+    """
+    LOGGER.info("Reading state from %s", file_name)
+    with open(file_name, encoding="utf-8") as file:
+        records = decode(file)
+    if not records or records[0]["type"] != "header" or records[0]["schema"] != SCHEMA_NAME:
+        raise ValueError(file_name + " is not a state file")
+    if records[0]["version"] > SCHEMA_VERSION:
+        raise ValueError(file_name + " was saved by a newer version with schema version "
+                         + str(records[0]["version"]))
+    return records
+
+
+def write_atomic(data: bytes, file_name: str = STATE_FILE) -> str:
+    """
+    Writes data to the file.
+
+    The data is written to a temporary file first and moved over the old
+    file, so the file is never left half written.
+    """
+    try:
+        with open(file_name + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(file_name + '.tmp', file_name)
+        return "success"
+    except FileNotFoundError:
+        LOGGER.error("State file not found")
+        return "File not found"
+
+
+class HistoryLog:
+    """
+    This class holds the stage transitions, finished batches and delivered orders.
+
+    New records are kept in memory until flush appends them to the history
+    file. The records already in the file are only read the first time
+    records is called. Damaged lines, such as one cut short by a crash
+    while it was appended, are skipped.
+    """
+    def __init__(self, file_name: str = HISTORY_FILE):
+        """
+        Initialising the history without reading the file.
+
+        :param file_name: The file the history is appended to.
+        """
+        self.file_name = file_name
+        self.pending = []
+        self.loaded = None
+        # The pending records are added to by the interface and written by the saver thread.
+        self.lock = threading.Lock()
+
+    def append(self, record: dict):
+        """Adds a new record to be written by the next flush."""
+        validate(record)
+        with self.lock:
+            self.pending.append(record)
+
+    def load(self) -> List[dict]:
+        """Reads the records in the history file if they haven't been read yet."""
+        if self.loaded is None:
+            LOGGER.info("Loading history from %s", self.file_name)
+            try:
+                with open(self.file_name, encoding="utf-8", errors="replace") as file:
+                    self.loaded = decode_lines(file, self.file_name)
+            except FileNotFoundError:
+                self.loaded = []
+        return self.loaded
+
+    def records(self, record_type: Optional[str] = None) -> List[dict]:
+        """
+        Returns the history, the oldest first.
+
+        :param record_type: If given, only the records of this type are returned.
+
+        :return: The records in the file followed by the records not yet written.
+        """
+        with self.lock:
+            pending = list(self.pending)
+        records = self.load() + pending
+        if record_type is None:
+            return records
+        return [record for record in records if record["type"] == record_type]
+
+    def flush(self) -> str:
+        """Appends the pending records to the history file."""
+        with self.lock:
+            pending = list(self.pending)
+        if not pending:
+            return "success"
+        try:
+            with open(self.file_name, 'ab+') as file:
+                # A line cut short by a crash is ended, so the new records aren't joined to it.
+                file.seek(0, os.SEEK_END)
+                if file.tell():
+                    file.seek(-1, os.SEEK_END)
+                    if file.read(1) != b"\n":
+                        file.write(b"\n")
+                file.write(encode(pending))
+        except OSError:
+            LOGGER.error("History could not be written")
+            return "History not written"
+        with self.lock:
+            del self.pending[:len(pending)]
+            if self.loaded is not None:
+                self.loaded.extend(pending)
+        LOGGER.debug("%d history records written", len(pending))
+        return "success"
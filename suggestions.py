@@ -0,0 +1,121 @@
+"""
+This module deals with suggesting the next batch to brew.
+
+The rule used to choose the batch is kept separate from the forecast so
+it can be reused with any demand, such as in the brewery simulation. Its
+settings are kept in a SuggestionPolicy, so other settings can be tried
+against past sales with policy_sweep.
+
+:attribute DEFAULT_POLICY: The settings used unless others are given.
+"""
+import os
+from math import ceil
+from datetime import datetime, timedelta
+from typing import Tuple, List, Dict, NamedTuple
+from log_setup import get_logger
+from sales_predictions import plot_next_year, get_total
+from inventory_management import Process, Tank, BEER_PROCESS, TANKS, available_tanks
+from instrumentation import instrumented
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("suggestions")
+
+
+class SuggestionPolicy(NamedTuple):
+    """
+    The settings of the rule choosing the next batch.
+
+    :attribute lead_days: The days from today to the first day of demand looked at.
+    :attribute window_days: The number of days of demand looked at.
+    :attribute pipeline_factor:
+    The bottles of demand each litre waiting, brewing or fermenting is taken to meet.
+    :attribute demand_share: The share of the demand left for the beer that is brewed.
+    :attribute round_to: The litres the volume is rounded up to.
+    :attribute min_tank_volume: The volume of free fermenter needed to suggest a batch.
+    """
+    lead_days: int = 70
+    window_days: int = 42
+    pipeline_factor: float = 2.0
+    demand_share: float = 0.5
+    round_to: int = 10
+    min_tank_volume: int = 800
+
+
+DEFAULT_POLICY = SuggestionPolicy()
+
+
+def current_datetime() -> datetime:
+    """Returning today's date as a datetime object."""
+    return datetime.combine(datetime.today().date(), datetime.min.time())
+
+
+def suggest_batch(totals_dict: Dict[str, float], process_obj: Process,
+                  tanks: List[Tank] = None,
+                  policy: SuggestionPolicy = DEFAULT_POLICY) -> Tuple[str, int]:
+    """
+    Choosing the next batch to brew from the predicted demand.
+
+    :param totals_dict: The predicted demand in bottles for each beer for the period.
+    :param process_obj: The Process object containing the stages of production.
+    :param tanks: The tanks that can be used. Defaults to TANKS.
+    :param policy: The settings of the rule.
+
+    :return: The name and suggested volume for the next beer to be brewed.
+    """
+    totals_dict = dict(totals_dict)
+    for batch in process_obj.waiting + process_obj.brewing + process_obj.fermenting:
+        if batch.beer in totals_dict:
+            totals_dict[batch.beer] -= batch.volume * policy.pipeline_factor
+
+    maximum = max(totals_dict.values())
+    key = list(totals_dict.keys())[list(totals_dict.values()).index(maximum)]
+
+    volume = int(ceil((maximum * policy.demand_share) / policy.round_to)) * policy.round_to
+
+    free_tanks = available_tanks(policy.min_tank_volume, 2, tanks)
+    if free_tanks and not process_obj.brewing and \
+            not [batch for batch in process_obj.waiting if batch.next_step == 1]:
+        max_possible = max([tank.volume for tank in free_tanks])
+        return key, min(max_possible, volume)
+    return None, None
+
+
+@instrumented("suggestion")
+def beer_suggestion(prediction: Tuple[List[datetime], Dict[str, List[float]]] = None,
+                    process_obj: Process = BEER_PROCESS, tanks: List[Tank] = None,
+                    policy: SuggestionPolicy = DEFAULT_POLICY) -> Tuple[str, int]:
+    """
+    Making a recommendation on the next batch to brew.
+
+    The recommendation algorithm is as follows, with the default policy:
+    1. Look at the 6 week period 10 weeks from now.
+    2. For all the predicted demands, subtract the volumes
+    currently waiting, brewing and fermenting.
+    3. Get the beer with the highest demand after step 2.
+    4. Look to see if any batches are brewing or waiting.
+    5. If the result from step 4 is None, recommend the beer from step 3.
+
+    :param prediction: The prediction from plot_next_year, if it has already been made.
+    :param process_obj: The Process object of the brewhouse.
+    :param tanks: The tanks of the brewhouse. Defaults to TANKS.
+    :param policy: The settings of the rule.
+
+    :return: The name and suggested volume for the next beer to be brewed.
+    """
+    LOGGER.info("Calculating next batch suggestion")
+    if prediction is None:
+        prediction = plot_next_year()
+    if prediction[0]:
+        totals_dict = get_total(current_datetime() + timedelta(days=policy.lead_days),
+                                policy.window_days, prediction)
+        if totals_dict is not None:
+            key, volume = suggest_batch(totals_dict, process_obj, TANKS if tanks is None else tanks,
+                                        policy)
+            if key is not None:
+                LOGGER.info("There is a beer suggestion")
+                return key, volume
+    LOGGER.info("No beer suggestion")
+    return None, None
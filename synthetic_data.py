@@ -0,0 +1,221 @@
+"""
+This module makes up sales data and brewery states of any size for benchmarks.
+
+The sales data is written in the same columns and date format as the csv
+file of real sales. Each day a random number of invoices is made, each
+for a random customer with one or more recipes. The sales of each recipe
+grow over the years and rise and fall with the seasons. The state is
+written as the records of a state file, with the tanks, the batches in
+each stage, the bottled stock and the open orders.
+
+Everything is made from a seed, so the same spec always gives the same data.
+
+Usage:
+    python synthetic_data.py --years 5 --recipes 12 --output sales.csv --state-dir site
+"""
+import os
+import csv
+import math
+import random
+import argparse
+from datetime import datetime, timedelta
+from typing import Tuple, List, Iterator, NamedTuple
+from log_setup import get_logger
+
+# The modules below change to the program's directory, so the paths given are resolved from here.
+START_DIR = os.getcwd()
+
+# pylint: disable=wrong-import-position
+from read_file import SALES_COLUMNS
+from inventory_management import Process, Tank, objects_from_records
+from state_store import STATE_FILE, encode, header, write_atomic
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("synthetic_data")
+
+# The forecast is made from Organic Red Helles, so it is always the first recipe.
+RECIPES = ["Organic Red Helles", "Organic Pilsner", "Organic Dunkel"]
+DATE_FORMAT = "%d-%b-%y"
+TANK_VOLUMES = [400, 800, 1000]
+TANK_FUNCTIONS = ["fermenter", "conditioner", "both"]
+# The stages a batch in a tank can be in for each function of tank.
+TANK_STEPS = {"fermenter": [2], "conditioner": [3], "both": [2, 3]}
+
+
+class SyntheticSpec(NamedTuple):
+    """
+    The size and shape of the data to make.
+
+    :attribute recipes: The number of recipes sold.
+    :attribute customers: The number of customers buying.
+    :attribute years: The number of years of sales.
+    :attribute invoices_per_day: The average number of invoices each day.
+    :attribute seasonality: How far sales rise above and fall below the average over a year.
+    :attribute growth: How much sales grow each year, 0.1 being 10%.
+    :attribute start: The date of the first sales.
+    :attribute tanks: The number of tanks.
+    :attribute batches: The number of batches in production.
+    :attribute orders: The number of open orders.
+    :attribute seed: The seed of the random numbers.
+    """
+    recipes: int = 3
+    customers: int = 20
+    years: float = 1.0
+    invoices_per_day: float = 2.0
+    seasonality: float = 0.3
+    growth: float = 0.1
+    start: datetime = datetime(2018, 11, 1)
+    tanks: int = 9
+    batches: int = 20
+    orders: int = 50
+    seed: int = 0
+
+
+def recipe_names(count: int) -> List[str]:
+    """Returns the names of the given number of recipes, the real ones first."""
+    return (RECIPES + ["Recipe %d" % number for number in range(len(RECIPES) + 1, count + 1)])[
+        :count]
+
+
+def sales_rows(spec: SyntheticSpec) -> Iterator[List]:
+    """
+    Makes the rows of sales data one day at a time, in the columns of the csv file.
+
+    Every recipe is sold on the first day, as the forecast needs the sales
+    of every beer to start before the last year of data.
+    """
+    rng = random.Random(spec.seed)
+    recipes = recipe_names(spec.recipes)
+    customers = ["Customer %d" % number for number in range(1, spec.customers + 1)]
+    # The average bottles of each recipe on a line of an invoice, and the day of the year
+    # its sales are highest.
+    sizes = {recipe: rng.uniform(5, 30) for recipe in recipes}
+    peaks = {recipe: rng.uniform(0, 365) for recipe in recipes}
+    invoice = 1
+    for day in range(int(spec.years * 365)):
+        date_text = (spec.start + timedelta(days=day)).strftime(DATE_FORMAT)
+        gyle = 1 + day // 7
+        trend = (1 + spec.growth) ** (day / 365)
+        invoices = round(rng.expovariate(1 / spec.invoices_per_day))
+        lines = [recipes] if day == 0 else []
+        lines += [rng.sample(recipes, rng.randint(1, min(3, len(recipes))))
+                  for _ in range(invoices)]
+        for invoice_recipes in lines:
+            customer = rng.choice(customers)
+            for recipe in invoice_recipes:
+                season = 1 + spec.seasonality * math.cos(2 * math.pi * (day - peaks[recipe]) / 365)
+                quantity = max(1, round(rng.gauss(1, 0.3) * sizes[recipe] * season * trend))
+                yield [invoice, customer, date_text, recipe, gyle, quantity]
+            invoice += 1
+
+
+def write_sales(file_name: str, spec: SyntheticSpec) -> int:
+    """
+    Writes made up sales data to a csv file.
+
+    :param file_name: The csv file to write.
+    :param spec: The size and shape of the data.
+
+    :return: The number of rows written.
+    """
+    rows = 0
+    with open(file_name, 'w', newline='', encoding="utf-8") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(SALES_COLUMNS)
+        for row in sales_rows(spec):
+            writer.writerow(row)
+            rows += 1
+    LOGGER.info("Wrote %d rows of made up sales to %s", rows, file_name)
+    return rows
+
+
+def state_file_records(spec: SyntheticSpec, now: float = None) -> List[dict]:
+    """
+    Makes the records of a state file for a brewery of the given size.
+
+    One batch is brewing, one is in each tank while there are batches
+    left, a few are bottling and the rest are waiting.
+
+    :param spec: The size of the state.
+    :param now: The time the batches are in their stages at. Defaults to now.
+
+    :return: The records, starting with the header.
+    """
+    # pylint: disable=too-many-locals
+    rng = random.Random(spec.seed)
+    now = datetime.now().timestamp() if now is None else now
+    recipes = recipe_names(spec.recipes)
+    tanks = [{"type": "tank", "name": "Tank %d" % number, "volume": rng.choice(TANK_VOLUMES),
+              "function": TANK_FUNCTIONS[number % len(TANK_FUNCTIONS)]}
+             for number in range(1, spec.tanks + 1)]
+    batches = []
+    free_tanks = list(tanks)
+    for number in range(spec.batches):
+        step, tank, volume = 0, None, rng.randrange(100, 1001, 50)
+        if number == 0:
+            step = 1
+        elif free_tanks:
+            tank = free_tanks.pop(0)
+            step = rng.choice(TANK_STEPS[tank["function"]])
+            volume = min(volume, tank["volume"])
+        elif number <= len(tanks) + 3:
+            step = 4
+        # Stages were started up to two weeks ago, so some have finished.
+        batches.append({"type": "batch", "id": "synthetic%d" % number,
+                        "beer": rng.choice(recipes), "volume": volume, "step": step,
+                        "next_step": step + 1, "start": now - rng.uniform(0, 14 * 86400),
+                        "tank": None if tank is None else tank["name"]})
+    stock = [{"type": "stock", "beer": recipe, "volume": rng.randrange(0, 2000, 50) / 2}
+             for recipe in recipes]
+    today = datetime.fromtimestamp(now).date()
+    orders = [{"type": "order", "id": number, "beer": rng.choice(recipes),
+               "quantity": rng.randint(1, 1000),
+               "due": (today + timedelta(days=rng.randint(-7, 60))).isoformat(),
+               "reference": None}
+              for number in range(1, spec.orders + 1)]
+    return [header(spec.orders + 1)] + tanks + batches + stock + orders
+
+
+def make_state(spec: SyntheticSpec, now: float = None) -> Tuple[Process, List[Tank]]:
+    """Makes the Process object and tanks of a brewery of the given size."""
+    return objects_from_records(state_file_records(spec, now))
+
+
+def write_state(directory: str, spec: SyntheticSpec, now: float = None) -> str:
+    """
+    Writes the state file of a brewery of the given size to the directory, as for a site.
+
+    :param directory: The directory to write the state file to.
+    :param spec: The size of the state.
+    :param now: The time the batches are in their stages at. Defaults to now.
+
+    :return: Error message.
+    """
+    os.makedirs(directory, exist_ok=True)
+    return write_atomic(encode(state_file_records(spec, now)), os.path.join(directory, STATE_FILE))
+
+
+def main(argv: List[str] = None):
+    """Writes made up sales data and optionally a state file from the command line."""
+    defaults = SyntheticSpec()
+    parser = argparse.ArgumentParser(description="Makes up sales data and brewery states.")
+    parser.add_argument("--output", required=True, help="csv file to write the sales data to")
+    parser.add_argument("--state-dir", help="directory to write a state file to")
+    for field in SyntheticSpec._fields:
+        if field != "start":
+            parser.add_argument("--" + field.replace("_", "-"), dest=field,
+                                type=type(getattr(defaults, field)),
+                                default=getattr(defaults, field))
+    args = parser.parse_args(argv)
+    spec = SyntheticSpec(**{field: getattr(args, field) for field in SyntheticSpec._fields
+                            if field != "start"})
+    print("%d rows written" % write_sales(os.path.join(START_DIR, args.output), spec))
+    if args.state_dir is not None:
+        print("State written: %s" % write_state(os.path.join(START_DIR, args.state_dir), spec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+This module works out how much each tank is used, to find capacity bottlenecks.
+
+The stages each batch spent in a tank are taken from the interval index
+of the brewery history in history. The busy time of each tank in each
+time bucket is the difference of the cumulative busy time at the bucket
+edges. The cumulative busy time of every tank at every edge comes from
+one binary search of the edges into the stage starts and ends sorted by
+tank, so it stays interactive with hundreds of tanks and years of history.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Dict, NamedTuple
+from log_setup import get_logger
+import numpy as np
+from inventory_management import Process, Tank, BEER_PROCESS, TANKS
+from history import HistoryIndex, history_index, timestamp
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("tank_analytics")
+
+DAY = 24 * 3600
+
+
+class Utilisation(NamedTuple):
+    """
+    How much each tank was used over a range of time.
+
+    :attribute tanks: The name of each tank.
+    :attribute functions: The capability of each tank.
+    :attribute edges: The start of each time bucket followed by the end of the last.
+    :attribute busy: The fraction of each bucket each tank was occupied, a row for each tank.
+    :attribute overall: The fraction of the whole range each tank was occupied.
+    :attribute by_class: The fraction of each bucket the tanks of each capability were occupied.
+    :attribute longest_idle: The longest time in seconds each tank was empty.
+    :attribute idle_periods: The number of times each tank was empty.
+    :attribute volume_efficiency:
+    The batch volume as a fraction of the tank volume while each tank was occupied.
+    :attribute queue: The number of waits, and the mean, longest and total wait
+    in seconds of the batches waiting for a tank in the range.
+    """
+    tanks: List[str]
+    functions: List[str]
+    edges: List[datetime]
+    busy: np.ndarray
+    overall: np.ndarray
+    by_class: Dict[str, np.ndarray]
+    longest_idle: np.ndarray
+    idle_periods: np.ndarray
+    volume_efficiency: np.ndarray
+    queue: Dict[str, float]
+
+
+def cumulative_busy(codes: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                    count: int, points: np.ndarray) -> np.ndarray:
+    """
+    Works out the busy time of each tank up to each point.
+
+    The busy time up to t is the sum of (t - start) over the stages started
+    by t, less the sum of (t - end) over the stages ended by t. Sorting the
+    starts and ends by tank and time lets every (tank, point) pair be
+    looked up at once with a running total.
+
+    :param codes: The tank of each stage, from 0 to count - 1.
+    :param starts: The start of each stage, relative to the first point.
+    :param ends: The end of each stage, relative to the first point.
+    :param count: The number of tanks.
+    :param points: The times to work out the busy time up to, relative to the first point.
+
+    :return: The busy time with a row for each tank and a column for each point.
+    """
+    span = points[-1] + 1.0
+    queries = (np.arange(count)[:, None] * span + points[None, :]).ravel()
+    tank_firsts = np.arange(count) * span
+    totals = np.zeros(len(queries))
+    repeated = np.tile(points, count)
+    for times, sign in ((starts, 1), (ends, -1)):
+        keys = codes * span + times
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        # Summing the times rather than the keys so large tank offsets don't lose precision.
+        running = np.r_[0.0, np.cumsum(times[order])]
+        found = np.searchsorted(keys, queries, side="right")
+        # Only the keys of the same tank count, which start at that tank's first key.
+        first = np.repeat(np.searchsorted(keys, tank_firsts, side="left"), len(points))
+        number = found - first
+        totals += sign * (number * repeated - (running[found] - running[first]))
+    return totals.reshape(count, len(points))
+
+
+def tank_utilisation(start: datetime, end: datetime, bucket_days: int = 7,
+                     tanks: List[Tank] = None, index: HistoryIndex = None,
+                     process_obj: Process = BEER_PROCESS) -> Utilisation:
+    """
+    Works out the utilisation of each tank between two dates.
+
+    :param start: The start of the range.
+    :param end: The end of the range.
+    :param bucket_days: The number of days in each time bucket.
+    :param tanks: The tanks to look at. Defaults to TANKS.
+    :param index: The history index to use. Defaults to the index of the Process object.
+    :param process_obj: The Process object whose history is used if no index is given.
+
+    :return: The utilisation.
+    """
+    LOGGER.info("Working out tank utilisation")
+    if tanks is None:
+        tanks = TANKS
+    if index is None:
+        index = history_index(process_obj)
+    first, last = timestamp(start), timestamp(end)
+    edges = np.r_[np.arange(first, last, bucket_days * DAY), last]
+    names = [tank.name for tank in tanks]
+    positions = {name: position for position, name in enumerate(names)}
+
+    rows = index.overlapping(first, last)
+    row_tanks = index.tanks[index.tank_codes[rows]]
+    in_list = np.array([name in positions for name in row_tanks], dtype=bool)
+    tanked, row_tanks = rows[in_list], row_tanks[in_list]
+    codes = np.array([positions[name] for name in row_tanks], dtype=int)
+    starts = np.maximum(index.starts[tanked], first) - first
+    ends = np.minimum(index.ends[tanked], last) - first
+
+    cumulative = cumulative_busy(codes, starts, ends, len(tanks), edges - first)
+    lengths = np.diff(edges)
+    busy = np.diff(cumulative, axis=1) / lengths
+    overall = cumulative[:, -1] / (last - first)
+
+    functions = [tank.function for tank in tanks]
+    by_class = {}
+    for function in dict.fromkeys(functions):
+        members = np.array([tank_function == function for tank_function in functions])
+        by_class[function] = busy[members].mean(axis=0)
+
+    # The gaps between the stages in each tank, and before the first and after the last.
+    order = np.lexsort((starts, codes))
+    codes, starts, ends = codes[order], starts[order], ends[order]
+    volumes = index.volumes[tanked][order]
+    previous_end = np.r_[0.0, ends[:-1]][:len(ends)]
+    previous_end[np.r_[True, codes[1:] != codes[:-1]][:len(codes)]] = 0.0
+    gaps = starts - previous_end
+    last_end = np.zeros(len(tanks))
+    np.maximum.at(last_end, codes, ends)
+    tail = np.full(len(tanks), last - first)
+    used = np.unique(codes)
+    tail[used] -= last_end[used]
+    longest_idle = tail.copy()
+    np.maximum.at(longest_idle, codes, gaps)
+    idle_periods = (tail > 0).astype(int)
+    np.add.at(idle_periods, codes, (gaps > 0).astype(int))
+
+    durations = ends - starts
+    tank_volumes = np.array([tank.volume for tank in tanks], dtype=float)
+    filled = np.bincount(codes, weights=volumes * durations, minlength=len(tanks))
+    occupied = np.bincount(codes, weights=durations, minlength=len(tanks))
+    volume_efficiency = np.divide(filled, tank_volumes * occupied,
+                                  out=np.zeros(len(tanks)), where=occupied > 0)
+
+    waiting = rows[index.steps[rows] == 0]
+    waits = np.minimum(index.ends[waiting], last) - np.maximum(index.starts[waiting], first)
+    queue = {"count": len(waits), "mean": float(waits.mean()) if len(waits) else 0.0,
+             "longest": float(waits.max()) if len(waits) else 0.0,
+             "total": float(waits.sum())}
+
+    dates = [datetime.fromtimestamp(edge) for edge in edges]
+    LOGGER.debug("Utilisation worked out for %d tanks and %d buckets", len(tanks), len(lengths))
+    return Utilisation(names, functions, dates, busy, overall, by_class, longest_idle,
+                       idle_periods, volume_efficiency, queue)
+
+
+def recent_utilisation(days: int = 90, bucket_days: int = 7,
+                       process_obj: Process = BEER_PROCESS,
+                       tanks: List[Tank] = None) -> Utilisation:
+    """Works out the utilisation of each tank over the given number of days up to now."""
+    end = datetime.fromtimestamp(process_obj.clock())
+    return tank_utilisation(end - timedelta(days=days), end, bucket_days, tanks,
+                            process_obj=process_obj)
@@ -0,0 +1,24 @@
+"""
+Shared set up of the tests.
+
+The modules of BrewHouse are in the directory above and change to it
+when imported, so it is put on the path, and tests reading other sales
+data put the csv file of the program back afterwards.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import read_file  # noqa: E402
+
+
+@pytest.fixture
+def sales_file(tmp_path):
+    """Gives a csv file name in a temporary directory, going back to the program's file after."""
+    original = read_file.SALES_FILE
+    yield str(tmp_path / "sales.csv")
+    read_file.use_sales_file(original)
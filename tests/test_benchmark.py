@@ -0,0 +1,22 @@
+"""Tests of timing the benchmarks and comparing their results in benchmark."""
+from benchmark import compare, time_function
+
+
+def results(**medians):
+    """Returns benchmark results of the small scale with the given medians."""
+    return {"results": [{"benchmark": name, "scale": "small", "median_ms": median}
+                        for name, median in medians.items()]}
+
+
+def test_function_is_run_after_each_setup():
+    calls = []
+    times = time_function(lambda: calls.append("run"), 3, lambda: calls.append("setup"))
+    assert calls == ["setup", "run"] * 3
+    assert set(times) == {"min_ms", "median_ms", "mean_ms"}
+    assert 0 <= times["min_ms"] <= times["median_ms"]
+
+
+def test_only_benchmarks_in_both_are_compared():
+    comparison = compare(results(parse=10.0, forecast=4.0), results(parse=5.0, plan=1.0))
+    assert comparison == [{"benchmark": "parse", "scale": "small", "old_ms": 10.0,
+                           "new_ms": 5.0, "ratio": 0.5}]
@@ -0,0 +1,84 @@
+"""Tests of the advance command of brewhouse, moving batches between tanks."""
+import pytest
+
+from brewhouse import CommandError, advance, main, make_parser
+from sites import Site
+from state_store import STATE_FILE, encode, header, read_state
+
+
+def batch(batch_id, volume, step, tank):
+    """Returns the record of a batch, at the step and in the tank given."""
+    return {"type": "batch", "id": batch_id, "beer": "Organic Pilsner", "volume": volume,
+            "step": step, "next_step": step + 1, "start": 0.0, "tank": tank}
+
+
+@pytest.fixture
+def site(tmp_path):
+    """
+    A site with a batch conditioning in Albert and a brewed 1000 litre batch to ferment.
+
+    Camilla is the only tank the brewed batch can go to: Albert is in use
+    and Gertrude only conditions and is too small.
+    """
+    records = [header(1),
+               {"type": "tank", "name": "Albert", "volume": 1000, "function": "both"},
+               {"type": "tank", "name": "Camilla", "volume": 1000, "function": "both"},
+               {"type": "tank", "name": "Gertrude", "volume": 680, "function": "conditioner"},
+               batch("conditioning", 900, 3, "Albert"),
+               batch("brewed", 1000, 1, None)]
+    (tmp_path / STATE_FILE).write_bytes(encode(records))
+    return Site("test", str(tmp_path))
+
+
+def run(site, *arguments):
+    """Runs advance on the site with the command line arguments given."""
+    return advance(make_parser().parse_args(["advance"] + list(arguments)), site)
+
+
+def tank_of(site, batch_id):
+    """Returns the tank the batch is in, as saved."""
+    return next(record["tank"] for record in read_state(site.state_file)
+                if record["type"] == "batch" and record["id"] == batch_id)
+
+
+@pytest.mark.parametrize("tank", ["Albert", "Gertrude"])
+def test_a_tank_the_batch_cant_go_to_is_refused(site, tank):
+    with pytest.raises(CommandError):
+        run(site, "--batch", "brewed", "--tank", tank)
+    assert tank_of(site, "brewed") is None
+    assert tank_of(site, "conditioning") == "Albert"
+    albert = next(tank for tank in site.tanks if tank.name == "Albert")
+    assert albert.current_batch.batch_id == "conditioning"
+
+
+def test_an_unknown_tank_is_refused(site):
+    with pytest.raises(CommandError):
+        run(site, "--batch", "brewed", "--tank", "Nowhere")
+
+
+def test_a_tank_without_a_batch_is_refused(site):
+    with pytest.raises(CommandError):
+        run(site, "--tank", "Camilla")
+
+
+def test_a_free_tank_that_fits_is_used(site):
+    records = run(site, "--batch", "brewed", "--tank", "Camilla")
+    assert records == [{"batch": "brewed", "beer": "Organic Pilsner", "from": "brewing",
+                        "tank": "Camilla", "to": "fermenting"}]
+    assert tank_of(site, "brewed") == "Camilla"
+
+
+def test_auto_tank_picks_a_tank_the_batch_can_go_to(site):
+    records = run(site, "--batch", "brewed", "--auto-tank", "--dry-run")
+    assert [record["tank"] for record in records] == ["Camilla"]
+    assert tank_of(site, "brewed") is None
+
+
+def test_main_reports_command_errors(capsys):
+    assert main(["advance", "--tank", "Camilla"]) == 1
+    assert "--tank can only be given with --batch" in capsys.readouterr().err
+
+
+def test_main_refuses_an_unknown_site(capsys):
+    assert main(["--site", "Nowhere", "suggest"]) == 2
+    assert "no site called Nowhere" in capsys.readouterr().err
@@ -0,0 +1,47 @@
+"""Tests of tracking the kinds of state changed and updating what depends on them in changes."""
+from changes import BATCH_MOVED, EVERYTHING, ORDER_CHANGED, SALES_CHANGED, STOCK_CHANGED, \
+    TANK_CHANGED, ChangeTracker, Dependents
+from inventory_management import Process, Tank, add_batch
+
+
+def test_tracker_gives_each_change_once():
+    tracker = ChangeTracker()
+    tracker.notify([BATCH_MOVED])
+    tracker.notify([TANK_CHANGED, BATCH_MOVED])
+    assert tracker.take() == {BATCH_MOVED, TANK_CHANGED}
+    assert tracker.take() == set()
+
+
+def test_changes_to_a_process_are_tracked():
+    process_obj = Process()
+    process_obj.changes.take()
+    batch = add_batch(process_obj, "Dunkel", 1000)
+    assert process_obj.changes.take() == {BATCH_MOVED}
+    tank = Tank("Albert", 1000, "both")
+    batch.go_next_step(process_obj, tank)
+    assert process_obj.changes.take() == {BATCH_MOVED, TANK_CHANGED}
+    batch.go_next_step(process_obj, tank)
+    batch.go_next_step(process_obj)
+    process_obj.changes.take()
+    batch.go_next_step(process_obj)
+    assert process_obj.changes.take() == {BATCH_MOVED, STOCK_CHANGED}
+    process_obj.changed()
+    assert process_obj.changes.take() == EVERYTHING
+
+
+def test_only_dependents_of_a_change_are_run_in_order():
+    dependents = Dependents()
+    ran = []
+    dependents.subscribe("batches", [BATCH_MOVED], lambda: ran.append("batches"))
+    dependents.subscribe("orders", [ORDER_CHANGED, STOCK_CHANGED], lambda: ran.append("orders"))
+    dependents.subscribe("graph", [SALES_CHANGED], lambda: ran.append("graph"))
+    dependents.subscribe("stock", [STOCK_CHANGED], lambda: ran.append("stock"))
+    timings = dependents.run({STOCK_CHANGED, BATCH_MOVED})
+    assert ran == ["batches", "orders", "stock"]
+    assert set(timings) == {"batches", "orders", "stock"}
+    assert dependents.last_timings == timings
+    ran.clear()
+    assert dependents.run(set()) == {}
+    assert ran == []
+    dependents.run(EVERYTHING)
+    assert ran == ["batches", "orders", "graph", "stock"]
@@ -0,0 +1,49 @@
+"""Tests of sharing the forecast of a beer between its customers in customer_demand."""
+import numpy as np
+import pytest
+
+from customer_demand import DTYPE, reconcile
+
+
+def forecasts(seed, days=60, customers=25):
+    """Makes up the forecast of a beer and of its customers, many customers forecast 0."""
+    rng = np.random.default_rng(seed)
+    base = rng.gamma(0.6, 20.0, size=(days, customers)).astype(DTYPE)
+    base[rng.random(base.shape) < 0.3] = 0
+    variances = rng.gamma(1.0, 50.0, size=customers)
+    # Totals both well above and well below the sum of the customers, and 0.
+    totals = base.sum(axis=1) * rng.uniform(0.0, 2.0, size=days)
+    totals[:3] = 0
+    return totals, base, variances
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_customers_add_up_to_the_totals(seed):
+    totals, base, variances = forecasts(seed)
+    reconciled = reconcile(totals, base, variances)
+    assert reconciled.shape == base.shape
+    np.testing.assert_allclose(reconciled.sum(axis=1, dtype=float), totals,
+                               rtol=1e-4, atol=1e-2)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_no_customer_goes_below_zero(seed):
+    totals, base, variances = forecasts(seed)
+    assert (reconcile(totals, base, variances) >= 0).all()
+    assert (reconcile(totals, base, variances, total_variance=100.0) >= 0).all()
+
+
+def test_with_the_variance_of_the_beer_the_total_moves_towards_the_customers():
+    totals, base, variances = forecasts(7)
+    reconciled = reconcile(totals, base, variances, total_variance=variances.sum())
+    sums = reconciled.sum(axis=1, dtype=float)
+    customers = base.sum(axis=1, dtype=float)
+    low, high = np.minimum(totals, customers), np.maximum(totals, customers)
+    assert (sums >= low - 1e-2).all() and (sums <= high + 1e-2).all()
+
+
+def test_customers_forecast_nothing_are_left_at_zero_when_the_total_comes_down():
+    base = np.array([[10.0, 0.0, 30.0]], dtype=DTYPE)
+    reconciled = reconcile(np.array([20.0]), base, np.array([1.0, 1.0, 1.0]))
+    assert reconciled[0, 1] == 0
+    assert reconciled.sum() == pytest.approx(20.0, abs=1e-4)
@@ -0,0 +1,104 @@
+"""Tests of writing the forecast and state of a site to files in exports."""
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from exports import CHUNK_ROWS, COLUMNS, INTERVAL_WIDTH, export_file, format_of, \
+    forecast_rows, text_chunks, totals_rows, write_csv, write_json_lines
+
+START = datetime(2019, 10, 30)
+PREDICTION = [START + timedelta(days=day) for day in range(10)], \
+    {"Dunkel": [float(day) for day in range(10)], "Pilsner": [2.0] * 10}
+
+
+def many_rows(count):
+    """Returns the given number of records, a day to each ten."""
+    return [{"date": date(2019, 1, 1) + timedelta(days=number // 10), "number": number}
+            for number in range(count)]
+
+
+def test_forecast_rows_with_intervals():
+    rows = list(forecast_rows(PREDICTION, {"Dunkel": 1.0}))
+    assert len(rows) == 20
+    assert rows[0] == {"date": START.date(), "beer": "Dunkel", "bottles": 0.0, "lower": 0.0,
+                       "upper": INTERVAL_WIDTH}
+    assert rows[18]["lower"] == pytest.approx(9.0 - INTERVAL_WIDTH)
+    assert rows[1]["lower"] is None and rows[1]["upper"] is None
+    assert "lower" not in next(forecast_rows(PREDICTION))
+
+
+def test_totals_of_whole_windows_only():
+    rows = list(totals_rows(PREDICTION, 4))
+    assert [(row["start"], row["beer"], row["bottles"]) for row in rows] == [
+        (START.date(), "Dunkel", 6.0), (START.date(), "Pilsner", 8.0),
+        ((START + timedelta(days=4)).date(), "Dunkel", 22.0),
+        ((START + timedelta(days=4)).date(), "Pilsner", 8.0)]
+    assert list(totals_rows((None, {}), 4)) == []
+
+
+def test_dates_are_written_as_text_without_changing_the_records():
+    rows = many_rows(CHUNK_ROWS + 5)
+    chunks = list(text_chunks(rows, [("date", "date"), ("number", "int")]))
+    assert [len(chunk) for chunk in chunks] == [CHUNK_ROWS, 5]
+    assert chunks[0][0] == {"date": "2019-01-01", "number": 0}
+    assert isinstance(rows[0]["date"], date)
+    assert list(text_chunks([{"due": date(2020, 1, 2)}]))[0] == [{"due": "2020-01-02"}]
+
+
+@pytest.mark.parametrize("count", [0, 1, CHUNK_ROWS + 1])
+def test_json_array_of_any_number_of_records(count):
+    file = io.StringIO()
+    assert write_json_lines(many_rows(count), file, array=True) == count
+    records = json.loads(file.getvalue())
+    assert [record["number"] for record in records] == list(range(count))
+
+
+def test_json_lines():
+    file = io.StringIO()
+    write_json_lines(many_rows(3), file)
+    assert [json.loads(line)["number"] for line in file.getvalue().splitlines()] == [0, 1, 2]
+
+
+def test_csv_has_every_field_without_columns():
+    file = io.StringIO()
+    assert write_csv([{"beer": "Dunkel"}, {"beer": "Pilsner", "volume": 800}], file) == 2
+    assert list(csv.reader(io.StringIO(file.getvalue()))) == [
+        ["beer", "volume"], ["Dunkel", ""], ["Pilsner", "800"]]
+
+
+def test_csv_of_columns(tmp_path):
+    file_name = str(tmp_path / "orders.csv")
+    rows = [{"order": 1, "beer": "Dunkel", "quantity": 10, "due": date(2020, 1, 2),
+             "reference": None}]
+    assert export_file(rows, "csv", file_name, COLUMNS["orders"]) == 1
+    with open(file_name, encoding="utf-8") as file:
+        assert file.read() == "order,beer,quantity,due,reference\n1,Dunkel,10,2020-01-02,\n"
+
+
+def test_failed_export_leaves_the_file(tmp_path):
+    path = tmp_path / "forecast.csv"
+    path.write_text("old")
+    with pytest.raises(ValueError):
+        export_file(many_rows(3), "xml", str(path))
+    assert path.read_text() == "old"
+    assert [entry.name for entry in tmp_path.iterdir()] == ["forecast.csv"]
+
+
+def test_parquet_round_trip(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    file_name = str(tmp_path / "forecast.parquet")
+    rows = list(forecast_rows(PREDICTION))
+    assert export_file(iter(rows), "parquet", file_name, COLUMNS["forecast"]) == 20
+    table = parquet.read_table(file_name)
+    assert table.column_names == ["date", "beer", "bottles"]
+    assert table.to_pylist() == rows
+
+
+@pytest.mark.parametrize("file_name, expected", [("out.CSV", "csv"), ("out.jsonl", "jsonl"),
+                                                 ("out.json", "json"), ("out.parquet", "parquet"),
+                                                 ("out.txt", "csv"), ("out", "csv")])
+def test_format_of(file_name, expected):
+    assert format_of(file_name) == expected
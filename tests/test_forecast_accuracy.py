@@ -0,0 +1,122 @@
+"""Tests of scoring issued forecasts and choosing a model for each beer in forecast_accuracy."""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import forecast_accuracy
+from forecast_accuracy import DEFAULT_MODEL, HORIZON_DAYS, MODELS, ROLLING_DAYS, \
+    AccuracyTracker, issue
+
+OTHER_MODEL = "seasonal naive"
+FIRST_DAY = datetime(2019, 1, 1)
+DAYS = 120
+
+
+def sales_data(seed=0):
+    """Makes up DAYS days of sales of two beers, in the structure of parse_data."""
+    rng = np.random.default_rng(seed)
+    dates = [FIRST_DAY + timedelta(days=day) for day in range(DAYS)]
+    return {'x': {"A": dates, "B": dates},
+            'y': {"A": rng.integers(0, 50, DAYS).tolist(), "B": rng.integers(0, 20, DAYS).tolist()}}
+
+
+def forecast_from(day, values):
+    """Returns a forecast of each beer from the day after the day, with the given values."""
+    dates = [FIRST_DAY + timedelta(days=day + 1 + number) for number in range(HORIZON_DAYS)]
+    return dates, {beer: list(sales) for beer, sales in values.items()}
+
+
+def tracker(tmp_path):
+    """Returns a tracker of the default model and one other, logging to a temporary file."""
+    return AccuracyTracker(str(tmp_path / "sales.forecasts.jsonl"),
+                           {DEFAULT_MODEL: lambda forecasts: None,
+                            OTHER_MODEL: lambda forecasts: None})
+
+
+def test_scores_match_working_them_out_one_by_one(tmp_path):
+    data_dict = sales_data()
+    rng = np.random.default_rng(1)
+    accuracy = tracker(tmp_path)
+    issued = []
+    for day in range(40, 110, 9):
+        for model in [DEFAULT_MODEL, OTHER_MODEL]:
+            values = {beer: rng.uniform(0, 40, HORIZON_DAYS) for beer in ["A", "B"]}
+            issued.append((model, day, values))
+            accuracy.record([issue(model, [day, 0], FIRST_DAY.toordinal() + day,
+                                   forecast_from(day, values))])
+    last = DAYS - 2
+    assert accuracy.score(data_dict) == ROLLING_DAYS
+
+    expected = {}
+    for model, day, values in issued:
+        for beer, forecast in values.items():
+            for scored in range(max(day + 1, last - ROLLING_DAYS + 1), last + 1):
+                offset = scored - day - 1
+                if offset < HORIZON_DAYS:
+                    error = float(np.float32(forecast[offset])) - data_dict['y'][beer][scored]
+                    sums = expected.setdefault((beer, model), [0, 0.0, 0.0, 0.0])
+                    sums[0] += 1
+                    sums[1] += error
+                    sums[2] += abs(error)
+                    sums[3] += data_dict['y'][beer][scored]
+    records = {(record["beer"], record["model"]): record for record in accuracy.records()}
+    assert set(records) == set(expected)
+    for key, (count, error, absolute, actual) in expected.items():
+        assert records[key]["scored"] == count
+        assert records[key]["mae"] == pytest.approx(absolute / count, rel=1e-6)
+        assert records[key]["bias"] == pytest.approx(error / count, rel=1e-6, abs=1e-6)
+        assert records[key]["wape"] == pytest.approx(absolute / actual, rel=1e-6)
+
+    # The log gives the same scores when read again.
+    again = tracker(tmp_path)
+    again.score(data_dict)
+    assert again.records() == accuracy.records()
+
+
+def test_a_better_model_is_chosen_once_both_are_scored(tmp_path):
+    data_dict = sales_data()
+    accuracy = tracker(tmp_path)
+    day = DAYS - 60
+    actual = {beer: sales[day + 1:day + 1 + HORIZON_DAYS] for beer, sales in data_dict['y'].items()}
+    accuracy.record([issue(DEFAULT_MODEL, [1], FIRST_DAY.toordinal() + day,
+                           forecast_from(day, {beer: np.array(sales) + 5.0
+                                               for beer, sales in actual.items()})),
+                     issue(OTHER_MODEL, [1], FIRST_DAY.toordinal() + day,
+                           forecast_from(day, {"A": np.array(actual["A"]) + 1.0,
+                                               "B": np.array(actual["B"]) + 9.0}))])
+    accuracy.score(data_dict)
+    assert accuracy.best_models() == {"A": OTHER_MODEL, "B": DEFAULT_MODEL}
+    selected = {record["beer"]: record["model"] for record in accuracy.records()
+                if record["selected"]}
+    assert selected == {"A": OTHER_MODEL, "B": DEFAULT_MODEL}
+
+
+def test_the_default_is_kept_until_it_is_scored(tmp_path):
+    data_dict = sales_data()
+    accuracy = tracker(tmp_path)
+    day = DAYS - 60
+    # The other model is perfect, but the default starts after the last day of sales.
+    accuracy.record([issue(DEFAULT_MODEL, [1], FIRST_DAY.toordinal() + DAYS,
+                           forecast_from(DAYS, {"A": [1.0] * HORIZON_DAYS,
+                                                "B": [1.0] * HORIZON_DAYS})),
+                     issue(OTHER_MODEL, [1], FIRST_DAY.toordinal() + day,
+                           forecast_from(day, {beer: sales[day + 1:day + 1 + HORIZON_DAYS]
+                                               for beer, sales in data_dict['y'].items()}))])
+    accuracy.score(data_dict)
+    assert accuracy.best_models() == {"A": DEFAULT_MODEL, "B": DEFAULT_MODEL}
+
+
+def test_customer_sum_is_given_the_default_forecast(monkeypatch):
+    def plot_next_year():
+        raise AssertionError("The default forecast was made again")
+
+    given = []
+    monkeypatch.setattr(forecast_accuracy, "plot_next_year", plot_next_year)
+    monkeypatch.setattr(forecast_accuracy, "customer_forecast",
+                        lambda prediction, method: given.append(prediction)
+                        or SimpleNamespace(totals=prediction))
+    prediction = forecast_from(DAYS, {"A": [1.0] * HORIZON_DAYS})
+    assert MODELS["customer sum"]({DEFAULT_MODEL: prediction}) is prediction
+    assert given == [prediction]
@@ -0,0 +1,77 @@
+"""Tests of caching the forecast and its windows in forecast_cache."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from forecast_cache import ForecastCache, forecast_window
+
+START = datetime(2019, 10, 30)
+DATES = [START + timedelta(days=day) for day in range(60)]
+PREDICTION = DATES, {"Dunkel": [float(day) for day in range(60)]}
+
+
+class Sales:
+    """Stands in for the sales data, counting the forecasts made from it."""
+    def __init__(self):
+        self.version = 1
+        self.forecasts = 0
+
+    def forecast(self):
+        self.forecasts += 1
+        return PREDICTION
+
+
+@pytest.fixture
+def sales():
+    """Gives the sales the cache is made from."""
+    return Sales()
+
+
+@pytest.fixture
+def cache(sales):
+    """Gives a cache of a few entries of the forecast of the sales."""
+    return ForecastCache(4, lambda: sales.version, sales.forecast)
+
+
+def test_window_is_sliced_from_the_forecast():
+    dates, data = forecast_window(PREDICTION, START + timedelta(days=7), 7)
+    assert dates == DATES[7:14]
+    assert data == {"Dunkel": [7.0, 8.0, 9.0, 10.0, 11.0, 12.0, 13.0]}
+
+
+@pytest.mark.parametrize("start", [START - timedelta(days=7), START - timedelta(days=1),
+                                   START + timedelta(days=55), START + timedelta(hours=12)])
+def test_window_outside_the_forecast(start):
+    assert forecast_window(PREDICTION, start, 7) == (False, False)
+
+
+def test_no_forecast():
+    assert forecast_window((None, None), START, 7) == (None, None)
+
+
+def test_forecast_is_made_once_for_each_version(cache, sales):
+    assert cache.forecast() is PREDICTION
+    cache.window(START, 7)
+    cache.window(START + timedelta(days=7), 7)
+    assert sales.forecasts == 1
+    sales.version = 2
+    cache.window(START, 7)
+    assert sales.forecasts == 2
+
+
+def test_least_recently_used_windows_are_dropped(cache):
+    first = cache.window(START, 7)
+    for week in range(1, 4):
+        cache.window(START + timedelta(days=7 * week), 7)
+    assert cache.peek(START, 7) is None
+    assert cache.peek(START + timedelta(days=21), 7) is not None
+    assert cache.window(START, 7) == first
+    assert cache.hits > 0
+
+
+def test_prefetch_at_the_first_date(cache):
+    # The window before the forecast is cached as not in the forecast rather than failing.
+    assert cache.prefetch(START, 7) == 2
+    assert cache.peek(START - timedelta(days=7), 7) == (False, False)
+    assert cache.peek(START + timedelta(days=7), 7)[0] == DATES[7:14]
+    assert cache.prefetch(START, 7) == 0
@@ -0,0 +1,162 @@
+"""Tests of the time-travel queries over the history of the brewery in history."""
+import random
+
+import numpy as np
+import pytest
+
+from changes import ORDER_CHANGED, SALES_CHANGED
+from history import INDEXES, HistoryIndex, history_index
+from inventory_management import Process, Tank, add_batch
+from state_store import HistoryLog
+
+TANKS = ["Albert", "Brigadier", "Camilla"]
+
+
+def transition(batch_id, step, time, tank=None, beer="Dunkel", volume=1000):
+    """Returns the record of a batch starting the step at the time."""
+    return {"type": "transition", "id": batch_id, "beer": beer, "volume": volume,
+            "step": step, "tank": tank, "time": time}
+
+
+def random_history(seed, batches=60):
+    """
+    Returns transitions of batches going through every stage at random times.
+
+    The last few batches are still in production, and the first one has been
+    in its tank for longer than any finished stage took.
+    """
+    rng = random.Random(seed)
+    records = [transition("stuck", 1, 0.0, beer="Pilsner"),
+               transition("stuck", 2, 1.0, "Stuck tank", beer="Pilsner")]
+    for number in range(batches):
+        time = rng.uniform(10, 1000)
+        beer = rng.choice(["Dunkel", "Red Helles"])
+        last_step = 5 if number < batches - 5 else rng.randint(1, 4)
+        for step in range(1, last_step + 1):
+            tank = rng.choice(TANKS) if step in [2, 3] else None
+            records.append(transition("b%d" % number, step, time, tank, beer))
+            time += rng.uniform(1, 20)
+    rng.shuffle(records)
+    return sorted(records, key=lambda record: record["time"])
+
+
+def intervals(records):
+    """Works out each stage of each batch one by one, as (id, stage, tank, start, end)."""
+    by_batch = {}
+    for record in records:
+        by_batch.setdefault(record["id"], []).append(record)
+    result = []
+    for stages in by_batch.values():
+        for index, record in enumerate(stages):
+            if record["step"] < 5:
+                end = stages[index + 1]["time"] if index + 1 < len(stages) else np.inf
+                result.append((record["id"], record["step"], record["tank"], record["time"],
+                               end))
+    return result
+
+
+def as_tuples(occupancies):
+    """Returns the id, stage, tank, start and end of each Occupancy, in any order."""
+    steps = ["waiting", "brewing", "fermenting", "conditioning", "bottling"]
+    return sorted((occupancy.batch_id, steps.index(occupancy.stage), occupancy.tank,
+                   occupancy.start, np.inf if occupancy.end is None else occupancy.end)
+                  for occupancy in occupancies)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_queries_match_checking_every_interval(seed):
+    records = random_history(seed)
+    index = HistoryIndex(records)
+    every = intervals(records)
+    assert len(index) == len(every)
+    rng = random.Random(seed)
+    for _ in range(50):
+        start = rng.uniform(-10, 1200)
+        end = start + rng.uniform(0, 100)
+        assert as_tuples(index.state_at(start)) == sorted(
+            interval for interval in every if interval[3] <= start < interval[4])
+        assert as_tuples(index.occupancy(start, end)) == sorted(
+            interval for interval in every if interval[3] < end and interval[4] > start)
+        assert as_tuples(index.occupancy(start, end, "Albert")) == sorted(
+            interval for interval in every
+            if interval[3] < end and interval[4] > start and interval[2] == "Albert")
+        busy = index.busy_seconds(start, end)
+        for tank in TANKS + ["Stuck tank"]:
+            expected = sum(min(interval[4], end) - max(interval[3], start)
+                           for interval in every
+                           if interval[2] == tank and interval[3] < end and interval[4] > start)
+            assert busy.get(tank, 0.0) == pytest.approx(expected)
+
+
+def test_state_is_given_the_earliest_started_first():
+    index = HistoryIndex(random_history(1))
+    starts = [occupancy.start for occupancy in index.state_at(500.0)]
+    assert starts == sorted(starts)
+    assert index.tanks_at(500.0)["Stuck tank"].batch_id == "stuck"
+
+
+def test_cycle_times():
+    records = [transition("a", 1, 0.0), transition("a", 2, 10.0, "Albert"),
+               transition("b", 1, 10.0), transition("b", 2, 30.0, "Camilla"),
+               transition("c", 1, 30.0), transition("c", 2, 36.0, "Albert"),
+               transition("d", 1, 40.0, beer="Pilsner")]
+    stats = HistoryIndex(records).cycle_times()
+    assert set(stats) == {("Dunkel", "brewing")}
+    brewing = stats[("Dunkel", "brewing")]
+    assert (brewing.count, brewing.minimum, brewing.median, brewing.maximum) == (3, 6, 10, 20)
+    assert brewing.mean == pytest.approx(12)
+    assert brewing.p90 == pytest.approx(18)
+    assert HistoryIndex(records).cycle_times(start=15.0)[("Dunkel", "brewing")].count == 2
+
+
+@pytest.fixture
+def process_obj(tmp_path):
+    """Gives an empty Process object with its history in a temporary directory."""
+    process = Process()
+    process.history = HistoryLog(str(tmp_path / "history.jsonl"))
+    return process
+
+
+def test_history_index_is_rebuilt_after_a_change(process_obj):
+    first = add_batch(process_obj, "Dunkel", 1000)
+    index = history_index(process_obj)
+    assert history_index(process_obj) is index
+    first.go_next_step(process_obj, Tank("Albert", 1000, "both"))
+    rebuilt = history_index(process_obj)
+    assert rebuilt is not index
+    assert [(occupancy.stage, occupancy.tank) for occupancy in rebuilt.state_at(
+        process_obj.clock())] == [("fermenting", "Albert")]
+
+
+def test_history_index_is_kept_when_no_batch_moved(process_obj):
+    add_batch(process_obj, "Dunkel", 1000)
+    index = history_index(process_obj)
+    process_obj.changed(ORDER_CHANGED)
+    process_obj.changed(SALES_CHANGED)
+    assert history_index(process_obj) is index
+
+
+def test_batches_from_before_the_history_are_indexed(process_obj):
+    batch = add_batch(process_obj, "Dunkel", 1000)
+    process_obj.history.pending.clear()
+    process_obj.changed()
+    state = history_index(process_obj).state_at(batch.current_start_time)
+    assert [(occupancy.batch_id, occupancy.stage) for occupancy in state] \
+        == [(batch.batch_id, "brewing")]
+
+
+def test_a_new_process_is_not_given_the_index_of_an_old_one(tmp_path):
+    indexed = len(INDEXES)
+    for attempt in range(30):
+        old = Process()
+        old.history = HistoryLog(str(tmp_path / ("old%d.jsonl" % attempt)))
+        add_batch(old, "Dunkel", 1000)
+        assert history_index(old).state_at(old.clock())
+        del old
+        # A new Process object often takes the place, and the id, of the one gone.
+        new = Process()
+        new.history = HistoryLog(str(tmp_path / ("new%d.jsonl" % attempt)))
+        assert not history_index(new).state_at(new.clock())
+        del new
+    # The indexes go with their Process objects.
+    assert len(INDEXES) == indexed
@@ -0,0 +1,77 @@
+"""Tests of adding the csv files dropped into the inbox with inbox.InboxWatcher."""
+import json
+
+import pytest
+
+from inbox import InboxWatcher
+from read_file import parse_data, use_sales_file
+
+HEADER = "Invoice Number,Customer,Date Required,Recipe,Gyle Number,Quantity ordered\n"
+
+
+@pytest.fixture
+def inbox(sales_file, tmp_path):
+    """Gives the inbox directory, with an empty csv file of sales data used by the program."""
+    with open(sales_file, "w", encoding="utf-8") as file:
+        file.write(HEADER)
+    use_sales_file(sales_file)
+    return tmp_path / "inbox"
+
+
+def row(invoice, quantity):
+    """Returns a line of sales of Dunkel."""
+    return "%d,Jaded Palates,0%d-Nov-18,Organic Dunkel,90,%d\n" % (invoice, invoice, quantity)
+
+
+def dunkel():
+    """Returns the total sales of Dunkel in the csv file."""
+    return sum(parse_data()["y"].get("Organic Dunkel", []))
+
+
+def test_files_are_added_when_they_stop_changing(inbox):
+    watcher = InboxWatcher(str(inbox))
+    (inbox / "export.csv").write_text(HEADER + row(1, 5) + row(2, 7).rstrip("\n"))
+    assert watcher.poll() == []
+    [result] = watcher.poll()
+    assert (result.file, result.result, result.rows) == ("export.csv", "success", 2)
+    assert dunkel() == 12
+    assert watcher.poll() == []
+
+
+def test_only_new_lines_are_added_after_a_restart(inbox):
+    path = inbox / "export.csv"
+    InboxWatcher(str(inbox)).poll(wait_until_stable=False)
+    path.write_text(HEADER + row(1, 5))
+    InboxWatcher(str(inbox)).poll(wait_until_stable=False)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(row(2, 7))
+    watcher = InboxWatcher(str(inbox))
+    [result] = watcher.poll(wait_until_stable=False)
+    assert result.rows == 1
+    assert dunkel() == 12
+    with open(watcher.ledger_file, encoding="utf-8") as file:
+        entry = json.load(file)["export.csv"]
+    assert (entry["offset"], entry["rows"]) == (path.stat().st_size, 2)
+
+
+def test_file_written_again_is_added_in_full(inbox):
+    path = inbox / "export.csv"
+    watcher = InboxWatcher(str(inbox))
+    path.write_text(HEADER + row(1, 5) + row(2, 7))
+    watcher.poll(wait_until_stable=False)
+    path.write_text(HEADER.replace("Invoice Number", "Invoice") + row(3, 1))
+    [result] = watcher.poll(wait_until_stable=False)
+    assert result.rows == 1
+    assert dunkel() == 13
+
+
+def test_failed_file_is_not_tried_again_until_it_changes(inbox):
+    path = inbox / "export.csv"
+    watcher = InboxWatcher(str(inbox))
+    path.write_text(HEADER + "1,Jaded Palates,someday,Organic Dunkel,90,5\n")
+    [result] = watcher.poll(wait_until_stable=False)
+    assert result.result == "Valid data not found in file"
+    assert watcher.poll(wait_until_stable=False) == []
+    path.write_text(HEADER + row(1, 5))
+    [result] = watcher.poll(wait_until_stable=False)
+    assert (result.result, result.rows) == ("success", 1)
@@ -0,0 +1,90 @@
+"""Tests of recording how long operations take in instrumentation."""
+import pytest
+
+from instrumentation import BOUNDS, Histogram, Metrics
+
+
+def histogram_of(times):
+    """Returns a histogram of the given times in seconds."""
+    histogram = Histogram()
+    for seconds in times:
+        histogram.observe(seconds)
+    return histogram
+
+
+def test_no_times():
+    assert Histogram().percentile(50) == 0.0
+
+
+@pytest.mark.parametrize("percent", [50, 95, 99])
+def test_percentiles_are_within_a_bucket(percent):
+    times = [milliseconds / 1000 for milliseconds in range(1, 1001)]
+    exact = times[int(percent / 100 * len(times)) - 1]
+    # The upper bound of the bucket is given, which is at most a fifth more.
+    assert exact <= histogram_of(times).percentile(percent) <= exact * 2 ** 0.25
+
+
+def test_percentiles_are_at_most_the_longest_time():
+    histogram = histogram_of([0.003] * 10)
+    assert histogram.percentile(99) == 0.003
+    assert histogram_of([1000.0]).percentile(50) == 1000.0
+    assert histogram_of([1000.0]).buckets[len(BOUNDS)] == 1
+
+
+def test_slow_tail_is_in_the_high_percentiles():
+    histogram = histogram_of([0.001] * 95 + [0.5] * 5)
+    assert histogram.percentile(50) < 0.0013
+    assert histogram.percentile(95) < 0.0013
+    assert histogram.percentile(99) == 0.5
+
+
+def test_nothing_is_recorded_while_off():
+    metrics = Metrics()
+    with metrics.timed("forecast"):
+        pass
+    metrics.count("cache.hit")
+    assert metrics.records() == [] and metrics.counter_records() == []
+
+
+def test_calls_are_timed_even_when_they_fail():
+    metrics = Metrics(enabled=True)
+
+    @metrics.instrumented("parse")
+    def parse(fail):
+        if fail:
+            raise ValueError("bad row")
+        return "parsed"
+
+    assert parse(False) == "parsed"
+    with pytest.raises(ValueError):
+        parse(True)
+    [record] = metrics.records()
+    assert (record["operation"], record["count"]) == ("parse", 2)
+    assert record["p50_ms"] <= record["p99_ms"] <= record["max_ms"]
+
+
+def test_records_are_longest_first():
+    metrics = Metrics(enabled=True)
+    metrics.observe("quick", 0.001)
+    metrics.observe("slow", 0.2)
+    metrics.observe("quick", 0.001)
+    assert [record["operation"] for record in metrics.records()] == ["slow", "quick"]
+    metrics.reset()
+    assert metrics.records() == []
+
+
+def test_prometheus_text(tmp_path):
+    metrics = Metrics(enabled=True)
+    for seconds in [0.001, 0.002, 0.5]:
+        metrics.observe('ui "orders"', seconds)
+    metrics.count("service.cached", 3)
+    text = metrics.prometheus_text()
+    assert 'brewhouse_operation_seconds_bucket{operation="ui \\"orders\\"",le="+Inf"} 3' in text
+    assert 'brewhouse_operation_seconds_count{operation="ui \\"orders\\""} 3' in text
+    assert 'brewhouse_events_total{event="service.cached"} 3' in text
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in text.splitlines() if "_bucket" in line]
+    assert buckets == sorted(buckets)
+    file_name = str(tmp_path / "metrics.prom")
+    assert metrics.write_prometheus(file_name) == "success"
+    with open(file_name, encoding="utf-8") as file:
+        assert file.read() == text
@@ -0,0 +1,107 @@
+"""Tests of the deadline heap that tracks when each batch finishes its stage."""
+import pytest
+
+from inventory_management import Process, Tank, StageScheduler, add_batch, \
+    finished_processes, next_stage_finish, stage_duration
+
+BREWING = stage_duration("brewing", 1000)
+FERMENTING = stage_duration("fermenting", 1000)
+
+
+class Clock:
+    """A clock that only moves when it is told to."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def process():
+    """Gives an empty Process object on a clock the test moves."""
+    process_obj = Process()
+    process_obj.clock = Clock()
+    return process_obj
+
+
+def test_only_timed_stages_are_scheduled(process):
+    brewing = add_batch(process, "Dunkel", 1000)
+    add_batch(process, "Red Helles", 1000)
+    assert [entry[-1] for entry in process.scheduler.heap] == [brewing]
+    assert len(process.waiting) == 1
+
+
+def test_finished_until_moved_on(process):
+    batch = add_batch(process, "Dunkel", 1000)
+    process.clock.now = BREWING - 1
+    assert process.scheduler.finished(process.clock()) == []
+    process.clock.now = BREWING
+    assert process.scheduler.finished(process.clock()) == [batch]
+    # A batch that can't move on yet is given again.
+    assert process.scheduler.finished(process.clock()) == [batch]
+    assert len(process.scheduler.heap) == 1
+
+
+def test_moved_batches_are_dropped(process):
+    batch = add_batch(process, "Dunkel", 1000)
+    tank = Tank("Albert", 1000, "both")
+    process.clock.now = BREWING
+    batch.go_next_step(process, tank)
+    # The brewing entry is stale, so only the fermenting stage is due.
+    assert process.scheduler.finished(process.clock()) == []
+    assert len(process.scheduler.heap) == 1
+    process.clock.now = BREWING + FERMENTING
+    assert process.scheduler.finished(process.clock()) == [batch]
+
+
+def test_finished_earliest_first(process):
+    scheduler = StageScheduler()
+    first, second = add_batch(process, "Dunkel", 1000), add_batch(process, "Red Helles", 1000)
+    second.current_step, second.current_start_time = 1, -10.0
+    scheduler.schedule(first, "brewing")
+    scheduler.schedule(second, "brewing")
+    assert scheduler.finished(BREWING) == [second, first]
+
+
+def test_rebuild_matches_scheduling(process):
+    batch = add_batch(process, "Dunkel", 1000)
+    scheduler = StageScheduler()
+    scheduler.rebuild(process)
+    assert scheduler.next_finish(0.0) == (BREWING, batch)
+    assert scheduler.finished(BREWING) == [batch]
+
+
+def test_next_finish_skips_finished_stages(process):
+    first = add_batch(process, "Dunkel", 1000)
+    process.clock.now = BREWING
+    first.go_next_step(process, Tank("Albert", 1000, "both"))
+    second = add_batch(process, "Red Helles", 1000)
+    process.clock.now = 2 * BREWING
+    # The second batch has finished brewing but hasn't moved on, so the
+    # fermenting of the first is next.
+    assert finished_processes(process) == [second]
+    assert next_stage_finish(process) == (BREWING + FERMENTING, first)
+    assert process.scheduler.finished(process.clock()) == [second]
+
+
+def test_next_finish_none_when_nothing_is_timed(process):
+    assert next_stage_finish(process) is None
+    add_batch(process, "Dunkel", 1000)
+    process.clock.now = BREWING
+    assert next_stage_finish(process) is None
+
+
+def test_a_batch_needing_a_tank_is_not_moved_without_one(process):
+    batch = add_batch(process, "Dunkel", 1000)
+    tank = Tank("Albert", 1000, "both")
+    process.clock.now = BREWING
+    batch.go_next_step(process, tank)
+    process.clock.now = BREWING + FERMENTING
+    version, heap, history = process.version, list(process.scheduler.heap), \
+        process.history.records()
+    assert batch.go_next_step(process) == 2
+    assert process.fermenting == [batch] and tank.current_batch is batch
+    assert batch.current_start_time == BREWING
+    assert (process.version, process.scheduler.heap, process.history.records()) \
+        == (version, heap, history)
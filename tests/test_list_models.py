@@ -0,0 +1,108 @@
+"""Tests of updating the lists of the interface by key with list_models.KeyedListModel."""
+import os
+import random
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# pylint: disable=wrong-import-position
+from PyQt5 import QtWidgets  # noqa: E402
+from list_models import KeyedListModel, Row, ROW_ROLE  # noqa: E402
+
+
+class Mirror:
+    """Keeps a copy of the rows of a model only from the signals it sends."""
+    def __init__(self, model):
+        self.model = model
+        self.rows = list(model.rows)
+        self.signals = []
+        model.rowsRemoved.connect(self.removed)
+        model.rowsInserted.connect(self.inserted)
+        model.rowsMoved.connect(self.moved)
+        model.dataChanged.connect(self.changed)
+        model.modelReset.connect(self.reset)
+
+    def removed(self, _parent, first, last):
+        self.signals.append("removed")
+        del self.rows[first:last + 1]
+
+    def inserted(self, _parent, first, last):
+        self.signals.append("inserted")
+        self.rows[first:first] = self.model.rows[first:last + 1]
+
+    def moved(self, _parent, start, _end, _destination, row):
+        self.signals.append("moved")
+        self.rows.insert(row if row < start else row - 1, self.rows.pop(start))
+
+    def changed(self, first, last):
+        self.signals.append("changed")
+        self.rows[first.row():last.row() + 1] = self.model.rows[first.row():last.row() + 1]
+
+    def reset(self):
+        self.signals.append("reset")
+        self.rows = list(self.model.rows)
+
+
+@pytest.fixture
+def model():
+    """Gives an empty model, with the Qt application it needs."""
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    return KeyedListModel()
+
+
+def rows(*keys, text="row"):
+    """Returns a row with the given text for each key."""
+    return [Row(key, "%s %s" % (text, key)) for key in keys]
+
+
+def test_first_rows_reset_the_model(model):
+    mirror = Mirror(model)
+    model.set_rows(rows(1, 2, 3))
+    assert mirror.signals == ["reset"]
+    assert model.rowCount() == 3
+    assert model.data(model.index(1)) == "row 2"
+    assert model.data(model.index(1), ROW_ROLE) == Row(2, "row 2")
+
+
+def test_the_same_rows_signal_nothing(model):
+    model.set_rows(rows(1, 2, 3))
+    mirror = Mirror(model)
+    model.set_rows(rows(1, 2, 3))
+    assert mirror.signals == []
+
+
+def test_only_changed_text_is_signalled(model):
+    model.set_rows(rows(1, 2, 3))
+    mirror = Mirror(model)
+    model.set_rows([Row(1, "row 1"), Row(2, "new text"), Row(3, "row 3", "Deliver")])
+    assert mirror.signals == ["changed", "changed"]
+    assert mirror.rows == model.rows
+
+
+def test_removed_and_inserted_runs_are_one_signal_each(model):
+    model.set_rows(rows(1, 2, 3, 4, 5))
+    mirror = Mirror(model)
+    model.set_rows(rows(1, 6, 7, 5))
+    assert mirror.signals == ["removed", "inserted"]
+    assert mirror.rows == rows(1, 6, 7, 5)
+
+
+def test_describe_gives_the_text_when_shown(model):
+    described = KeyedListModel(describe=lambda row: row.text.upper())
+    described.set_rows(rows(1))
+    assert described.data(described.index(0)) == "ROW 1"
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_signals_give_the_new_rows(model, seed):
+    rng = random.Random(seed)
+    model.set_rows(rows(*rng.sample(range(30), 10)))
+    mirror = Mirror(model)
+    for _ in range(20):
+        keys = rng.sample(range(30), rng.randint(0, 15))
+        new_rows = [Row(key, "row %d" % key if rng.random() < 0.7 else "changed %d" % key)
+                    for key in keys]
+        model.set_rows(new_rows)
+        assert model.rows == new_rows
+        assert mirror.rows == new_rows
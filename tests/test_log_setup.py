@@ -0,0 +1,79 @@
+"""Tests of writing the records of every module to the log file through the queue in log_setup."""
+import logging
+import os
+import sys
+
+import pytest
+
+import log_setup
+from log_setup import QUEUE_HANDLER, get_logger, parse_levels, set_level
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    """Gives a small log file in a temporary directory, written to by a new listener."""
+    log_setup.stop_listener()
+    monkeypatch.setattr(log_setup, "LOG_FILE", str(tmp_path / "test.log"))
+    monkeypatch.setattr(log_setup, "MAX_BYTES", 2000)
+    log_setup.start_listener()
+    yield log_setup.LOG_FILE
+    log_setup.stop_listener()
+    monkeypatch.undo()
+    log_setup.start_listener()
+
+
+@pytest.fixture
+def levels():
+    """Gives the levels by name, put back with the level of each logger afterwards."""
+    original = dict(log_setup.LEVELS)
+    yield log_setup.LEVELS
+    log_setup.LEVELS.clear()
+    log_setup.LEVELS.update(original)
+    for name, logger in log_setup.LOGGERS.items():
+        logger.setLevel(log_setup.level_of(name))
+
+
+def test_levels_are_parsed():
+    assert parse_levels("WARNING, service=debug,inbox=LOUD") == {"": logging.WARNING,
+                                                                 "service": logging.DEBUG}
+    assert parse_levels("") == {}
+
+
+def test_one_handler_however_many_modules_ask():
+    first = get_logger("test_log_setup")
+    assert get_logger("test_log_setup") is first
+    assert first.handlers.count(QUEUE_HANDLER) == 1
+
+
+def test_levels_of_loggers_are_changed(levels):
+    logger = get_logger("test_levels")
+    set_level("", logging.ERROR)
+    assert logger.level == logging.ERROR
+    set_level("test_levels", logging.DEBUG)
+    assert logger.level == logging.DEBUG
+    assert get_logger("test_other_levels").level == logging.ERROR
+    assert levels["test_levels"] == logging.DEBUG
+
+
+def test_record_is_made_text_before_it_is_queued():
+    try:
+        raise ValueError("bad row")
+    except ValueError:
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "Row %d of %s", (3, "x"),
+                                   sys.exc_info())
+    prepared = QUEUE_HANDLER.prepare(record)
+    assert (prepared.msg, prepared.args, prepared.exc_info) == ("Row 3 of x", None, None)
+    assert "ValueError: bad row" in prepared.exc_text
+
+
+def test_records_are_written_and_the_file_rotated(log_file):
+    logger = get_logger("test_log_setup")
+    for number in range(100):
+        logger.warning("Record %d of the test", number)
+    log_setup.stop_listener()
+    assert os.path.exists(log_file + ".1")
+    with open(log_file, encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    assert lines[-1].endswith("test_log_setup - WARNING - Record 99 of the test")
+    assert os.path.getsize(log_file + ".1") <= 2000
+    assert not os.path.exists(log_file + ".4")
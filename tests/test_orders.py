@@ -0,0 +1,99 @@
+"""Tests of importing and fulfilling orders in orders.OrderBook."""
+import pickle
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from orders import OrderBook
+
+
+def write_orders(path, rows):
+    """Writes a csv file of orders with the columns of the sales data."""
+    path.write_text("Invoice Number,Recipe,Quantity ordered,Date Required\n"
+                    + "".join(",".join(row) + "\n" for row in rows))
+    return str(path)
+
+
+def test_import_adds_orders_earliest_due_first(tmp_path):
+    book = OrderBook()
+    file_name = write_orders(tmp_path / "orders.csv",
+                             [["1", "A", "5", "01-Dec-18"], ["2", "A", "7", "01-Nov-18"],
+                              ["3", "B", "2", "2018-11-15"]])
+    assert book.import_csv(file_name) == 3
+    assert len(book) == 3
+    assert book.peek("A").due == date(2018, 11, 1)
+    assert book.peek("A").reference == "2"
+    assert book.peek("B").quantity == 2
+
+
+@pytest.mark.parametrize("bad_row", [["3", "A", "x", "01-Oct-18"],
+                                     ["3", "A", "4", "not a date"],
+                                     ["3", "A", "0", "01-Oct-18"],
+                                     ["3", "A", "-4", "01-Oct-18"],
+                                     ["3", "", "4", "01-Oct-18"],
+                                     ["3", " ", "4", "01-Oct-18"],
+                                     ["3", "A"]])
+def test_import_with_a_bad_row_adds_nothing(tmp_path, bad_row):
+    book = OrderBook()
+    book.add("A", 1, date(2019, 1, 1))
+    file_name = write_orders(tmp_path / "orders.csv",
+                             [["1", "A", "5", "01-Dec-18"], ["2", "A", "7", "01-Nov-18"], bad_row])
+    with pytest.raises(ValueError):
+        book.import_csv(file_name)
+    assert len(book) == 1
+    assert book.peek("A").due == date(2019, 1, 1)
+    assert len(book.heaps["A"]) == 1
+
+
+def test_import_without_a_column_adds_nothing(tmp_path):
+    book = OrderBook()
+    path = tmp_path / "orders.csv"
+    path.write_text("Recipe,Quantity ordered\nA,5\n")
+    with pytest.raises(KeyError):
+        book.import_csv(str(path))
+    assert len(book) == 0
+
+
+def test_fulfil_delivers_in_order_of_due_date_until_stock_runs_out():
+    book = OrderBook()
+    late = book.add("A", 30, date(2019, 3, 1))
+    early = book.add("A", 50, date(2019, 1, 1))
+    middle = book.add("A", 40, date(2019, 2, 1))
+    other = book.add("B", 10, date(2019, 1, 1))
+    stock = {"A": 100, "B": 5}
+    delivered = book.fulfil(stock)
+    assert [order.order_id for order in delivered] == [early.order_id, middle.order_id]
+    assert stock == {"A": 10, "B": 5}
+    # The later order isn't delivered even though a smaller one would fit.
+    assert book.peek("A") is late
+    assert book.get(other.order_id) is other
+    assert early.status == "delivered"
+
+
+def test_cancelled_orders_are_skipped():
+    book = OrderBook()
+    first = book.add("A", 5, date(2019, 1, 1))
+    second = book.add("A", 5, date(2019, 2, 1))
+    book.cancel(first.order_id)
+    assert book.peek("A") is second
+    assert book.fulfil({"A": 100}) == [second]
+    assert len(book) == 0
+
+
+def test_orders_are_given_earliest_due_first(tmp_path):
+    book = OrderBook()
+    rng = random.Random(3)
+    for _ in range(200):
+        book.add(rng.choice("ABC"), 1, date(2019, 1, 1) + timedelta(days=rng.randrange(90)))
+    book.import_csv(write_orders(tmp_path / "orders.csv",
+                                 [["1", "D", "5", "01-Dec-18"], ["2", "A", "7", "15-Feb-19"]]))
+    for order in list(book)[::3]:
+        book.cancel(order.order_id)
+    book.fulfil({"B": 40})
+    expected = sorted(book.open.values(), key=lambda order: (order.due, order.order_id))
+    assert list(book) == expected
+    # Closed orders are dropped from the due dates once they are most of them.
+    assert len(book.by_due) <= 2 * len(book) + 32
+    loaded = pickle.loads(pickle.dumps(book))
+    assert [order.order_id for order in loaded] == [order.order_id for order in expected]
@@ -0,0 +1,114 @@
+"""Tests of planning the batches to brew in planner and the plan command of brewhouse."""
+from datetime import datetime, timedelta
+from math import ceil
+
+import numpy as np
+import pytest
+
+import brewhouse
+from inventory_management import Batch, Process, Tank, stage_duration
+from planner import DAY, Planner, plan_production
+from sites import Site
+
+START = datetime(2020, 1, 1)
+HORIZON = 120
+
+
+def prediction(bottles=20.0):
+    """Gives the dates and daily sales of Dunkel over the horizon, as from plot_next_year."""
+    return [START + timedelta(days=day) for day in range(HORIZON)], \
+        {"Dunkel": [bottles] * HORIZON}
+
+
+def waiting(process_obj, next_step, volume=1000):
+    """Adds a Dunkel batch that finished the step before next_step and is waiting for a tank."""
+    batch = Batch("Dunkel", volume, START.timestamp())
+    batch.next_step = next_step
+    process_obj.waiting.append(batch)
+    return batch
+
+
+def stages(*names, volume=1000):
+    """Returns the days the stages take for the volume."""
+    return sum(stage_duration(name, volume) for name in names) / DAY
+
+
+def planner(process_obj, tanks):
+    """Sets up a Planner without planning any new batches."""
+    return Planner(prediction(), process_obj, tanks, START, HORIZON, 42, 1)
+
+
+@pytest.mark.parametrize("next_step, still_to_do", [
+    (3, ["conditioning", "bottling"]),
+    (2, ["fermenting", "conditioning", "bottling"])])
+def test_batches_waiting_for_a_tank_arrive(next_step, still_to_do):
+    tanks = [Tank("Albert", 1000, "both")]
+    empty = planner(Process(), tanks)
+    process_obj = Process()
+    waiting(process_obj, next_step)
+    planned = planner(process_obj, tanks)
+    arrival = planned.projected[planned.index["Dunkel"]] - empty.projected[empty.index["Dunkel"]]
+    ready = int(ceil(stages(*still_to_do)))
+    assert not arrival[:ready].any()
+    assert np.all(arrival[ready:] == 2000)
+    # The tank it still needs is booked.
+    assert planned.book.free_at[0] == pytest.approx(stages(*still_to_do[:-1]))
+
+
+def conditioning(volume):
+    """Returns a Process object with a batch conditioning in a conditioner, and its tanks."""
+    conditioner = Tank("Gertrude", 1000, "conditioner")
+    in_use = Batch("Dunkel", volume, START.timestamp())
+    in_use.current_step, in_use.next_step, in_use.current_tank = 3, 4, conditioner
+    conditioner.current_batch = in_use
+    process_obj = Process()
+    process_obj.conditioning.append(in_use)
+    return process_obj, [conditioner]
+
+
+def test_a_waiting_batch_waits_for_its_tank_to_be_free():
+    before = planner(*conditioning(500))
+    process_obj, tanks = conditioning(500)
+    waiting(process_obj, 3)
+    planned = planner(process_obj, tanks)
+    assert planned.book.free_at[0] == pytest.approx(2 * stages("conditioning"))
+    arrival = planned.projected[planned.index["Dunkel"]] - before.projected[before.index["Dunkel"]]
+    ready = int(ceil(stages("conditioning", "conditioning", "bottling")))
+    assert not arrival[:ready].any()
+    assert np.all(arrival[ready:] == 2000)
+
+
+def test_a_batch_waiting_for_a_tank_is_not_brewed_again():
+    tanks = [Tank("Albert", 1000, "both"), Tank("Camilla", 1000, "both")]
+    empty = plan_production(prediction(), Process(), tanks, START, HORIZON, time_budget=0.0)
+    process_obj = Process()
+    waiting(process_obj, 3)
+    planned = plan_production(prediction(), process_obj, tanks, START, HORIZON,
+                              time_budget=0.0)
+    assert sum(batch.volume for batch in planned.batches) \
+        < sum(batch.volume for batch in empty.batches)
+    assert planned.shortage < empty.shortage
+
+
+def test_plan_command(monkeypatch, tmp_path):
+    process_obj = Process()
+    waiting(process_obj, 3)
+    site = Site("test", str(tmp_path), process_obj, [Tank("Albert", 1000, "both")])
+    monkeypatch.setattr(brewhouse.FORECASTS, "forecast", prediction)
+    args = brewhouse.make_parser().parse_args(["plan", "--start", "2020-01-01", "--days",
+                                               str(HORIZON), "--time-budget", "0"])
+    records = brewhouse.plan(args, site)
+    assert records
+    assert {record["beer"] for record in records} == {"Dunkel"}
+    assert all(record["fermenter"] == "Albert" and not record["queued"] for record in records)
+    assert records == sorted(records, key=lambda record: record["start"])
+    assert records[0]["start"] >= (START + timedelta(days=stages("conditioning")
+                                                     - stages("brewing"))).date()
+
+
+def test_plan_command_outside_the_forecast(monkeypatch, tmp_path):
+    site = Site("test", str(tmp_path), Process(), [Tank("Albert", 1000, "both")])
+    monkeypatch.setattr(brewhouse.FORECASTS, "forecast", prediction)
+    args = brewhouse.make_parser().parse_args(["plan", "--start", "2021-01-01"])
+    with pytest.raises(brewhouse.CommandError):
+        brewhouse.plan(args, site)
@@ -0,0 +1,68 @@
+"""Tests of trying settings of the suggestion policy against past sales in policy_sweep."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from policy_sweep import YEAR_DAYS, historical_replay, policy_grid, sweep
+from suggestions import SuggestionPolicy
+
+START = datetime(2018, 11, 1)
+TANKS = [("Albert", 1000, "both"), ("Brigadier", 800, "both")]
+
+
+def sales_data(days, daily=lambda beer, day: day % 7 + (10 if beer == "Dunkel" else 20)):
+    """Returns the sales of two beers over the days, in the structure returned by parse_data."""
+    beers = ["Dunkel", "Pilsner"]
+    return {"x": {beer: [START + timedelta(days=day) for day in range(days)] for beer in beers},
+            "y": {beer: [daily(beer, day) for day in range(days)] for beer in beers}}
+
+
+def test_every_combination_is_a_policy():
+    policies = policy_grid({"lead_days": [42, 56], "demand_share": [0.5, 1.0], "round_to": [10]})
+    assert len(policies) == 4
+    assert {(policy.lead_days, policy.demand_share) for policy in policies} == \
+        {(42, 0.5), (42, 1.0), (56, 0.5), (56, 1.0)}
+    assert all(policy.window_days == SuggestionPolicy().window_days for policy in policies)
+
+
+def test_forecast_is_the_sales_of_a_year_before():
+    data_dict = sales_data(600)
+    (dates, replayed), (forecast_dates, forecast) = historical_replay(100, 20, data_dict)
+    assert dates[0] == START + timedelta(days=480) and len(dates) == 120
+    assert replayed["Dunkel"] == data_dict["y"]["Dunkel"][480:]
+    assert forecast_dates[:120] == dates and len(forecast_dates) == 120 + YEAR_DAYS
+    first = 480 - YEAR_DAYS
+    assert forecast["Pilsner"][:240] == data_dict["y"]["Pilsner"][first:first + 240]
+
+
+def test_short_sales_are_forecast_from_before_the_replay():
+    data_dict = sales_data(300)
+    _, (_, forecast) = historical_replay(100, 20, data_dict)
+    # 180 days before the replay, so the first 184 days have no sales a year before.
+    average = sum(data_dict["y"]["Dunkel"][:180]) / 180
+    assert forecast["Dunkel"][:184] == [average] * 184
+    assert forecast["Dunkel"][184:] == data_dict["y"]["Dunkel"]
+
+
+def test_no_day_is_forecast_from_later_sales():
+    _, (_, forecast) = historical_replay(100, 20, sales_data(300))
+    later = sales_data(300, lambda beer, day: 1000 if day >= 180 else day % 7 + 10)
+    _, (_, changed) = historical_replay(100, 20, later)
+    # Days of the replay are forecast the same whatever was sold in it.
+    assert changed["Dunkel"][:120] == forecast["Dunkel"][:120]
+
+
+def test_replay_needs_sales_before_it():
+    with pytest.raises(ValueError):
+        historical_replay(100, 20, sales_data(120))
+
+
+def test_sweep_gives_a_result_for_each_policy():
+    replay = historical_replay(60, 14, sales_data(400))
+    policies = policy_grid({"lead_days": [42, 56], "demand_share": [0.5, 1.0]})
+    results = sweep(policies, TANKS, 60, 14, max_workers=2, replay=replay)
+    assert len(results) == 4
+    keys = [(result["stockout_days"], result["unmet_bottles"], result["mean_stock_bottles"])
+            for result in results]
+    assert keys == sorted(keys)
+    assert all(result["batches_started"] > 0 for result in results)
@@ -0,0 +1,65 @@
+"""Tests of projecting the bottles in stock in projection."""
+from datetime import date, datetime, timedelta
+from math import ceil
+
+import numpy as np
+
+from inventory_management import BOTTLE_VOLUME, Process, add_batch, time_until_bottled
+from projection import DAY, project_inventory
+
+START = datetime(2020, 1, 1)
+
+
+def prediction(days, bottles):
+    """Gives the dates and daily sales of Dunkel, as from plot_next_year."""
+    return [START + timedelta(days=day) for day in range(days)], {"Dunkel": [bottles] * days}
+
+
+def stocked(litres):
+    """Returns a Process object with the litres of Dunkel bottled."""
+    process_obj = Process()
+    process_obj.finished["Dunkel"] = litres
+    return process_obj
+
+
+def test_stock_runs_down_with_the_predicted_sales():
+    projection = project_inventory(prediction(30, 10.0), stocked(100), START, 30)
+    row = projection.beers.index("Dunkel")
+    assert np.allclose(projection.on_hand[row], 200 - 10 * np.arange(1, 31))
+    # The stock is gone at the end of day 20, and short on day 21.
+    assert projection.first_stockout["Dunkel"] == START + timedelta(days=20)
+
+
+def test_batches_in_production_arrive_when_bottled():
+    process_obj = Process()
+    process_obj.clock = START.timestamp
+    batch = add_batch(process_obj, "Red Helles", 1000)
+    projection = project_inventory(None, process_obj, START, 180)
+    row = projection.beers.index("Red Helles")
+    ready = int(ceil(time_until_bottled(batch, START.timestamp()) / DAY))
+    assert projection.arrivals[row].sum() == 1000 / BOTTLE_VOLUME
+    assert projection.arrivals[row, ready] == 1000 / BOTTLE_VOLUME
+    assert projection.first_stockout["Red Helles"] is None
+
+
+def test_orders_are_taken_on_their_due_date():
+    process_obj = stocked(50)
+    process_obj.orders.add("Dunkel", 30, date(2020, 1, 5))
+    process_obj.orders.add("Dunkel", 5, date(2020, 1, 6))
+    process_obj.orders.add("Dunkel", 20, date(2019, 12, 1))
+    projection = project_inventory(prediction(10, 10.0), process_obj, START, 10)
+    row = projection.beers.index("Dunkel")
+    # The overdue order is taken on the first day, and an order only adds
+    # to the predicted sales when it is larger.
+    assert projection.demand[row].tolist() == [20, 10, 10, 10, 30, 10, 10, 10, 10, 10]
+    assert projection.first_stockout["Dunkel"] == START + timedelta(days=7)
+
+
+def test_only_orders_without_a_prediction():
+    process_obj = stocked(0)
+    process_obj.orders.add("Dunkel", 3, date(2020, 1, 3))
+    projection = project_inventory(([], {}), process_obj, START, 5)
+    row = projection.beers.index("Dunkel")
+    assert projection.demand[row].tolist() == [0, 0, 3, 0, 0]
+    assert projection.on_hand[row].tolist() == [0, 0, -3, -3, -3]
+    assert projection.first_stockout["Dunkel"] == START + timedelta(days=2)
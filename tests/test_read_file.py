@@ -0,0 +1,76 @@
+"""Tests of reading the csv file of sales data and adding to it in read_file."""
+import pytest
+
+import read_file
+from read_file import SalesTotals, append_sales, complete_lines, parse_data, use_sales_file
+
+HEADER = "Invoice Number,Customer,Date Required,Recipe,Gyle Number,Quantity ordered\n"
+
+
+@pytest.fixture
+def sales(sales_file):
+    """Gives a csv file of sales data of one row, used as the csv file of the program."""
+    with open(sales_file, "w", encoding="utf-8") as file:
+        file.write(HEADER + "1,Jaded Palates,02-Nov-18,Organic Dunkel,90,12\n")
+    use_sales_file(sales_file)
+    return sales_file
+
+
+def write(path, text):
+    """Writes the text to the file and returns its name."""
+    path.write_bytes(text.encode("utf-8"))
+    return str(path)
+
+
+def totals():
+    """Returns the total sales of each beer sold in the csv file."""
+    return {beer: sum(quantities) for beer, quantities in parse_data()["y"].items()
+            if sum(quantities)}
+
+
+def test_last_row_without_a_newline_is_added(sales, tmp_path):
+    new = write(tmp_path / "new.csv", HEADER + "2,Jaded Palates,03-Nov-18,Organic Dunkel,91,5\n"
+                "3,Jaded Palates,04-Nov-18,Organic Pilsner,92,7")
+    result, added, end = append_sales(new)
+    assert (result, added) == ("success", 2)
+    assert end == (tmp_path / "new.csv").stat().st_size
+    assert totals() == {"Organic Dunkel": 17, "Organic Pilsner": 7}
+    with open(sales, encoding="utf-8") as file:
+        assert file.read().endswith("Organic Pilsner,92,7\n")
+
+
+def test_file_is_added_from_the_offset(sales, tmp_path):
+    new = write(tmp_path / "new.csv", HEADER + "2,Jaded Palates,03-Nov-18,Organic Dunkel,91,5\n")
+    _, _, end = append_sales(new)
+    with open(new, "a", encoding="utf-8") as file:
+        file.write("3,Jaded Palates,04-Nov-18,Organic Dunkel,92,7\n")
+    assert append_sales(new, end)[:2] == ("success", 1)
+    assert totals() == {"Organic Dunkel": 24}
+
+
+def test_invalid_file_adds_nothing(sales, tmp_path):
+    new = write(tmp_path / "new.csv", HEADER + "2,Jaded Palates,03-Nov-18,Organic Dunkel,91,5\n"
+                "3,Jaded Palates,someday,Organic Dunkel,92,7")
+    assert append_sales(new) == ("Valid data not found in file", 0, 0)
+    assert append_sales(str(tmp_path / "missing.csv"))[0] == "File not found"
+    assert totals() == {"Organic Dunkel": 12}
+
+
+def test_row_being_written_to_the_csv_file_is_read_once_complete(sales):
+    sales_totals = SalesTotals(sales)
+    assert sales_totals.update() == 1
+    with open(sales, "a", encoding="utf-8") as file:
+        file.write("2,Jaded Palates,03-Nov-18,Organic Dunkel,91,")
+    assert sales_totals.update() == 0
+    with open(sales, "a", encoding="utf-8") as file:
+        file.write("5\n")
+    assert sales_totals.update() == 1
+
+
+@pytest.mark.parametrize("to_end, expected", [(False, [b"a\nb\n"]), (True, [b"a\nb\n", b"c"])])
+def test_complete_lines(tmp_path, to_end, expected):
+    write(tmp_path / "lines", "a\nb\nc")
+    with open(tmp_path / "lines", "rb") as file:
+        chunks = list(complete_lines(file, chunk_size=read_file.CHUNK_SIZE, to_end=to_end))
+    assert [lines for lines, _ in chunks] == expected
+    assert chunks[-1][1] == sum(len(lines) for lines in expected)
@@ -0,0 +1,143 @@
+"""Tests of compacting old sales into weekly and monthly totals in retention."""
+import os
+import shutil
+from datetime import datetime
+
+import pytest
+
+import read_file
+from read_file import archive_file_name, parse_data, use_sales_file
+from retention import MIN_DAILY_YEARS, RetentionPolicy, compact_sales, cutoffs, period_of
+from synthetic_data import SyntheticSpec, write_sales
+
+SPEC = SyntheticSpec(recipes=4, customers=15, years=4, invoices_per_day=4)
+POLICY = RetentionPolicy(daily_years=MIN_DAILY_YEARS, weekly_years=3.0)
+
+
+@pytest.fixture
+def sales(sales_file):
+    """Writes four years of sales and reads them, giving the file and what was read."""
+    write_sales(sales_file, SPEC)
+    use_sales_file(sales_file)
+    return sales_file, parse_data()
+
+
+def period_totals(data_dict, through, weekly):
+    """Adds up the sales of each beer in each period before the day, as the archive keeps them."""
+    totals = {}
+    for beer, dates in data_dict['x'].items():
+        for day, sold in zip(dates, data_dict['y'][beer]):
+            if day < through and sold:
+                key = beer, period_of(day, day < weekly)[0]
+                totals[key] = totals.get(key, 0) + sold
+    return totals
+
+
+def archived_totals(data_dict):
+    """Returns the total of each beer in each period given by parse_data."""
+    return {(beer, start): quantity for beer, periods in data_dict['periods'].items()
+            for start, _, quantity in periods if quantity}
+
+
+def total_sales(data_dict, beer):
+    """Returns the sales of the beer on every day and in every period."""
+    return sum(data_dict['y'].get(beer, [])) \
+        + sum(quantity for _, _, quantity in data_dict['periods'].get(beer, []))
+
+
+def test_periods_are_whole_weeks_cut_at_months():
+    assert period_of(datetime(2019, 10, 30), False) == (datetime(2019, 10, 28), 4)
+    assert period_of(datetime(2019, 11, 2), False) == (datetime(2019, 11, 1), 3)
+    assert period_of(datetime(2019, 11, 6), False) == (datetime(2019, 11, 4), 7)
+    assert period_of(datetime(2019, 2, 14), True) == (datetime(2019, 2, 1), 28)
+
+
+def test_compaction_keeps_the_totals(sales):
+    file_name, before = sales
+    size = os.path.getsize(file_name)
+    result = compact_sales(POLICY)
+    assert result["moved"] > 0 and result["weeks"] > 0 and result["months"] > 0
+    assert os.path.getsize(file_name) < size
+
+    use_sales_file(file_name)
+    after = parse_data()
+    through = datetime.combine(result["through"], datetime.min.time())
+    weekly = cutoffs(max(dates[-1] for dates in before['x'].values()), POLICY)[1]
+    assert archived_totals(after) == period_totals(before, through, weekly)
+    for beer, dates in before['x'].items():
+        kept = dates.index(through)
+        assert after['x'][beer] == dates[kept:]
+        assert after['y'][beer] == before['y'][beer][kept:]
+        assert total_sales(after, beer) == sum(before['y'][beer])
+
+
+def test_last_row_without_a_newline_is_kept(sales):
+    file_name, _ = sales
+    with open(file_name, "rb+") as file:
+        file.seek(-1, os.SEEK_END)
+        file.truncate()
+        file.seek(0)
+        last_row = file.read().rsplit(b"\n", 1)[1]
+    compact_sales(POLICY)
+    with open(file_name, "rb") as file:
+        assert file.read().endswith(b"\n" + last_row + b"\n")
+
+
+def test_compacting_again_reads_nothing(sales):
+    first = compact_sales(POLICY)
+    again = compact_sales(POLICY)
+    assert again["moved"] == 0 and again["kept"] == 0
+    assert again["through"] == first["through"]
+    assert (again["weeks"], again["months"]) == (first["weeks"], first["months"])
+
+
+def test_an_interrupted_compaction_counts_nothing_twice(sales, tmp_path):
+    file_name, before = sales
+    copy = str(tmp_path / "copy.csv")
+    shutil.copyfile(file_name, copy)
+    compact_sales(POLICY)
+    # As if the archive was written and the csv file wasn't.
+    shutil.copyfile(copy, file_name)
+
+    use_sales_file(file_name)
+    after = parse_data()
+    for beer in before['x']:
+        assert total_sales(after, beer) == sum(before['y'][beer])
+    assert compact_sales(POLICY)["moved"] == 0
+
+
+def test_rows_are_kept_for_the_days_the_forecasts_read(sales):
+    file_name, _ = sales
+    compact_sales(POLICY)
+    use_sales_file(file_name)
+    last = max(dates[-1] for dates in parse_data()['x'].values())
+    first = min(min(rows.days) for rows in read_file.SALES.customer_sales()[1].values())
+    assert last.toordinal() - first >= round(MIN_DAILY_YEARS * 365) - 1
+
+
+def test_days_read_once_compacted_stay_the_same_as_years_are_added(sales_file):
+    lengths = []
+    for years in [4, 6]:
+        write_sales(sales_file, SPEC._replace(years=years))
+        if os.path.exists(archive_file_name(sales_file)):
+            os.remove(archive_file_name(sales_file))
+        use_sales_file(sales_file)
+        compact_sales(POLICY)
+        use_sales_file(sales_file)
+        data_dict = parse_data()
+        lengths.append(max(len(dates) for dates in data_dict['x'].values()))
+    # Only the days of the rows are given, however many years are archived. The rows
+    # start on the first day of a week, so up to a week more may be kept.
+    assert max(lengths) <= round(MIN_DAILY_YEARS * 365) + 7
+    assert max(lengths) - min(lengths) < 7
+
+
+@pytest.mark.parametrize("policy", [RetentionPolicy(1, 2), RetentionPolicy(2, 2),
+                                    RetentionPolicy(3, 2)])
+def test_policies_keeping_too_little_are_refused(sales, policy):
+    file_name, _ = sales
+    size = os.path.getsize(file_name)
+    with pytest.raises(ValueError):
+        compact_sales(policy)
+    assert os.path.getsize(file_name) == size
+    assert not os.path.exists(archive_file_name(file_name))
@@ -0,0 +1,84 @@
+"""Tests of answering requests for the state of the sites and the forecast in service."""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from forecast_cache import ForecastCache
+from inventory_management import Tank
+from service import BrewService, Request, RequestError
+from sites import SiteRegistry
+
+START = datetime(2019, 10, 30)
+DATES = [START + timedelta(days=day) for day in range(60)]
+PREDICTION = DATES, {"Organic Dunkel": [10.0] * 60, "Organic Pilsner": [20.0] * 60}
+
+
+@pytest.fixture
+def service(tmp_path):
+    """Gives a service of a site in a temporary directory, with a forecast of two beers."""
+    registry = SiteRegistry(str(tmp_path / "sites.json"))
+    registry.add("North", [Tank("Albert", 1000, "both")], str(tmp_path / "north"))
+    brew_service = BrewService(registry, ForecastCache(8, lambda: 1, lambda: PREDICTION))
+    yield brew_service
+    brew_service.executor.shutdown()
+
+
+def respond(service, method, target, payload=None):
+    """Returns the response of the service to the request, or the RequestError it raises."""
+    path, _, query = target.partition("?")
+    request = Request(method, target, path, dict(part.split("=") for part in query.split("&")
+                                                 if part),
+                      {}, b"" if payload is None else json.dumps(payload).encode("utf-8"), True)
+    try:
+        return asyncio.run(service.respond(request))
+    except RequestError as error:
+        return error
+
+
+def test_batch_of_a_forecast_beer_is_started(service):
+    response = respond(service, "POST", "/sites/North/batches",
+                       {"beer": "Organic Dunkel", "volume": 800})
+    assert response.status == 201
+    batch_id = json.loads(response.body)["batch"]
+    assert [batch.batch_id for batch in service.site("North").process.brewing] == [batch_id]
+
+
+@pytest.mark.parametrize("beer", ["Organic Lager", "", "organic dunkel"])
+def test_batch_of_an_unknown_beer_is_refused(service, beer):
+    response = respond(service, "POST", "/sites/North/batches", {"beer": beer, "volume": 800})
+    assert response.status == 400
+    assert not service.site("North").process.brewing
+
+
+def test_order_of_an_unknown_beer_is_refused(service):
+    order = {"beer": "Organic Lager", "quantity": 10, "due": "2019-11-05"}
+    assert respond(service, "POST", "/sites/North/orders", order).status == 400
+    assert not service.site("North").process.orders
+    order["beer"] = "Organic Pilsner"
+    assert respond(service, "POST", "/sites/North/orders", order).status == 201
+    assert [order.beer for order in service.site("North").process.orders] == ["Organic Pilsner"]
+
+
+def test_any_beer_is_taken_without_a_forecast(service):
+    service.forecasts = ForecastCache(8, lambda: 1, lambda: (None, None))
+    response = respond(service, "POST", "/sites/North/batches",
+                       {"beer": "Organic Lager", "volume": 500})
+    assert response.status == 201
+
+
+def test_forecast_window(service):
+    response = respond(service, "GET", "/forecast?start=2019-11-01&days=7")
+    assert response.status == 200
+    assert response.etag is not None
+    assert json.loads(response.body)["sales"]["Organic Pilsner"] == [20.0] * 7
+
+
+@pytest.mark.parametrize("start", ["2019-10-29", "2019-12-25"])
+def test_forecast_window_outside_the_forecast(service, start):
+    assert respond(service, "GET", "/forecast?start=%s&days=7" % start).status == 404
+
+
+def test_unknown_site(service):
+    assert respond(service, "GET", "/sites/Nowhere/batches").status == 404
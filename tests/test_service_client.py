@@ -0,0 +1,72 @@
+"""Tests of sending requests to the service in service_client."""
+import http.client
+
+import pytest
+
+from service_client import ServiceClient
+
+
+class Response:
+    """A response to a request sent on a FakeConnection."""
+    status = 200
+
+    def read(self):
+        return b'{"ok": true}'
+
+    def getheaders(self):
+        return [("Content-Type", "application/json")]
+
+
+class FakeConnection:
+    """A connection failing the given way, or answering if no failure is given."""
+    def __init__(self, sent, failure=None, sending=False):
+        self.sent = sent
+        self.failure = failure
+        self.sending = sending
+
+    def request(self, method, path, body, headers):
+        if self.failure is not None and self.sending:
+            raise self.failure
+        self.sent.append((method, path))
+
+    def getresponse(self):
+        if self.failure is not None:
+            raise self.failure
+        return Response()
+
+    def close(self):
+        pass
+
+
+def client_with(*connections):
+    """Returns a ServiceClient given each of the connections in turn."""
+    client = ServiceClient()
+    remaining = list(connections)
+    client.connection = lambda: remaining.pop(0)
+    return client
+
+
+def test_a_get_is_sent_again_when_the_answer_is_lost():
+    sent = []
+    client = client_with(FakeConnection(sent, http.client.RemoteDisconnected()),
+                         FakeConnection(sent))
+    assert client.request("GET", "/sites")[0] == 200
+    assert sent == [("GET", "/sites"), ("GET", "/sites")]
+
+
+@pytest.mark.parametrize("failure", [http.client.RemoteDisconnected(),
+                                     ConnectionResetError()])
+def test_a_post_is_not_sent_again_once_it_has_been_sent(failure):
+    sent = []
+    client = client_with(FakeConnection(sent, failure), FakeConnection(sent))
+    with pytest.raises(type(failure)):
+        client.request("POST", "/sites/Main/batches", b"{}")
+    assert sent == [("POST", "/sites/Main/batches")]
+
+
+def test_a_post_is_sent_again_when_it_could_not_be_sent():
+    sent = []
+    client = client_with(FakeConnection(sent, BrokenPipeError(), sending=True),
+                         FakeConnection(sent))
+    assert client.request("POST", "/sites/Main/batches", b"{}")[0] == 200
+    assert sent == [("POST", "/sites/Main/batches")]
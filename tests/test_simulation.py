@@ -0,0 +1,68 @@
+"""Tests of running the brewery forward on a virtual clock in simulation."""
+from datetime import datetime, timedelta
+
+from inventory_management import BOTTLE_VOLUME, batches_in_production
+from simulation import Scenario, run_grid, run_scenario
+
+TANKS = [("Albert", 1000, "both"), ("Gertrude", 1000, "conditioner")]
+
+
+def demand(days, bottles=10.0):
+    """Gives the dates and daily sales of Dunkel, as from plot_next_year."""
+    dates = [datetime(2020, 1, 1) + timedelta(days=day) for day in range(days)]
+    return dates, {"Dunkel": [bottles] * days}
+
+
+def brew_once(_totals, process_obj, _tanks):
+    """Starts a 1000 litre batch of Dunkel if the brewery has never had one."""
+    if batches_in_production(process_obj) or process_obj.finished:
+        return None, 0
+    return "Dunkel", 1000
+
+
+def never_brew(_totals, _process_obj, _tanks):
+    """Never starts a batch."""
+    return None, 0
+
+
+def test_a_batch_goes_through_every_stage():
+    result = run_scenario(Scenario("once", TANKS, days=120, policy=brew_once), demand(120))
+    assert result["batches_started"] == 1
+    assert result["litres_bottled"] == 1000
+    # Everything bottled was either sold or is still in stock.
+    assert result["sold_bottles"] * BOTTLE_VOLUME + result["finished_stock"]["Dunkel"] \
+        == 1000
+    # Nothing is bottled for the first 90 days, so those are stockouts.
+    assert result["stockout_days"]["Dunkel"] >= 90
+    assert result["tank_utilisation"]["Albert"] > 0
+
+
+def test_demand_without_stock_is_unmet():
+    result = run_scenario(Scenario("idle", TANKS, days=30, policy=never_brew), demand(30, 4))
+    assert result["sold_bottles"] == 0
+    assert result["unmet_bottles"] == 120
+    assert result["stockout_days"] == {"Dunkel": 30}
+    assert result["tank_utilisation"] == {"Albert": 0.0, "Gertrude": 0.0}
+
+
+def test_a_batch_without_a_fermenter_waits():
+    tanks = [("Gertrude", 1000, "conditioner")]
+    result = run_scenario(Scenario("no fermenter", tanks, days=120, policy=brew_once),
+                          demand(120))
+    assert result["batches_started"] == 1
+    assert result["litres_bottled"] == 0
+
+
+def test_warm_up_days_are_left_out():
+    result = run_scenario(Scenario("warm", TANKS, days=30, policy=never_brew, warmup_days=10),
+                          demand(30, 4))
+    assert result["days"] == 20
+    assert result["unmet_bottles"] == 80
+
+
+def test_grid_matches_single_runs():
+    scenarios = [Scenario("once", TANKS, days=120, policy=brew_once),
+                 Scenario("idle", TANKS, days=120, policy=never_brew)]
+    sales = demand(120)
+    assert run_grid(scenarios, sales, max_workers=2) \
+        == [run_scenario(scenario, sales) for scenario in scenarios]
@@ -0,0 +1,86 @@
+"""Tests of running several brewhouses as sites in sites."""
+import json
+from datetime import date
+
+import pytest
+
+from inventory_management import BEER_PROCESS, Tank, objects_from_records
+from sites import MAIN_SITE, Site, SiteRegistry, site_records, site_suggestions, \
+    total_finished, total_pipeline
+from state_store import read_state
+
+
+@pytest.fixture
+def registry(tmp_path):
+    """Gives a registry of the main site and a site in a temporary directory with Dunkel."""
+    sites = SiteRegistry(str(tmp_path / "sites.json"))
+    north = sites.add("North", [Tank("Albert", 1000, "both")], str(tmp_path / "north"))
+    north.process.finished["Dunkel"] = 300
+    north.add_batch("Dunkel", 800)
+    return sites
+
+
+def test_added_sites_are_listed_and_saved(registry, tmp_path):
+    assert registry.names() == [MAIN_SITE, "North"]
+    with open(registry.file_name, encoding="utf-8") as file:
+        assert json.load(file) == [{"name": "North", "directory": str(tmp_path / "north")}]
+    with pytest.raises(ValueError):
+        registry.add("North", [], str(tmp_path / "other"))
+    process_obj, tanks = objects_from_records(read_state(registry.get("North").state_file))
+    assert [tank.name for tank in tanks] == ["Albert"]
+    assert not process_obj.finished
+
+
+def test_sites_are_loaded_when_first_used(registry):
+    again = SiteRegistry(registry.file_name)
+    north = again.get("North")
+    assert not north.loaded
+    assert [tank.name for tank in north.tanks] == ["Albert"]
+    assert north.loaded
+    assert north.process is north.process
+
+
+def test_a_site_without_a_state_file_starts_empty(tmp_path):
+    site = Site("Empty", str(tmp_path / "empty"))
+    assert site.tanks == []
+    assert not site.process.finished
+
+
+def test_changes_are_saved_to_the_site_only(registry):
+    north = registry.get("North")
+    north.add_order("Dunkel", 100, date(2020, 1, 1))
+    assert north.state_manager.save()
+    process_obj, _ = objects_from_records(read_state(north.state_file))
+    assert process_obj.finished == {"Dunkel": 300}
+    assert [order.beer for order in process_obj.orders] == ["Dunkel"]
+    assert [batch.volume for batch in process_obj.brewing] == [800]
+    assert not any(order.beer == "Dunkel" and order.quantity == 100
+                   for order in BEER_PROCESS.orders)
+
+
+def test_totals_add_up_every_site(registry):
+    main = dict(BEER_PROCESS.finished)
+    totals = total_finished(registry)
+    assert totals["Dunkel"] == main.get("Dunkel", 0) + 300
+    assert {beer: volume for beer, volume in totals.items() if beer != "Dunkel"} \
+        == {beer: volume for beer, volume in main.items() if beer != "Dunkel"}
+    assert total_pipeline(registry)["Dunkel"] >= 800
+
+
+def test_records_of_a_site(registry):
+    north = registry.get("North")
+    assert site_records(north, "stock") == [{"beer": "Dunkel", "litres": 300, "bottles": 600}]
+    assert site_records(north, "tanks") == [{"tank": "Albert", "volume": 1000,
+                                             "function": "both", "batch": None}]
+    batches = site_records(north, "batches")
+    assert [(record["beer"], record["stage"], record["tank"]) for record in batches] \
+        == [("Dunkel", "brewing", None)]
+    with pytest.raises(ValueError):
+        site_records(north, "nothing")
+
+
+def test_suggestions_for_every_site(registry):
+    suggestions = site_suggestions({"Dunkel": 5000.0}, registry)
+    assert set(suggestions) == {MAIN_SITE, "North"}
+    # North is brewing, so it can't start another batch.
+    assert suggestions["North"] == (None, None)
@@ -0,0 +1,87 @@
+"""Tests of saving the state in the background with state_manager.StateManager."""
+import threading
+import time
+
+import pytest
+
+from inventory_management import Process, Tank, add_batch, objects_from_records, \
+    snapshot_objects
+from state_manager import StateManager
+from state_store import HistoryLog, read_state
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """Gives a StateManager of an empty brewery saving to a temporary directory."""
+    process_obj = Process()
+    process_obj.history = HistoryLog(str(tmp_path / "history.jsonl"))
+    saver = StateManager(process_obj, [Tank("Albert", 1000, "both")],
+                         str(tmp_path / "state.jsonl"), debounce=0.05, max_delay=1.0,
+                         interval=60.0)
+    yield saver
+    saver.stopped.set()
+    saver.requested.set()
+
+
+def saved_batches(manager):
+    """Returns the beer of each batch in the saved state."""
+    process_obj, _ = objects_from_records(read_state(manager.file_name))
+    return [batch.beer for batch in process_obj.brewing + process_obj.waiting]
+
+
+def test_only_changes_are_saved(manager):
+    assert not manager.save()
+    add_batch(manager.process_obj, "Dunkel", 1000)
+    assert manager.save()
+    assert saved_batches(manager) == ["Dunkel"]
+    assert not manager.save()
+    assert manager.stats()["saves"] == 1
+
+
+def test_history_is_written_with_the_state(manager):
+    add_batch(manager.process_obj, "Dunkel", 1000)
+    manager.save()
+    history = HistoryLog(manager.process_obj.history.file_name).records()
+    assert [record["type"] for record in history] == ["transition"]
+
+
+def test_requests_are_saved_once_in_the_background(manager, monkeypatch):
+    saves = []
+    save = manager.save
+    monkeypatch.setattr(manager, "save", lambda: saves.append(save()))
+    manager.start()
+    for beer in ["Dunkel", "Red Helles", "Pilsner"]:
+        add_batch(manager.process_obj, beer, 1000)
+        manager.request_save()
+    deadline = time.monotonic() + 5
+    while not saves and time.monotonic() < deadline:
+        time.sleep(0.01)
+    manager.stop()
+    # The burst of requests is one save, and stopping has nothing left to save.
+    assert saves == [True, False]
+    assert not manager.thread.is_alive()
+    assert saved_batches(manager) == ["Dunkel", "Red Helles", "Pilsner"]
+
+
+def test_stop_saves_changes_left(manager):
+    manager.start()
+    add_batch(manager.process_obj, "Dunkel", 1000)
+    manager.stop()
+    assert saved_batches(manager) == ["Dunkel"]
+
+
+def test_snapshot_waits_for_a_change_to_finish(manager):
+    process_obj = manager.process_obj
+    snapshots = []
+    with process_obj.lock:
+        add_batch(process_obj, "Dunkel", 1000)
+        thread = threading.Thread(target=lambda: snapshots.append(
+            snapshot_objects(process_obj, manager.tanks)))
+        thread.start()
+        thread.join(0.1)
+        assert not snapshots
+        add_batch(process_obj, "Red Helles", 1000)
+    thread.join()
+    version, data = snapshots[0]
+    assert version == process_obj.version
+    assert b"Red Helles" in data
@@ -0,0 +1,65 @@
+"""Tests of encoding and decoding state records and of the history log in state_store."""
+import pytest
+
+from state_store import HistoryLog, decode, decode_lines, encode, header, read_state, validate
+
+
+def delivered(number):
+    """Returns a history record of a delivered order."""
+    return {"type": "delivered_order", "id": number, "beer": "A", "quantity": 3,
+            "due": "2019-01-01", "reference": None, "time": 1.5 + number}
+
+
+RECORDS = [header(7),
+           {"type": "tank", "name": "Albert", "volume": 1000, "function": "both"},
+           {"type": "batch", "id": "b1", "beer": "A", "volume": 500.0, "step": 3,
+            "next_step": 4, "start": 12.5, "tank": "Albert"},
+           {"type": "stock", "beer": "A", "volume": 20.5},
+           {"type": "order", "id": 3, "beer": "A", "quantity": 9, "due": "2019-02-01",
+            "reference": "r"}]
+
+
+def test_encode_decode_round_trip():
+    data = encode(RECORDS)
+    assert data.endswith(b"\n")
+    assert decode(data.decode("utf-8").splitlines()) == RECORDS
+
+
+def test_read_state_round_trip(tmp_path):
+    path = tmp_path / "state.jsonl"
+    path.write_bytes(encode(RECORDS))
+    assert read_state(str(path)) == RECORDS
+
+
+def test_decode_checks_the_fields():
+    with pytest.raises(ValueError):
+        decode(['{"type": "tank", "name": "Albert", "volume": "big", "function": "both"}'])
+    with pytest.raises(ValueError):
+        validate({"type": "spaceship"})
+
+
+def test_decode_lines_skips_damaged_lines():
+    lines = encode([delivered(1), delivered(2), delivered(3)]).decode("utf-8").splitlines()
+    lines[1] = lines[1][:-5]
+    lines.append("[1, 2]")
+    assert [record["id"] for record in decode_lines(lines, "test")] == [1, 3]
+
+
+def test_history_with_a_line_cut_short_is_still_read(tmp_path):
+    file_name = str(tmp_path / "history.jsonl")
+    history = HistoryLog(file_name)
+    history.append(delivered(1))
+    history.append(delivered(2))
+    assert history.flush() == "success"
+    with open(file_name, "rb") as file:
+        data = file.read()
+    with open(file_name, "wb") as file:
+        file.write(data[:-10])
+
+    history = HistoryLog(file_name)
+    assert [record["id"] for record in history.records()] == [1]
+    history.append(delivered(3))
+    assert history.flush() == "success"
+    # The new record is on a line of its own after the damaged one.
+    assert [record["id"] for record in HistoryLog(file_name).records()] == [1, 3]
+    assert [record["id"] for record in history.records("delivered_order")] == [1, 3]
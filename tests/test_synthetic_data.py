@@ -0,0 +1,46 @@
+"""Tests of making up sales data and states of a given size in synthetic_data."""
+import csv
+from datetime import datetime
+
+from inventory_management import batches_in_production
+from read_file import SALES_COLUMNS
+from synthetic_data import SyntheticSpec, make_state, recipe_names, sales_rows, write_sales
+
+SPEC = SyntheticSpec(recipes=5, years=0.5, tanks=4, batches=10, orders=7, seed=3)
+NOW = datetime(2020, 3, 1).timestamp()
+
+
+def test_recipes_start_with_the_real_ones():
+    assert recipe_names(2) == ["Organic Red Helles", "Organic Pilsner"]
+    assert recipe_names(5)[3:] == ["Recipe 4", "Recipe 5"]
+
+
+def test_sales_are_the_same_for_the_same_seed():
+    assert list(sales_rows(SPEC)) == list(sales_rows(SPEC))
+    assert list(sales_rows(SPEC)) != list(sales_rows(SPEC._replace(seed=4)))
+
+
+def test_every_recipe_is_sold_on_the_first_day(tmp_path):
+    file_name = str(tmp_path / "sales.csv")
+    rows = write_sales(file_name, SPEC)
+    with open(file_name, encoding="utf-8") as file:
+        lines = list(csv.reader(file))
+    assert lines[0] == SALES_COLUMNS
+    assert len(lines) == rows + 1
+    first_day = lines[1][2]
+    assert {line[3] for line in lines[1:] if line[2] == first_day} == set(recipe_names(5))
+    assert all(int(line[5]) >= 1 for line in lines[1:])
+
+
+def test_state_is_of_the_size_asked_for():
+    process_obj, tanks = make_state(SPEC, NOW)
+    assert len(tanks) == 4
+    assert len(process_obj.brewing) == 1
+    assert len(batches_in_production(process_obj)) == 10
+    assert len(process_obj.orders) == 7
+    assert set(process_obj.finished) <= set(recipe_names(5))
+    # Each tank holds at most one batch, and only batches that fit.
+    in_tanks = [batch for batch in batches_in_production(process_obj)
+                if batch.current_tank is not None]
+    assert len({batch.current_tank.name for batch in in_tanks}) == len(in_tanks)
+    assert all(batch.volume <= batch.current_tank.volume for batch in in_tanks)
@@ -0,0 +1,64 @@
+"""Tests of working out how much each tank is used in tank_analytics."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from history import HistoryIndex
+from inventory_management import Tank
+from tank_analytics import DAY, tank_utilisation
+
+START = datetime(2020, 1, 6)
+T0 = START.timestamp()
+TANKS = [Tank("Albert", 1000, "both"), Tank("Gertrude", 1000, "conditioner"),
+         Tank("R2D2", 800, "fermenter")]
+
+
+def transition(batch_id, step, day, tank=None, volume=1000):
+    """Returns the record of a batch starting the step on the day after START."""
+    return {"type": "transition", "id": batch_id, "beer": "Dunkel", "volume": volume,
+            "step": step, "tank": tank, "time": T0 + day * DAY}
+
+
+def test_busy_and_idle_time_of_each_tank():
+    index = HistoryIndex([transition("a", 2, 1, "Albert", 500), transition("a", 3, 3),
+                          transition("b", 0, 4), transition("b", 2, 5, "Albert"),
+                          transition("b", 4, 6)])
+    result = tank_utilisation(START, START + timedelta(days=7), 7, TANKS, index)
+    assert result.tanks == ["Albert", "Gertrude", "R2D2"]
+    assert result.overall == pytest.approx([3 / 7, 0, 0])
+    assert result.busy[:, 0] == pytest.approx([3 / 7, 0, 0])
+    assert result.longest_idle == pytest.approx([2 * DAY, 7 * DAY, 7 * DAY])
+    assert result.idle_periods.tolist() == [3, 1, 1]
+    # Albert held 500 litres for 2 days and 1000 litres for 1.
+    assert result.volume_efficiency == pytest.approx([2 / 3, 0, 0])
+    assert result.queue == {"count": 1, "mean": DAY, "longest": DAY, "total": DAY}
+    assert result.by_class["both"] == pytest.approx([3 / 7])
+
+
+def test_stages_are_cut_at_the_range():
+    index = HistoryIndex([transition("a", 2, -3, "R2D2"), transition("a", 3, 2, "Gertrude"),
+                          transition("a", 4, 20)])
+    result = tank_utilisation(START, START + timedelta(days=14), 7, TANKS, index)
+    assert result.busy[2] == pytest.approx([2 / 7, 0])
+    assert result.busy[1] == pytest.approx([5 / 7, 1])
+    assert result.longest_idle[1] == pytest.approx(2 * DAY)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_buckets_match_the_busy_time_of_the_index(seed):
+    rng = random.Random(seed)
+    records = []
+    for number in range(80):
+        day = rng.uniform(-20, 120)
+        for step in range(1, 6):
+            tank = rng.choice(TANKS).name if step in [2, 3] else None
+            records.append(transition("b%d" % number, step, day, tank))
+            day += rng.uniform(0.5, 15)
+    index = HistoryIndex(sorted(records, key=lambda record: record["time"]))
+    result = tank_utilisation(START, START + timedelta(days=100), 7, TANKS, index)
+    edges = [edge.timestamp() for edge in result.edges]
+    for bucket, (first, last) in enumerate(zip(edges, edges[1:])):
+        busy = index.busy_seconds(first, last)
+        expected = [busy.get(tank.name, 0.0) / (last - first) for tank in TANKS]
+        assert result.busy[:, bucket] == pytest.approx(expected)
@@ -0,0 +1,54 @@
+"""Tests of the parts of user_interface that run tasks in the background."""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# pylint: disable=wrong-import-position
+from PyQt5 import QtWidgets  # noqa: E402
+import user_interface  # noqa: E402
+from user_interface import UiMainWindow  # noqa: E402
+from workers import TaskRunner  # noqa: E402
+
+
+@pytest.fixture
+def window(monkeypatch):
+    """
+    Gives the Add File parts of the main window, with pop ups recorded instead of shown.
+
+    Making the whole window would forecast and start watching the inbox, so
+    only what add_file uses is made.
+    """
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    messages = []
+    monkeypatch.setattr(user_interface, "pop_up", messages.append)
+    ui = SimpleNamespace(file_dir_edit=QtWidgets.QLineEdit(),
+                         add_file_button=QtWidgets.QPushButton(), runner=TaskRunner(),
+                         messages=messages, app=app)
+    for name in ["show_file_result", "show_file_error"]:
+        setattr(ui, name, getattr(UiMainWindow, name).__get__(ui))
+    return ui
+
+
+def test_add_file_button_comes_back_after_an_error(window):
+    def add_sales(_file_dir):
+        raise ConnectionError("service is down")
+
+    window.registry = SimpleNamespace(add_sales=add_sales)
+    window.file_dir_edit.setText("sales.csv")
+    UiMainWindow.add_file(window)
+    assert not window.add_file_button.isEnabled()
+    window.runner.wait()
+    assert window.add_file_button.isEnabled()
+    assert window.messages == ["Failed to add file: service is down"]
+
+
+def test_add_file_button_comes_back_after_a_failed_file(window):
+    window.registry = SimpleNamespace(add_sales=lambda file_dir: "failed: no file " + file_dir)
+    window.file_dir_edit.setText("sales.csv")
+    UiMainWindow.add_file(window)
+    window.runner.wait()
+    assert window.add_file_button.isEnabled()
+    assert window.messages == ["failed: no file sales.csv"]
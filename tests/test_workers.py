@@ -0,0 +1,83 @@
+"""Tests of running tasks for the interface in the thread pool with workers.TaskRunner."""
+import os
+import threading
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# pylint: disable=wrong-import-position
+from PyQt5 import QtCore, QtWidgets  # noqa: E402
+from workers import TaskRunner  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def app():
+    """Gives the Qt application the results are delivered through."""
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def runner(app):
+    """Gives a TaskRunner with a pool of one thread, so later tasks queue."""
+    pool = QtCore.QThreadPool()
+    pool.setMaxThreadCount(1)
+    task_runner = TaskRunner(pool=pool)
+    yield task_runner
+    task_runner.wait()
+
+
+def blocked(release, value):
+    """Waits for the event and then returns the value."""
+    release.wait(5)
+    return value
+
+
+def test_only_the_latest_result_is_given(runner):
+    release = threading.Event()
+    results = []
+    runner.submit("graph", blocked, results.append, release, "old")
+    runner.submit("graph", lambda: "new", results.append)
+    assert runner.is_busy("graph")
+    release.set()
+    runner.wait()
+    assert results == ["new"]
+    assert not runner.is_busy()
+
+
+def test_a_queued_task_is_replaced(runner):
+    release = threading.Event()
+    ran = []
+    runner.submit("first", blocked, lambda result: None, release, None)
+    runner.submit("graph", ran.append, lambda result: None, "queued")
+    runner.submit("graph", ran.append, lambda result: None, "latest")
+    release.set()
+    runner.wait()
+    # The older task was taken out of the queue before it started.
+    assert ran == ["latest"]
+    assert runner.pending == {"first": 0, "graph": 0}
+
+
+def test_keys_are_independent(runner):
+    results = []
+    runner.submit("a", lambda: 1, results.append)
+    runner.submit("b", lambda: 2, results.append)
+    runner.wait()
+    assert sorted(results) == [1, 2]
+
+
+def test_errors_are_given_to_on_error(runner):
+    def fail():
+        raise ConnectionError("service is down")
+
+    results, errors, busy = [], [], []
+    runner.busy_changed.connect(lambda key, is_busy: busy.append((key, is_busy)))
+    generation = runner.submit("file", fail, results.append, on_error=errors.append)
+    runner.wait()
+    assert generation == 1
+    assert (results, errors) == ([], ["service is down"])
+    assert busy == [("file", True), ("file", False)]
+    # Without on_error the failure is only logged.
+    runner.submit("file", fail, results.append)
+    runner.wait()
+    assert (results, errors) == ([], ["service is down"])
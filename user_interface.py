@@ -7,107 +7,42 @@ Form implementation generated from reading ui file 'interface.ui'.
 Created by: PyQt5 UI code generator 5.13.0.
 """
 import sys
+import argparse
 from os import path as os_path, chdir
-from math import ceil
-from threading import Thread
-from datetime import datetime, timedelta
-from typing import Tuple, List, Dict, Callable, Union
-from time import sleep as time_sleep
-import logging
+from datetime import datetime
+from functools import partial
+from typing import Tuple, List, Dict, Callable, Optional, Union
+from time import time as time_now
+from log_setup import get_logger
 from PyQt5 import QtCore, QtGui, QtWidgets
 import pyqtgraph as pg
-from sales_predictions import plot_next_year, get_total
-from inventory_management import Tank, Batch, \
-    BEER_PROCESS, TANKS, show_beer_steps, show_tanks, add_batch, \
-    available_tanks, finished_processes, save_objects
-from read_file import write_data
-
-LOGGER = logging.getLogger("user_interface")
-LOGGER.setLevel(logging.DEBUG)
-F_HANDLER = logging.FileHandler('log_file.log')
-F_FORMAT = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-F_HANDLER.setFormatter(F_FORMAT)
-LOGGER.addHandler(F_HANDLER)
+from suggestions import current_datetime
+from inventory_management import Process, Tank, Batch, \
+    describe_batch, describe_ongoing, describe_tank, get_next_tanks, \
+    finished_processes, next_stage_finish, BOTTLE_VOLUME
+from orders import Order
+from tank_analytics import Utilisation, recent_utilisation
+from sites import SITES, SiteRegistry
+from service_client import RemoteRegistry
+from workers import TaskRunner, Relay
+from inbox import InboxWatcher, IngestResult
+from list_models import Row, KeyedListModel, make_list_view
+from exports import EXPORTS, EXTENSIONS, export_rows, export_file, format_of, interval_errors
+from instrumentation import METRICS, instrumented
+from changes import BATCH_MOVED, TANK_CHANGED, STOCK_CHANGED, ORDER_CHANGED, SALES_CHANGED, \
+    Dependents
+
+LOGGER = get_logger("user_interface")
 
 ABS_PATH = os_path.abspath(__file__)
 D_NAME = os_path.dirname(ABS_PATH)
 chdir(D_NAME)
 
-
-# pylint: disable=c-extension-no-member
-def current_datetime() -> datetime:
-    """Returning today's date as a datetime object."""
-    return datetime.combine(datetime.today().date(), datetime.min.time())
-
-
-def beer_suggestion() -> Tuple[str, int]:
-    """
-    Making a recommendation on the next batch to brew.
-
-    The recommendation algorithm is as follows:
-    1. Look at the 6 week period 10 weeks from now.
-    2. For all the predicted demands, subtract the volumes
-    currently waiting, brewing and fermenting.
-    3. Get the beer with the highest demand after step 2.
-    4. Look to see if any batches are brewing or waiting.
-    5. If the result from step 4 is None, recommend the beer from step 3.
-
-    :return: The name and suggested volume for the next beer to be brewed.
-    """
-    LOGGER.info("Calculating next batch suggestion")
-    if plot_next_year()[0]:
-        totals_dict = get_total(current_datetime() + timedelta(weeks=10), 7 * 6, plot_next_year())
-        for batch in BEER_PROCESS.waiting + BEER_PROCESS.brewing + BEER_PROCESS.fermenting:
-            LOGGER.info("There are batches waiting, brewing or fermenting")
-            totals_dict[batch.beer] -= batch.volume * 2
-
-        maximum = max(totals_dict.values())
-        key = list(totals_dict.keys())[list(totals_dict.values()).index(maximum)]
-        LOGGER.debug("Beer with max demand fetched")
-
-        volume = int(ceil((maximum * 0.5) / 10.0)) * 10
-
-        tanks = available_tanks(800, 2)
-        if tanks and not BEER_PROCESS.brewing and \
-                not [batch for batch in BEER_PROCESS.waiting if batch.next_step == 1]:
-            max_possible = max([tank.volume for tank in tanks])
-            volume = min(max_possible, volume)
-            LOGGER.info("There is a beer suggestion")
-            return key, volume
-    LOGGER.info("No beer suggestion")
-    return None, None
-
-
-def get_next_tanks(batch_object: Batch) -> List[Tank]:
-    """
-    Returns the list of tanks that may be required for the next stage for a batch.
-
-    :param batch_object: The Batch object to look tanks for.
-    :return: List of tanks required if any.
-    """
-    LOGGER.info("Getting the list of tanks for next step")
-    if batch_object.next_step in [2, 3]:
-        LOGGER.info("Tanks are required for next step of %s", batch_object.beer)
-        tanks = available_tanks(batch_object.volume, batch_object.next_step)
-        if batch_object.current_tank is not None and\
-                batch_object.current_tank.function == "conditioner":
-            LOGGER.debug("Adding current tank to list.")
-            tanks = [batch_object.current_tank] + tanks
-        if tanks:
-            LOGGER.info("Tanks returned")
-            return tanks
-    LOGGER.info("No tank required")
-    return False
-
-
-def save_continuously():
-    """Procedure to save the state of batches and tanks every 2 minutes"""
-    while True:
-        save_objects(BEER_PROCESS, TANKS)
-        LOGGER.warning("Current state auto-saved")
-        time_sleep(120)
+# Milliseconds between checks for changes made by others using the same service.
+POLL_INTERVAL = 2000
 
 
+# pylint: disable=c-extension-no-member
 def pop_up(text: str):
     """Shows a pop up box for the given text"""
     message = QtWidgets.QMessageBox()
@@ -118,6 +53,17 @@ def pop_up(text: str):
 class UiMainWindow:
     """This class is for creating the user interface"""
     # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-public-methods
+    @property
+    def process(self) -> Process:
+        """The Process object of the site being shown."""
+        return self.site.process
+
+    @property
+    def tanks(self) -> List[Tank]:
+        """The list of tanks of the site being shown."""
+        return self.site.tanks
+
     def get_graph(self, dates: List[datetime] = None,
                   data: Dict[str, List[int]] = None, symbol: str = None):
         """
@@ -131,18 +77,34 @@ class UiMainWindow:
         :param symbol: Symbol for data points.
         """
         LOGGER.info("Getting graph")
+        if not dates or not data or len(dates) != len(data['Organic Pilsner']):
+            self.runner.submit("graph", self.registry.forecasts.window,
+                               lambda result: self.plot_graph(*result), current_datetime(), 180)
+        else:
+            self.plot_graph(dates, data, symbol)
+
+    def plot_graph(self, dates: List[datetime], predict_dict: Dict[str, List[int]],
+                   symbol: str = None):
+        """
+        Plots the prediction on the graph.
+
+        :param dates: List of dates.
+        :param predict_dict: List of sales for each beer.
+        :param symbol: Symbol for data points.
+        """
+        if not dates:
+            LOGGER.error("No prediction to plot")
+            return
         self.widget.clear()
-        if self.widget.plotItem.legend:
+        legend = self.widget.plotItem.legend
+        if legend is not None:
             LOGGER.debug("Legend cleared")
-            self.widget.plotItem.legend.scene().removeItem(self.widget.plotItem.legend)
+            if legend.scene() is not None:
+                legend.scene().removeItem(legend)
+            # So addLegend makes a new legend rather than returning the removed one.
+            self.widget.plotItem.legend = None
         self.widget.setTitle("Prediction")
 
-        if not dates or not data or len(dates) != len(data['Organic Pilsner']):
-            start_date = current_datetime()
-            dates, predict_dict = plot_next_year(start_date=start_date, date_range=180)
-        else:
-            predict_dict = data
-
         # Date in strings to show on graph
         string_dates = [date.strftime("%d/%m/%y") for date in dates]
 
@@ -169,21 +131,16 @@ class UiMainWindow:
     def show_tanks(self):
         """Showing tank states for each tank that is processing a batch."""
         LOGGER.info("Showing each tank state")
-        self.tanks_list.clear()
-        tank_strings = show_tanks()
-        self.tanks_list.addItems(tank_strings)
+        self.tanks_model.set_rows([Row(tank.name, describe_tank(tank)) for tank in self.tanks
+                                   if tank.current_batch is not None])
 
-    def make_step_function(self, batch: Batch, combo_box: QtWidgets.QComboBox = None) -> Callable:
-        """Making the function to be linked for the next step button."""
+    def make_step_function(self, batch: Batch, tank: Tank = None) -> Callable:
+        """Making the function to move the batch to the next step, in the tank if given."""
         def go_next_step():
             """The function to be linked to the 'next step' button."""
-            # If next step requires a tank.
             LOGGER.info("next step button clicked")
-            if combo_box is None:
-                batch.go_next_step(BEER_PROCESS)
-            else:
-                batch.go_next_step(BEER_PROCESS, combo_box.currentText())
-            self.refresh_page()
+            self.site.advance(batch, tank)
+            self.update_page()
 
         return go_next_step
 
@@ -194,68 +151,122 @@ class UiMainWindow:
         def add_batch2():
             """The function to add a batch"""
             LOGGER.info("Add batch button clicked")
-            add_batch(beer=name, volume=volume)
-            self.refresh_page()
+            self.site.add_batch(name, volume)
+            self.update_page()
         return add_batch2
 
     def show_beers(self):
         """
         Showing all batches that is currently being processed.
 
-        Each batch that is being processed and its description is found
-        using show_beer_steps and a button to go to the next step and a
-        combo box if necessary is created.
+        Each batch is a row keyed by its id, so only the rows of batches
+        that have moved are updated. How long each batch has been in its
+        stage is worked out when the row is drawn.
         """
         LOGGER.info("Showing each processing batch to interface")
-        self.batches_list.clear()
-
-        # Getting each Batch object and the description.
-        batch_objects, beers = show_beer_steps()
-        for counter, beer in enumerate(beers):
-            batch_object = batch_objects[counter]
-            add_item = QtGui.QListWidgetItem(beer)
-            add_item.setFlags(add_item.flags() ^ QtCore.Qt.ItemIsSelectable)
-            self.batches_list.addItem(add_item)
-
-            # Layout for button and combo box.
-            widget = QtWidgets.QWidget(self.batches_list)
-            layout = QtWidgets.QHBoxLayout(widget)
-            layout.setContentsMargins(230, 20, 0, 0)
-
-            LOGGER.debug("Getting next function")
-            next_function = self.make_step_function(batch_object)
-            get_next = get_next_tanks(batch_object)
-
-            # If the next step requires a tank, create combo box.
-            if get_next:
-                tanks = get_next
-                combo_box = QtWidgets.QComboBox(widget)
-                layout.addWidget(combo_box)
-                for tank in tanks:
-                    combo_box.addItem(tank.name + " " + str(tank.volume) + "L")
-                next_function = self.make_step_function(batch_object, combo_box)
-            LOGGER.info("Next function retrieved")
-
-            # Making the button to go to the next step.
-            button = QtWidgets.QToolButton(widget)
-            button.setText("Next Step")
-            button.clicked.connect(next_function)
-
-            layout.addStretch()
-            layout.addWidget(button)
-
-            self.batches_list.setItemWidget(add_item, widget)
+        rows = []
+        for step_name in self.process.step_names[:-1]:
+            for batch in self.process.steps[step_name]:
+                rows.append(Row(batch.batch_id or id(batch), describe_batch(batch, step_name),
+                                "Next Step", batch))
+        self.batches_model.set_rows(rows)
+        self.batches_list.viewport().update()
         LOGGER.debug("Beers shown")
 
+    def describe_batch_row(self, row: Row) -> str:
+        """Returns the text of the row of a batch with how long it has been in its stage."""
+        return row.text + describe_ongoing(row.payload, self.process)
+
+    def advance_batch(self, row: Row, position: QtCore.QPoint):
+        """
+        Moves the batch of the row to the next step when its 'Next Step' button is clicked.
+
+        If the next step requires a tank, a menu of the tanks the batch can
+        go in is shown at the button to choose from.
+
+        :param row: The row of the batch.
+        :param position: Where the button was clicked on the screen.
+        """
+        batch = row.payload
+        tanks = get_next_tanks(batch, self.tanks)
+        tank = None
+        if tanks:
+            menu = QtWidgets.QMenu(self.batches_list)
+            for choice in tanks:
+                menu.addAction(choice.name + " " + str(choice.volume) + "L")
+            chosen = menu.exec_(position)
+            if chosen is None:
+                return
+            tank = tanks[menu.actions().index(chosen)]
+        self.make_step_function(batch, tank)()
+
+    @instrumented("ui.refresh_page")
     def refresh_page(self):
-        """Function to update all descriptions in the interface"""
+        """Function to update all descriptions of the site in the interface"""
         LOGGER.info("Refreshing page")
-        self.show_beers()
-        self.show_tanks()
-        self.show_bottled()
-        self.show_orders()
-        self.get_recommendation()
-        save_objects(BEER_PROCESS, TANKS)
+        self.site.sync()
+        self.process.changes.take()
+        self.dependents.run([BATCH_MOVED, TANK_CHANGED, STOCK_CHANGED, ORDER_CHANGED])
+
+    def poll_service(self):
+        """Updates the parts of the interface changed by others using the same service."""
+        try:
+            self.site.sync()
+        except (OSError, ValueError) as error:
+            LOGGER.error("Could not reach the service: %s", error)
+            self.status_bar.showMessage("Could not reach the service")
+            return
+        self.update_page()
+
+    @instrumented("ui.update_page")
+    def update_page(self, *kinds: str):
+        """
+        Updates only the parts of the interface depending on what has changed.
+
+        :param kinds:
+        Kinds of change made outside the Process object, such as to the sales data.
+        The changes made to the Process object are taken from its ChangeTracker.
+        """
+        self.dependents.run(self.process.changes.take().union(kinds))
+
+    def save_changes(self):
+        """Asks for the site to be saved in the background and shows how long the last save took."""
+        self.site.request_save()
+        self.show_save_stats()
+
+    def switch_site(self, name: str):
+        """
+        Shows the site with the given name.
+
+        The site is loaded the first time it is shown. The graph is the
+        same for every site so it isn't plotted again.
+        """
+        LOGGER.info("Switching to site %s", name)
+        self.site = self.registry.get(name)
+        self.site.open()
+        self.refresh_page()
+
+    def show_save_stats(self):
+        """Shows how long the latest background save took in the status bar."""
+        stats = self.site.save_stats()
+        if stats["saves"]:
+            self.status_bar.showMessage("Last saved in %.1f ms" % (stats["last_snapshot_ms"]
+                                                                   + stats["last_write_ms"]))
+
+    def schedule_next_finish(self):
+        """
+        Sets the timer to update the suggestions when the next stage finishes.
+
+        The timer is capped as QTimer intervals are limited to a 32 bit integer.
+        """
+        LOGGER.info("Scheduling the next stage finish")
+        self.finish_timer.stop()
+        next_finish = next_stage_finish(self.process)
+        if next_finish is not None:
+            finish_time, batch = next_finish
+            wait = max(0, int((finish_time - time_now()) * 1000))
+            self.finish_timer.start(min(wait, 24 * 3600 * 1000))
+            LOGGER.debug("Next stage finishes for %s in %d ms", batch.beer, wait)
 
     def add_beers(self):
         """
@@ -274,131 +285,162 @@ class UiMainWindow:
         else:
             if volume != "" and 0 < volume <= 1000:
                 beer = self.combo_box.currentText()
-                add_batch(beer=beer, volume=volume)
-                self.refresh_page()
+                self.site.add_batch(beer, volume)
+                self.update_page()
             else:
                 LOGGER.warning("Value between 0 and 1000 not entered for volume")
                 pop_up("Please enter a value between 0 and 1000")
 
         self.volume_edit.setText("")
 
+    def search_range(self) -> int:
+        """Returns the number of days chosen to search."""
+        return 7 if self.range_choice.currentText() == "Week" else 30
+
     def search_graph(self):
         """
         This is the function to search the graph
 
-        Date and width is grabbed from the user interface
-        which is then passed to plot_next_year to obtain the
-        data. Next, get_graph is used to plot the graph.
+        Date and width is grabbed from the user interface and the window
+        of the forecast is taken from the forecasts of the registry. If it is
+        already cached it is plotted straight away, otherwise it is worked
+        out in the background. The windows before and after are then worked
+        out in the background so stepping to them is instant.
         """
+        forecasts = self.registry.forecasts
         LOGGER.info("Grabbing graph")
         # Grabbing the date and region from the interface
         date = self.date_edit.date().toPyDate()
-        width = self.range_choice.currentText()
+        d_range = self.search_range()
 
         # Changing date object to a datetime object
         date_time = datetime.combine(date, datetime.min.time())
 
-        if width == "Week":
-            d_range = 7
+        cached = forecasts.peek(date_time, d_range)
+        if cached is not None:
+            LOGGER.debug("Search served from the cache")
+            self.show_search(cached)
         else:
-            d_range = 30
+            self.runner.submit("graph", forecasts.window, self.show_search, date_time, d_range)
+        self.runner.submit("prefetch", forecasts.prefetch, lambda added: None,
+                           date_time, d_range)
+
+    def step_search(self, direction: int):
+        """
+        Searches the window before or after the date being searched.
 
-        # Getting the dates and data for specified region.
-        dates, data = plot_next_year(start_date=date_time, date_range=d_range)
+        :param direction: 1 for the next window, -1 for the previous.
+        """
+        self.date_edit.setDate(self.date_edit.date().addDays(direction * self.search_range()))
+        self.search_graph()
+
+    def show_search(self, result: Tuple[List[datetime], Dict[str, List[int]]]):
+        """Plots the searched part of the prediction, or says if the date wasn't found."""
+        dates, data = result
         if dates:
-            self.get_graph(dates, data, "d")
+            self.plot_graph(dates, data, "d")
         else:
             LOGGER.error("Date not found")
             pop_up("Failed to find date")
 
-    def make_start_suggestion(self):
+    def make_start_suggestion(self, suggestion: Tuple[str, int]) -> List[Row]:
         """
         Make suggestions to start a new batch.
 
         If starting a new brew is suggested, the recommendation
-        is shown and a button next to it to actually start the brew.
-        """
-        LOGGER.info("Showing the suggestions for batches to start")
-        self.suggestions_list.clear()
+        is shown with a button to actually start the brew.
 
-        # Getting the suggestion
-        key, volume = beer_suggestion()
+        :param suggestion: The beer and volume from beer_suggestion.
 
-        widget = QtWidgets.QWidget(self.suggestions_list)
+        :return: The row of the suggestion, if there is one.
+        """
+        LOGGER.info("Showing the suggestions for batches to start")
+        key, volume = suggestion
 
         # If it is suggested to start a batch.
-        if key is not None:
+        if key is not None and volume > 10:
             LOGGER.debug("There is a suggestions")
-            if volume > 10:
-                # Creating the string to display.
-                add_item = QtGui.QListWidgetItem("Start brewing " + str(volume) + "L of " + key)
-                add_item.setFlags(add_item.flags() ^ QtCore.Qt.ItemIsSelectable)
-                self.suggestions_list.addItem(add_item)
+            return [Row(("start", key), "Start brewing " + str(volume) + "L of " + key,
+                        "Execute", (key, volume))]
+        return []
 
-                # Creating the button
-                button = QtWidgets.QToolButton(widget)
-                button.setText("Execute")
-                next_function = self.make_add_function(key, volume)
-                button.clicked.connect(next_function)
-
-                layout = QtWidgets.QHBoxLayout(widget)
-                layout.setContentsMargins(0, 0, 0, 0)
-
-                layout.addStretch()
-                layout.addWidget(button)
-
-                self.suggestions_list.setItemWidget(add_item, widget)
-                LOGGER.debug("Suggestion shown")
-
-    def make_next_suggestion(self):
+    def make_next_suggestion(self) -> List[Row]:
         """
         This is the function to make a suggestion for batches that should be moved to the next step.
 
-        It gets the batches that have finished in their process from finished_processes
-        and displays it. If the next step doesn't require a tank, a button is displayed
-        to actually move it to the next step.
+        It gets the batches that have finished in their process from finished_processes.
+        If the next step doesn't require a tank, the row has a button to
+        actually move it to the next step.
+
+        :return: The row of each batch.
         """
         LOGGER.info("Showing suggestion for batches to advance")
-        step_finished = finished_processes()
-        for batch in step_finished:
-            add_item = QtGui.QListWidgetItem("Process next step for " + batch.beer + " that is "
-                                             + BEER_PROCESS.step_names[batch.current_step] + "\n")
-            add_item.setFlags(add_item.flags() ^ QtCore.Qt.ItemIsSelectable)
-            self.suggestions_list.addItem(add_item)
-
-            widget = QtWidgets.QWidget(self.suggestions_list)
-            layout = QtWidgets.QHBoxLayout(widget)
-            layout.setContentsMargins(0, 20, 0, 0)
-            layout.addStretch()
-
-            get_next = get_next_tanks(batch)
+        rows = []
+        for batch in finished_processes(self.process):
             # If a tank is not required in the next step
-            if not get_next:
-                LOGGER.debug("Next step does not requires a tank.")
-                # Getting the function to link to the button.
-                next_function = self.make_step_function(batch)
-
-                # Making the button.
-                button = QtWidgets.QToolButton(widget)
-                button.setText("Execute")
-                button.clicked.connect(next_function)
-                layout.addWidget(button)
-
-            self.suggestions_list.setItemWidget(add_item, widget)
+            action = None if get_next_tanks(batch, self.tanks) else "Execute"
+            rows.append(Row(("next", batch.batch_id or id(batch)),
+                            "Process next step for " + batch.beer + " that is "
+                            + self.process.step_names[batch.current_step], action, batch))
         LOGGER.debug("Suggestions shown")
+        return rows
+
+    @staticmethod
+    def make_stockout_warnings(first_stockout: Dict[str, Optional[datetime]]) -> List[Row]:
+        """
+        Warns about each beer that is projected to run out.
+
+        The projection uses the batches in production, the bottled beers,
+        the orders and the prediction.
+
+        :param first_stockout: The first date each beer is projected to run out.
+
+        :return: The row of each warning.
+        """
+        LOGGER.info("Showing stock out warnings")
+        return [Row(("stockout", beer), beer + " is projected to run out on "
+                    + date.strftime("%d/%m/%Y"))
+                for beer, date in first_stockout.items() if date is not None]
+
+    def execute_suggestion(self, row: Row, _position: QtCore.QPoint):
+        """Carries out the suggestion of the row when its 'Execute' button is clicked."""
+        LOGGER.info("Execute button clicked")
+        if row.key[0] == "start":
+            self.make_add_function(*row.payload)()
+        else:
+            self.make_step_function(row.payload)()
 
     def get_recommendation(self):
-        """This shows the recommendations on the interface"""
+        """Works out the recommendations in the background to show on the interface."""
         LOGGER.info("Retrieving recommendations")
-        self.make_start_suggestion()
-        self.make_next_suggestion()
+        self.runner.submit("recommendation", self.site.recommendations,
+                           self.show_recommendations, self.prediction)
+
+    def forget_prediction(self):
+        """Forgets the forecast so it is made again from the new sales data."""
+        self.prediction = None
+
+    def show_recommendations(self, result: Tuple[Tuple[str, int], Dict[str, Optional[datetime]],
+                                                 Tuple[List[datetime], Dict[str, List[float]]]]):
+        """This shows the recommendations on the interface and keeps the forecast for next time."""
+        suggestion, first_stockout, self.prediction = result
+        self.suggestions_model.set_rows(self.make_start_suggestion(suggestion)
+                                        + self.make_next_suggestion()
+                                        + self.make_stockout_warnings(first_stockout))
+
+    def show_busy(self, key: str, busy: bool):
+        """Shows which parts of the interface are being worked out in the background."""
+        if key == "recommendation":
+            self.suggest_label.setText("Suggested To Do:" + (" (updating...)" if busy else ""))
+        elif key == "graph":
+            self.widget.setTitle("Prediction" + (" (updating...)" if busy else ""))
+        self.busy_bar.setVisible(self.runner.is_busy())
 
     def show_bottled(self):
         """This shows all the bottled beers."""
         LOGGER.info("Showing bottled beers")
-        self.bottled_list.clear()
-        for beer, volume in BEER_PROCESS.finished.items():
-            self.bottled_list.addItem(str(int(volume/0.5)) + " bottles of " + beer)
+        self.bottled_model.set_rows([Row(beer, str(int(volume / BOTTLE_VOLUME)) + " bottles of "
+                                         + beer) for beer, volume in self.process.finished.items()])
 
     def add_order(self):
         """
@@ -412,80 +454,273 @@ class UiMainWindow:
         bottle_quantity = self.spin_box.value()
         due_date = self.date_edit_2.date().toPyDate()
         if bottle_quantity > 0:
-            BEER_PROCESS.orders.append([beer, bottle_quantity, due_date])
+            self.site.add_order(beer, bottle_quantity, due_date)
             LOGGER.debug("Order added")
         else:
             pop_up("Please enter a value larger than 0")
-        self.refresh_page()
+        self.update_page()
 
-    def make_deliver_button(self, order: List[Union[str, int]]) -> Callable:
+    def make_deliver_button(self, order: Order) -> Callable:
         """
         Makes the function for the 'deliver' button for orders to be connected to.
 
-        :param order: The list of attributes of an order.
+        :param order: The Order object.
 
         :return: The function for the 'deliver' button to be linked to.
         """
         LOGGER.info("Making function to link to deliver button")
 
-        def deliver_order():
+        def deliver():
             """
             The function that is executed when the 'deliver' button is pressed.
 
-            The order is removed from BEER_PROCESS, the number of bottles is
+            The order is removed from the site, the number of bottles is
             updated if there is enough in the inventory.
             """
             LOGGER.info("Deliver button clicked")
-            if order[0] in BEER_PROCESS.finished and \
-                    BEER_PROCESS.finished[order[0]] >= order[1]*0.5:
-                BEER_PROCESS.orders.remove(order)
-                BEER_PROCESS.finished[order[0]] -= order[1]*0.5
-                self.refresh_page()
+            if self.site.deliver(order.order_id):
+                self.update_page()
                 LOGGER.info("Order removed successfully")
             else:
-                LOGGER.warning("Not enough inventory")
                 pop_up("Not enough inventory")
 
-        return deliver_order
+        return deliver
+
+    def deliver_row(self, row: Row, _position: QtCore.QPoint):
+        """Delivers the order of the row when its 'Deliver' button is clicked."""
+        self.make_deliver_button(row.payload)()
+
+    def fulfil_all(self):
+        """Delivers every order that can be made from the bottled beers, the earliest due first."""
+        LOGGER.info("Fulfil all button clicked")
+        delivered = self.site.fulfil()
+        self.update_page()
+        pop_up(str(len(delivered)) + " orders delivered")
+
+    def import_orders(self):
+        """Adds every order in a csv file chosen by the user."""
+        LOGGER.info("Importing orders")
+        file_dir, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self.central_widget, "Import Orders", "", "CSV files (*.csv)")
+        if not file_dir:
+            return
+        try:
+            added = self.site.import_orders(file_dir)
+        except (OSError, KeyError, ValueError):
+            LOGGER.error("Failed to import orders")
+            pop_up("Valid orders not found in file")
+        else:
+            self.update_page()
+            pop_up(str(added) + " orders imported")
 
     def show_orders(self):
         """
         Shows all the orders.
 
-        For each order, the order displayed and a button to deliver the
-        order is created.
+        Each order is a row keyed by its id with a button to deliver the
+        order, so only the rows of orders added or delivered are updated.
         """
         LOGGER.info("Showing all orders")
-        self.orders_list.clear()
         self.spin_box.setValue(1)
 
-        # Retrieving the orders
-        orders = BEER_PROCESS.orders
-        for order in orders:
-            # Making the string to show.
-            add_item = QtGui.QListWidgetItem(str(order[1]) + " bottles of " + order[0]
-                                             + " due " + order[2].strftime("%d/%m/%Y"))
-            add_item.setFlags(add_item.flags() ^ QtCore.Qt.ItemIsSelectable)
-            self.orders_list.addItem(add_item)
+        # Retrieving the orders, the earliest due first. Orders don't change,
+        # so the row of each is only made once.
+        rows = []
+        for order in self.process.orders:
+            row = self.order_rows.get(order.order_id)
+            if row is None or row.payload is not order:
+                row = Row(order.order_id, str(order.quantity) + " bottles of " + order.beer
+                          + " due " + order.due.strftime("%d/%m/%Y"), "Deliver", order)
+                self.order_rows[order.order_id] = row
+            rows.append(row)
+        if len(self.order_rows) > 2 * len(rows):
+            self.order_rows = {row.key: row for row in rows}
+        self.orders_model.set_rows(rows)
+        LOGGER.debug("All orders shown")
+
+    def show_utilisation(self, utilisation: Utilisation) -> QtWidgets.QDialog:
+        """
+        Shows how much each tank was used over the last 90 days in a dialog.
 
-            next_function = self.make_deliver_button(order)
-            LOGGER.debug("Next function retrieved")
+        A table gives the figures for each tank and a graph shows the
+        weekly utilisation of each capability of tank.
 
-            widget = QtWidgets.QWidget(self.orders_list)
+        :param utilisation: The utilisation, as from recent_utilisation.
+        """
+        LOGGER.info("Showing tank utilisation")
+        dialog = QtWidgets.QDialog(self.central_widget)
+        dialog.setWindowTitle("Tank Utilisation - last 90 days")
+        dialog.resize(700, 600)
+        layout = QtWidgets.QVBoxLayout(dialog)
+
+        headers = ["Tank", "Function", "Busy", "Longest idle", "Idle periods", "Volume used"]
+        table = QtWidgets.QTableWidget(len(utilisation.tanks), len(headers), dialog)
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        for row, name in enumerate(utilisation.tanks):
+            values = [name, utilisation.functions[row],
+                      "%.0f%%" % (utilisation.overall[row] * 100),
+                      "%.1f days" % (utilisation.longest_idle[row] / (24 * 3600)),
+                      str(utilisation.idle_periods[row]),
+                      "%.0f%%" % (utilisation.volume_efficiency[row] * 100)]
+            for column, value in enumerate(values):
+                table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+        table.resizeColumnsToContents()
+        layout.addWidget(table)
+
+        queue = utilisation.queue
+        layout.addWidget(QtWidgets.QLabel(
+            "%d waits for a tank, averaging %.1f hours and at most %.1f hours"
+            % (queue["count"], queue["mean"] / 3600, queue["longest"] / 3600)))
+
+        graph = pg.PlotWidget(dialog)
+        graph.setTitle("Weekly utilisation by function")
+        graph.addLegend(size=(70, 50), offset=(10, 1))
+        weeks = list(range(len(utilisation.edges) - 1))
+        for colour, (function, busy) in zip(['r', 'g', 'b'], utilisation.by_class.items()):
+            graph.plotItem.plot(weeks, busy * 100, pen=pg.mkPen(colour, width=1), name=function)
+        x_axis = graph.getAxis('bottom')
+        x_axis.setTicks([[(week, utilisation.edges[week].strftime("%d/%m"))
+                          for week in weeks[::2]]])
+        layout.addWidget(graph)
+        dialog.show()
+        return dialog
+
+    def show_accuracy(self, records: List[Dict]) -> QtWidgets.QDialog:
+        """
+        Shows the recent errors of each forecasting model for each beer in a dialog.
 
-            # Creating the button.
-            button = QtWidgets.QToolButton(widget)
-            button.setText("Deliver")
-            button.clicked.connect(next_function)
+        :param records: The errors, as from ACCURACY.records. The model each beer is forecast
+        with is marked.
+        """
+        LOGGER.info("Showing forecast accuracy")
+        dialog = QtWidgets.QDialog(self.central_widget)
+        dialog.setWindowTitle("Forecast Accuracy")
+        dialog.resize(700, 450)
+        layout = QtWidgets.QVBoxLayout(dialog)
+        scored = [record for record in records if record["from"] is not None]
+        layout.addWidget(QtWidgets.QLabel(
+            "Scored from %s to %s" % (scored[0]["from"], scored[0]["to"]) if scored
+            else "No sales have been scored against a forecast yet"))
+
+        headers = ["Beer", "Model", "Days scored", "MAE", "Bias", "WAPE", "Selected"]
+        table = QtWidgets.QTableWidget(len(records), len(headers), dialog)
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        for row, record in enumerate(records):
+            values = [record["beer"], record["model"], str(record["scored"])] + \
+                ["-" if record[key] is None else form % (record[key] * scale)
+                 for key, form, scale in [("mae", "%.1f", 1), ("bias", "%+.1f", 1),
+                                          ("wape", "%.0f%%", 100)]] + \
+                ["Yes" if record["selected"] else ""]
+            for column, value in enumerate(values):
+                table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+        table.resizeColumnsToContents()
+        layout.addWidget(table)
+        dialog.show()
+        return dialog
+
+    def show_metrics(self) -> QtWidgets.QDialog:
+        """
+        Shows how long each operation took in a dialog, opened with Ctrl+Shift+P.
 
-            layout = QtWidgets.QHBoxLayout(widget)
-            layout.setContentsMargins(0, 0, 0, 0)
+        Recording is turned on and off with the check box, and the times can
+        be written to a file in the Prometheus text format.
+        """
+        LOGGER.info("Showing metrics")
+        dialog = QtWidgets.QDialog(self.central_widget)
+        dialog.setWindowTitle("Profiler")
+        dialog.resize(760, 500)
+        layout = QtWidgets.QVBoxLayout(dialog)
+        record_box = QtWidgets.QCheckBox("Record how long each operation takes", dialog)
+        record_box.setChecked(METRICS.enabled)
+        record_box.toggled.connect(METRICS.enable)
+        layout.addWidget(record_box)
+
+        headers = ["Operation", "Count", "p50 ms", "p95 ms", "p99 ms", "Max ms", "Total ms"]
+        table = QtWidgets.QTableWidget(0, len(headers), dialog)
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        layout.addWidget(table)
+        counters = QtWidgets.QLabel(dialog)
+        counters.setWordWrap(True)
+        layout.addWidget(counters)
+
+        def fill():
+            records = METRICS.records()
+            table.setRowCount(len(records))
+            for row, record in enumerate(records):
+                values = [record["operation"], str(record["count"])] + \
+                    ["%.2f" % record[key] for key in ["p50_ms", "p95_ms", "p99_ms", "max_ms",
+                                                      "total_ms"]]
+                for column, value in enumerate(values):
+                    table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+            table.resizeColumnsToContents()
+            counters.setText(", ".join("%s: %d" % (record["counter"], record["value"])
+                                       for record in METRICS.counter_records()))
+
+        def reset():
+            METRICS.reset()
+            fill()
+
+        def export():
+            file_dir, _ = QtWidgets.QFileDialog.getSaveFileName(
+                dialog, "Export Metrics", "metrics.prom", "Prometheus text (*.prom *.txt)")
+            if file_dir:
+                pop_up(METRICS.write_prometheus(file_dir))
+
+        buttons = QtWidgets.QHBoxLayout()
+        for text, function in [("Refresh", fill), ("Reset", reset), ("Export...", export)]:
+            button = QtWidgets.QPushButton(text, dialog)
+            button.clicked.connect(function)
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
+        fill()
+        dialog.show()
+        return dialog
+
+    def export(self, what: str):
+        """
+        Asks where to export the forecast, totals or state of the site and writes it there.
 
-            layout.addStretch()
-            layout.addWidget(button)
+        The format is taken from the extension of the file, and the file is
+        written in the background.
 
-            self.orders_list.setItemWidget(add_item, widget)
-        LOGGER.debug("All orders shown")
+        :param what: One of EXPORTS.
+        """
+        filters = ["CSV (*.csv)", "JSON lines (*.jsonl)", "JSON (*.json)", "Parquet (*.parquet)"]
+        file_dir, chosen = QtWidgets.QFileDialog.getSaveFileName(
+            self.central_widget, "Export " + what.capitalize(), what + ".csv", ";;".join(filters))
+        if not file_dir:
+            return
+        default = ["csv", "jsonl", "json", "parquet"][filters.index(chosen)] \
+            if chosen in filters else "csv"
+        output_format = format_of(file_dir, default)
+        if not os_path.splitext(file_dir)[1]:
+            file_dir += EXTENSIONS[output_format]
+        LOGGER.info("Exporting %s to %s", what, file_dir)
+        self.runner.submit("export", self.write_export, pop_up, what, file_dir, output_format)
+
+    def write_export(self, what: str, file_dir: str, output_format: str) -> str:
+        """
+        Writes an export of the site shown, with intervals around the forecast.
+
+        Run in the background.
+
+        :return: The message to show.
+        """
+        prediction, errors = None, None
+        if what in ["forecast", "totals"]:
+            prediction = self.registry.forecasts.forecast()
+        if what == "forecast":
+            errors = interval_errors(self.registry.accuracy())
+        columns, rows = export_rows(what, self.site, prediction, errors=errors)
+        try:
+            written = export_file(rows, output_format, file_dir, columns)
+        except (OSError, ValueError) as error:
+            LOGGER.error("Failed to export %s: %s", what, error)
+            return "Failed to export: " + str(error)
+        return "%d records written to %s" % (written, file_dir)
 
     def add_file(self):
         """
@@ -496,23 +731,61 @@ class UiMainWindow:
         LOGGER.info("Adding file")
         file_dir = self.file_dir_edit.text()
         self.file_dir_edit.setText("Enter file directory for new csv file")
-        result = write_data(file_dir)
+        self.add_file_button.setEnabled(False)
+        self.runner.submit("file", self.registry.add_sales, self.show_file_result, file_dir,
+                           on_error=self.show_file_error)
+
+    def show_file_result(self, result: str):
+        """Says whether the file was added, and updates the prediction if it was."""
+        self.add_file_button.setEnabled(True)
         if result == "success":
             message_text = "Successfully added csv file"
+            self.update_page(SALES_CHANGED)
         else:
             LOGGER.error("Failed to add file")
             message_text = str(result)
         pop_up(message_text)
 
+    def show_file_error(self, message: str):
+        """Says the file couldn't be added, such as when the service is down."""
+        self.add_file_button.setEnabled(True)
+        LOGGER.error("Failed to add file: %s", message)
+        pop_up("Failed to add file: " + message)
+
+    def show_ingest_progress(self, name: str, read: int, size: int):
+        """Shows how much of a file dropped into the inbox has been added."""
+        self.status_bar.showMessage("Adding %s: %d%%" % (name, 100 * read // max(size, 1)))
+
+    def show_ingested(self, result: IngestResult):
+        """Says whether a file dropped into the inbox was added, and updates the prediction."""
+        if result.result == "success":
+            self.status_bar.showMessage("Added %d rows from %s" % (result.rows, result.file))
+            if result.rows:
+                self.update_page(SALES_CHANGED)
+        else:
+            self.status_bar.showMessage("Could not add %s: %s" % (result.file, result.result))
+
+    def stop_watching(self):
+        """Stops adding the files dropped into the inbox."""
+        if self.watcher is not None:
+            self.watcher.stop()
+
     # pylint: disable=too-many-statements
-    def __init__(self, main_window: QtWidgets.QMainWindow):
+    def __init__(self, main_window: QtWidgets.QMainWindow,
+                 registry: Union[SiteRegistry, RemoteRegistry] = SITES):
         """
         This is the layout of each object in the user interface.
 
         :param main_window: QtMainWindow object.
+        :param registry: The sites to show, either loaded from disk or held by a service.
         """
         main_window.setObjectName("main_window")
         main_window.resize(1751, 869)
+        self.registry = registry
+        self.site = registry.get(registry.names()[0])
+        self.runner = TaskRunner(main_window)
+        # The forecast the recommendations were last worked out with, kept until the sales change.
+        self.prediction = None
         self.central_widget = QtWidgets.QWidget(main_window)
 
         font = QtGui.QFont()
@@ -537,6 +810,15 @@ class UiMainWindow:
         self.search_button.setGeometry(QtCore.QRect(352, 7, 91, 26))
         self.search_button.setText("Search")
         self.search_button.clicked.connect(self.search_graph)
+        self.search_button.setToolTip("Ctrl+Left and Ctrl+Right search the previous and next week "
+                                      "or month")
+        self.next_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Right"), main_window)
+        self.next_shortcut.activated.connect(partial(self.step_search, 1))
+        self.previous_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Left"), main_window)
+        self.previous_shortcut.activated.connect(partial(self.step_search, -1))
+        self.metrics_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Shift+P"),
+                                                    main_window)
+        self.metrics_shortcut.activated.connect(self.show_metrics)
         self.graph_button = QtWidgets.QPushButton(self.central_widget)
         self.graph_button.setGeometry(QtCore.QRect(0, 5, 93, 28))
         self.graph_button.setText("Full Graph")
@@ -574,20 +856,39 @@ class UiMainWindow:
         self.refresh_button.setObjectName("refresh_button")
         self.refresh_button.setText("Refresh")
         self.refresh_button.clicked.connect(self.refresh_page)
+        self.utilisation_button = QtWidgets.QPushButton(self.central_widget)
+        self.utilisation_button.setGeometry(QtCore.QRect(540, 810, 90, 28))
+        self.utilisation_button.setText("Utilisation")
+        self.utilisation_button.clicked.connect(
+            lambda: self.runner.submit("utilisation", recent_utilisation, self.show_utilisation,
+                                       90, 7, self.process, self.tanks))
+        self.accuracy_button = QtWidgets.QPushButton(self.central_widget)
+        self.accuracy_button.setGeometry(QtCore.QRect(630, 810, 90, 28))
+        self.accuracy_button.setText("Accuracy")
+        self.accuracy_button.clicked.connect(
+            lambda: self.runner.submit("accuracy", self.registry.accuracy, self.show_accuracy))
+        self.export_button = QtWidgets.QPushButton(self.central_widget)
+        self.export_button.setGeometry(QtCore.QRect(720, 810, 90, 28))
+        self.export_button.setText("Export")
+        export_menu = QtWidgets.QMenu(self.export_button)
+        for what in EXPORTS:
+            export_menu.addAction(what.capitalize(), partial(self.export, what))
+        self.export_button.setMenu(export_menu)
 
         self.widget = pg.PlotWidget(self.central_widget)
         self.widget.setGeometry(QtCore.QRect(0, 40, 901, 421))
         self.widget.setObjectName("widget")
         self.get_graph()
 
-        self.batches_list = QtWidgets.QListWidget(self.central_widget)
+        self.batches_model = KeyedListModel(main_window, self.describe_batch_row)
+        self.batches_list = make_list_view(self.central_widget, self.batches_model)
         self.batches_list.setGeometry(QtCore.QRect(0, 485, 450, 276))
         self.batches_list.setObjectName("batches_list")
-        self.batches_list.setWordWrap(True)
-        self.tanks_list = QtWidgets.QListWidget(self.central_widget)
+        self.batches_list.itemDelegate().clicked.connect(self.advance_batch)
+        self.tanks_model = KeyedListModel(main_window)
+        self.tanks_list = make_list_view(self.central_widget, self.tanks_model)
         self.tanks_list.setGeometry(QtCore.QRect(450, 485, 450, 276))
         self.tanks_list.setObjectName("tanks_list")
-        self.tanks_list.setWordWrap(True)
         self.batch_label = QtWidgets.QLabel(self.central_widget)
         self.batch_label.setGeometry(QtCore.QRect(5, 465, 86, 16))
         self.batch_label.setText("Batch Status:")
@@ -597,19 +898,32 @@ class UiMainWindow:
         self.tank_label.setText("Tank Status:")
         self.tank_label.setFont(font)
 
-        self.suggestions_list = QtWidgets.QListWidget(self.central_widget)
+        self.suggestions_model = KeyedListModel(main_window)
+        self.suggestions_list = make_list_view(self.central_widget, self.suggestions_model)
         self.suggestions_list.setGeometry(QtCore.QRect(900, 40, 426, 721))
-        self.suggestions_list.setWordWrap(True)
+        self.suggestions_list.itemDelegate().clicked.connect(self.execute_suggestion)
         self.suggest_label = QtWidgets.QLabel(self.central_widget)
         self.suggest_label.setGeometry(QtCore.QRect(904, 10, 120, 21))
         self.suggest_label.setText("Suggested To Do:")
         self.suggest_label.setFont(font)
+        self.finish_timer = QtCore.QTimer(main_window)
+        self.finish_timer.setSingleShot(True)
+        self.finish_timer.timeout.connect(self.get_recommendation)
+        self.finish_timer.timeout.connect(self.schedule_next_finish)
         self.get_recommendation()
 
         self.order_button = QtWidgets.QPushButton(self.central_widget)
         self.order_button.setGeometry(QtCore.QRect(1493, 80, 93, 28))
         self.order_button.setText("Add Order")
         self.order_button.clicked.connect(self.add_order)
+        self.fulfil_button = QtWidgets.QPushButton(self.central_widget)
+        self.fulfil_button.setGeometry(QtCore.QRect(1593, 80, 75, 28))
+        self.fulfil_button.setText("Fulfil All")
+        self.fulfil_button.clicked.connect(self.fulfil_all)
+        self.import_orders_button = QtWidgets.QPushButton(self.central_widget)
+        self.import_orders_button.setGeometry(QtCore.QRect(1668, 80, 80, 28))
+        self.import_orders_button.setText("Import...")
+        self.import_orders_button.clicked.connect(self.import_orders)
         self.date_edit_2 = QtWidgets.QDateEdit(self.central_widget)
         self.date_edit_2.setGeometry(QtCore.QRect(1613, 40, 111, 31))
         self.date_edit_2.setDateTime(QtCore.QDateTime.currentDateTime())
@@ -634,17 +948,20 @@ class UiMainWindow:
         self.bottles_label.setFont(font2)
         self.bottles_label.setText("bottles")
 
-        self.orders_list = QtWidgets.QListWidget(self.central_widget)
+        # Every order is one line, so the rows are given the same height to keep long lists quick.
+        self.orders_model = KeyedListModel(main_window)
+        self.order_rows = {}
+        self.orders_list = make_list_view(self.central_widget, self.orders_model, uniform=True)
         self.orders_list.setGeometry(QtCore.QRect(1325, 140, 426, 291))
-        self.orders_list.setWordWrap(True)
+        self.orders_list.itemDelegate().clicked.connect(self.deliver_row)
         self.orders_label = QtWidgets.QLabel(self.central_widget)
         self.orders_label.setGeometry(QtCore.QRect(1330, 115, 91, 16))
         self.orders_label.setText("Orders:")
         self.orders_label.setFont(font)
 
-        self.bottled_list = QtWidgets.QListWidget(self.central_widget)
+        self.bottled_model = KeyedListModel(main_window)
+        self.bottled_list = make_list_view(self.central_widget, self.bottled_model, uniform=True)
         self.bottled_list.setGeometry(QtCore.QRect(1325, 465, 431, 296))
-        self.bottled_list.setWordWrap(True)
         self.bottled_label = QtWidgets.QLabel(self.central_widget)
         self.bottled_label.setGeometry(QtCore.QRect(1330, 440, 200, 16))
         self.bottled_label.setText("Bottled and ready:")
@@ -667,16 +984,63 @@ class UiMainWindow:
                                    "with the most demand, along with the available equipment")
 
         main_window.setCentralWidget(self.central_widget)
+        self.status_bar = QtWidgets.QStatusBar(main_window)
+        main_window.setStatusBar(self.status_bar)
+        self.busy_bar = QtWidgets.QProgressBar(self.status_bar)
+        self.busy_bar.setRange(0, 0)
+        self.busy_bar.setMaximumWidth(120)
+        self.busy_bar.setVisible(self.runner.is_busy())
+        self.status_bar.addPermanentWidget(self.busy_bar)
+        self.runner.busy_changed.connect(self.show_busy)
+        for key in ["graph", "recommendation"]:
+            self.show_busy(key, self.runner.is_busy(key))
+        self.site_choice = QtWidgets.QComboBox(self.status_bar)
+        self.site_choice.addItems(registry.names())
+        self.site_choice.currentTextChanged.connect(self.switch_site)
+        self.status_bar.addPermanentWidget(QtWidgets.QLabel("Site:"))
+        self.status_bar.addPermanentWidget(self.site_choice)
         QtCore.QMetaObject.connectSlotsByName(main_window)
 
+        # What each part of the interface is updated for. The forecast is forgotten
+        # before the recommendations are worked out again.
+        self.dependents = Dependents()
+        self.dependents.subscribe("batches", [BATCH_MOVED], self.show_beers)
+        self.dependents.subscribe("tanks", [TANK_CHANGED], self.show_tanks)
+        self.dependents.subscribe("bottled", [STOCK_CHANGED], self.show_bottled)
+        self.dependents.subscribe("orders", [ORDER_CHANGED], self.show_orders)
+        self.dependents.subscribe("graph", [SALES_CHANGED], self.get_graph)
+        self.dependents.subscribe("forecast", [SALES_CHANGED], self.forget_prediction)
+        self.dependents.subscribe("recommendation", [BATCH_MOVED, TANK_CHANGED, STOCK_CHANGED,
+                                                     ORDER_CHANGED, SALES_CHANGED],
+                                  self.get_recommendation)
+        self.dependents.subscribe("next finish", [BATCH_MOVED], self.schedule_next_finish)
+        self.dependents.subscribe("save", [BATCH_MOVED, TANK_CHANGED, STOCK_CHANGED,
+                                           ORDER_CHANGED], self.save_changes)
+
         LOGGER.info("Finished creating user interface")
         # Refresh the page.
         self.refresh_page()
 
-        # Constantly save the batches and tanks.
-        process = Thread(target=save_continuously, args=(), daemon=True)
-        process.start()
-        LOGGER.debug("New thread started")
+        # Save the batches and tanks in the background whenever they change.
+        self.site.open()
+        LOGGER.debug("State saver started")
+
+        # Others may change the sites held by a service, so it is checked for changes.
+        self.poll_timer = QtCore.QTimer(main_window)
+        self.poll_timer.timeout.connect(self.poll_service)
+        if registry.remote:
+            self.poll_timer.start(POLL_INTERVAL)
+
+        # Sales data dropped into the inbox is added in the background. With a
+        # service, the service watches its own inbox instead.
+        self.relay = Relay(main_window)
+        self.watcher = None
+        if not registry.remote:
+            self.watcher = InboxWatcher(
+                forecasts=registry.forecasts,
+                on_progress=partial(self.relay.call, self.show_ingest_progress),
+                on_ingested=partial(self.relay.call, self.show_ingested))
+            self.watcher.start()
 
 
 if __name__ == "__main__":
@@ -688,8 +1052,21 @@ if __name__ == "__main__":
         LOGGER.info("High Dpi Pixmaps enabled")
         QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_UseHighDpiPixmaps, True)
 
-    APP = QtWidgets.QApplication(sys.argv)
+    PARSER = argparse.ArgumentParser(description="Shows the BrewHouse interface.")
+    PARSER.add_argument("--server", help="address of a service to use, such as "
+                                         "http://127.0.0.1:8765, instead of the files here")
+    PARSER.add_argument("--metrics", action="store_true",
+                        help="record how long each operation takes from the start")
+    ARGS, QT_ARGS = PARSER.parse_known_args()
+    if ARGS.metrics:
+        METRICS.enable()
+    REGISTRY = SITES if ARGS.server is None else RemoteRegistry(ARGS.server)
+
+    APP = QtWidgets.QApplication(sys.argv[:1] + QT_ARGS)
     WINDOW = QtWidgets.QMainWindow()
-    UI = UiMainWindow(WINDOW)
+    UI = UiMainWindow(WINDOW, REGISTRY)
+    APP.aboutToQuit.connect(UI.stop_watching)
+    APP.aboutToQuit.connect(UI.runner.wait)
+    APP.aboutToQuit.connect(REGISTRY.stop)
     WINDOW.show()
     sys.exit(APP.exec_())
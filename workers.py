@@ -0,0 +1,170 @@
+"""
+This module runs slow work for the user interface in a thread pool.
+
+Each task has a key such as "graph" or "recommendation". Submitting a task
+gives it the next generation number for its key, and the result is only
+passed to the callback if no newer task with the same key was submitted
+in the meantime. A newer task also takes the older one out of the queue if
+it hasn't started yet. Results are sent back to the main thread with Qt
+signals, so the callbacks can update the interface.
+"""
+import os
+from typing import Callable, Any, Tuple
+from log_setup import get_logger
+from PyQt5 import QtCore
+
+ABS_PATH = os.path.abspath(__file__)
+D_NAME = os.path.dirname(ABS_PATH)
+os.chdir(D_NAME)
+
+LOGGER = get_logger("workers")
+
+
+# pylint: disable=c-extension-no-member
+class WorkerSignals(QtCore.QObject):
+    """The signals a Worker sends its result back with."""
+    # pylint: disable=too-few-public-methods
+    finished = QtCore.pyqtSignal(str, int, object)
+    failed = QtCore.pyqtSignal(str, int, str)
+
+
+class Worker(QtCore.QRunnable):
+    """This class runs one task in the thread pool."""
+    def __init__(self, key: str, generation: int, function: Callable, args: Tuple,
+                 signals: WorkerSignals):
+        """
+        Initialising the task.
+
+        :param key: The key of the task.
+        :param generation: The generation of the task for its key.
+        :param function: The function to run.
+        :param args: The arguments to call the function with.
+        :param signals: The signals to send the result with.
+        """
+        super().__init__()
+        self.key = key
+        self.generation = generation
+        self.function = function
+        self.args = args
+        self.signals = signals
+        # The runner keeps the worker until it has finished, so it can be taken out of the queue.
+        self.setAutoDelete(False)
+
+    def run(self):
+        """Runs the function and sends the result or the error."""
+        try:
+            result = self.function(*self.args)
+        except Exception as error:  # pylint: disable=broad-except
+            LOGGER.exception("Task %s failed", self.key)
+            self.signals.failed.emit(self.key, self.generation, str(error))
+        else:
+            self.signals.finished.emit(self.key, self.generation, result)
+
+
+class TaskRunner(QtCore.QObject):
+    """This class submits tasks to the thread pool and passes on the latest result for each key."""
+    # Sent with the key of a task and whether any task with that key is still to finish.
+    busy_changed = QtCore.pyqtSignal(str, bool)
+
+    def __init__(self, parent: QtCore.QObject = None, pool: QtCore.QThreadPool = None):
+        """
+        Initialising the runner.
+
+        :param parent: The Qt parent of the runner.
+        :param pool: The thread pool to use. Defaults to the global thread pool.
+        """
+        super().__init__(parent)
+        self.pool = QtCore.QThreadPool.globalInstance() if pool is None else pool
+        self.generations = {}
+        self.callbacks = {}
+        # The latest worker for each key, and every worker by (key, generation) until it finishes.
+        self.workers = {}
+        self.alive = {}
+        self.pending = {}
+        self.signals = WorkerSignals(self)
+        self.signals.finished.connect(self.on_finished)
+        self.signals.failed.connect(self.on_failed)
+
+    def submit(self, key: str, function: Callable, callback: Callable[[Any], None], *args,
+               on_error: Callable[[str], None] = None) -> int:
+        """
+        Runs the function in the thread pool and passes the result to the callback.
+
+        :param key: The key of the task. Results of older tasks with the same key are dropped.
+        :param function: The function to run.
+        :param callback: The function given the result on the main thread.
+        :param args: The arguments to call the function with.
+        :param on_error: The function given the error message if the task fails.
+
+        :return: The generation of the task.
+        """
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        self.callbacks[key] = (callback, on_error)
+        older = self.workers.get(key)
+        if older is not None and self.pool.tryTake(older):
+            LOGGER.debug("Task %s %d taken out of the queue", key, older.generation)
+            del self.alive[(key, older.generation)]
+            self.set_pending(key, -1)
+        worker = Worker(key, generation, function, args, self.signals)
+        self.workers[key] = worker
+        self.alive[(key, generation)] = worker
+        self.set_pending(key, 1)
+        self.pool.start(worker)
+        return generation
+
+    def set_pending(self, key: str, change: int):
+        """Changes the number of tasks still to finish for the key and says if it is busy."""
+        self.pending[key] = self.pending.get(key, 0) + change
+        self.busy_changed.emit(key, self.pending[key] > 0)
+
+    def is_busy(self, key: str = None) -> bool:
+        """Whether a task with the key, or any task if no key is given, is still to finish."""
+        if key is None:
+            return any(self.pending.values())
+        return self.pending.get(key, 0) > 0
+
+    def is_current(self, key: str, generation: int) -> bool:
+        """Forgets the finished task and returns whether it is the latest with its key."""
+        worker = self.alive.pop((key, generation), None)
+        if self.workers.get(key) is worker:
+            del self.workers[key]
+        self.set_pending(key, -1)
+        return self.generations.get(key) == generation
+
+    def on_finished(self, key: str, generation: int, result: Any):
+        """Passes the result to the callback if the task is the latest with its key."""
+        if not self.is_current(key, generation):
+            LOGGER.debug("Dropping stale result of task %s %d", key, generation)
+            return
+        self.callbacks[key][0](result)
+
+    def on_failed(self, key: str, generation: int, message: str):
+        """Passes the error to the error callback if the task is the latest with its key."""
+        if self.is_current(key, generation) and self.callbacks[key][1] is not None:
+            self.callbacks[key][1](message)
+
+    def wait(self, msecs: int = -1) -> bool:
+        """Waits for the thread pool and delivers the results. Used when closing and in scripts."""
+        done = self.pool.waitForDone(msecs)
+        QtCore.QCoreApplication.processEvents()
+        return done
+
+
+class Relay(QtCore.QObject):
+    """This class calls functions on the main thread for threads that aren't in the pool."""
+    # pylint: disable=too-few-public-methods
+    called = QtCore.pyqtSignal(object, tuple)
+
+    def __init__(self, parent: QtCore.QObject = None):
+        """
+        Initialising the relay. It has to be made on the main thread.
+
+        :param parent: The Qt parent of the relay.
+        """
+        super().__init__(parent)
+        self.called.connect(lambda function, args: function(*args))
+
+    def call(self, function: Callable, *args):
+        """Calls the function with the arguments on the main thread, from any thread."""
+        self.called.emit(function, args)